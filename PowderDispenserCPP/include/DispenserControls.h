@@ -3,8 +3,14 @@
 #define DISPENSERCONTROLS_H
 
 #include "Utils.h"
+#include "ScaleControls.h"
 #include <SparkFun_ProDriver_TC78H670FTG_Arduino_Library.h>
 
+// How a DispenseUntil dose ended, reported in '<Dosed:weight,steps,reason>'.
+#define DOSE_REACHED 0      // The scale reached the stop weight.
+#define DOSE_STEP_LIMIT 1   // The step limit was hit first, e.g. because the hopper ran empty.
+#define DOSE_INTERRUPTED 2  // A new command arrived from the PC.
+
 class DispenserControls {
 public:
     DispenserControls(Utils& utils);
@@ -15,14 +21,29 @@ public:
     bool isDispenserEnabled();
     void changeDir(int dir);
     void dispense(int steps, int dir);
+    uint8_t dispenseUntil(ScaleControls& scale, float target, float stopAt, float stepsPerGram,
+                          int maxChunk, int minChunk, unsigned long settleMs, int dir);
+    void setFeedRate(float stepsPerSecond, int dir, long maxSteps, unsigned long curMicros);
+    void stopFeed(bool completed);
+    void updateFeed(unsigned long curMicros);
+    bool isFeeding() { return feedRate > 0; }
 
     static int dispenseDir;
     static bool dispenserEnabled;
     static const float dispenserCalFactor;
+    static const uint8_t DOSE_SAMPLES = 32;  // Readings averaged per weight check of a DispenseUntil dose.
+    static const uint8_t FEED_MAX_BURST = 32; // Most steps taken per loop() pass while feeding.
 
 private:
     Utils& utils;
     PRODRIVER Dispenser;
+
+    // Continuous feed state, see setFeedRate().
+    float feedRate = 0;                 // Steps per second; 0 while not feeding.
+    int feedDir = 1;
+    long feedSteps = 0;                 // Steps taken since the feed started.
+    long feedLimit = 0;                 // Steps after which the feed stops by itself; 0 for no limit.
+    unsigned long lastFeedMicros = 0;   // Time up to which the steps due have been taken.
 };
 
 =======
@@ -30,8 +51,14 @@ private:
 #define DISPENSERCONTROLS_H
 
 #include "Utils.h"
+#include "ScaleControls.h"
 #include <SparkFun_ProDriver_TC78H670FTG_Arduino_Library.h>
 
+// How a DispenseUntil dose ended, reported in '<Dosed:weight,steps,reason>'.
+#define DOSE_REACHED 0      // The scale reached the stop weight.
+#define DOSE_STEP_LIMIT 1   // The step limit was hit first, e.g. because the hopper ran empty.
+#define DOSE_INTERRUPTED 2  // A new command arrived from the PC.
+
 class DispenserControls {
 public:
     DispenserControls(Utils& utils);
@@ -42,14 +69,29 @@ public:
     bool isDispenserEnabled();
     void changeDir(int dir);
     void dispense(int steps, int dir);
+    uint8_t dispenseUntil(ScaleControls& scale, float target, float stopAt, float stepsPerGram,
+                          int maxChunk, int minChunk, unsigned long settleMs, int dir);
+    void setFeedRate(float stepsPerSecond, int dir, long maxSteps, unsigned long curMicros);
+    void stopFeed(bool completed);
+    void updateFeed(unsigned long curMicros);
+    bool isFeeding() { return feedRate > 0; }
 
     static int dispenseDir;
     static bool dispenserEnabled;
     static const float dispenserCalFactor;
+    static const uint8_t DOSE_SAMPLES = 32;  // Readings averaged per weight check of a DispenseUntil dose.
+    static const uint8_t FEED_MAX_BURST = 32; // Most steps taken per loop() pass while feeding.
 
 private:
     Utils& utils;
     PRODRIVER Dispenser;
+
+    // Continuous feed state, see setFeedRate().
+    float feedRate = 0;                 // Steps per second; 0 while not feeding.
+    int feedDir = 1;
+    long feedSteps = 0;                 // Steps taken since the feed started.
+    long feedLimit = 0;                 // Steps after which the feed stops by itself; 0 for no limit.
+    unsigned long lastFeedMicros = 0;   // Time up to which the steps due have been taken.
 };
 
 >>>>>>> c5e728c45412297ccfbd7313ba623480bfd3dee3
@@ -10,6 +10,9 @@
 
 class MixerControls {
 public:
+    // Outputs that can run in the background, timed with millis() instead of delay().
+    enum Output : uint8_t { MIXER, DRAIN, PUMP, NUM_OUTPUTS };
+
     MixerControls(Utils& utils);
 
     void setupRelay(Qwiic_Relay &relay);
@@ -22,10 +25,29 @@ public:
     void setupPump(uint8_t pin);
     void runPump(uint8_t pin, float runTime);
 
+    void start(Output output, float runTime, unsigned long curMillis);
+    void startPump(uint8_t pin, float runTime, unsigned long curMillis);
+    bool stop(const char *name, unsigned long curMillis);
+    void update(unsigned long curMillis);
+    bool isRunning(Output output) const { return outputs[output].active; }
+
 private:
+    struct TimedOutput {
+        bool active;
+        unsigned long startMillis;
+        unsigned long runMillis;
+    };
+
     Utils& utils;
     Qwiic_Relay relay_mixer;
     Qwiic_Relay relay_drain;
+    TimedOutput outputs[NUM_OUTPUTS] = {};
+    uint8_t pumpPin = 0;  // Pin of the pump running in the background.
+
+    static const char* const OUTPUT_NAMES[NUM_OUTPUTS];
+
+    void switchOutput(Output output, bool on);
+    void finish(Output output, bool completed, unsigned long curMillis);
 };
 
 #endif // MIXERCONTROLS_H
@@ -29,6 +29,14 @@ public:
     float applyFilter(float reading, FilterType filterType = EWMA);
     void tareScale();
 
+    void startStream(float rateHz, uint8_t avgReadingSamples = 1, FilterType filterType = EWMA);
+    void stopStream();
+    void updateStream(unsigned long curMillis);
+    bool isStreaming() { return streaming; }
+    bool isScaleOn() { return scalePowered; }
+    void setBinaryFrames(bool enabled) { binaryFrames = enabled; }
+    bool usesBinaryFrames() { return binaryFrames; }
+
     static constexpr bool allowNegative = true;
     static constexpr uint8_t numReadings = 10;
     static const uint8_t numMeas;
@@ -49,6 +57,16 @@ private:
     float lpfFilterValue;
     bool settingsDetected;
     bool scaleRunning;
+    bool scalePowered = false;
+
+    bool streaming = false;
+    unsigned long streamIntervalMs = 50;
+    unsigned long lastStreamMillis = 0;
+    uint8_t streamSamples = 1;
+    FilterType streamFilter = EWMA;
+
+    bool binaryFrames = false;  // Send readings as binary frames instead of ASCII text.
+    void sendFrame(char kind, const void* value, unsigned long timestamp);
 };
 
 #endif // SCALECONTROLS_H
@@ -83,6 +101,14 @@ public:
     float applyFilter(float reading, FilterType filterType = EWMA);
     void tareScale();
 
+    void startStream(float rateHz, uint8_t avgReadingSamples = 1, FilterType filterType = EWMA);
+    void stopStream();
+    void updateStream(unsigned long curMillis);
+    bool isStreaming() { return streaming; }
+    bool isScaleOn() { return scalePowered; }
+    void setBinaryFrames(bool enabled) { binaryFrames = enabled; }
+    bool usesBinaryFrames() { return binaryFrames; }
+
     static constexpr bool allowNegative = true;
     static constexpr uint8_t numReadings = 10;
     static const uint8_t numMeas;
@@ -103,6 +129,16 @@ private:
     float lpfFilterValue;
     bool settingsDetected;
     bool scaleRunning;
+    bool scalePowered = false;
+
+    bool streaming = false;
+    unsigned long streamIntervalMs = 50;
+    unsigned long lastStreamMillis = 0;
+    uint8_t streamSamples = 1;
+    FilterType streamFilter = EWMA;
+
+    bool binaryFrames = false;  // Send readings as binary frames instead of ASCII text.
+    void sendFrame(char kind, const void* value, unsigned long timestamp);
 };
 
 #endif // SCALECONTROLS_H
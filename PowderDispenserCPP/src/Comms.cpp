@@ -6,6 +6,28 @@ unsigned long Comms::curMillis = 0;             // Tracks the current time in mi
 unsigned long Comms::prevReplyToPCmillis = 0;   // Tracks the last time a reply was sent to the PC.
 unsigned long Comms::replyToPCinterval = 1000;  // Interval (in milliseconds) for sending periodic replies to the PC.
 
+/**
+ * Checks whether an actuator command asks to run in the background.
+ * 
+ * Parameters:
+ * - `message` (const char*): The complete command, e.g. "Mix,5,1".
+ * - `fields` (byte): Number of comma-separated fields of the background form of the command.
+ * 
+ * Returns:
+ * - `true` if the command has `fields` fields and the last one is a non-zero flag.
+ */
+static bool runsInBackground(const char *message, byte fields) {
+    byte count = 1;
+    const char *last = message;
+    for (const char *c = message; *c; c++) {
+        if (*c == ',') {
+            count++;
+            last = c + 1;
+        }
+    }
+    return count == fields && atoi(last) != 0;
+}
+
 /**
  * Constructor for the Comms class.
  * 
@@ -79,7 +101,74 @@ void Comms::parseData() {
     char *token = strtok(inputBuffer, ",");  // Extract the first token (command).
 
     // Compare the command token and execute the corresponding operation.
-    if (strcmp(token, "Mix") == 0) {
+    if (strcmp(token, "Ping") == 0) {
+        // Report the scale power, dispenser, streaming and framing states so the PC can attach without a reset.
+        Serial.print("<Status:");
+        Serial.print(scaleControls.isScaleOn());
+        Serial.print(",");
+        Serial.print(dispenserControls.isDispenserEnabled());
+        Serial.print(",");
+        Serial.print(scaleControls.isStreaming());
+        Serial.print(",");
+        Serial.print(scaleControls.usesBinaryFrames());
+        Serial.println(">");
+        replyToPC();
+    } else if (strcmp(token, "Binary") == 0) {
+        // Send Weight, ADC and Stream readings as binary frames (1) or ASCII text (0); acknowledged in ASCII.
+        scaleControls.setBinaryFrames(atoi(strtok(NULL, ",")) != 0);
+        replyToPC();
+    } else if (strcmp(token, "Stream") == 0) {
+        float rateHz = atof(strtok(NULL, ","));              // Get the number of readings per second.
+        uint8_t avgReadingSamples = atoi(strtok(NULL, ","));  // Get the number of readings per sample.
+        FilterType filterType = ScaleControls::getFilterTypeFromString(strtok(NULL, ","));
+        replyToPC();
+        scaleControls.startStream(rateHz, avgReadingSamples, filterType);
+    } else if (strcmp(token, "StreamStop") == 0) {
+        scaleControls.stopStream();
+        replyToPC();
+    } else if ((strcmp(token, "Mix") == 0 || strcmp(token, "Drain") == 0 || strcmp(token, "Pump") == 0)
+               && runsInBackground(messageFromPC, strcmp(token, "Pump") == 0 ? 4 : 3)) {
+        // '<Mix,duration,1>', '<Drain,duration,1>' and '<Pump,pin,duration,1>' switch the output on and return at
+        // once; MixerControls::update() switches it off after the duration and sends '<Done:...>'.
+        if (strcmp(token, "Pump") == 0) {
+            int pin = atoi(strtok(NULL, ","));         // Get pin number.
+            float duration = atof(strtok(NULL, ","));  // Get duration.
+            mixerControls.startPump(pin, duration, curMillis);
+        } else {
+            float duration = atof(strtok(NULL, ","));  // Get duration.
+            MixerControls::Output output = (strcmp(token, "Mix") == 0) ? MixerControls::MIXER : MixerControls::DRAIN;
+            mixerControls.start(output, duration, curMillis);
+        }
+        replyToPC();
+    } else if (strcmp(token, "DispenseUntil") == 0) {
+        // '<DispenseUntil,target,stopAt,stepsPerGram,maxChunk,minChunk,settleMs,dir>': dose by weight on the board.
+        float target = atof(strtok(NULL, ","));
+        float stopAt = atof(strtok(NULL, ","));
+        float stepsPerGram = atof(strtok(NULL, ","));
+        int maxChunk = atoi(strtok(NULL, ","));
+        int minChunk = atoi(strtok(NULL, ","));
+        unsigned long settleMs = atol(strtok(NULL, ","));
+        int dir = atoi(strtok(NULL, ","));
+        dispenserControls.dispenseUntil(scaleControls, target, stopAt, stepsPerGram, maxChunk, minChunk, settleMs, dir);
+        replyToPC();
+    } else if (strcmp(token, "Feed") == 0) {
+        // '<Feed,stepsPerSecond,dir,maxSteps>': turn the auger continuously, or change the rate of the running feed.
+        float rate = atof(strtok(NULL, ","));
+        int dir = atoi(strtok(NULL, ","));
+        long maxSteps = atol(strtok(NULL, ","));
+        dispenserControls.setFeedRate(rate, dir, maxSteps, micros());
+        replyToPC();
+    } else if (strcmp(token, "FeedStop") == 0) {
+        // End the feed; '<Fed:...>' reports its steps before the acknowledgement.
+        if (dispenserControls.isFeeding()) {
+            dispenserControls.stopFeed(false);
+        }
+        replyToPC();
+    } else if (strcmp(token, "Stop") == 0) {
+        // Stop the named background output ('Mix', 'Drain' or 'Pump'), or all of them.
+        mixerControls.stop(strtok(NULL, ","), curMillis);
+        replyToPC();
+    } else if (strcmp(token, "Mix") == 0) {
         float duration = atof(strtok(NULL, ","));  // Get duration from the command.
         mixerControls.run(mixerControls.getMixerRelay(), duration);
         replyToPC();
@@ -68,6 +68,9 @@ void DispenserControls::enableDispenser() {
  * - Updates the `dispenserEnabled` flag to `false`.
  */
 void DispenserControls::disableDispenser() {
+    if (isFeeding()) {
+        stopFeed(false);        // A disabled driver would ignore the steps.
+    }
     Dispenser.disable();        // Deactivate the dispenser driver.
     dispenserEnabled = false;   // Update the enabled state.
 }
@@ -115,3 +118,160 @@ void DispenserControls::changeDir(int dir) {
 void DispenserControls::dispense(int steps, int dir) {
     Dispenser.stepSerial(steps, dir);  // Command the dispenser to step.
 }
+
+/**
+ * Sends the weight and step count of a DispenseUntil dose to the PC.
+ * 
+ * Parameters:
+ * - `frame` (const char*): Frame type, "Progress" or "Dosed".
+ * - `weight` (float): Current weight in grams.
+ * - `steps` (long): Steps dispensed so far.
+ * - `last` (unsigned long): `millis()` for progress frames, the end reason for the final frame.
+ */
+static void sendDoseFrame(const char *frame, float weight, long steps, unsigned long last) {
+    Serial.print("<");
+    Serial.print(frame);
+    Serial.print(":");
+    Serial.print(weight, Utils::getDecimal());
+    Serial.print(",");
+    Serial.print(steps);
+    Serial.print(",");
+    Serial.print(last);
+    Serial.println(">");
+}
+
+/**
+ * Dispenses until the scale reaches a weight, checking the scale between bursts on the board instead of
+ * waiting for a command from the PC after each one.
+ * 
+ * Parameters:
+ * - `scale` (ScaleControls&): The scale to read.
+ * - `target` (float): Target weight in grams.
+ * - `stopAt` (float): Weight in grams at which dispensing stops (at most `target`).
+ * - `stepsPerGram` (float): Auger calibration, used to size the bursts.
+ * - `maxChunk` (int): Largest burst in steps.
+ * - `minChunk` (int): Smallest burst in steps.
+ * - `settleMs` (unsigned long): Wait after each burst for the powder to land and the scale to settle.
+ * - `dir` (int): Dispensing direction.
+ * 
+ * Behavior:
+ * - Each burst aims for half of the remaining mass (bounded by `minChunk` and `maxChunk`), so the dose
+ *   approaches the target from below while powder in flight and filter lag catch up.
+ * - Sends '<Progress:weight,steps,millis>' after every weight check and '<Dosed:weight,steps,reason>' at the end.
+ * - Stops after twice the expected number of steps, or as soon as a new command arrives from the PC.
+ * 
+ * Returns:
+ * - `DOSE_REACHED`, `DOSE_STEP_LIMIT` or `DOSE_INTERRUPTED`.
+ */
+uint8_t DispenserControls::dispenseUntil(ScaleControls& scale, float target, float stopAt, float stepsPerGram,
+                                         int maxChunk, int minChunk, unsigned long settleMs, int dir) {
+    long limit = (long)(2 * target * stepsPerGram) + maxChunk;  // Guards against an empty hopper or a blocked auger.
+    long steps = 0;
+    uint8_t reason;
+    float weight = scale.convertToWeight(scale.getReading(DOSE_SAMPLES, NONE));
+    while (true) {
+        sendDoseFrame("Progress", weight, steps, millis());
+        if (weight >= stopAt) {
+            reason = DOSE_REACHED;
+            break;
+        }
+        if (steps >= limit) {
+            reason = DOSE_STEP_LIMIT;
+            break;
+        }
+        if (Serial.available() > 0) {
+            reason = DOSE_INTERRUPTED;  // The PC wants the board back; the command is read after the reply.
+            break;
+        }
+        long chunk = constrain((long)((target - weight) * stepsPerGram * 0.5), (long)minChunk, (long)maxChunk);
+        dispense(chunk, dir);
+        steps += chunk;
+        delay(settleMs);  // Let the powder land and the load cell settle.
+        weight = scale.convertToWeight(scale.getReading(DOSE_SAMPLES, NONE));
+    }
+    sendDoseFrame("Dosed", weight, steps, reason);
+    return reason;
+}
+
+/**
+ * Starts turning the auger continuously, or changes the speed of a running feed without stopping it.
+ * 
+ * Parameters:
+ * - `stepsPerSecond` (float): Step rate; 0 or less stops the feed.
+ * - `dir` (int): Dispensing direction.
+ * - `maxSteps` (long): Steps after which the feed stops by itself, counted from the start of the feed;
+ *   0 for no limit. Guards against a lost connection or an empty hopper.
+ * - `curMicros` (unsigned long): Current `micros()`.
+ * 
+ * Behavior:
+ * - The steps are taken by `updateFeed()` from `loop()`, so commands, streamed readings and background
+ *   actuators keep being served while the auger turns.
+ * - A new rate applies from the next step on; the step count and the limit carry over.
+ */
+void DispenserControls::setFeedRate(float stepsPerSecond, int dir, long maxSteps, unsigned long curMicros) {
+    if (stepsPerSecond <= 0) {
+        if (isFeeding()) {
+            stopFeed(false);
+        }
+        return;
+    }
+    if (!isFeeding()) {
+        feedSteps = 0;
+        lastFeedMicros = curMicros;
+    }
+    feedRate = stepsPerSecond;
+    feedDir = dir;
+    feedLimit = maxSteps;
+}
+
+/**
+ * Stops a continuous feed and reports it to the PC as '<Fed:steps,completed,millis>'.
+ * 
+ * Parameters:
+ * - `completed` (bool): True if the feed reached its step limit, false if it was stopped.
+ */
+void DispenserControls::stopFeed(bool completed) {
+    feedRate = 0;
+    Serial.print("<Fed:");
+    Serial.print(feedSteps);
+    Serial.print(",");
+    Serial.print(completed);
+    Serial.print(",");
+    Serial.print(millis());
+    Serial.println(">");
+}
+
+/**
+ * Takes the steps of a continuous feed that are due. Called from `loop()`.
+ * 
+ * Parameters:
+ * - `curMicros` (unsigned long): Current `micros()`.
+ * 
+ * Behavior:
+ * - Takes at most `FEED_MAX_BURST` steps per call, so a fast feed does not hold up the loop. If the loop was
+ *   held up for longer (e.g. by a blocking command), the missed steps are dropped instead of being caught up.
+ */
+void DispenserControls::updateFeed(unsigned long curMicros) {
+    if (!isFeeding()) {
+        return;
+    }
+    float stepMicros = 1000000.0 / feedRate;
+    long due = (long)((curMicros - lastFeedMicros) / stepMicros);
+    if (due <= 0) {
+        return;
+    }
+    if (due > FEED_MAX_BURST) {
+        due = FEED_MAX_BURST;
+        lastFeedMicros = curMicros;  // Drop the backlog.
+    } else {
+        lastFeedMicros += (unsigned long)(due * stepMicros);
+    }
+    if (feedLimit > 0 && feedSteps + due > feedLimit) {
+        due = feedLimit - feedSteps;
+    }
+    dispense(due, feedDir);
+    feedSteps += due;
+    if (feedLimit > 0 && feedSteps >= feedLimit) {
+        stopFeed(true);
+    }
+}
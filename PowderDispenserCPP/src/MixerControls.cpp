@@ -1,5 +1,8 @@
 #include "MixerControls.h"
 
+// Names of the background outputs in '<Started:...>' and '<Done:...>' frames and in '<Stop,...>'.
+const char* const MixerControls::OUTPUT_NAMES[MixerControls::NUM_OUTPUTS] = {"Mix", "Drain", "Pump"};
+
 /**
  * Constructor for the MixerControls class.
  * 
@@ -94,3 +97,128 @@ void MixerControls::runPump(uint8_t pin, float runTime) {
     delay(runTime * 1000);      // Wait for the specified duration in milliseconds.
     digitalWrite(pin, LOW);     // Turn the pump off.
 }
+
+/**
+ * Switches a background output on or off.
+ * 
+ * Parameters:
+ * - `output` (Output): The mixer relay, the drain relay or the pump pin.
+ * - `on` (bool): `true` to switch it on.
+ */
+void MixerControls::switchOutput(Output output, bool on) {
+    if (output == PUMP) {
+        digitalWrite(pumpPin, on ? HIGH : LOW);
+    } else {
+        Qwiic_Relay &relay = (output == MIXER) ? relay_mixer : relay_drain;
+        if (on) {
+            relay.turnRelayOn();
+        } else {
+            relay.turnRelayOff();
+        }
+    }
+}
+
+/**
+ * Starts running an output for a specified duration without blocking the loop.
+ * 
+ * Parameters:
+ * - `output` (Output): `MIXER` or `DRAIN` (use `startPump()` for the pump).
+ * - `runTime` (float): Duration to run the output, in seconds.
+ * - `curMillis` (unsigned long): The current time from `millis()`.
+ * 
+ * Behavior:
+ * - Ends a run of the same output that is still in progress, reporting it as stopped.
+ * - Switches the output on and sends '<Started:name,runMillis>'.
+ * - `update()` switches it off once the duration has passed.
+ */
+void MixerControls::start(Output output, float runTime, unsigned long curMillis) {
+    if (outputs[output].active) {
+        finish(output, false, curMillis);  // A new run replaces the current one.
+    }
+    outputs[output].active = true;
+    outputs[output].startMillis = curMillis;
+    outputs[output].runMillis = (unsigned long)(runTime * 1000);
+    switchOutput(output, true);
+    Serial.print("<Started:");
+    Serial.print(OUTPUT_NAMES[output]);
+    Serial.print(",");
+    Serial.print(outputs[output].runMillis);
+    Serial.println(">");
+}
+
+/**
+ * Starts running the pump on a pin for a specified duration without blocking the loop.
+ * 
+ * Parameters:
+ * - `pin` (uint8_t): The pin number connected to the pump relay.
+ * - `runTime` (float): Duration to run the pump, in seconds.
+ * - `curMillis` (unsigned long): The current time from `millis()`.
+ */
+void MixerControls::startPump(uint8_t pin, float runTime, unsigned long curMillis) {
+    if (outputs[PUMP].active) {
+        finish(PUMP, false, curMillis);  // Only one pump runs in the background at a time.
+    }
+    pumpPin = pin;
+    start(PUMP, runTime, curMillis);
+}
+
+/**
+ * Switches an output off and reports the end of its run to the PC.
+ * 
+ * Parameters:
+ * - `output` (Output): The output to switch off.
+ * - `completed` (bool): `true` if the run lasted its full duration, `false` if it was stopped early.
+ * - `curMillis` (unsigned long): The current time from `millis()`.
+ * 
+ * Behavior:
+ * - Sends '<Done:name,completed,millis>'.
+ */
+void MixerControls::finish(Output output, bool completed, unsigned long curMillis) {
+    switchOutput(output, false);
+    outputs[output].active = false;
+    Serial.print("<Done:");
+    Serial.print(OUTPUT_NAMES[output]);
+    Serial.print(",");
+    Serial.print(completed);
+    Serial.print(",");
+    Serial.print(curMillis);
+    Serial.println(">");
+}
+
+/**
+ * Stops background outputs before their duration has passed.
+ * 
+ * Parameters:
+ * - `name` (const char*): "Mix", "Drain" or "Pump", or `NULL` to stop all outputs.
+ * - `curMillis` (unsigned long): The current time from `millis()`.
+ * 
+ * Returns:
+ * - `true` if `name` is `NULL` or a known output, `false` otherwise.
+ */
+bool MixerControls::stop(const char *name, unsigned long curMillis) {
+    bool known = (name == NULL);
+    for (uint8_t i = 0; i < NUM_OUTPUTS; i++) {
+        if (name == NULL || strcmp(name, OUTPUT_NAMES[i]) == 0) {
+            known = true;
+            if (outputs[i].active) {
+                finish((Output)i, false, curMillis);
+            }
+        }
+    }
+    return known;
+}
+
+/**
+ * Switches off the background outputs whose duration has passed. Called from `loop()`.
+ * 
+ * Parameters:
+ * - `curMillis` (unsigned long): The current time from `millis()`.
+ */
+void MixerControls::update(unsigned long curMillis) {
+    for (uint8_t i = 0; i < NUM_OUTPUTS; i++) {
+        // Subtracting the start time keeps the comparison correct when millis() wraps around.
+        if (outputs[i].active && curMillis - outputs[i].startMillis >= outputs[i].runMillis) {
+            finish((Output)i, true, curMillis);
+        }
+    }
+}
@@ -1,4 +1,5 @@
 #include "ScaleControls.h"
+#include <util/crc16.h>
 
 // Definitions for static constants and variables.
 const uint8_t ScaleControls::numMeas = 10;  // Default number of measurements.
@@ -72,6 +73,7 @@ void ScaleControls::setupScale(int sampleRate, int gain, int ldoVoltage) {
     // Mark the scale as running and power it down.
     scaleRunning = true;
     Scale.powerDown();
+    scalePowered = false;
 }
 
 /**
@@ -79,6 +81,7 @@ void ScaleControls::setupScale(int sampleRate, int gain, int ldoVoltage) {
  */
 void ScaleControls::scaleOn() {
     Scale.powerUp();
+    scalePowered = true;
 }
 
 /**
@@ -86,6 +89,7 @@ void ScaleControls::scaleOn() {
  */
 void ScaleControls::scaleOff() {
     Scale.powerDown();
+    scalePowered = false;
 }
 
 /**
@@ -171,3 +175,117 @@ float ScaleControls::getReading(uint8_t avgReadingSamples, FilterType filterType
     }
     return sum / avgReadingSamples;  // Return the average.
 }
+
+
+/**
+ * Starts streaming weight readings to the PC at a fixed rate.
+ * Parameters:
+ * - `rateHz` (float): Number of readings per second. The effective rate is limited by the scale's
+ *   sample rate divided by `avgReadingSamples`.
+ * - `avgReadingSamples` (uint8_t): Number of readings averaged per streamed sample.
+ * - `filterType` (FilterType): The type of filter to apply to each reading.
+ */
+void ScaleControls::startStream(float rateHz, uint8_t avgReadingSamples, FilterType filterType) {
+    if (rateHz <= 0) {
+        stopStream();
+        return;
+    }
+    streamIntervalMs = (unsigned long)(1000.0 / rateHz);
+    streamSamples = avgReadingSamples > 0 ? avgReadingSamples : 1;
+    streamFilter = filterType;
+    lastStreamMillis = millis() - streamIntervalMs;  // Send the first sample right away.
+    streaming = true;
+}
+
+/**
+ * Stops streaming weight readings.
+ */
+void ScaleControls::stopStream() {
+    streaming = false;
+}
+
+/**
+ * Sends one streamed weight reading if streaming is active and the interval has elapsed.
+ * Called from `loop()`, so streaming does not block command handling.
+ * Parameters:
+ * - `curMillis` (unsigned long): The current time in milliseconds.
+ *
+ * Behavior:
+ * - Sends `<Stream:weight,millis>` with the weight in grams and the time the reading was taken,
+ *   or a binary 'S' frame with the same content in binary mode.
+ */
+void ScaleControls::updateStream(unsigned long curMillis) {
+    if (!streaming || curMillis - lastStreamMillis < streamIntervalMs) {
+        return;
+    }
+    lastStreamMillis = curMillis;
+
+    float weight = convertToWeight(getReading(streamSamples, streamFilter, streamIntervalMs));
+    if (binaryFrames) {
+        sendFrame('S', &weight, curMillis);
+        return;
+    }
+    Serial.print("<Stream:");
+    Serial.print(weight, Utils::getDecimal());
+    Serial.print(",");
+    Serial.print(curMillis);
+    Serial.println(">");
+}
+
+/**
+ * Sends a reading as a binary frame instead of ASCII text (see `setBinaryFrames`).
+ * Parameters:
+ * - `kind` (char): 'W' (weight), 'A' (raw ADC) or 'S' (streamed weight).
+ * - `value` (const void*): The 4-byte value: a float in grams, or an int32 ADC reading.
+ * - `timestamp` (unsigned long): `millis()` when the reading was taken.
+ *
+ * Behavior:
+ * - Sends 0xA5, the kind, the payload length (8), the value and the timestamp (little-endian, as stored
+ *   on the AVR) and the CRC-16/XMODEM of kind, length and payload: 13 bytes instead of up to 23.
+ */
+void ScaleControls::sendFrame(char kind, const void* value, unsigned long timestamp) {
+    uint8_t frame[13];
+    frame[0] = 0xA5;
+    frame[1] = kind;
+    frame[2] = 8;
+    memcpy(frame + 3, value, 4);
+    memcpy(frame + 7, &timestamp, 4);
+    uint16_t crc = 0;
+    for (uint8_t i = 1; i < 11; i++) {
+        crc = _crc_xmodem_update(crc, frame[i]);
+    }
+    memcpy(frame + 11, &crc, 2);
+    Serial.write(frame, sizeof(frame));
+}
+
+/**
+ * Measures the weight and sends it to the PC as `<Weight:grams>`, or as a binary 'W' frame in binary mode.
+ * Parameters: see `getReading`.
+ */
+void ScaleControls::sendWeight(uint8_t avgReadingSamples, FilterType filterType, unsigned long timeout_ms) {
+    float weight = convertToWeight(getReading(avgReadingSamples, filterType, timeout_ms));
+    if (binaryFrames) {
+        sendFrame('W', &weight, millis());
+        return;
+    }
+    Serial.print("<Weight:");
+    Serial.print(weight, Utils::getDecimal());
+    Serial.println(">");
+}
+
+/**
+ * Measures the raw ADC reading and sends it to the PC as `<ADC:counts>`, or as a binary 'A' frame with the
+ * reading rounded to whole counts in binary mode.
+ * Parameters: see `getReading`.
+ */
+void ScaleControls::sendRaw(uint8_t avgReadingSamples, FilterType filterType, unsigned long timeout_ms) {
+    float raw = getReading(avgReadingSamples, filterType, timeout_ms);
+    if (binaryFrames) {
+        int32_t counts = lround(raw);
+        sendFrame('A', &counts, millis());
+        return;
+    }
+    Serial.print("<ADC:");
+    Serial.print(raw, 2);
+    Serial.println(">");
+}
@@ -59,6 +59,15 @@ void loop() {
     // Check for and process any incoming data from the PC.
     comms.getDataFromPC();
 
+    // Push a weight reading to the PC if streaming mode is active.
+    scaleControls.updateStream(millis());
+
+    // Switch off the mixer, drain and pump once their background runs have finished.
+    mixerControls.update(millis());
+
+    // Take the steps of a continuous auger feed that are due.
+    dispenserControls.updateFeed(micros());
+
     // Placeholder for replying to the PC (commented out).
     // replyToPC();
 }
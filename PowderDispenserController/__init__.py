@@ -6,7 +6,15 @@ ensuring that all necessary components are available for use when the package is
 
 Imports:
     - PowderDispenseController: The main controller class responsible for managing powder dispensing operations.
+    - AsyncPowderDispenseController: An asyncio variant of the controller for driving many rigs from one event loop.
+    - DispenserFleet: Manages several dispensers connected to one PC as a group.
+    - Recipe, RecipeScheduler: Run recipes as graphs of steps, overlapping steps that use different resources.
     - Utility functions for serial port detection, configuration management, and log handling.
+    - Logging switches: the package logs through a queue-backed pipeline, see `logconfig`.
+
+The asyncio controller, the fleet and the scheduler are imported when they are first accessed, as loading asyncio takes longer
+than the rest of the package; heavy dependencies (numpy, pandas, scipy, pyarrow) are likewise imported only by the
+functions that need them, so `import PowderDispenserController` stays fast.
 
 Attributes:
     __all__: A list of public objects exposed by this module. These objects represent the components
@@ -17,15 +25,43 @@ Attributes:
 from .controller import PowderDispenseController
 
 # Import utility functions for managing serial ports and configurations.
-from .utils import list_serial_ports, get_serial_port
+from .utils import list_serial_ports, get_serial_port, get_serial_ports
+
+# Import the logging configuration functions.
+from .logconfig import configure_logging, set_command_logging
 
 # Define the list of public objects exposed by this module.
 __all__ = [
     'PowderDispenseController',  # Main powder dispensing controller.
+    'AsyncPowderDispenseController',  # Asyncio variant of the controller.
+    'DispenserFleet',            # Group of dispensers operated concurrently.
+    'Recipe',                    # DAG of steps for the recipe scheduler.
+    'RecipeScheduler',           # Runs recipes, overlapping independent steps.
     'list_serial_ports',         # Function to list available serial ports.
     'get_serial_port',           # Function to retrieve a serial port.
+    'get_serial_ports',          # Function to retrieve all USB serial ports.
     'read_logfile',              # Utility function to read log files (if defined elsewhere).
     'write_to_logfile',          # Utility function to write to log files (if defined elsewhere).
     'get_config',                # Function to retrieve the system's configuration.
-    'save_config'                # Function to save the updated configuration.
+    'save_config',               # Function to save the updated configuration.
+    'configure_logging',         # Function to set the level, destinations and format of the logs.
+    'set_command_logging'        # Function to switch the per-command log messages on or off.
 ]
+
+# Classes imported on first access, see __getattr__.
+_LAZY_IMPORTS = {
+    'AsyncPowderDispenseController': '.async_controller',
+    'DispenserFleet': '.fleet',
+    'Recipe': '.scheduler',
+    'RecipeScheduler': '.scheduler',
+}
+
+
+def __getattr__(name):
+    # Imports the lazily loaded classes when they are first accessed (PEP 562).
+    if name in _LAZY_IMPORTS:
+        import importlib
+        value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value  # Later accesses no longer go through __getattr__.
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,929 @@
+"""
+This module defines the AsyncPowderDispenseController class, an asyncio variant of PowderDispenseController.
+
+The serial port is read from the event loop itself (`loop.add_reader` on the port's file descriptor), so a
+single event loop can drive many rigs concurrently without a thread per rig, and the waits between steps of
+the sequences wait for the scale to settle without blocking the loop.
+
+Classes:
+    AsyncSerialLink - Event-loop driven serial transport routing received frames into per-type queues.
+    AsyncPowderDispenseController - Asynchronous controller with the same method surface as PowderDispenseController.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+import serial
+
+from .comms import ActuatorDone, FrameBuffer, MessageQueues, drive_async, parse_status, reading_value
+from .binary import NEGOTIATION_TIMEOUT
+from .controller import ControllerSettings, command_logger
+from .dispense import DispenseReport
+from .instrumentation import CommandStats
+from .pipeline import RX_WINDOW, CommandBatch
+from .utils import set_hangup_on_close
+from .stream import WeightStream, parse_stream_sample
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSerialLink(MessageQueues):
+    """
+    Reads frames from a serial port on the asyncio event loop and routes them by type, with the same
+    sequence-number semantics as `MessageDispatcher` (see MessageQueues).
+
+    On platforms where the port exposes a file descriptor the loop is notified when data arrives;
+    otherwise (e.g. Windows COM ports) the port is polled every `poll_interval` seconds.
+
+    Parameters:
+        ser (serial.Serial): The open serial port. It is switched to non-blocking reads.
+        queue_size (int): Maximum number of messages kept per type (default: 256).
+        poll_interval (float): Polling interval in seconds when no file descriptor is available (default: 0.01).
+    """
+    def __init__(self, ser, queue_size=256, poll_interval=0.01) -> None:
+        super().__init__(queue_size)
+        self.ser = ser
+        self.ser.timeout = 0  # Reads return immediately with whatever is available.
+        self.poll_interval = poll_interval
+        self.buffer = FrameBuffer()
+        self._loop = None
+        self._fd = None
+        self._poller = None
+        self._changed = None
+
+    def start(self):
+        """
+        Starts reading from the port on the running event loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._changed = self._loop.create_future()
+        try:
+            self._fd = self.ser.fileno()
+            self._loop.add_reader(self._fd, self._on_readable)
+        except (AttributeError, NotImplementedError):
+            self._fd = None
+            self._poller = self._loop.create_task(self._poll())
+
+    def stop(self):
+        """
+        Stops reading from the port.
+        """
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    async def _poll(self):
+        while True:
+            self._on_readable()
+            await asyncio.sleep(self.poll_interval)
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except serial.SerialException as e:
+            self.error = e
+            self.stop()
+            self._notify()
+            return
+        if data and self.buffer.feed(data):
+            while len(self.buffer):
+                self._route(self.buffer.pop())
+            self._notify()
+
+    def _notify(self):
+        # Wake every waiter by resolving the current future and replacing it with a fresh one.
+        if not self._changed.done():
+            self._changed.set_result(None)
+        self._changed = self._loop.create_future()
+
+    async def wait_for(self, kind=None, after_seq=0, timeout=None):
+        """
+        Waits for the next message of a given type.
+
+        Parameters:
+            kind (str or tuple, optional): Message type(s) to wait for. Any type if None.
+            after_seq (int): Only messages with a higher sequence number are accepted (default: 0).
+            timeout (float, optional): Maximum time in seconds to wait. Waits indefinitely if None.
+
+        Returns:
+            Message: The oldest matching message.
+
+        Raises:
+            TimeoutError: If no matching message arrives within the timeout.
+        """
+        kinds = self._kinds(kind)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            msg, remaining = self._check(kinds, after_seq, deadline)
+            if msg is not None:
+                return msg
+            try:
+                await asyncio.wait_for(asyncio.shield(self._changed), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def subscribe(self, kind, callback):
+        """
+        Hands every future message of a type to `callback` instead of queueing it.
+        """
+        self.subscribers[kind] = callback
+
+    def unsubscribe(self, kind):
+        """
+        Removes the subscriber of a message type.
+        """
+        self.subscribers.pop(kind, None)
+
+    def write(self, data):
+        """
+        Writes bytes to the serial port.
+        """
+        self.ser.write(data)
+
+    def clear(self):
+        """
+        Discards all queued messages.
+        """
+        for queue in self.queues.values():
+            queue.clear()
+
+
+class AsyncPowderDispenseController(ControllerSettings):
+    """
+    Asynchronous counterpart of PowderDispenseController. Create it with `await AsyncPowderDispenseController.create(...)`,
+    which opens the port and waits for the Arduino's boot banner without blocking the event loop.
+
+    Parameters:
+        ser_port (str): The name of the serial port to connect to the hardware.
+        baud_rate (int): The baud rate for serial communication (default: 115200).
+        mixTime (float): Default mixing time in seconds (default: 10.0).
+        drainTime (float): Default draining time in seconds (default: 10.0).
+        defAugerType (str, optional): Default auger type (default: '8mm_base').
+        defPowderType (str, optional): Default powder type (default: 'dishwasher_salt').
+        config_file (str): Path to the configuration file (default: 'config.json').
+        log_file (str, optional): Path of the session log file (default: 'logs/log_<timestamp>.csv');
+                                  a '.parquet' path stores the log in columnar form.
+        instrument (bool): If True, records the latency, bytes and outcome of every command, see stats() (default: True).
+        config_overlay (str, optional): Per-rig file whose values replace those of `config_file`, and to which
+                                        calibration changes are saved instead (default: None).
+        fast_attach (bool): If True, connect() attaches to a running Arduino without resetting it, see attach() (default: False).
+        binary_frames (bool): If True, connect() asks the firmware to send scale readings as binary frames, falling
+                              back to ASCII if it does not support them, see set_binary_frames() (default: False).
+    """
+    _sleep = staticmethod(asyncio.sleep)  # Waits in the command sequences shared with the blocking controller.
+
+    def __init__(self, ser_port, baud_rate=115200, mixTime=10.0, drainTime=10.0, defAugerType=None, defPowderType=None, config_file='config.json', log_file=None, instrument=True, fast_attach=False, config_overlay=None, binary_frames=False) -> None:
+        self.ser_port = ser_port
+        self.log_file = log_file
+        self.baud_rate = baud_rate
+        self.fast_attach = fast_attach
+        self.binary_frames = binary_frames
+        self.binaryFrames = False  # Whether the firmware sends scale readings as binary frames; ASCII after a reset.
+        self.binarySupport = None  # Whether the firmware supports binary frames; None until known.
+        self.ser = None
+        self.link = None
+        self.last_command_seq = 0
+        self.command_count = 0  # Number of commands sent since the controller was created.
+        self.weightStream = None
+        self.weightStreaming = None  # Whether the firmware supports Stream; None until known.
+        self._lock = asyncio.Lock()  # Serializes command/reply exchanges on this rig.
+        self._actuator_runs = {'Mix': deque(), 'Drain': deque(), 'Pump': deque()}  # Pending background runs, oldest first.
+        self.backgroundActuators = None  # Whether the firmware runs Mix, Drain and Pump in the background; None until known.
+        self.deviceDosing = None  # Whether the firmware supports DispenseUntil; None until known.
+        self.continuousFeed = None  # Whether the firmware supports Feed and FeedStop; None until known.
+        self.feedRate = 0.0  # Step rate of the running continuous feed; 0 while the auger stands still.
+        self.lastFeed = None  # FeedEnd of the latest continuous feed.
+        self.instrumentation = CommandStats() if instrument else None  # Per-command latency histograms, see stats().
+
+        # Load the configuration file and store settings.
+        self._load_settings(config_file, mixTime, drainTime, defAugerType, defPowderType, config_overlay)
+
+        # Scale and stepper states are forced off (or adopted from the firmware when attaching fast) in connect().
+        self.isScaleOn = True
+        self.isStepperOn = True
+
+    @classmethod
+    async def create(cls, ser_port, **kwargs):
+        """
+        Creates a controller and connects it to the Arduino.
+
+        Parameters:
+            ser_port (str): The name of the serial port to connect to the hardware.
+            **kwargs: Further arguments passed to the constructor.
+
+        Returns:
+            AsyncPowderDispenseController: The connected controller.
+        """
+        controller = cls(ser_port, **kwargs)
+        await controller.connect()
+        return controller
+
+    async def connect(self):
+        """
+        Opens the serial port, waits for the Arduino to signal readiness, and switches the stepper and scale off.
+        With `fast_attach`, attaches to the running firmware instead, see attach().
+        """
+        self.ser = serial.Serial(self.ser_port, self.baud_rate, timeout=0)
+        logger.info("Serial port %s opened at baud rate %s", self.ser_port, self.baud_rate)
+        kept_dtr = set_hangup_on_close(self.ser, not self.fast_attach) is False  # Opening did not reset the board.
+        self.link = AsyncSerialLink(self.ser)
+        self.link.start()
+        self.link.subscribe('Done', self._on_actuator_done)
+        self.link.subscribe('Fed', self._on_feed_end)
+
+        if self.fast_attach or kept_dtr:
+            await self.attach()
+        else:
+            await self.wait_for_arduino()
+        if not self.fast_attach:
+            await self.disableStepper()  # Ensure stepper motor is disabled initially.
+            await self.scaleOff()  # Ensure scale is powered off initially.
+        await self.set_binary_frames(self.binary_frames)  # Negotiate the format of the scale readings.
+
+        # Name the log file of this session; it is created with the first row written.
+        self._create_log_file(self.log_file)
+
+    async def close(self):
+        """
+        Stops reading from the port, closes it, flushes the session log and saves pending configuration changes.
+        """
+        if self.link is not None:
+            self.link.stop()
+        if self.ser is not None:
+            self.ser.close()
+        self._cancel_actuator_runs()
+        self._close_log()
+        self.config_store.close()
+
+    async def __aenter__(self):
+        if self.link is None:
+            await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    ### COMMS #####################
+    def send_to_arduino(self, send_str):
+        """
+        Sends a specified string to the connected Arduino device over the serial port.
+
+        Parameters:
+            send_str (str): The command string to send to the Arduino.
+        """
+        self.link.write(send_str.encode('utf-8'))
+
+    async def recv_from_arduino(self, timeout=None):
+        """
+        Receives the next message of any type from the Arduino.
+
+        Parameters:
+            timeout (int, optional): Maximum time in seconds to wait for a response.
+
+        Returns:
+            str: The string received from the Arduino.
+        """
+        timeout = timeout or self.DEFAULT_timeout
+        return (await self.link.wait_for(timeout=timeout)).text
+
+    async def wait_for_arduino(self):
+        """
+        Waits for the readiness message the Arduino sends once it has booted.
+        """
+        msg = await self.link.wait_for('Ready', timeout=None)
+        logger.info(msg.text)
+
+    async def ping(self, timeout=None):
+        """
+        Asks the firmware for its state with a 'Ping' command, which has no side effects.
+
+        Parameters:
+            timeout (float, optional): Maximum time in seconds to wait for the reply (default: DEFAULT_timeout).
+
+        Returns:
+            RigStatus: Whether the scale is powered, the stepper is enabled and weights are being streamed.
+        """
+        timeout = timeout or self.DEFAULT_timeout
+        # Like _exchange(), but the reading that follows the acknowledgement is a status rather than a number.
+        async with self._lock:
+            self.last_command_seq = self.link.last_seq
+            rx_mark = self.link.buffer.bytes_received
+            sent_at = time.monotonic()
+            try:
+                self.send_to_arduino("<Ping>")
+                command_logger.info("Sent from PC -- COMMAND -- %s", "<Ping>")
+                ack = await self.link.wait_for('Msg', after_seq=self.last_command_seq, timeout=timeout)
+            except Exception as e:
+                self._record_command(self.link.buffer, "<Ping>", sent_at, rx_mark, None, 'timeout' if isinstance(e, TimeoutError) else 'error')
+                raise
+            self._record_command(self.link.buffer, "<Ping>", sent_at, rx_mark, ack, 'ok')
+            msg = await self.link.wait_for('Status', after_seq=self.last_command_seq, timeout=timeout)
+        return parse_status(msg)
+
+    async def attach(self, timeout=None, interval=0.25):
+        """
+        Attaches to a running Arduino without resetting it: pings it until it answers and adopts the reported
+        scale and stepper state. A weight stream left running by a previous session is stopped.
+
+        Parameters:
+            timeout (float, optional): Maximum time in seconds to wait for the firmware (default: DEFAULT_timeout).
+            interval (float): Time in seconds to wait for each ping's reply before sending another (default: 0.25).
+
+        Returns:
+            RigStatus: The state reported by the firmware.
+
+        Raises:
+            TimeoutError: If the firmware does not answer, e.g. because it does not support 'Ping'.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.DEFAULT_timeout)
+        while True:
+            try:
+                status = await self.ping(timeout=min(interval, max(deadline - loop.time(), 0.01)))
+                break
+            except TimeoutError:
+                if loop.time() >= deadline:
+                    raise TimeoutError("No reply to 'Ping'; the firmware may be too old to attach to without a reset.") from None
+
+        self.isScaleOn = bool(status.scale_on)
+        self.isStepperOn = bool(status.stepper_on)
+        self.binaryFrames = bool(status.binary)
+        self.binarySupport = status.binary is not None  # Only firmware with binary frames reports a fourth flag.
+        self.weightStreaming = True  # The Status frame reports the streaming state, so the firmware knows Stream.
+        if status.streaming:
+            await self.run_command("<StreamStop>")  # Nobody consumes the stream of the previous session.
+        logger.info("Attached to running firmware: scale %s, stepper %s", 'on' if status.scale_on else 'off', 'on' if status.stepper_on else 'off')
+        return status
+
+    async def set_binary_frames(self, enabled=True, timeout=None):
+        """
+        Switches the scale readings (Weight, ADC and Stream) between binary frames and ASCII text, see
+        PowderDispenseController.set_binary_frames(). The readings stay ASCII if the firmware does not
+        acknowledge the request in time, or is known not to support it.
+
+        Parameters:
+            enabled (bool): True for binary frames, False for ASCII text (default: True).
+            timeout (float, optional): Maximum time in seconds to wait for the acknowledgement (default: NEGOTIATION_TIMEOUT).
+
+        Returns:
+            bool: Whether the firmware now sends binary frames.
+        """
+        enabled = bool(enabled)
+        if enabled == self.binaryFrames:
+            return enabled
+        if self.binarySupport is False:
+            logger.info("Firmware does not support binary frames; scale readings stay ASCII.")
+            return self.binaryFrames
+        try:
+            await self.run_command(f"<Binary,{int(enabled)}>", timeout=timeout or NEGOTIATION_TIMEOUT)
+        except TimeoutError:
+            logger.info("Firmware does not support binary frames; scale readings stay ASCII.")
+            self.binarySupport = False  # Not asked again on this connection.
+            return self.binaryFrames
+        self.binarySupport = True
+        self.binaryFrames = enabled
+        return enabled
+
+    async def run_command(self, command_str, timeout=None):
+        """
+        Sends a command string to the Arduino and waits for its acknowledgement.
+
+        Parameters:
+            command_str (str): The command string formatted specifically for the hardware.
+            timeout (float, optional): Maximum time in seconds to wait for the reply. Waits indefinitely if None.
+
+        Returns:
+            str: The reply received from the Arduino.
+        """
+        response, _ = await self._exchange(command_str, timeout)
+        return response
+
+    def batch(self, timeout=None):
+        """
+        Creates a CommandBatch that queues operations and runs them pipelined, see run_batch(). Use it with
+        `async with`, or await its `run()`.
+
+        Returns:
+            CommandBatch: The empty batch.
+        """
+        return CommandBatch(self, timeout)
+
+    async def run_batch(self, commands, timeout=None, window=RX_WINDOW):
+        """
+        Sends several commands back-to-back instead of waiting for each acknowledgement before sending the
+        next command. The acknowledgements are matched to the commands in order by their echoed text.
+
+        Parameters:
+            commands (list of str or BatchCommand): The commands, e.g. from a CommandBatch.
+            timeout (float, optional): Maximum time in seconds to wait for each acknowledgement of commands without
+                                       their own timeout, counted from the previous one. Waits indefinitely if None.
+            window (int): Maximum number of unacknowledged command bytes in flight (default: RX_WINDOW).
+
+        Returns:
+            list of BatchResult: One result per command, in order.
+        """
+        async with self._lock:
+            return await drive_async(self._batch_steps(self.link, self.link.buffer, commands, timeout, window))
+
+    async def _exchange(self, command_str, timeout=None, value_kind=None):
+        # Sends a command and waits for its acknowledgement and, if given, the '<value_kind:...>' reading that
+        # follows it. The lock keeps coroutines sharing this controller from interleaving their replies.
+        async with self._lock:
+            self.last_command_seq = self.link.last_seq
+            rx_mark = self.link.buffer.bytes_received
+            sent_at = time.monotonic()
+            try:
+                self.send_to_arduino(command_str)
+                self.command_count += 1
+                command_logger.info("Sent from PC -- COMMAND -- %s", command_str)
+                msg = await self.link.wait_for('Msg', after_seq=self.last_command_seq, timeout=timeout)
+            except Exception as e:
+                self._record_command(self.link.buffer, command_str, sent_at, rx_mark, None, 'timeout' if isinstance(e, TimeoutError) else 'error')
+                raise
+            self._record_command(self.link.buffer, command_str, sent_at, rx_mark, msg, 'ok')
+            response = msg.text
+            command_logger.info("Reply Received: %s", response)
+            value = await self._get_value(value_kind) if value_kind else None
+        return response, value
+
+    async def _get_value(self, kind):
+        # Returns the value of the next '<kind:...>' reading (ASCII or binary) received after the latest command.
+        msg = await self.link.wait_for(kind, after_seq=self.last_command_seq, timeout=self.DEFAULT_timeout)
+        value = reading_value(msg)
+        if value is None:
+            logger.warning("Error parsing %s from message: %s", kind, msg.text)
+        return value
+
+    async def get_raw(self):
+        """
+        Retrieves the raw ADC reading that follows an 'ADC' command.
+
+        Returns:
+            float: The raw ADC value.
+        """
+        return await self._get_value('ADC')
+
+    async def get_weight(self):
+        """
+        Retrieves the weight reading that follows a 'Meas' command.
+
+        Returns:
+            float: The weight in grams.
+        """
+        return await self._get_value('Weight')
+
+    ### Single Control Functions
+    async def dispense(self, amount_or_steps, direction=None, runSteps=False, augerType=None, powderType=None):
+        """
+        Controls the dispenser to dispense a specified amount or number of steps of powder.
+
+        Parameters:
+            amount_or_steps (float): The amount of powder to dispense in grams or the number of steps for the stepper motor.
+            direction (int, optional): The direction to dispense.
+            runSteps (bool, optional): If True, the input is treated as the number of steps; if False, as the amount in grams.
+            augerType (str, optional): The type of auger to use for the operation.
+            powderType (str, optional): The type of powder to be dispensed.
+        """
+        augerType = augerType or self.DEFAULT_augerType
+        powderType = powderType or self.DEFAULT_powderType
+        direction = direction or self.dispenseDir
+        neededSteps = amount_or_steps if runSteps else self._steps_for(amount_or_steps, augerType, powderType)
+        await self.run_command(f"<Dispense,{neededSteps},{direction}>")
+
+    async def enableStepper(self):
+        """
+        Enables the stepper motor, allowing it to be used for dispensing operations.
+        """
+        if not self.isStepperOn:
+            await self.run_command("<DispenserOn>")
+            self.isStepperOn = True
+
+    async def disableStepper(self):
+        """
+        Disables the stepper motor.
+        """
+        if self.isStepperOn:
+            await self.run_command("<DispenserOff>")  # Also ends a continuous feed.
+            self.isStepperOn = False
+
+    async def set_feed_rate(self, rate, direction=None, max_steps=None):
+        """
+        Turns the auger continuously at a step rate, or changes the rate of the running feed without stopping it,
+        see PowderDispenseController.set_feed_rate().
+
+        Raises:
+            RuntimeError: If the firmware does not support continuous feeding.
+        """
+        command_str, timeout = self._feed_command(rate, direction, max_steps)
+        if self.feedRate == 0:
+            self.lastFeed = None  # A new feed starts.
+        try:
+            await self.run_command(command_str, timeout=timeout)
+        except TimeoutError:
+            if self.continuousFeed is not None:
+                raise
+            self.continuousFeed = False
+            raise RuntimeError("The firmware does not support continuous feeding.") from None
+        self.continuousFeed = True
+        self.feedRate = max(rate, 0.0) if self.lastFeed is None else 0.0
+
+    async def stop_feed(self):
+        """
+        Stops the continuous feed.
+
+        Returns:
+            FeedEnd: The steps of the latest feed, or None if no feed ran since the last one was reported.
+        """
+        if self.continuousFeed:
+            await self.run_command("<FeedStop>", timeout=self.DEFAULT_timeout)
+            self.feedRate = 0.0
+        return self.lastFeed
+
+    async def measRaw(self, avgReadingSamples=100, filterType=None):
+        """
+        Measures and returns the raw sensor data from the scale.
+
+        Parameters:
+            avgReadingSamples (int, optional): The number of readings to average for noise reduction.
+            filterType (str, optional): The filter type to apply for smoothing the sensor data.
+
+        Returns:
+            float: The raw sensor data after optional filtering.
+        """
+        filterType = filterType or self.DEFAULT_filterType
+        _, adc_val = await self._exchange(f"<ADC,{avgReadingSamples},{filterType}>", value_kind='ADC')
+        return adc_val
+
+    async def measWeight(self, avgReadingSamples=100, filterType=None):
+        """
+        Measures and returns the calibrated weight from the scale.
+
+        Parameters:
+            avgReadingSamples (int, optional): The number of readings to average for noise reduction.
+            filterType (str, optional): The type of filtering to apply.
+
+        Returns:
+            float: The weight measured by the scale in grams.
+        """
+        filterType = filterType or self.DEFAULT_filterType
+        _, weight_val = await self._exchange(f"<Meas,{avgReadingSamples},{filterType}>", value_kind='Weight')
+        return weight_val
+
+    async def start_weight_stream(self, rate=20, avgReadingSamples=1, filterType=None, buffer_size=1024):
+        """
+        Switches the scale to streaming mode, in which the Arduino pushes weight readings continuously.
+
+        Parameters:
+            rate (float, optional): Number of readings per second (default: 20).
+            avgReadingSamples (int, optional): The number of readings the Arduino averages per streamed sample.
+            filterType (str, optional): The filter type to apply on the Arduino.
+            buffer_size (int, optional): Maximum number of samples kept for a slow consumer (default: 1024).
+
+        Returns:
+            WeightStream: Ring buffer receiving the samples; consume it with `async for`.
+
+        Raises:
+            RuntimeError: If the firmware does not support streaming mode.
+        """
+        if self.weightStreaming is False:
+            raise RuntimeError("The firmware does not support weight streaming.")
+        filterType = filterType or self.DEFAULT_filterType
+        await self.stop_weight_stream()
+        await self.scaleOn()
+
+        stream = WeightStream(buffer_size)
+        self.link.subscribe('Stream', lambda msg: stream.push(parse_stream_sample(msg)))
+        self.weightStream = stream
+        command_str = f"<Stream,{rate},{avgReadingSamples},{filterType}>"
+        if self.weightStreaming is None:
+            # Firmware without the command may acknowledge it all the same, so only a reading proves support.
+            try:
+                await self.run_command(command_str, timeout=NEGOTIATION_TIMEOUT)
+                self.weightStreaming = await stream.await_started(NEGOTIATION_TIMEOUT + 1.0 / rate)
+            except TimeoutError:
+                self.weightStreaming = False
+            if not self.weightStreaming:
+                logger.warning("Firmware does not support weight streaming; settling waits poll the scale with Meas instead.")
+                self.link.unsubscribe('Stream')
+                stream.close()
+                self.weightStream = None
+                raise RuntimeError("The firmware does not support weight streaming.")
+        else:
+            await self.run_command(command_str)
+        return stream
+
+    async def stop_weight_stream(self):
+        """
+        Stops streaming mode.
+        """
+        if self.weightStream is not None:
+            await self.run_command("<StreamStop>")
+            self.link.unsubscribe('Stream')
+            self.weightStream.close()
+            self.weightStream = None
+
+    async def stream_weights(self, rate=20, avgReadingSamples=1, filterType=None, buffer_size=1024):
+        """
+        Async generator yielding streamed weight samples; streaming stops when the generator is closed.
+        Wrap it in `contextlib.aclosing()` to stop streaming as soon as the loop is left.
+
+        Yields:
+            WeightSample: Timestamped weight readings in grams.
+        """
+        stream = await self.start_weight_stream(rate, avgReadingSamples, filterType, buffer_size)
+        try:
+            async for sample in stream:
+                yield sample
+        finally:
+            if self.weightStream is stream:
+                await self.stop_weight_stream()
+
+    async def wait_for_settle(self, window=None, max_slope=None, max_std=None, timeout=None):
+        """
+        Waits until the scale readings are stable, see `PowderDispenseController.wait_for_settle`.
+
+        Returns:
+            SettleResult: The mean weight of the final window, whether the scale settled and how long it took.
+        """
+        detector = self._settling_detector(window, max_slope, max_std, timeout)
+        stream = self.weightStream
+        if stream is not None:
+            stream.drain()
+            result = await detector.wait_async(stream)
+        else:
+            try:
+                stream = await self.start_weight_stream()
+            except RuntimeError:
+                result = await detector.poll_async(lambda: self.measWeight(avgReadingSamples=1))
+            else:
+                try:
+                    result = await detector.wait_async(stream)
+                finally:
+                    await self.stop_weight_stream()
+        if not result.settled:
+            logger.warning("Scale did not settle within %.1f s (slope %.4f g/s, std %.4f g); continuing at %s g.",
+                           result.elapsed, result.slope, result.std, result.weight)
+        return result
+
+    async def _settled_weight(self):
+        # Waits for the scale to settle and returns the mean weight of the final window, or a 'Meas' reading if
+        # no reading arrived while waiting.
+        result = await self.wait_for_settle()
+        return result.weight if result.weight is not None else await self.measWeight()
+
+    async def scaleOn(self, settle_time=None):
+        """
+        Turns on the scale and waits for it to settle.
+
+        Parameters:
+            settle_time (float, optional): Maximum time in seconds to wait for the scale to settle after turning
+                                           it on. Defaults to the configured settling timeout; 0 skips the wait.
+        """
+        if not self.isScaleOn:
+            await self.run_command("<ScaleOn>")
+            self.isScaleOn = True
+            if settle_time != 0:
+                await self.wait_for_settle(timeout=settle_time)
+
+    async def scaleOff(self):
+        """
+        Turns off the scale.
+        """
+        if self.isScaleOn:
+            await self.run_command("<ScaleOff>")
+            self.isScaleOn = False
+
+    async def tare(self):
+        """
+        Tares the scale, setting the current weight as the zero reference point.
+        """
+        await self.run_command("<Tare>")
+
+    async def _start_actuator(self, actuator, command_str, duration):
+        """
+        Sends a background actuator command such as '<Mix,5,1>' and returns an asyncio Future that is resolved by
+        the '<Done:...>' frame the firmware sends when the actuator stops, see
+        PowderDispenseController._start_actuator. With firmware that runs the command blocking, the Future is
+        already resolved.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # Registered before sending, as a short run may end before the reply is read; the lock hands out the port
+        # in the order of the calls, so the runs of an actuator are queued in the order of their commands.
+        self._actuator_runs[actuator].append(future)
+        try:
+            await self.run_command(command_str, timeout=duration + self.DEFAULT_timeout)
+        except BaseException:
+            self._end_actuator_run(actuator, future)
+            raise
+        try:
+            await self.link.wait_for('Started', after_seq=self.last_command_seq, timeout=0)
+            self.backgroundActuators = True
+        except TimeoutError:
+            self.backgroundActuators = False
+            self._end_actuator_run(actuator, future, ActuatorDone(actuator, True, None))
+        return future
+
+    async def start_pump(self, pump, volume=None, time=None):
+        """
+        Starts a pump for a set volume or time without waiting for it to finish.
+
+        Returns:
+            asyncio.Future: Resolves to an ActuatorDone when the pump stops.
+        """
+        pump_pin, pump_time = self._pump_time(pump, volume, time)
+        if pump_time <= 0:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(ActuatorDone('Pump', True, None))
+            return future
+        return await self._start_actuator('Pump', f"<Pump,{pump_pin},{pump_time},1>", pump_time)
+
+    async def start_mixer(self, duration=None):
+        """
+        Starts the mixer without waiting for it to finish.
+
+        Returns:
+            asyncio.Future: Resolves to an ActuatorDone when the mixer stops.
+        """
+        duration = duration or self.mixTime
+        return await self._start_actuator('Mix', f"<Mix,{duration},1>", duration)
+
+    async def start_drain(self, duration=None):
+        """
+        Starts draining without waiting for it to finish.
+
+        Returns:
+            asyncio.Future: Resolves to an ActuatorDone when the drain stops.
+        """
+        duration = duration or self.drainTime
+        return await self._start_actuator('Drain', f"<Drain,{duration},1>", duration)
+
+    async def start_flush(self, volume=None, time=None):
+        """
+        Starts a flush without waiting for it to finish.
+
+        Returns:
+            asyncio.Future: Resolves to an ActuatorDone when the flush pump stops.
+        """
+        return await self.start_pump('Flush', volume, time)
+
+    async def stop_actuators(self, actuator=None):
+        """
+        Stops background runs before their time is up. Their futures resolve with `completed` set to False.
+
+        Parameters:
+            actuator (str, optional): 'Mix', 'Drain' or 'Pump'; stops all of them if None.
+        """
+        if self.backgroundActuators is False:
+            return
+        await self.run_command(f"<Stop,{actuator}>" if actuator else "<Stop>", timeout=self.DEFAULT_timeout)
+
+    async def runPump(self, pump, volume=None, time=None):
+        """
+        Operates a specified pump to dispense a set volume or run for a set time.
+
+        Parameters:
+            pump (str): Identifier for the pump (e.g., 'Flush' or 'Drain').
+            volume (float, optional): Volume to dispense. Defaults to None.
+            time (float, optional): Time in seconds to run the pump. Defaults to None.
+
+        Returns:
+            ActuatorDone: How the run ended.
+        """
+        pump_time = self._pump_time(pump, volume, time)[1]
+        future = await self.start_pump(pump, volume, time)
+        return await asyncio.wait_for(future, pump_time + self.DEFAULT_timeout)
+
+    async def runMixer(self, duration=None):
+        """
+        Runs the mixer for a specified duration.
+
+        Parameters:
+            duration (float, optional): Time in seconds to run the mixer. Defaults to the configured mixing time.
+
+        Returns:
+            ActuatorDone: How the run ended.
+        """
+        duration = duration or self.mixTime
+        return await asyncio.wait_for(await self.start_mixer(duration), duration + self.DEFAULT_timeout)
+
+    async def runDrain(self, duration=None):
+        """
+        Runs the draining operation for a specified duration.
+
+        Parameters:
+            duration (float, optional): Time in seconds to drain. Defaults to the configured draining time.
+
+        Returns:
+            ActuatorDone: How the run ended.
+        """
+        duration = duration or self.drainTime
+        return await asyncio.wait_for(await self.start_drain(duration), duration + self.DEFAULT_timeout)
+
+    async def runFlush(self, volume=None, time=None):
+        """
+        Runs a flushing operation using the pump.
+
+        Parameters:
+            volume (float, optional): Volume to flush through the system. Defaults to None.
+            time (float, optional): Time in seconds to run the flush. Defaults to None.
+
+        Returns:
+            ActuatorDone: How the run ended.
+        """
+        return await self.runPump('Flush', volume, time)
+
+    ### Sequence Control Functions
+    async def reset(self, drainTime=None, flushTime=None):
+        """
+        Resets the dispensing system by running a drain operation followed by a flush and another drain.
+
+        Parameters:
+            drainTime (float, optional): The duration to run the drain operation. Defaults to the configured drain time.
+            flushTime (float, optional): The duration to run the flush operation. Defaults to the configured flush time.
+        """
+        drainTime = drainTime or self.drainTime
+        flushTime = flushTime or self.flushTime
+
+        await self.runDrain(drainTime)
+        await asyncio.sleep(1)
+        await self.runFlush(flushTime)
+        await asyncio.sleep(1)
+        await self.runDrain(drainTime)
+        await asyncio.sleep(1)
+
+    async def dispense_powder_seq(self, desired_amount):
+        """
+        Dispenses a specified amount of powder using real-time feedback from the scale, following the
+        same steps as `PowderDispenseController.dispense_powder_seq`.
+
+        Parameters:
+            desired_amount (float): The target amount of powder to dispense in grams.
+
+        Returns:
+            DispenseReport: Dispense time, final amount, overshoot and number of round trips.
+        """
+        start, start_commands, bursts, total_steps = time.perf_counter(), self.command_count, 1, 0
+        await self.scaleOn()
+        await self.tare()
+        try:
+            await self.start_weight_stream()  # One stream serves every settling wait of the sequence.
+        except RuntimeError:
+            pass  # wait_for_settle polls the scale instead.
+        try:
+            current_amount = await self._settled_weight()
+
+            await self.enableStepper()
+            initial_dispense_amount = desired_amount * 0.50  # Start with 50% of the desired amount.
+            await self.dispense(initial_dispense_amount, direction=self.dispenseDir, runSteps=False)
+            total_steps += self._steps_for(initial_dispense_amount, self.DEFAULT_augerType, self.DEFAULT_powderType)
+
+            # Iteratively dispense smaller amounts based on remaining weight.
+            for fraction, steps in ((0.80, 400), (0.97, 20), (0.99, 5)):
+                while current_amount < desired_amount * fraction:
+                    await self.dispense(steps, direction=self.dispenseDir, runSteps=True)
+                    bursts, total_steps = bursts + 1, total_steps + steps
+                    current_amount = await self._settled_weight()
+        finally:
+            await self.stop_weight_stream()
+
+        await self.disableStepper()
+        await self.scaleOff()
+        logger.info("Dispensing complete.")
+        return DispenseReport(desired_amount, current_amount, max(current_amount - desired_amount, 0.0),
+                              time.perf_counter() - start, self.command_count - start_commands, bursts, total_steps)
+
+    async def dispense_until(self, target, threshold=None, max_chunk=10000, min_chunk=5, settle_time=0.5, augerType=None, powderType=None, on_progress=None):
+        """
+        Dispenses powder until the scale reaches a target weight, with the firmware checking the scale between
+        bursts, falling back to the same loop on the PC; see `PowderDispenseController.dispense_until`.
+
+        Returns:
+            DispenseReport: Dispense time, final amount, overshoot and number of round trips.
+        """
+        start, start_commands = time.perf_counter(), self.command_count
+        command_str, stop_at, steps_per_gram = self._dose_command(target, threshold, max_chunk, min_chunk, settle_time, augerType, powderType)
+        await self.scaleOn()
+        await self.tare()
+        await self.enableStepper()
+        try:
+            outcome = await self._dose_on_device(command_str, settle_time, on_progress) if self.deviceDosing is not False else None
+            if outcome is None:
+                outcome = await self._dose_on_host(target, stop_at, steps_per_gram, max_chunk, min_chunk, settle_time, on_progress)
+        finally:
+            await self.disableStepper()
+            await self.scaleOff()
+        return self._dose_report(target, *outcome, start, start_commands)
+
+    async def _dose_on_device(self, command_str, settle_time, on_progress):
+        # Sends '<DispenseUntil,...>' and follows its progress frames; returns (DoseResult, bursts), or None if
+        # the firmware does not know the command.
+        async with self._lock:
+            return await drive_async(self._dose_device_steps(self.link, self.link.buffer, command_str, settle_time, on_progress))
+
+    async def _dose_on_host(self, target, stop_at, steps_per_gram, max_chunk, min_chunk, settle_time, on_progress):
+        # The loop of DispenserControls::dispenseUntil, run from the PC.
+        return await drive_async(self._dose_host_steps(target, stop_at, steps_per_gram, max_chunk, min_chunk, settle_time, on_progress))
@@ -0,0 +1,176 @@
+"""
+Binary frames for scale readings.
+
+In ASCII mode every reading travels as text, e.g. '<Stream:1.2345,40960>\\r\\n' (23 bytes), which the Arduino
+formats with `Serial.print(float)` and the PC parses with `split()` and `float()`. At the NAU7802's 320 SPS the
+text framing, not the sensor, limits the reading rate. After the PC sends '<Binary,1>', the firmware sends
+Weight, ADC and Stream readings as fixed-size binary frames instead; command acknowledgements, the status and
+the boot banner stay ASCII.
+
+Frame layout (13 bytes, little-endian like the AVR):
+    sync    uint8    0xA5, a byte the firmware never sends in ASCII output
+    kind    uint8    'W' (Weight), 'A' (ADC) or 'S' (Stream)
+    length  uint8    payload length, always 8
+    value   float32  grams for Weight and Stream, int32 ADC counts for ADC
+    millis  uint32   the Arduino's millis() when the reading was taken
+    crc     uint16   CRC-16/XMODEM of kind, length and payload (avr-libc `_crc_xmodem_update`)
+
+Frames are decoded in place from the receive buffer. Runs of at least `NUMPY_MIN_FRAMES` frames, e.g. after the
+reader fell behind a fast stream, are decoded through one NumPy `frombuffer` view, with the CRCs of all frames
+computed column by column, instead of frame by frame with `struct`.
+
+Classes:
+    BinaryReading - A reading decoded from a binary frame.
+
+Functions:
+    encode_frame(kind, value, device_ms) - Packs a reading into a binary frame.
+    frame_length(data, offset) - Returns the size of a binary frame starting at an offset, 0 if the header is invalid.
+    decode_frames(data, offset) - Decodes the run of consecutive binary frames starting at an offset.
+"""
+import struct
+from binascii import crc_hqx
+from collections import namedtuple
+
+SYNC = 0xA5                         # First byte of every binary frame.
+PAYLOAD = struct.Struct('<fI')      # Weight and Stream payload: grams, millis.
+ADC_PAYLOAD = struct.Struct('<iI')  # ADC payload: counts, millis.
+HEADER_SIZE = 3                     # Sync, kind and length bytes.
+CRC = struct.Struct('<H')
+FRAME_SIZE = HEADER_SIZE + PAYLOAD.size + CRC.size
+NUMPY_MIN_FRAMES = 64               # Shortest run of frames decoded with NumPy.
+NEGOTIATION_TIMEOUT = 0.5           # Seconds to wait for '<Binary,...>' to be acknowledged before staying ASCII.
+
+# Frame kind byte -> (message type, payload struct).
+FRAME_KINDS = {
+    ord('W'): ('Weight', PAYLOAD),
+    ord('A'): ('ADC', ADC_PAYLOAD),
+    ord('S'): ('Stream', PAYLOAD),
+}
+KIND_CODES = {kind: code for code, (kind, _) in FRAME_KINDS.items()}
+KIND_NAMES = {code: kind for code, (kind, _) in FRAME_KINDS.items()}
+SYNC_BYTES = bytes((SYNC,))
+KIND_BYTES = bytes(FRAME_KINDS)
+LENGTH_BYTES = bytes((PAYLOAD.size,))
+_NUMPY_LAYOUT = _NUMPY_CRC_TABLE = None  # Frame dtype and CRC lookup table, created on the first NumPy decode.
+
+BinaryReading = namedtuple('BinaryReading', ['kind', 'value', 'device_ms'])
+BinaryReading.__doc__ = """
+A reading decoded from a binary frame.
+
+Attributes:
+    kind (str): Message type ('Weight', 'ADC' or 'Stream').
+    value (float or int): The weight in grams, or the ADC reading in counts.
+    device_ms (int): The Arduino's `millis()` when the reading was taken.
+"""
+
+
+def encode_frame(kind, value, device_ms):
+    """
+    Packs a reading into a binary frame, as the firmware sends it.
+
+    Parameters:
+        kind (str): Message type ('Weight', 'ADC' or 'Stream').
+        value (float): The weight in grams, or the ADC reading (rounded to whole counts).
+        device_ms (int): The Arduino's `millis()`; wraps around at 2**32 like on the board.
+
+    Returns:
+        bytes: The frame.
+    """
+    code = KIND_CODES[kind]
+    payload_struct = FRAME_KINDS[code][1]
+    value = int(round(value)) if payload_struct is ADC_PAYLOAD else value
+    body = bytes((code, payload_struct.size)) + payload_struct.pack(value, device_ms & 0xFFFFFFFF)
+    return bytes((SYNC,)) + body + CRC.pack(crc_hqx(body, 0))
+
+
+def frame_length(data, offset):
+    """
+    Returns the size of the binary frame whose sync byte is at `offset`, so a partial frame can be told from noise
+    before all of it has arrived.
+
+    Parameters:
+        data (bytes-like): The received bytes.
+        offset (int): Position of a sync byte.
+
+    Returns:
+        int: FRAME_SIZE if the header is valid or not yet complete, 0 if the sync byte does not start a frame.
+    """
+    if len(data) > offset + 1 and data[offset + 1] not in FRAME_KINDS:
+        return 0
+    if len(data) > offset + 2 and data[offset + 2] != PAYLOAD.size:
+        return 0
+    return FRAME_SIZE
+
+
+def _run_length(data, offset):
+    # Number of complete frames with a valid header starting back to back at `offset`.
+    count = (len(data) - offset) // FRAME_SIZE
+    for column, valid in ((0, SYNC_BYTES), (1, KIND_BYTES), (2, LENGTH_BYTES)):
+        if not count:
+            break
+        values = data[offset + column:offset + count * FRAME_SIZE:FRAME_SIZE]
+        count -= len(values.lstrip(valid))
+    return count
+
+
+def _decode_numpy(data, offset, count):
+    # Decodes `count` frames through one NumPy view on the buffer, checking all CRCs column by column; returns
+    # None if NumPy is not installed.
+    try:
+        import numpy as np  # Only needed for long runs of frames, see NUMPY_MIN_FRAMES.
+    except ImportError:
+        return None
+    global _NUMPY_LAYOUT, _NUMPY_CRC_TABLE
+    if _NUMPY_LAYOUT is None:
+        _NUMPY_LAYOUT = np.dtype({
+            'names': ['kind', 'value', 'counts', 'millis', 'crc', 'body'],
+            'formats': ['u1', '<f4', '<i4', '<u4', '<u2', ('u1', (FRAME_SIZE - 1 - CRC.size,))],
+            'offsets': [1, HEADER_SIZE, HEADER_SIZE, HEADER_SIZE + 4, FRAME_SIZE - CRC.size, 1],
+            'itemsize': FRAME_SIZE,
+        })
+        _NUMPY_CRC_TABLE = np.array([crc_hqx(bytes((i,)), 0) for i in range(256)], dtype=np.uint16)
+    frames = np.frombuffer(data, dtype=_NUMPY_LAYOUT, count=count, offset=offset)
+    crc = np.zeros(count, dtype=np.uint16)
+    body = frames['body']
+    for column in range(body.shape[1]):
+        crc = (crc << 8) ^ _NUMPY_CRC_TABLE[(crc >> 8) ^ body[:, column]]
+    kinds = frames['kind']
+    values = frames['value'].tolist()
+    for i in np.flatnonzero(kinds == KIND_CODES['ADC']).tolist():
+        values[i] = int(frames['counts'][i])
+    return zip(kinds.tolist(), values, frames['millis'].tolist(), (crc == frames['crc']).tolist())
+
+
+def _decode_struct(data, offset, count):
+    # Decodes `count` frames one by one.
+    readings = []
+    for start in range(offset, offset + count * FRAME_SIZE, FRAME_SIZE):
+        kind, payload_struct = FRAME_KINDS[data[start + 1]]
+        crc, = CRC.unpack_from(data, start + FRAME_SIZE - CRC.size)
+        if crc_hqx(data[start + 1:start + FRAME_SIZE - CRC.size], 0) == crc:
+            readings.append(BinaryReading(kind, *payload_struct.unpack_from(data, start + HEADER_SIZE)))
+    return readings
+
+
+def decode_frames(data, offset=0):
+    """
+    Decodes the run of complete binary frames that starts at `offset` and follows back to back. Frames failing
+    the CRC check are skipped.
+
+    Parameters:
+        data (bytearray or bytes): The received bytes; they are read in place.
+        offset (int): Position of the first sync byte.
+
+    Returns:
+        tuple: (list of BinaryReading, offset after the run, number of frames with a CRC error). The offset equals
+               `offset` if no complete frame starts there.
+    """
+    count = _run_length(data, offset)
+    if not count:
+        return [], offset, 0
+    decoded = _decode_numpy(data, offset, count) if count >= NUMPY_MIN_FRAMES else None
+    if decoded is None:
+        readings = _decode_struct(data, offset, count)
+    else:
+        readings = [BinaryReading(KIND_NAMES[code], value, device_ms) for code, value, device_ms, valid in decoded if valid]
+    return readings, offset + count * FRAME_SIZE, count - len(readings)
@@ -0,0 +1,716 @@
+"""
+Serial framing utilities for communicating with the powder dispenser firmware.
+
+The firmware wraps every message in start and end markers ('<' and '>'), mirroring the framing
+implemented in `Comms::getDataFromPC` on the Arduino side. This module reads whatever the operating
+system has buffered in one call and reassembles complete frames across reads, instead of pulling
+the port one byte at a time.
+
+Classes:
+    FrameBuffer - Reassembles '<...>' frames from arbitrary chunks of received bytes.
+    FrameReader - Reads complete frames from a serial port, enforcing the timeout at every wait.
+    Message - A received frame tagged with its type, sequence number and arrival time.
+    BinaryMessage - A reading received as a binary frame, tagged like a Message.
+    MessageQueues - Per-type queues of received messages, shared by the blocking and asyncio transports.
+    MessageDispatcher - Background thread routing received frames into per-type queues.
+    RigStatus - Firmware state reported in reply to a 'Ping' command.
+    ActuatorDone - End of a background run of the mixer, drain or pump.
+    DoseProgress - Weight check during a dose by weight.
+    DoseResult - End of a dose by weight.
+    FeedEnd - End of a continuous auger feed.
+
+Functions:
+    classify(text) - Returns the message type of a frame.
+    make_message(seq, frame, timestamp) - Wraps a frame from a FrameBuffer into a Message or BinaryMessage.
+    reading_value(msg) - Returns the value of a received Weight or ADC reading.
+    parse_status(msg) - Converts a received 'Status' message into a RigStatus.
+    parse_done(msg) - Converts a received 'Done' message into an ActuatorDone.
+    parse_dose(msg) - Converts a received 'Progress' or 'Dosed' message into a DoseProgress or DoseResult.
+    parse_fed(msg) - Converts a received 'Fed' message into a FeedEnd.
+    drive(steps) - Runs a command sequence written as a generator of calls, blocking.
+    drive_async(steps) - Runs a command sequence written as a generator of calls on the event loop.
+"""
+import inspect
+import threading
+import time
+from collections import deque, namedtuple
+
+from .binary import SYNC, BinaryReading, decode_frames, frame_length
+
+START_MARKER = b'<'  # Marks the beginning of a frame.
+END_MARKER = b'>'    # Marks the end of a frame.
+SYNC_BYTE = bytes((SYNC,))  # Starts a binary frame.
+
+READY_BANNER = "Ready to push powder, baby!"  # Sent by the firmware once `setup()` has finished.
+
+# Message types, keyed by the prefix the firmware puts in front of the frame content.
+MESSAGE_KINDS = (
+    ('Msg', 'Msg'),             # Command acknowledgement, e.g. '<Msg Tare Time 12>'.
+    ('Weight', 'Weight'),       # Weight reading, e.g. '<Weight:1.2345>'.
+    ('ADC', 'ADC'),             # Raw ADC reading, e.g. '<ADC:123456>'.
+    ('Stream', 'Stream'),       # Streamed weight reading, e.g. '<Stream:1.2345,40960>'.
+    ('Status', 'Status'),       # Reply to 'Ping': scale on, dispenser enabled, streaming, binary, e.g. '<Status:1,0,0,1>'.
+    ('Started', 'Started'),     # Background actuator switched on, with its run time in ms, e.g. '<Started:Mix,5000>'.
+    ('Done', 'Done'),           # Background actuator switched off: completed or stopped, millis, e.g. '<Done:Mix,1,40960>'.
+    ('Progress', 'Progress'),   # DispenseUntil weight check: grams, steps, millis, e.g. '<Progress:0.2512,800,40960>'.
+    ('Dosed', 'Dosed'),         # End of a DispenseUntil dose: grams, steps, reason, e.g. '<Dosed:0.4987,1650,0>'.
+    ('Fed', 'Fed'),             # End of a continuous feed: steps, completed or stopped, millis, e.g. '<Fed:23500,0,40960>'.
+    (READY_BANNER, 'Ready'),    # Boot banner.
+)
+OTHER_KIND = 'Other'            # Any frame without a known prefix.
+
+
+class FrameBuffer:
+    """
+    Persistent reassembly buffer for '<...>' framed messages.
+
+    Bytes can be fed in chunks of any size; complete frames are extracted as soon as their end
+    marker arrives, while partial frames are kept until the next chunk. Bytes outside of a frame
+    (e.g. the '\\r\\n' appended by `Serial.println` on the firmware side) are discarded. Binary
+    frames (see `binary`) are recognised by their sync byte and decoded in place into BinaryReadings.
+
+    Parameters:
+        max_frame_size (int): Maximum length of a frame before the partial data is dropped (default: 1024).
+    """
+    def __init__(self, max_frame_size=1024) -> None:
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()  # Bytes received but not yet assigned to a complete frame.
+        self._frames = deque()      # Complete frames waiting to be consumed.
+        self.bytes_received = 0     # Total number of bytes fed so far.
+        self.arrivals = deque(maxlen=64)  # (time.monotonic(), byte offset) of the most recent chunks.
+        self.crc_errors = 0         # Binary frames dropped because their CRC did not match.
+
+    def feed(self, data):
+        """
+        Adds received bytes to the buffer and extracts every complete frame.
+
+        Parameters:
+            data (bytes): The chunk of bytes read from the serial port.
+
+        Returns:
+            int: The number of complete frames waiting to be consumed.
+        """
+        offset = self.bytes_received
+        self.bytes_received = offset + len(data)  # Counted before the chunk is recorded, so an offset noted in between excludes it.
+        self.arrivals.append((time.monotonic(), offset))
+        buf = self._buffer
+        buf += data
+
+        start = self._next_frame(buf, 0)
+        while start != -1:
+            if buf[start] == SYNC:
+                readings, end, errors = decode_frames(buf, start)
+                if end == start:
+                    if frame_length(buf, start):
+                        break  # Partial binary frame; wait for the rest.
+                    end = start + 1  # Not a frame: skip the sync byte.
+                self._frames.extend(readings)
+                self.crc_errors += errors
+                start = self._next_frame(buf, end)
+                continue
+            end = buf.find(END_MARKER, start + 1)
+            if end == -1:
+                break
+            # A start marker inside the frame means the previous frame was truncated; resync on it.
+            restart = buf.rfind(START_MARKER, start + 1, end)
+            if restart != -1:
+                start = restart
+            self._frames.append(buf[start + 1:end].decode('utf-8', errors='replace'))
+            start = self._next_frame(buf, end + 1)
+
+        if start == -1:
+            buf.clear()  # Nothing but noise left over.
+        else:
+            del buf[:start]  # Keep the partial frame for the next chunk.
+            if len(buf) > self.max_frame_size:
+                buf.clear()  # Runaway frame without an end marker.
+        return len(self._frames)
+
+    @staticmethod
+    def _next_frame(buf, position):
+        # Position of the next start marker or binary sync byte at or after `position`, -1 if there is none.
+        start = buf.find(START_MARKER, position)
+        sync = buf.find(SYNC_BYTE, position, len(buf) if start == -1 else start)
+        return start if sync == -1 else sync
+
+    def first_arrival(self, offset):
+        """
+        Returns the arrival time of the first chunk starting at or after a byte offset.
+
+        Parameters:
+            offset (int): A value of `bytes_received`, e.g. noted just before sending a command.
+
+        Returns:
+            float: The `time.monotonic()` at which the chunk was fed, or None if no such chunk is recorded.
+        """
+        first = None
+        for arrived, start in reversed(list(self.arrivals)):  # Copied, as the reader thread may append meanwhile.
+            if start < offset:
+                break
+            first = arrived
+        return first
+
+    def pop(self):
+        """
+        Returns the oldest complete frame, or None if no frame is available.
+        """
+        return self._frames.popleft() if self._frames else None
+
+    def clear(self):
+        """
+        Discards all buffered bytes and pending frames.
+        """
+        self._buffer.clear()
+        self._frames.clear()
+
+    def __len__(self):
+        return len(self._frames)
+
+
+class FrameReader:
+    """
+    Reads '<...>' framed messages from a serial port in bulk.
+
+    Each read drains everything currently in the OS buffer (`read(in_waiting)`), and when the buffer
+    is empty the reader blocks in the port's own timed read for at most `poll_interval` seconds at a
+    time, so the overall timeout is checked at every wait point.
+
+    Parameters:
+        ser (serial.Serial): The open serial port to read from.
+        poll_interval (float): Longest single blocking read in seconds (default: 0.25).
+    """
+    def __init__(self, ser, poll_interval=0.25) -> None:
+        self.ser = ser
+        self.poll_interval = poll_interval
+        self.buffer = FrameBuffer()
+        self._port_timeout = None
+        self._set_port_timeout(poll_interval)
+
+    def _set_port_timeout(self, timeout):
+        # Reconfiguring the port is a syscall on most platforms, so only do it when the value changes.
+        if timeout != self._port_timeout:
+            self.ser.timeout = timeout
+            self._port_timeout = timeout
+
+    @property
+    def in_waiting(self):
+        """
+        int: Number of complete frames already buffered, or the number of bytes waiting in the
+        OS buffer if no complete frame has been reassembled yet.
+        """
+        return len(self.buffer) or self.ser.in_waiting
+
+    def fill(self, timeout):
+        """
+        Reads whatever is available from the port into the frame buffer, waiting up to `timeout` seconds
+        for the first byte if nothing is pending.
+
+        Parameters:
+            timeout (float): Maximum time in seconds to wait for data.
+
+        Returns:
+            int: The number of bytes read.
+        """
+        waiting = self.ser.in_waiting
+        if waiting:
+            data = self.ser.read(waiting)
+        else:
+            self._set_port_timeout(min(max(timeout, 0), self.poll_interval))
+            data = self.ser.read(1)  # Blocks until the first byte or the timeout.
+            waiting = self.ser.in_waiting
+            if data and waiting:
+                data += self.ser.read(waiting)
+        if data:
+            self.buffer.feed(data)
+        return len(data)
+
+    def wait(self, timeout=None):
+        """
+        Blocks until a complete frame is buffered. The wait happens inside the port's timed read
+        (select/poll on the file descriptor), so an idle wait does not consume CPU.
+
+        Parameters:
+            timeout (float, optional): Maximum time in seconds to wait. Waits indefinitely if None.
+
+        Returns:
+            bool: True if a frame is available, False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not len(self.buffer):
+            if deadline is None:
+                self.fill(self.poll_interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.fill(remaining)
+        return True
+
+    def read_frame(self, timeout=None):
+        """
+        Returns the next complete frame, reading from the port as needed.
+
+        Parameters:
+            timeout (float, optional): Maximum time in seconds to wait for a complete frame. Waits indefinitely if None.
+
+        Returns:
+            str or BinaryReading: The frame content without the start and end markers, or the decoded binary frame.
+
+        Raises:
+            TimeoutError: If no complete frame arrives within the timeout.
+        """
+        if not self.wait(timeout):
+            raise TimeoutError("Arduino did not respond within timeout. Try resetting the device.")
+        return self.buffer.pop()
+
+    def clear(self):
+        """
+        Discards pending frames and any partially received data.
+        """
+        self.buffer.clear()
+
+
+Message = namedtuple('Message', ['seq', 'kind', 'text', 'timestamp'])
+Message.__doc__ = """
+A frame received from the Arduino.
+
+Attributes:
+    seq (int): Sequence number, increasing by one for every frame received on the port.
+    kind (str): Message type ('Msg', 'Weight', 'ADC', 'Stream', 'Status', 'Started', 'Done', 'Progress', 'Dosed',
+                'Fed', 'Ready' or 'Other').
+    text (str): The frame content without the start and end markers.
+    timestamp (float): `time.monotonic()` at which the frame was parsed.
+"""
+
+
+def classify(text):
+    """
+    Returns the message type of a frame based on its prefix.
+
+    Parameters:
+        text (str): The frame content.
+
+    Returns:
+        str: One of 'Msg', 'Weight', 'ADC', 'Stream', 'Status', 'Started', 'Done', 'Progress', 'Dosed', 'Fed', 'Ready'
+             or 'Other'.
+    """
+    for prefix, kind in MESSAGE_KINDS:
+        if text.startswith(prefix):
+            return kind
+    return OTHER_KIND
+
+
+class BinaryMessage(namedtuple('BinaryMessage', ['seq', 'kind', 'value', 'device_ms', 'timestamp'])):
+    """
+    A reading received as a binary frame. It has the `seq`, `kind`, `text` and `timestamp` attributes of a
+    Message, and carries the decoded value, so it does not have to be parsed from text.
+
+    Attributes:
+        seq (int): Sequence number, shared with the Messages received on the port.
+        kind (str): Message type ('Weight', 'ADC' or 'Stream').
+        value (float or int): The weight in grams, or the ADC reading in counts.
+        device_ms (int): The Arduino's `millis()` when the reading was taken.
+        timestamp (float): `time.monotonic()` at which the frame was decoded.
+    """
+    __slots__ = ()
+
+    @property
+    def text(self):
+        """str: The reading in the firmware's ASCII form, e.g. 'Stream:1.2345,40960', for logs and display."""
+        if self.kind == 'Stream':
+            return f"Stream:{self.value:.4f},{self.device_ms}"
+        if self.kind == 'ADC':
+            return f"ADC:{self.value}"
+        return f"{self.kind}:{self.value:.4f}"
+
+
+def make_message(seq, frame, timestamp):
+    """
+    Wraps a frame taken from a FrameBuffer into a Message, or a BinaryMessage if it was a binary frame.
+
+    Parameters:
+        seq (int): The sequence number of the message.
+        frame (str or BinaryReading): The frame.
+        timestamp (float): `time.monotonic()` at which the frame was parsed.
+    """
+    if isinstance(frame, BinaryReading):
+        return BinaryMessage(seq, frame.kind, frame.value, frame.device_ms, timestamp)
+    return Message(seq, classify(frame), frame, timestamp)
+
+
+def reading_value(msg):
+    """
+    Returns the value of a received Weight or ADC reading, e.g. 1.2345 for '<Weight:1.2345>'.
+
+    Parameters:
+        msg (Message or BinaryMessage): The reading.
+
+    Returns:
+        float: The value, or None if the message could not be parsed.
+    """
+    if isinstance(msg, BinaryMessage):
+        return float(msg.value)
+    try:
+        return float(msg.text.split(':')[1].split(',')[0])
+    except (IndexError, ValueError):
+        return None
+
+
+RigStatus = namedtuple('RigStatus', ['scale_on', 'stepper_on', 'streaming', 'binary'], defaults=(None,))
+RigStatus.__doc__ = """
+Firmware state reported by '<Status:scale,dispenser,streaming,binary>' in reply to a 'Ping' command.
+
+Attributes:
+    scale_on (bool): Whether the scale is powered up.
+    stepper_on (bool): Whether the dispenser's stepper driver is enabled.
+    streaming (bool): Whether the firmware is streaming weight readings.
+    binary (bool): Whether readings are sent as binary frames; None for firmware that reports three flags, which
+                   has no binary frames.
+"""
+
+
+def parse_status(msg):
+    """
+    Converts a received 'Status' message into a RigStatus.
+
+    Parameters:
+        msg (Message or str): The message, or its text, e.g. 'Status:1,0,0,1'.
+
+    Returns:
+        RigStatus: The reported state.
+
+    Raises:
+        ValueError: If the message is not a well-formed status report.
+    """
+    text = msg.text if isinstance(msg, Message) else msg
+    try:
+        flags = [bool(int(value)) for value in text.split(':', 1)[1].split(',')]
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"Malformed status message: {text}") from e
+    if not len(RigStatus._fields) - 1 <= len(flags) <= len(RigStatus._fields):
+        raise ValueError(f"Malformed status message: {text}")
+    return RigStatus(*flags)
+
+
+ActuatorDone = namedtuple('ActuatorDone', ['actuator', 'completed', 'device_ms'])
+ActuatorDone.__doc__ = """
+End of a background run, reported by '<Done:actuator,completed,millis>'.
+
+Attributes:
+    actuator (str): 'Mix', 'Drain' or 'Pump'.
+    completed (bool): True if the actuator ran for its full duration, False if it was stopped or restarted early.
+    device_ms (int): The Arduino's `millis()` when the actuator was switched off, or None for firmware that ran
+                     the command blocking.
+"""
+
+
+def parse_done(msg):
+    """
+    Converts a received 'Done' message into an ActuatorDone.
+
+    Parameters:
+        msg (Message or str): The message, or its text, e.g. 'Done:Mix,1,40960'.
+
+    Returns:
+        ActuatorDone: The actuator and how its run ended.
+
+    Raises:
+        ValueError: If the message is not a well-formed completion report.
+    """
+    text = msg.text if isinstance(msg, Message) else msg
+    try:
+        actuator, completed, device_ms = text.split(':', 1)[1].split(',')
+        return ActuatorDone(actuator, bool(int(completed)), int(device_ms))
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"Malformed completion message: {text}") from e
+
+
+DoseProgress = namedtuple('DoseProgress', ['weight', 'steps', 'device_ms'])
+DoseProgress.__doc__ = """
+Weight check during a dose by weight, reported by '<Progress:weight,steps,millis>' before every burst.
+
+Attributes:
+    weight (float): The weight on the scale in grams.
+    steps (int): Auger steps dispensed so far.
+    device_ms (int): The Arduino's `millis()` at the check, or None if the dose runs on the PC.
+"""
+
+DoseResult = namedtuple('DoseResult', ['weight', 'steps', 'reason'])
+DoseResult.__doc__ = """
+End of a dose by weight, reported by '<Dosed:weight,steps,reason>'.
+
+Attributes:
+    weight (float): The final weight on the scale in grams.
+    steps (int): Auger steps dispensed in total.
+    reason (str): 'reached' if the stop weight was reached, 'step_limit' if the step limit was hit first
+                  (e.g. an empty hopper), 'interrupted' if a new command arrived from the PC.
+"""
+
+DOSE_REASONS = ('reached', 'step_limit', 'interrupted')  # Reason codes of '<Dosed:...>' (DOSE_REACHED, ...).
+
+
+def parse_dose(msg):
+    """
+    Converts a received 'Progress' or 'Dosed' message into a DoseProgress or DoseResult.
+
+    Parameters:
+        msg (Message or str): The message, or its text, e.g. 'Dosed:0.4987,1650,0'.
+
+    Raises:
+        ValueError: If the message is not a well-formed dose report.
+    """
+    text = msg.text if isinstance(msg, Message) else msg
+    try:
+        kind, values = text.split(':', 1)
+        weight, steps, last = values.split(',')
+        if kind == 'Dosed':
+            return DoseResult(float(weight), int(steps), DOSE_REASONS[int(last)])
+        return DoseProgress(float(weight), int(steps), int(last))
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"Malformed dose message: {text}") from e
+
+
+FeedEnd = namedtuple('FeedEnd', ['steps', 'completed', 'device_ms'])
+FeedEnd.__doc__ = """
+End of a continuous feed, reported by '<Fed:steps,completed,millis>'.
+
+Attributes:
+    steps (int): Auger steps taken since the feed started, across all rate changes.
+    completed (bool): True if the feed stopped at its step limit, False if it was stopped by the PC.
+    device_ms (int): The Arduino's `millis()` when the auger stopped.
+"""
+
+
+def parse_fed(msg):
+    """
+    Converts a received 'Fed' message into a FeedEnd.
+
+    Parameters:
+        msg (Message or str): The message, or its text, e.g. 'Fed:23500,0,40960'.
+
+    Returns:
+        FeedEnd: The steps of the feed and how it ended.
+
+    Raises:
+        ValueError: If the message is not a well-formed feed report.
+    """
+    text = msg.text if isinstance(msg, Message) else msg
+    try:
+        steps, completed, device_ms = text.split(':', 1)[1].split(',')
+        return FeedEnd(int(steps), bool(int(completed)), int(device_ms))
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"Malformed feed message: {text}") from e
+
+
+class MessageQueues:
+    """
+    Per-type queues of received messages, each message tagged with a sequence number.
+
+    Callers note `last_seq` before sending a command and then wait for the first message of the
+    expected type with a higher sequence number. Older messages of that type are stale replies and
+    are dropped, while messages of other types stay queued for whoever expects them, so the input
+    buffer never has to be flushed. Message types with a subscriber (see `subscribe()`) are handed
+    to the subscriber instead of being queued.
+
+    This class holds the routing and the selection of messages; MessageDispatcher (a reader thread and a
+    condition variable) and `async_controller.AsyncSerialLink` (the event loop and a future) add how frames
+    arrive and how waiters are woken.
+
+    Parameters:
+        queue_size (int): Maximum number of messages kept per type (default: 256).
+    """
+    def __init__(self, queue_size=256) -> None:
+        self.queues = {kind: deque(maxlen=queue_size) for _, kind in MESSAGE_KINDS}
+        self.queues[OTHER_KIND] = deque(maxlen=queue_size)
+        self.last_seq = 0          # Sequence number of the most recent message.
+        self.error = None          # Exception that stopped the reader, if any.
+        self.subscribers = {}      # Message type -> callback receiving every message of that type.
+
+    def _route(self, frame):
+        # Tags a frame from the FrameBuffer and hands it to the subscriber of its type, or queues it.
+        self.last_seq += 1
+        msg = make_message(self.last_seq, frame, time.monotonic())
+        callback = self.subscribers.get(msg.kind)
+        if callback is not None:
+            callback(msg)
+        else:
+            self.queues[msg.kind].append(msg)
+
+    def _kinds(self, kind):
+        # The message types a `wait_for(kind)` accepts.
+        if kind is None:
+            return tuple(self.queues)
+        if isinstance(kind, str):
+            return (kind,)
+        return tuple(kind)
+
+    def _take(self, kinds, after_seq):
+        # Returns the oldest matching message newer than `after_seq`, dropping stale ones on the way.
+        best = None
+        for kind in kinds:
+            queue = self.queues[kind]
+            while queue and queue[0].seq <= after_seq:
+                queue.popleft()
+            if queue and (best is None or queue[0].seq < best.seq):
+                best = queue[0]
+        if best is not None:
+            self.queues[best.kind].popleft()
+        return best
+
+    def _check(self, kinds, after_seq, deadline):
+        # One pass of a wait: returns (message, None) if one matches, else (None, seconds left to wait; None
+        # for no limit). Raises the reader's error, or TimeoutError once the deadline has passed.
+        msg = self._take(kinds, after_seq)
+        if msg is not None:
+            return msg, None
+        if self.error is not None:
+            raise self.error
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError("Arduino did not respond within timeout. Try resetting the device.")
+        return None, remaining
+
+
+class MessageDispatcher(MessageQueues):
+    """
+    Continuously reads frames from the serial port on a background thread and routes them by type
+    into per-type queues, see MessageQueues.
+
+    Parameters:
+        reader (FrameReader): The frame reader wrapping the serial port.
+        queue_size (int): Maximum number of messages kept per type (default: 256).
+    """
+    def __init__(self, reader, queue_size=256) -> None:
+        super().__init__(queue_size)
+        self.reader = reader
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the background reader thread.
+        """
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='PowderDispenserReader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background reader thread and waits for it to exit.
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        reader = self.reader
+        try:
+            while self._running:
+                if not reader.wait(reader.poll_interval):
+                    continue
+                with self._cond:
+                    while len(reader.buffer):
+                        self._route(reader.buffer.pop())
+                    self._cond.notify_all()
+        except Exception as e:  # Typically a SerialException when the device is unplugged.
+            with self._cond:
+                self.error = e
+                self._cond.notify_all()
+
+    def subscribe(self, kind, callback):
+        """
+        Hands every future message of a type to `callback` (called on the reader thread) instead of queueing it.
+
+        Parameters:
+            kind (str): The message type, e.g. 'Stream'.
+            callback (callable): Function receiving each Message. It must not block.
+        """
+        with self._cond:
+            self.subscribers[kind] = callback
+
+    def unsubscribe(self, kind):
+        """
+        Removes the subscriber of a message type; further messages of that type are queued again.
+        """
+        with self._cond:
+            self.subscribers.pop(kind, None)
+
+    def wait_for(self, kind=None, after_seq=0, timeout=None):
+        """
+        Waits for the next message of a given type.
+
+        Parameters:
+            kind (str or tuple, optional): Message type(s) to wait for. Any type if None.
+            after_seq (int): Only messages with a higher sequence number are accepted (default: 0).
+            timeout (float, optional): Maximum time in seconds to wait. Waits indefinitely if None.
+
+        Returns:
+            Message: The oldest matching message.
+
+        Raises:
+            TimeoutError: If no matching message arrives within the timeout.
+            Exception: The error that stopped the reader thread, if it died while waiting.
+        """
+        kinds = self._kinds(kind)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                msg, remaining = self._check(kinds, after_seq, deadline)
+                if msg is not None:
+                    return msg
+                self._cond.wait(remaining)
+
+    def clear(self):
+        """
+        Discards all queued messages.
+        """
+        with self._cond:
+            for queue in self.queues.values():
+                queue.clear()
+
+
+def drive(steps):
+    """
+    Runs a command sequence written once for the blocking and the asyncio controller: a generator that yields
+    zero-argument calls (e.g. `functools.partial(dispatcher.wait_for, 'Msg', after_seq=seq)`) and receives
+    their results, or has their exceptions raised at the `yield`.
+
+    Parameters:
+        steps (generator): The command sequence.
+
+    Returns:
+        The value the generator returns.
+    """
+    result = error = None
+    while True:
+        try:
+            call = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = call(), None
+        except Exception as e:
+            result, error = None, e
+
+
+async def drive_async(steps):
+    """
+    Async version of `drive()`: awaits the results of the calls that return awaitables, such as the methods
+    of the asyncio controller.
+    """
+    result = error = None
+    while True:
+        try:
+            call = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = call(), None
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception as e:
+            result, error = None, e
@@ -0,0 +1,551 @@
+"""
+Configuration file handling for the powder dispensing package.
+
+The configuration file is JSON with `//` line comments (and `/* ... */` block comments), as shipped in
+`config.json`. `load_settings` parses and validates it once into an immutable `Settings` snapshot, in which
+the calibration is held as typed records with precomputed lookups, e.g. the grams per step and steps per
+gram of every auger/powder pair, so the controllers do not walk nested dictionaries on every command.
+
+Snapshots are cached per file and rebuilt only when the file's modification time or size changes. A new
+snapshot is built completely before it replaces the cached one, so readers see either the old or the new
+configuration, never a mix; if the changed file cannot be parsed, the previous snapshot stays in use and the
+error is raised to the caller.
+
+Changes are persisted through `ConfigStore`, which collects bursts of changes into one write, replaces the
+file atomically (temporary file, fsync, rename) under a lock shared by all processes, and can write them to
+a per-rig overlay file instead, leaving a configuration file shared by several rigs untouched.
+
+Classes:
+    ConfigError - Raised when a configuration file is not valid.
+    AugerCalibration - Calibration of one auger/powder pair.
+    InFlightCalibration - Learned settled-mass predictor of one auger/powder pair.
+    PumpCalibration - Calibration and control pin of a pump.
+    LoadCellCalibration - Calibration line of a load cell.
+    CalibrationWeight - A known weight used for scale calibration.
+    Settings - Validated, immutable snapshot of a configuration file.
+    ConfigStore - Debounced, atomic and locked persistence of configuration changes.
+
+Functions:
+    strip_comments(text) - Removes '//' and '/* */' comments from JSON text.
+    parse_config(text) - Parses commented JSON text into a dictionary.
+    read_config(config_file) - Reads a commented JSON configuration file into a dictionary.
+    set_config_value(config, keys, value) - Sets a nested value in a configuration dictionary.
+    merge_config(base, overlay) - Applies the values of an overlay configuration on top of a base configuration.
+    load_settings(config_file, overlay_file, reload) - Returns the cached Settings of a file, reloading it if it changed.
+    file_lock(path) - Context manager holding an exclusive lock on a file across processes.
+    write_json_atomic(path, data) - Replaces a JSON file atomically.
+"""
+import atexit
+import contextlib
+import copy
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import weakref
+from collections import namedtuple
+from types import MappingProxyType
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows.
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# JSON strings are matched first, so comment markers inside them (e.g. in URLs) are left alone.
+_TOKENS = re.compile(r'"(?:\\.|[^"\\])*"|//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+# Keys the controllers read without a fallback value.
+_REQUIRED = {
+    'constants': ('decimal', 'dispenseDir', 'numMeas'),
+    'default_constants': ('DEFAULT_REPS', 'DEFAULT_SAMPLES', 'DEFAULT_TIMEOUT', 'DEFAULT_DISPENSE_DIR'),
+}
+
+
+class ConfigError(ValueError):
+    """
+    Raised when a configuration file cannot be parsed or lacks required values.
+    """
+
+
+AugerCalibration = namedtuple('AugerCalibration', ['grams_per_step', 'steps_per_gram'])
+AugerCalibration.__doc__ = """
+Calibration of one auger/powder pair: grams of powder delivered per stepper motor step, and its inverse.
+"""
+
+InFlightCalibration = namedtuple('InFlightCalibration', ['horizon', 'window', 'gain', 'slope', 'steps'])
+InFlightCalibration.__doc__ = """
+Coefficients of the settled-weight predictor of one auger/powder pair, see `inflight.InFlightModel`: the settled
+weight gain of a burst is `gain * seen + slope * slope_seen + steps * burst_steps`, where `seen` and `slope_seen`
+are the gain and slope over the last `window` seconds of samples up to `horizon` seconds after the burst.
+"""
+
+PumpCalibration = namedtuple('PumpCalibration', ['a', 'b', 'pin'])
+PumpCalibration.__doc__ = """
+Calibration of a pump, whose run time for a volume is `a * volume + b`, and the pin controlling it.
+"""
+
+LoadCellCalibration = namedtuple('LoadCellCalibration', ['slope', 'intercept'])
+LoadCellCalibration.__doc__ = """
+Calibration line of a load cell.
+"""
+
+CalibrationWeight = namedtuple('CalibrationWeight', ['value', 'unit'])
+CalibrationWeight.__doc__ = """
+A known weight used for scale calibration.
+"""
+
+
+def strip_comments(text):
+    """
+    Removes '//' line comments and '/* */' block comments from JSON text. Block comments are replaced by
+    their line breaks, so line numbers in parse errors still match the file.
+    """
+    def replace(match):
+        token = match.group(0)
+        if token.startswith('"'):
+            return token
+        return '\n' * token.count('\n')
+    return _TOKENS.sub(replace, text)
+
+
+def parse_config(text, source='<string>'):
+    """
+    Parses commented JSON text into a dictionary.
+
+    Parameters:
+        text (str): The JSON text, optionally with '//' and '/* */' comments.
+        source (str): Name of the text's origin used in error messages (default: '<string>').
+
+    Returns:
+        dict: The parsed configuration.
+
+    Raises:
+        ConfigError: If the text is not valid JSON or not a JSON object.
+    """
+    try:
+        config = json.loads(strip_comments(text))
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"'{source}' is not valid JSON: {e}") from None
+    if not isinstance(config, dict):
+        raise ConfigError(f"'{source}' must contain a JSON object.")
+    return config
+
+
+def read_config(config_file):
+    """
+    Reads a commented JSON configuration file into a dictionary.
+
+    Parameters:
+        config_file (str): The path to the configuration file.
+
+    Returns:
+        dict: The parsed configuration.
+
+    Raises:
+        FileNotFoundError: If the configuration file does not exist.
+        ConfigError: If the file is not valid JSON.
+    """
+    try:
+        with open(config_file, 'r') as f:
+            text = f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Error: '{config_file}' file not found. Please make sure the file exists in the current directory."
+        ) from None
+    return parse_config(text, config_file)
+
+
+def _number(value, where):
+    # Returns `value` if it is a JSON number (not a boolean), otherwise raises ConfigError.
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ConfigError(f"{where} must be a number, not {value!r}.")
+    return value
+
+
+def _section(config, *keys):
+    # Returns the nested dictionary config[keys[0]][keys[1]]..., raising ConfigError if it is missing.
+    node = config
+    for depth, key in enumerate(keys):
+        node = node.get(key) if isinstance(node, dict) else None
+        if not isinstance(node, dict):
+            raise ConfigError(f"Missing section '{'.'.join(keys[:depth + 1])}'.")
+    return node
+
+
+class Settings:
+    """
+    Validated, immutable snapshot of a configuration file. Create it with `load_settings` (cached), or
+    directly from a configuration dictionary.
+
+    Parameters:
+        config (dict): The parsed configuration.
+        path (str, optional): The file it was read from.
+        version (tuple, optional): (modification time in ns, size) of the file when it was read.
+
+    Raises:
+        ConfigError: If the configuration lacks required values or has values of the wrong type.
+
+    Attributes:
+        path (str): The configuration file, or None if built from a dictionary.
+        version (tuple): (modification time in ns, size) of the file when it was read; with an overlay file,
+                         the pair of the versions of both files.
+        augers (Mapping): (augerType, powderType) -> AugerCalibration.
+        inflight (Mapping): (augerType, powderType) -> InFlightCalibration, for the pairs with a learned predictor.
+        pumps (Mapping): Pump name (e.g. 'Flush') -> PumpCalibration.
+        load_cells (Mapping): Load cell name (e.g. '100g') -> LoadCellCalibration.
+        weights (tuple of CalibrationWeight): Known weights for scale calibration.
+        scale_single_point_cal (bool): Whether single-point calibration is applied for the scale.
+        constants (Mapping): The 'constants' section.
+        default_constants (Mapping): The 'default_constants' section.
+    """
+    __slots__ = ('path', 'version', 'augers', 'inflight', 'pumps', 'load_cells', 'weights', 'scale_single_point_cal',
+                 'constants', 'default_constants', '_data')
+
+    def __init__(self, config, path=None, version=None) -> None:
+        calibration = _section(config, 'calibration')
+        augers = {}
+        for augerType, powders in _section(config, 'calibration', 'augers').items():
+            if not isinstance(powders, dict):
+                raise ConfigError(f"calibration.augers.{augerType} must map powder types to calibration factors.")
+            for powderType, factor in powders.items():
+                factor = _number(factor, f"calibration.augers.{augerType}.{powderType}")
+                if factor <= 0:
+                    raise ConfigError(f"calibration.augers.{augerType}.{powderType} must be positive, not {factor!r}.")
+                augers[augerType, powderType] = AugerCalibration(factor, 1 / factor)
+
+        inflight = {}
+        for augerType, powders in calibration.get('inflight', {}).items():
+            for powderType, model in (powders.items() if isinstance(powders, dict) else ()):
+                where = f"calibration.inflight.{augerType}.{powderType}"
+                if not isinstance(model, dict):
+                    raise ConfigError(f"{where} must have the fields {', '.join(InFlightCalibration._fields)}.")
+                inflight[augerType, powderType] = InFlightCalibration(*(_number(model.get(field), f"{where}.{field}") for field in InFlightCalibration._fields))
+
+        pumps = {}
+        for name, pump in _section(config, 'calibration', 'pumps').items():
+            where = f"calibration.pumps.{name}"
+            if not isinstance(pump, dict) or 'pin' not in pump:
+                raise ConfigError(f"{where} must have a 'pin'.")
+            pumps[name] = PumpCalibration(_number(pump.get('a', 0), f"{where}.a"), _number(pump.get('b', 0), f"{where}.b"), pump['pin'])
+
+        load_cells = {}
+        for name, cell in calibration.get('loadCells', {}).items():
+            where = f"calibration.loadCells.{name}"
+            if not isinstance(cell, dict):
+                raise ConfigError(f"{where} must have a 'Slope' and an 'Intercept'.")
+            load_cells[name] = LoadCellCalibration(_number(cell.get('Slope'), f"{where}.Slope"), _number(cell.get('Intercept'), f"{where}.Intercept"))
+
+        weights = []
+        for i, weight in enumerate(calibration.get('weights', [])):
+            if not isinstance(weight, dict):
+                raise ConfigError(f"calibration.weights[{i}] must have a 'value'.")
+            weights.append(CalibrationWeight(_number(weight.get('value'), f"calibration.weights[{i}].value"), weight.get('unit', 'g')))
+
+        for section, keys in _REQUIRED.items():
+            values = _section(config, section)
+            missing = [key for key in keys if key not in values]
+            if missing:
+                raise ConfigError(f"Missing {', '.join(missing)} in section '{section}'.")
+
+        self.path = path
+        self.version = version
+        self.augers = MappingProxyType(augers)
+        self.inflight = MappingProxyType(inflight)
+        self.pumps = MappingProxyType(pumps)
+        self.load_cells = MappingProxyType(load_cells)
+        self.weights = tuple(weights)
+        self.scale_single_point_cal = bool(calibration.get('scaleSinglePointCal', False))
+        self.constants = MappingProxyType(dict(config['constants']))
+        self.default_constants = MappingProxyType(dict(config['default_constants']))
+        self._data = copy.deepcopy(config)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, '_data'):
+            raise AttributeError("Settings are immutable; change the configuration file and reload it instead.")
+        super().__setattr__(name, value)
+
+    def auger(self, augerType, powderType):
+        """
+        Returns the AugerCalibration of an auger/powder pair.
+
+        Raises:
+            KeyError: If the pair has not been calibrated.
+        """
+        try:
+            return self.augers[augerType, powderType]
+        except KeyError:
+            raise KeyError(f"No calibration for auger '{augerType}' with powder '{powderType}'.") from None
+
+    def pump(self, name):
+        """
+        Returns the PumpCalibration of a pump.
+
+        Raises:
+            KeyError: If the pump is not configured.
+        """
+        try:
+            return self.pumps[name]
+        except KeyError:
+            raise KeyError(f"No pump '{name}' in the configuration.") from None
+
+    def to_dict(self):
+        """
+        Returns a modifiable copy of the configuration as a dictionary.
+        """
+        return copy.deepcopy(self._data)
+
+
+def merge_config(base, overlay):
+    """
+    Returns a copy of `base` with the values of `overlay` applied on top. Nested dictionaries are merged
+    key by key, all other values of the overlay replace those of the base.
+    """
+    merged = copy.deepcopy(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _file_version(path):
+    # Returns (modification time in ns, size) of a file, or None if it does not exist.
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+_cache = {}  # (absolute path, absolute overlay path or None) -> Settings of the latest versions read.
+_cache_lock = threading.Lock()
+
+
+def load_settings(config_file, overlay_file=None, reload=True):
+    """
+    Returns the Settings of a configuration file, optionally with the values of a per-rig overlay file
+    applied on top. The files are only read and validated again if the modification time or size of
+    either changed since they were last loaded.
+
+    Parameters:
+        config_file (str): The path to the configuration file.
+        overlay_file (str, optional): Path of an overlay file with values that replace those of the
+                                      configuration file; a missing overlay file counts as empty.
+        reload (bool): If False, returns the cached snapshot without checking the files, if there is one (default: True).
+
+    Returns:
+        Settings: The snapshot of the current file contents.
+
+    Raises:
+        FileNotFoundError: If the configuration file does not exist.
+        ConfigError: If a file is not valid. The previously cached snapshot, if any, stays cached.
+    """
+    path = os.path.abspath(config_file)
+    overlay = os.path.abspath(overlay_file) if overlay_file else None
+    key = (path, overlay)
+    cached = _cache.get(key)
+    if cached is not None and not reload:
+        return cached
+    base_version = _file_version(path)
+    if base_version is None:
+        raise FileNotFoundError(
+            f"Error: '{config_file}' file not found. Please make sure the file exists in the current directory."
+        )
+    version = (base_version, _file_version(overlay)) if overlay else base_version
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached.version == version:
+            return cached  # Loaded by another thread in the meantime.
+        config = read_config(path)
+        if overlay and version[1] is not None:
+            config = merge_config(config, read_config(overlay))
+        settings = Settings(config, path, version)
+        _cache[key] = settings  # Replaced in one step: readers get the old or the new snapshot.
+    return settings
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Context manager holding an exclusive lock on `path + '.lock'` across processes, e.g. while a
+    configuration file is read, modified and written back. The lock file itself is left in place.
+    """
+    with open(path + '.lock', 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # Retries for 10 s before raising OSError.
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_json_atomic(path, data):
+    """
+    Writes `data` as indented JSON to `path` so that the file always holds either the old or the new
+    contents: the data is written to a temporary file in the same directory, flushed to disk, and
+    renamed over `path`.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        # Persist the rename itself (POSIX); not supported on Windows.
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def set_config_value(config, keys, value):
+    """
+    Sets config[keys[0]][keys[1]]... = value in a configuration dictionary, creating missing sections.
+    """
+    node = config
+    for key in keys[:-1]:
+        if not isinstance(node.get(key), dict):
+            node[key] = {}
+        node = node[key]
+    node[keys[-1]] = value
+
+
+class ConfigStore:
+    """
+    Persists configuration changes, e.g. new calibration factors, safely and without rewriting the file
+    for every single change.
+
+    Changes are collected in memory and written together at most `delay` seconds after the first of them,
+    or when `flush()` or `close()` is called. Each write locks the file (see `file_lock`), reads its current
+    contents, applies only the collected changes and replaces the file atomically (see `write_json_atomic`),
+    so controllers in several processes sharing one file do not overwrite each other's changes and a crash
+    never leaves a half-written file.
+
+    With an `overlay_file`, changes are written there instead of to the configuration file, which then stays
+    untouched (including its comments); `load_settings(config_file, overlay_file)` applies the overlay.
+
+    Parameters:
+        config_file (str): The configuration file.
+        overlay_file (str, optional): Per-rig file receiving the changes instead (default: None).
+        delay (float): Time in seconds changes are collected before they are written (default: 0.5).
+    """
+    def __init__(self, config_file, overlay_file=None, delay=0.5) -> None:
+        self.config_file = config_file
+        self.overlay_file = overlay_file
+        self.delay = delay
+        self.writes = 0          # Number of times the file has been written.
+        self._pending = {}       # Key path tuple -> value not yet written.
+        self._lock = threading.Lock()
+        self._timer = None
+        _stores.add(self)
+
+    @property
+    def target(self):
+        """
+        str: The file the changes are written to.
+        """
+        return self.overlay_file or self.config_file
+
+    @property
+    def pending(self):
+        """
+        bool: Whether there are changes that have not been written yet.
+        """
+        return bool(self._pending)
+
+    def set(self, keys, value):
+        """
+        Schedules a change, e.g. `store.set(('calibration', 'augers', '8mm_base', 'dishwasher_salt'), 2.1e-05)`.
+
+        Parameters:
+            keys (tuple of str): Path of the value in the configuration.
+            value: The new value; must be JSON serializable.
+        """
+        with self._lock:
+            self._pending[tuple(keys)] = value
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_in_background(self):
+        # Called by the timer thread; the changes stay scheduled if writing fails.
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Could not save configuration changes to %s: %s", self.target, e)
+
+    def flush(self):
+        """
+        Writes all scheduled changes now.
+
+        Returns:
+            bool: True if the file was written, False if there was nothing to write.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return False
+            try:
+                with file_lock(self.target):
+                    config = read_config(self.target) if os.path.exists(self.target) else {}
+                    for keys, value in pending.items():
+                        set_config_value(config, keys, value)
+                    write_json_atomic(self.target, config)
+            except BaseException:
+                pending.update(self._pending)
+                self._pending = pending  # Keep the changes for the next attempt.
+                raise
+            self.writes += 1
+        logger.info("Configuration saved to %s", self.target)
+        return True
+
+    def close(self):
+        """
+        Writes all scheduled changes and stops collecting new ones in the background.
+        """
+        self.flush()
+        _stores.discard(self)
+
+
+_stores = weakref.WeakSet()  # ConfigStores with possibly unwritten changes.
+
+
+@atexit.register
+def _flush_stores():
+    # Writes changes still collected when the interpreter exits.
+    for store in list(_stores):
+        try:
+            store.flush()
+        except Exception as e:
+            logger.error("Could not save configuration changes to %s: %s", store.target, e)
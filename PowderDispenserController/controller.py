@@ -4,60 +4,69 @@ It includes methods to operate the scale, mixer, and pumps based on pre-defined
 and execute sequences for dispensing, flushing, draining, and more.
 
 Classes:
+    ControllerSettings - Configuration-derived settings and calculations shared by the sync and async controllers.
     PowderDispenseController - A controller to manage dispensing operations including scale and mixer functions.
 """
 import serial
 import serial.tools.list_ports
 import time
 import json
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import os
+import logging
+import threading
 import datetime
-from scipy import stats
-from .utils import get_config, read_logfile, write_to_logfile, list_serial_ports, save_config
-
-class PowderDispenseController:
+from collections import deque
+from concurrent.futures import Future
+from functools import partial
+from .utils import write_to_logfile, list_serial_ports, set_hangup_on_close, pulse_dtr
+from .config import ConfigError, ConfigStore, Settings, load_settings, set_config_value
+from .comms import ActuatorDone, DoseProgress, DoseResult, FrameReader, MessageDispatcher, drive, parse_done, parse_dose, parse_fed, parse_status, reading_value
+from .binary import NEGOTIATION_TIMEOUT
+from .pipeline import RX_WINDOW, BatchCommand, BatchResult, CommandBatch, echo_matches
+from .stream import WeightStream, parse_stream_sample
+from .dispense import DOSE_SAMPLES, DOSE_STOP_FRACTION, ClosedLoopDispenser, DispenseReport, FeedController, dose_chunk
+from .settling import SettlingDetector
+from .logwriter import SessionLogWriter
+from .instrumentation import CommandStats, command_name
+from .logconfig import COMMAND_LOGGER, flush_logging
+
+logger = logging.getLogger(__name__)
+command_logger = logging.getLogger(COMMAND_LOGGER)  # Per-command chatter, see logconfig.set_command_logging().
+
+
+def _prompt(message=''):
+    # Interactive prompts stay on stdout; queued log records are written first so they appear above the prompt.
+    flush_logging()
+    return input(message)
+
+class ControllerSettings:
     """
-    Initializes the PowderDispenseController with the given serial port and configuration settings.
-    Sets up the necessary hardware connections and calibration parameters for powder dispensing operations.
-
-    Parameters:
-        ser_port (str): The name of the serial port to connect to the hardware.
-        baud_rate (int): The baud rate for serial communication (default: 115200).
-        mixTime (float): Default mixing time in seconds (default: 10.0).
-        drainTime (float): Default draining time in seconds (default: 10.0).
-        defAugerType (str, optional): Default auger type (default: '8mm_base').
-        defPowderType (str, optional): Default powder type (default: 'dishwasher_salt').
-        config_file (str): Path to the configuration file (default: 'config.json').
+    Loads the configuration file and holds the operational defaults and calibration lookups that do not
+    depend on how the controller talks to the Arduino. Shared by `PowderDispenseController` and
+    `AsyncPowderDispenseController`.
     """
-    def __init__(self, ser_port, baud_rate=115200, mixTime=10.0, drainTime=10.0, defAugerType=None, defPowderType=None, config_file='config.json') -> None:
-        # Initialize the serial connection to the Arduino.
-        self.ser = serial.Serial(ser_port, baud_rate)
-        print(f"Serial port {ser_port} opened at baud rate {baud_rate}")
-
-        # Wait for the Arduino to signal readiness.
-        self.wait_for_arduino()
+    def _load_settings(self, config_file, mixTime, drainTime, defAugerType, defPowderType, config_overlay=None):
+        """
+        Loads the configuration file and sets the default operational parameters.
 
+        Parameters:
+            config_file (str): Path to the configuration file.
+            mixTime (float): Default mixing time in seconds.
+            drainTime (float): Default draining time in seconds.
+            defAugerType (str, optional): Default auger type.
+            defPowderType (str, optional): Default powder type.
+            config_overlay (str, optional): Per-rig file whose values replace those of the configuration file,
+                                            and which receives configuration changes instead of it.
+        """
         # Load the configuration file and store settings.
         self.config_file = config_file
-        self.powder_config = get_config(config_file)
-
-        # Initialize scale and stepper states.
-        self.isScaleOn = True
-        self.isStepperOn = True
-        self.disableStepper()  # Ensure stepper motor is disabled initially.
-        self.scaleOff()  # Ensure scale is powered off initially.
+        self.config_overlay = config_overlay
+        self.config_store = ConfigStore(config_file, overlay_file=config_overlay)  # Saves calibration changes.
+        self._apply_settings(load_settings(config_file, config_overlay))
 
         # Set default values for operational parameters.
         self.DEFAULT_augerType = defAugerType or '8mm_base'
         self.DEFAULT_powderType = defPowderType or 'dishwasher_salt'
         self.DEFAULT_filterType = 'EWMA'
-        self.DEFAULT_reps = self.powder_config['default_constants']['DEFAULT_REPS']
-        self.DEFAULT_samples = self.powder_config['default_constants']['DEFAULT_SAMPLES']
-        self.DEFAULT_timeout = self.powder_config['default_constants']['DEFAULT_TIMEOUT']
-        self.DEFAULT_direction = self.powder_config['default_constants']['DEFAULT_DISPENSE_DIR']
         self.DEFAULT_flushVolume = 1
 
         # Set default operational times and pin configurations.
@@ -66,25 +75,517 @@ class PowderDispenseController:
         self.flushTime = 1
         self.flushPin = 12
 
+    def _apply_settings(self, settings):
+        """
+        Takes over the configuration-derived defaults and calibration parameters from a Settings snapshot.
+        Defaults set through the constructor or the set_* methods are kept.
+        """
+        self.settings = settings
+        self.powder_config = settings.to_dict()  # Modifiable copy, e.g. for calibration sequences.
+        default_constants = settings.default_constants
+        self.DEFAULT_reps = default_constants['DEFAULT_REPS']
+        self.DEFAULT_samples = default_constants['DEFAULT_SAMPLES']
+        self.DEFAULT_timeout = default_constants['DEFAULT_TIMEOUT']
+        self.DEFAULT_direction = default_constants['DEFAULT_DISPENSE_DIR']
+
+        # Scale settling criteria, falling back to built-in values for configuration files without them.
+        self.DEFAULT_settleWindow = default_constants.get('DEFAULT_SETTLE_WINDOW', 0.5)
+        self.DEFAULT_settleMaxSlope = default_constants.get('DEFAULT_SETTLE_MAX_SLOPE', 0.005)
+        self.DEFAULT_settleMaxStd = default_constants.get('DEFAULT_SETTLE_MAX_STD', 0.002)
+        self.DEFAULT_settleTimeout = default_constants.get('DEFAULT_SETTLE_TIMEOUT', 5)
+
         # Load calibration parameters.
-        self.scaleSinglePointCal = self.powder_config['calibration']['scaleSinglePointCal']
-        self.numMeas = self.powder_config['constants']['numMeas']
-        self.dispenseDir = self.powder_config['constants']['dispenseDir']
-        self.decimal = self.powder_config['constants']['decimal']
+        self.scaleSinglePointCal = settings.scale_single_point_cal
+        self.numMeas = settings.constants['numMeas']
+        self.dispenseDir = settings.constants['dispenseDir']
+        self.decimal = settings.constants['decimal']
 
         # Extract calibration weights from configuration.
-        self.calWeights = self.powder_config['calibration']['weights']
-        self.calWeights_values = [weight['value'] for weight in self.calWeights]
+        self.calWeights = self.powder_config['calibration'].get('weights', [])
+        self.calWeights_values = [weight.value for weight in settings.weights]
+
+    def reload_config(self):
+        """
+        Reloads the configuration file (and overlay file) if it changed since it was loaded (by modification
+        time and size). Unsaved changes of this controller are saved first. The new values are taken over all
+        at once; if the file is not valid, the current values stay in use.
+
+        Returns:
+            bool: True if a changed configuration was loaded, False if the file is unchanged.
+
+        Raises:
+            ConfigError: If the changed file cannot be parsed or lacks required values.
+        """
+        self.config_store.flush()
+        settings = load_settings(self.config_file, self.config_overlay)
+        if settings is self.settings:
+            return False
+        self._apply_settings(settings)
+        logger.info("Configuration reloaded from %s", self.config_file)
+        return True
+
+    def update_config(self, keys, value):
+        """
+        Changes a configuration value, e.g. a calibration factor. The controller uses the new value at once;
+        it is saved to the configuration file (or the overlay file) shortly after, together with any other
+        changes made in the meantime, see ConfigStore.
+
+        Parameters:
+            keys (tuple of str): Path of the value, e.g. ('calibration', 'augers', '8mm_base', 'dishwasher_salt').
+            value: The new value.
+
+        Raises:
+            ConfigError: If the change makes the configuration invalid; nothing is changed then.
+        """
+        config = self.settings.to_dict()
+        set_config_value(config, keys, value)
+        settings = Settings(config, self.settings.path, self.settings.version)  # Validates before anything is changed.
+        self.config_store.set(keys, value)
+        self._apply_settings(settings)
+
+    def update_config_with_calibration(self, slope, intercept, loadCell=None):
+        """
+        Stores a new scale calibration line.
+
+        Parameters:
+            slope (float): Slope of the calibration line.
+            intercept (float): Intercept of the calibration line.
+            loadCell (str, optional): Name of the load cell, e.g. '100g' (default: the first configured load cell).
+        """
+        loadCell = loadCell or next(iter(self.settings.load_cells), None)
+        if loadCell is None:
+            raise ConfigError("No load cell configured in 'calibration.loadCells'; pass loadCell.")
+        self.update_config(('calibration', 'loadCells', loadCell, 'Slope'), float(slope))
+        self.update_config(('calibration', 'loadCells', loadCell, 'Intercept'), float(intercept))
+        logger.info("Updated calibration of load cell %s: slope %s, intercept %s", loadCell, slope, intercept)
+
+    def update_config_with_inflight_model(self, model, augerType=None, powderType=None):
+        """
+        Stores a settled-weight predictor, which the closed-loop engine then uses for this auger/powder pair.
+
+        Parameters:
+            model (InFlightModel): The fitted predictor, see `inflight.InFlightModel.fit`.
+            augerType (str, optional): The auger type the model was fitted for (default: controller default).
+            powderType (str, optional): The powder type the model was fitted for (default: controller default).
+        """
+        augerType = augerType or self.DEFAULT_augerType
+        powderType = powderType or self.DEFAULT_powderType
+        self.update_config(('calibration', 'inflight', augerType, powderType), model.to_calibration())
+        logger.info("Updated in-flight model of %s/%s: %r", augerType, powderType, model)
 
-        # Ensure a logs directory exists for logging operations.
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
+    def _settling_detector(self, window=None, max_slope=None, max_std=None, timeout=None):
+        """
+        Creates a SettlingDetector, using the configured settling criteria for any argument left as None.
+        """
+        return SettlingDetector(
+            window=self.DEFAULT_settleWindow if window is None else window,
+            max_slope=self.DEFAULT_settleMaxSlope if max_slope is None else max_slope,
+            max_std=self.DEFAULT_settleMaxStd if max_std is None else max_std,
+            timeout=self.DEFAULT_settleTimeout if timeout is None else timeout,
+        )
+
+    def _create_log_file(self, log_file=None):
+        """
+        Names the CSV log file of this session, by default after the current time in the 'logs' directory.
+        The file (and its directory) is only created when the first row is written through `log_writer`,
+        so sessions that never log do not leave empty files behind and connecting does not touch the disk.
 
-        # Initialize a new log file for this session.
+        Parameters:
+            log_file (str, optional): Path of the log file to create instead of the default name. A path ending
+                                      in '.parquet' creates a columnar log store instead (requires pyarrow).
+        """
         now = datetime.datetime.now()
-        self.log_file = f"logs/log_{now.strftime('%d%m%Y_%H%M%S')}.csv"
-        log_df = pd.DataFrame(columns=['desired amount', 'measured amount', '# of steps', 'filter type'])
-        log_df.to_csv(self.log_file, index=False)
+        self.log_file = log_file or f"logs/log_{now.strftime('%d%m%Y_%H%M%S')}.csv"
+        self._log_writer = None
+
+    @property
+    def log_writer(self):
+        """
+        The append-only writer of the session log, opened on first use.
+        """
+        if getattr(self, '_log_writer', None) is None:
+            if self.log_file.endswith('.parquet'):
+                from .logstore import ParquetLogWriter  # pyarrow is only needed for columnar logs.
+                self._log_writer = ParquetLogWriter(self.log_file)
+            else:
+                self._log_writer = SessionLogWriter(self.log_file)
+        return self._log_writer
+
+    def _close_log(self):
+        """
+        Flushes and closes the session log if it has been opened.
+        """
+        writer, self._log_writer = getattr(self, '_log_writer', None), None
+        if writer is not None:
+            writer.close()
+
+    def _steps_for(self, amount, augerType, powderType):
+        """
+        Converts an amount of powder in grams into stepper motor steps using the auger calibration factor.
+        """
+        return amount / self.settings.auger(augerType, powderType).grams_per_step
+
+    def _dose_command(self, target, threshold, max_chunk, min_chunk, settle_time, augerType, powderType):
+        """
+        Returns the '<DispenseUntil,...>' command of a dose by weight and the parameters of its loop.
+
+        Returns:
+            tuple: (command string, stop weight in grams, steps per gram).
+        """
+        steps_per_gram = 1.0 / self.settings.auger(augerType or self.DEFAULT_augerType, powderType or self.DEFAULT_powderType).grams_per_step
+        stop_at = min(threshold, target) if threshold is not None else target * DOSE_STOP_FRACTION
+        command_str = (f"<DispenseUntil,{target:.4f},{stop_at:.4f},{steps_per_gram:.1f},{max_chunk},{min_chunk},"
+                       f"{int(settle_time * 1000)},{self.dispenseDir}>")
+        return command_str, stop_at, steps_per_gram
+
+    def _dose_report(self, target, result, bursts, start, start_commands):
+        """
+        Logs how a dose by weight ended and summarizes it as a DispenseReport.
+        """
+        if result.reason != 'reached':
+            logger.warning("Dose of %.4f g ended early (%s) at %.4f g.", target, result.reason, result.weight)
+        return DispenseReport(target, result.weight, max(result.weight - target, 0.0), time.perf_counter() - start,
+                              self.command_count - start_commands, bursts, result.steps)
+
+    def _batch_steps(self, messages, buffer, commands, timeout, window):
+        """
+        The command sequence of `run_batch`, written once for both controllers: a generator for `comms.drive`
+        or `comms.drive_async`. The caller holds the controller's lock.
+
+        Parameters:
+            messages (MessageQueues): The controller's MessageDispatcher or AsyncSerialLink.
+            buffer (FrameBuffer): The FrameBuffer of the port, for the instrumentation.
+            commands, timeout, window: As for `run_batch`.
+
+        Returns:
+            list of BatchResult: One result per command, in order.
+        """
+        entries = [c if isinstance(c, BatchCommand) else BatchCommand(c) for c in commands]
+        results = []
+        cursor = messages.last_seq  # Replies to the batch are newer than this.
+        in_flight = deque()  # (entry, sent_at, rx_mark, size) of sent, unacknowledged commands.
+        outstanding = 0  # Bytes of the commands in flight.
+        next_index = 0
+        while len(results) < len(entries):
+            # Send as many of the following commands as fit into the window.
+            while next_index < len(entries):
+                entry = entries[next_index]
+                size = len(entry.command.encode('utf-8'))
+                if in_flight and outstanding + size > window:
+                    break
+                rx_mark = buffer.bytes_received
+                sent_at = time.monotonic()
+                self.send_to_arduino(entry.command)
+                self.command_count += 1
+                command_logger.info("Sent from PC -- COMMAND -- %s", entry.command)
+                in_flight.append((entry, sent_at, rx_mark, size))
+                outstanding += size
+                next_index += 1
+
+            # Wait for the acknowledgement of the oldest command in flight.
+            entry, sent_at, rx_mark, size = in_flight.popleft()
+            outstanding -= size
+            wait = entry.timeout if entry.timeout is not None else timeout
+            try:
+                msg = yield partial(messages.wait_for, 'Msg', after_seq=cursor, timeout=wait)
+                while not echo_matches(entry.command, msg.text):
+                    logger.warning("Skipping reply %s while waiting for the acknowledgement of %s", msg.text, entry.command)
+                    msg = yield partial(messages.wait_for, 'Msg', after_seq=msg.seq, timeout=wait)
+            except Exception as e:
+                self._record_command(buffer, entry.command, sent_at, rx_mark, None, 'timeout' if isinstance(e, TimeoutError) else 'error')
+                raise
+            self._record_command(buffer, entry.command, sent_at, rx_mark, msg, 'ok')
+            command_logger.info("Reply Received: %s", msg.text)
+
+            value = None
+            if entry.value_kind:
+                # The reading is sent just before the acknowledgement.
+                reading = yield partial(messages.wait_for, entry.value_kind, after_seq=cursor, timeout=self.DEFAULT_timeout)
+                value = reading_value(reading)
+                if value is None:
+                    logger.warning("Error parsing %s from message: %s", entry.value_kind, reading.text)
+            self.last_command_seq = cursor
+            cursor = msg.seq
+            if entry.on_ack is not None:
+                entry.on_ack()
+            results.append(BatchResult(entry.command, msg.text, value))
+        return results
+
+    def _dose_device_steps(self, messages, buffer, command_str, settle_time, on_progress):
+        """
+        The command sequence of a dose by weight on the device: sends '<DispenseUntil,...>' and follows its
+        progress frames until the dose ends. A generator for `comms.drive` or `comms.drive_async`; the caller
+        holds the controller's lock.
+
+        Returns:
+            tuple: (DoseResult, number of bursts), or None if the firmware does not know the command.
+
+        Raises:
+            TimeoutError: If the firmware stops reporting during the dose.
+        """
+        self.last_command_seq = after = messages.last_seq
+        rx_mark = buffer.bytes_received
+        sent_at = time.monotonic()
+        self.send_to_arduino(command_str)
+        self.command_count += 1
+        command_logger.info("Sent from PC -- COMMAND -- %s", command_str)
+        checks = 0
+        try:
+            while True:
+                # The first weight check comes within milliseconds; firmware without the command stays silent.
+                timeout = NEGOTIATION_TIMEOUT if checks == 0 else settle_time + self.DEFAULT_timeout
+                msg = yield partial(messages.wait_for, ('Progress', 'Dosed'), after_seq=after, timeout=timeout)
+                after = msg.seq
+                frame = parse_dose(msg)
+                if isinstance(frame, DoseResult):
+                    break
+                checks += 1
+                if on_progress is not None:
+                    on_progress(frame)
+            reply = yield partial(messages.wait_for, 'Msg', after_seq=after, timeout=self.DEFAULT_timeout)
+        except TimeoutError:
+            self._record_command(buffer, command_str, sent_at, rx_mark, None, 'timeout')
+            if checks == 0:
+                logger.info("Firmware does not support DispenseUntil; dosing from the PC.")
+                self.deviceDosing = False
+                return None
+            raise
+        self._record_command(buffer, command_str, sent_at, rx_mark, reply, 'ok')
+        command_logger.info("Reply Received: %s", reply.text)
+        self.deviceDosing = True
+        return frame, max(checks - 1, 0)
+
+    def _dose_host_steps(self, target, stop_at, steps_per_gram, max_chunk, min_chunk, settle_time, on_progress):
+        """
+        The loop of DispenserControls::dispenseUntil, run from the PC for firmware without DispenseUntil.
+        A generator for `comms.drive` or `comms.drive_async`.
+
+        Returns:
+            tuple: (DoseResult, number of bursts).
+        """
+        limit = 2 * target * steps_per_gram + max_chunk  # Guards against an empty hopper, as on the device.
+        steps = bursts = 0
+        weight = yield partial(self.measWeight, DOSE_SAMPLES, 'NONE')
+        while True:
+            if on_progress is not None:
+                on_progress(DoseProgress(weight, steps, None))
+            if weight >= stop_at or steps >= limit:
+                break
+            chunk = dose_chunk(target, weight, steps_per_gram, min_chunk, max_chunk)
+            yield partial(self.dispense, chunk, direction=self.dispenseDir, runSteps=True)
+            steps, bursts = steps + chunk, bursts + 1
+            yield partial(self._sleep, settle_time)  # Let the powder land and the load cell settle.
+            weight = yield partial(self.measWeight, DOSE_SAMPLES, 'NONE')
+        return DoseResult(weight, steps, 'reached' if weight >= stop_at else 'step_limit'), bursts
+
+    def _pump_time(self, pump, volume=None, time=None):
+        """
+        Returns the pump's control pin and run time, calculated from the calibration parameters if a
+        volume is given, otherwise taken from `time`. A run time of 0 means the pump should not run.
+        """
+        calibration = self.settings.pump(pump)
+        pump_pin = calibration.pin  # Get the pump's control pin.
+        if volume is not None and volume > 0:
+            # Calculate the pump runtime based on the calibration parameters.
+            pump_time = calibration.a * volume + calibration.b
+        elif time is not None and time > 0:
+            # Use the specified time if no volume is provided.
+            pump_time = time
+        else:
+            pump_time = 0
+        return pump_pin, pump_time
+
+    def _on_actuator_done(self, msg):
+        """
+        Resolves the oldest pending run of the actuator named in a '<Done:...>' frame with an ActuatorDone.
+        Subscribed to 'Done' messages, so it runs where the frames are read and must not block.
+        """
+        try:
+            done = parse_done(msg)
+        except ValueError:
+            logger.warning("Error parsing completion message: %s", msg.text)
+            return
+        runs = self._actuator_runs.get(done.actuator)
+        if runs:  # Runs of a previous session are not tracked.
+            future = runs.popleft()
+            if not future.done():
+                future.set_result(done)
+
+    def _end_actuator_run(self, actuator, future, result=None):
+        """
+        Stops tracking a run whose '<Done:...>' frame will not come, and resolves it with `result` if given:
+        the command failed, or the firmware ran it blocking because it has no background actuators.
+        """
+        runs = self._actuator_runs.get(actuator)
+        if runs and future in runs:
+            runs.remove(future)
+        if result is not None and not future.done():
+            future.set_result(result)
+
+    def _on_feed_end(self, msg):
+        """
+        Notes the end of a continuous feed reported in a '<Fed:...>' frame, whether the PC stopped it or it
+        reached its step limit. Subscribed to 'Fed' messages, so it runs where the frames are read.
+        """
+        try:
+            self.lastFeed = parse_fed(msg)
+        except ValueError:
+            logger.warning("Error parsing feed message: %s", msg.text)
+            return
+        self.feedRate = 0.0
+
+    def _feed_command(self, rate, direction, max_steps):
+        """
+        Returns the '<Feed,...>' command setting the auger's step rate, and the timeout for its acknowledgement:
+        short while it is unknown whether the firmware supports the command, as it ignores unknown commands.
+        """
+        if self.continuousFeed is False:
+            raise RuntimeError("The firmware does not support continuous feeding.")
+        timeout = NEGOTIATION_TIMEOUT if self.continuousFeed is None else self.DEFAULT_timeout
+        return f"<Feed,{max(rate, 0):.1f},{direction or self.dispenseDir},{int(max_steps or 0)}>", timeout
+
+    def _cancel_actuator_runs(self):
+        """
+        Cancels the futures of all runs still pending, e.g. when the port is closed.
+        """
+        for runs in self._actuator_runs.values():
+            while runs:
+                runs.popleft().cancel()
+
+    def _record_command(self, buffer, command_str, sent_at, rx_mark, msg, outcome):
+        # Adds one command to the instrumentation. `buffer` is the FrameBuffer of the port and `rx_mark` its
+        # `bytes_received` just before the command was sent.
+        if self.instrumentation is None:
+            return
+        first_byte = buffer.first_arrival(rx_mark)
+        self.instrumentation.record(
+            command_str, sent_at,
+            first_byte=None if first_byte is None else first_byte - sent_at,
+            reply=None if msg is None else msg.timestamp - sent_at,
+            bytes_out=len(command_str.encode('utf-8')),
+            bytes_in=0 if msg is None else len(msg.text.encode('utf-8')) + 2,  # Including the frame markers.
+            outcome=outcome)
+
+    def stats(self, command=None):
+        """
+        Returns the live command statistics collected since the controller was created or `reset_stats()`.
+
+        Parameters:
+            command (str, optional): Only return the statistics of this command name (e.g. 'Meas').
+
+        Returns:
+            dict: Maps each command name to its number of calls, counts per outcome ('ok', 'timeout', 'error'),
+                  bytes sent and received, and the count, min, mean, p50, p90, p99 and max of its first-byte
+                  and reply latencies in milliseconds ('first_byte', 'reply'). A single entry if `command` is
+                  given (empty if it was never sent).
+
+        Raises:
+            RuntimeError: If the controller was created with `instrument=False`.
+        """
+        if self.instrumentation is None:
+            raise RuntimeError("Command instrumentation is disabled for this controller.")
+        snapshot = self.instrumentation.snapshot()
+        return snapshot if command is None else snapshot.get(command, {})
+
+    def export_stats(self, path):
+        """
+        Writes the command statistics, including the full latency histograms, to a JSON file.
+
+        Parameters:
+            path (str): Path of the JSON file.
+        """
+        if self.instrumentation is None:
+            raise RuntimeError("Command instrumentation is disabled for this controller.")
+        self.instrumentation.export(path)
+
+    def reset_stats(self):
+        """
+        Discards the collected command statistics.
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.reset()
+
+class PowderDispenseController(ControllerSettings):
+    """
+    Initializes the PowderDispenseController with the given serial port and configuration settings.
+    Sets up the necessary hardware connections and calibration parameters for powder dispensing operations.
+
+    Parameters:
+        ser_port (str): The name of the serial port to connect to the hardware.
+        baud_rate (int): The baud rate for serial communication (default: 115200).
+        mixTime (float): Default mixing time in seconds (default: 10.0).
+        drainTime (float): Default draining time in seconds (default: 10.0).
+        defAugerType (str, optional): Default auger type (default: '8mm_base').
+        defPowderType (str, optional): Default powder type (default: 'dishwasher_salt').
+        config_file (str): Path to the configuration file (default: 'config.json').
+        measure_cpu (bool): If True, records the CPU time consumed by every command (default: False).
+        instrument (bool): If True, records the latency, bytes and outcome of every command, see stats() (default: True).
+        log_file (str, optional): Path of the session log file (default: 'logs/log_<timestamp>.csv');
+                                  a '.parquet' path stores the log in columnar form.
+        config_overlay (str, optional): Per-rig file whose values replace those of `config_file`, and to which
+                                        calibration changes are saved instead, e.g. when several rigs share one
+                                        configuration file (default: None).
+        fast_attach (bool): If True, attaches to a running Arduino without resetting it: the port is left with
+                            DTR asserted on close, the firmware is probed with 'Ping' instead of waiting for the
+                            boot banner, and the scale and stepper keep their current state (default: False).
+        binary_frames (bool): If True, asks the firmware to send scale readings as binary frames, falling back to
+                              ASCII if it does not support them; if False, readings are sent as ASCII text, see
+                              set_binary_frames() (default: False).
+    """
+    _sleep = staticmethod(time.sleep)  # Waits in the command sequences shared with the asyncio controller.
+
+    def __init__(self, ser_port, baud_rate=115200, mixTime=10.0, drainTime=10.0, defAugerType=None, defPowderType=None, config_file='config.json', measure_cpu=False, log_file=None, instrument=True, fast_attach=False, config_overlay=None, binary_frames=False) -> None:
+        # Initialize the serial connection to the Arduino.
+        self.ser = serial.Serial(ser_port, baud_rate)
+        logger.info("Serial port %s opened at baud rate %s", ser_port, baud_rate)
+        self.reader = FrameReader(self.ser)  # Buffered reader reassembling '<...>' frames.
+        self.dispatcher = MessageDispatcher(self.reader)  # Background thread routing frames by type.
+        self.dispatcher.start()
+        self.last_command_seq = 0  # Sequence number of the last message received before the latest command.
+        self.command_count = 0  # Number of commands sent since the controller was created.
+        self.weightStream = None  # Active WeightStream while streaming mode is on.
+        self.weightStreaming = None  # Whether the firmware supports Stream; None until known.
+        self.binaryFrames = False  # Whether the firmware sends scale readings as binary frames; ASCII after a reset.
+        self.binarySupport = None  # Whether the firmware supports binary frames; None until known.
+        self._lock = threading.RLock()  # Keeps threads sharing this controller from interleaving replies.
+        self._actuator_runs = {'Mix': deque(), 'Drain': deque(), 'Pump': deque()}  # Pending background runs, oldest first.
+        self.backgroundActuators = None  # Whether the firmware runs Mix, Drain and Pump in the background; None until known.
+        self.deviceDosing = None  # Whether the firmware supports DispenseUntil; None until known.
+        self.continuousFeed = None  # Whether the firmware supports Feed and FeedStop; None until known.
+        self.feedRate = 0.0  # Step rate of the running continuous feed; 0 while the auger stands still.
+        self.lastFeed = None  # FeedEnd of the latest continuous feed.
+        self.dispatcher.subscribe('Done', self._on_actuator_done)
+        self.dispatcher.subscribe('Fed', self._on_feed_end)
+
+        # CPU usage measurement per command type, see cpu_report().
+        self.measure_cpu = measure_cpu
+        self.cpu_usage = {}
+
+        # Per-command latency histograms, see stats().
+        self.instrumentation = CommandStats() if instrument else None
+
+        # Load the configuration file and store settings.
+        self._load_settings(config_file, mixTime, drainTime, defAugerType, defPowderType, config_overlay)
+
+        # Closing the port drops DTR and resets the Arduino, unless attaching fast; in that case the next session can attach fast too.
+        kept_dtr = set_hangup_on_close(self.ser, not fast_attach) is False  # The previous session left DTR asserted: opening did not reset the board.
+
+        # Initialize scale and stepper states.
+        self.isScaleOn = True
+        self.isStepperOn = True
+        if fast_attach:
+            self.attach()  # Adopt the state of the running firmware.
+        else:
+            if kept_dtr and not pulse_dtr(self.ser):
+                self.attach()  # The board cannot be reset from here; make sure it is up instead.
+            else:
+                self.wait_for_arduino()  # Wait for the Arduino to signal readiness.
+            self.disableStepper()  # Ensure stepper motor is disabled initially.
+            self.scaleOff()  # Ensure scale is powered off initially.
+        self.set_binary_frames(binary_frames)  # Negotiate the format of the scale readings.
+
+        # Name the log file of this session; it is created with the first row written.
+        self._create_log_file(log_file)
 
     ### COMMS #####################
     def send_to_arduino(self, send_str):
@@ -98,7 +599,9 @@ class PowderDispenseController:
 
     def recv_from_arduino(self, timeout=None):
         """
-        Receives a string from the Arduino device over the serial port with an optional timeout.
+        Receives the next message of any type from the Arduino with an optional timeout.
+        Messages are read continuously by the background reader thread, so nothing that arrived
+        between calls is lost.
 
         Parameters:
             timeout (int, optional): Maximum time in seconds to wait for a response.
@@ -110,60 +613,221 @@ class PowderDispenseController:
             TimeoutError: If no response is received within the specified timeout.
         """
         timeout = timeout or self.DEFAULT_timeout  # Use default timeout if none is provided.
-        start_marker = 60  # ASCII code for '<'.
-        end_marker = 62    # ASCII code for '>'.
-        start_time = time.time()
-        ck = ""  # Buffer to store the received string.
-
-        while time.time() - start_time < timeout:
-            # Wait for the start marker.
-            while ord(self.ser.read()) != start_marker:
-                pass
-
-            # Read characters until the end marker is encountered.
-            while ord(self.ser.read()) != end_marker:
-                char = self.ser.read().decode("utf-8")
-                ck += char
-            return ck
-
-        raise TimeoutError("Arduino did not respond within timeout. Try resetting the device.")
+        return self.dispatcher.wait_for(timeout=timeout).text
 
     def wait_for_arduino(self):
         """
         Waits for a readiness message from the Arduino indicating it is ready to receive commands.
         This function is essential during initialization to ensure the Arduino is fully booted.
         """
-        msg = ""
-        while "Ready to push powder, baby!" not in msg:
-            while self.ser.in_waiting == 0:  # Wait until there is data in the serial buffer.
-                pass
-            msg = self.recv_from_arduino()  # Read the message from Arduino.
-            print(msg)  # Print the message to confirm readiness.
+        msg = self.dispatcher.wait_for('Ready', timeout=None)  # Block until the boot banner arrives.
+        logger.info(msg.text)  # Log the message to confirm readiness.
+
+    def ping(self, timeout=None):
+        """
+        Asks the firmware for its state with a 'Ping' command, which has no side effects.
+
+        Parameters:
+            timeout (float, optional): Maximum time in seconds to wait for the reply (default: DEFAULT_timeout).
+
+        Returns:
+            RigStatus: Whether the scale is powered, the stepper is enabled and weights are being streamed.
+
+        Raises:
+            TimeoutError: If no reply is received within the timeout.
+        """
+        timeout = timeout or self.DEFAULT_timeout
+        with self._lock:
+            self.run_command("<Ping>", timeout=timeout)
+            msg = self.dispatcher.wait_for('Status', after_seq=self.last_command_seq, timeout=timeout)
+        return parse_status(msg)
+
+    def attach(self, timeout=None, interval=0.25):
+        """
+        Attaches to a running Arduino without resetting it: pings it until it answers (e.g. while it is still
+        booting) and adopts the reported scale and stepper state instead of switching both off. A weight stream
+        left running by a previous session is stopped.
+
+        Parameters:
+            timeout (float, optional): Maximum time in seconds to wait for the firmware (default: DEFAULT_timeout).
+            interval (float): Time in seconds to wait for each ping's reply before sending another (default: 0.25).
+
+        Returns:
+            RigStatus: The state reported by the firmware.
+
+        Raises:
+            TimeoutError: If the firmware does not answer, e.g. because it does not support 'Ping'.
+        """
+        deadline = time.monotonic() + (timeout or self.DEFAULT_timeout)
+        while True:
+            try:
+                status = self.ping(timeout=min(interval, max(deadline - time.monotonic(), 0.01)))
+                break
+            except TimeoutError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("No reply to 'Ping'; the firmware may be too old to attach to without a reset.") from None
+
+        self.isScaleOn = bool(status.scale_on)
+        self.isStepperOn = bool(status.stepper_on)
+        self.binaryFrames = bool(status.binary)
+        self.binarySupport = status.binary is not None  # Only firmware with binary frames reports a fourth flag.
+        self.weightStreaming = True  # The Status frame reports the streaming state, so the firmware knows Stream.
+        if status.streaming:
+            self.run_command("<StreamStop>")  # Nobody consumes the stream of the previous session.
+        logger.info("Attached to running firmware: scale %s, stepper %s", 'on' if status.scale_on else 'off', 'on' if status.stepper_on else 'off')
+        return status
+
+    def set_binary_frames(self, enabled=True, timeout=None):
+        """
+        Switches the scale readings (Weight, ADC and Stream) between binary frames and ASCII text. Binary frames
+        are a third of the size and need no text parsing, see `binary`. Firmware without binary frames ignores
+        the request, so the readings stay ASCII when it is not acknowledged in time. The request is not sent
+        when the firmware is known not to support it, e.g. from its 'Status' reply, see attach().
+
+        Parameters:
+            enabled (bool): True for binary frames, False for ASCII text (default: True).
+            timeout (float, optional): Maximum time in seconds to wait for the acknowledgement (default: NEGOTIATION_TIMEOUT).
+
+        Returns:
+            bool: Whether the firmware now sends binary frames.
+        """
+        enabled = bool(enabled)
+        if enabled == self.binaryFrames:
+            return enabled
+        if self.binarySupport is False:
+            logger.info("Firmware does not support binary frames; scale readings stay ASCII.")
+            return self.binaryFrames
+        try:
+            self.run_command(f"<Binary,{int(enabled)}>", timeout=timeout or NEGOTIATION_TIMEOUT)
+        except TimeoutError:
+            logger.info("Firmware does not support binary frames; scale readings stay ASCII.")
+            self.binarySupport = False  # Not asked again on this connection.
+            return self.binaryFrames
+        self.binarySupport = True
+        self.binaryFrames = enabled
+        return enabled
 
     def clear_serial_buffer(self):
         """
-        Clears the serial buffer to ensure there are no lingering data packets before sending a new command.
-        This is important for maintaining the integrity of the command sequences sent to the Arduino.
+        Clears the serial buffer and discards all queued messages.
+        Commands no longer need this, as replies are matched by sequence number, but it is kept for
+        explicitly resynchronising with the Arduino.
         """
         self.ser.reset_input_buffer()  # Clear the input buffer.
+        self.dispatcher.clear()  # Drop any queued messages.
+
+    def close(self):
+        """
+        Stops the background reader thread, closes the serial port, flushes the session log and saves
+        pending configuration changes.
+        """
+        self.dispatcher.stop()
+        self.ser.close()
+        self._cancel_actuator_runs()
+        self._close_log()
+        self.config_store.close()
 
-    def run_command(self, command_str):
+    def run_command(self, command_str, timeout=None):
         """
         Sends a command string to the connected hardware through the serial interface.
         Designed to control the hardware operations such as turning on the scale, mixing, or dispensing.
 
         Parameters:
             command_str (str): The command string formatted specifically for the hardware.
+            timeout (float, optional): Maximum time in seconds to wait for the reply. Waits indefinitely if None.
+
+        Returns:
+            str: The reply received from the Arduino.
+
+        Raises:
+            TimeoutError: If no reply is received within the specified timeout.
+        """
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        with self._lock:
+            self.last_command_seq = self.dispatcher.last_seq  # Anything received up to now is not a reply to this command.
+            rx_mark = self.reader.buffer.bytes_received
+            sent_at = time.monotonic()
+            try:
+                self.send_to_arduino(command_str)  # Send the command string to the Arduino.
+                self.command_count += 1
+                command_logger.info("Sent from PC -- COMMAND -- %s", command_str)  # Log the sent command.
+
+                # Block until the acknowledgement for this command arrives.
+                msg = self.dispatcher.wait_for('Msg', after_seq=self.last_command_seq, timeout=timeout)
+            except Exception as e:
+                self._record_command(self.reader.buffer, command_str, sent_at, rx_mark, None, 'timeout' if isinstance(e, TimeoutError) else 'error')
+                raise
+            self._record_command(self.reader.buffer, command_str, sent_at, rx_mark, msg, 'ok')
+            response = msg.text
+            command_logger.info("Reply Received: %s", response)
+
+        if self.measure_cpu:
+            self._record_cpu(command_str, time.process_time() - cpu_start, time.perf_counter() - wall_start)
+        return response
+
+    def batch(self, timeout=None):
+        """
+        Creates a CommandBatch that queues operations and runs them pipelined, see run_batch().
+
+        Parameters:
+            timeout (float, optional): Maximum time in seconds to wait for each acknowledgement of commands
+                                       without their own timeout. Waits indefinitely if None.
+
+        Returns:
+            CommandBatch: The empty batch; it runs at the end of a `with` block or on `run()`.
+        """
+        return CommandBatch(self, timeout)
+
+    def run_batch(self, commands, timeout=None, window=RX_WINDOW):
         """
-        self.clear_serial_buffer()  # Clear any residual data in the serial buffer.
-        self.send_to_arduino(command_str)  # Send the command string to the Arduino.
-        print(f"Sent from PC -- COMMAND -- {command_str}")  # Log the sent command.
+        Sends several commands back-to-back instead of waiting for each acknowledgement before sending the
+        next command. The acknowledgements are matched to the commands in order by their echoed text.
+
+        Parameters:
+            commands (list of str or BatchCommand): The commands, e.g. from a CommandBatch.
+            timeout (float, optional): Maximum time in seconds to wait for each acknowledgement of commands without
+                                       their own timeout, counted from the previous one. Waits indefinitely if None.
+            window (int): Maximum number of unacknowledged command bytes in flight, so the Arduino's serial
+                          receive buffer does not overflow (default: RX_WINDOW).
 
-        # Wait for and print the response from Arduino.
-        while self.ser.in_waiting == 0:
-            pass
-        response = self.recv_from_arduino()
-        print(f"Reply Received: {response}")
+        Returns:
+            list of BatchResult: One result per command, in order.
+
+        Raises:
+            TimeoutError: If an acknowledgement is not received in time. Commands sent after it may still be
+                          executed by the Arduino.
+        """
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        with self._lock:
+            results = drive(self._batch_steps(self.dispatcher, self.reader.buffer, commands, timeout, window))
+
+        if self.measure_cpu:
+            self._record_cpu("<Batch>", time.process_time() - cpu_start, time.perf_counter() - wall_start)
+        return results
+
+    def _record_cpu(self, command_str, cpu_time, wall_time):
+        """
+        Accumulates the CPU and wall-clock time of a command under its command name (e.g. 'Mix').
+        """
+        name = command_name(command_str)
+        usage = self.cpu_usage.setdefault(name, {'calls': 0, 'cpu_s': 0.0, 'wall_s': 0.0})
+        usage['calls'] += 1
+        usage['cpu_s'] += cpu_time
+        usage['wall_s'] += wall_time
+        command_logger.info("CPU time for %s: %.6f s over %.3f s wall time", name, cpu_time, wall_time)
+
+    def cpu_report(self):
+        """
+        Returns the CPU time consumed per command type while `measure_cpu` was enabled.
+
+        Returns:
+            dict: Maps each command name to its number of calls, total CPU seconds ('cpu_s'),
+                  total wall-clock seconds ('wall_s') and CPU seconds per call ('cpu_s_per_call').
+        """
+        return {
+            name: dict(usage, cpu_s_per_call=usage['cpu_s'] / usage['calls'])
+            for name, usage in self.cpu_usage.items()
+        }
 
 
 
@@ -171,56 +835,32 @@ class PowderDispenseController:
     def get_raw(self):
         """
         Requests and retrieves a raw analog-to-digital converter (ADC) reading from the Arduino.
+        Waits for the first 'ADC' message received after the most recent command was sent.
 
         Returns:
             float: The raw ADC value as a float, representing the analog signal level detected by the Arduino.
         """
-        msg = ""
-        # Loop until a message containing "ADC" is received.
-        while "ADC" not in msg:
-            while self.ser.in_waiting == 0:  # Wait for data in the Serial buffer.
-                pass
-            msg = self.recv_from_arduino()  # Read the message from Arduino.
-            if "ADC" in msg:
-                try:
-                    raw_data = msg.split(':')[1]  # Extract the data after the "ADC:" prefix.
-                    raw_val = float(raw_data.split(',')[0])  # Parse the first value as a float.
-                    return raw_val
-                except (IndexError, ValueError) as e:
-                    # Handle cases where the message format is unexpected or invalid.
-                    print(f"Error parsing ADC from message: {msg}")
-                    print(f"Exception: {e}")
-                    return None
-            else:
-                print(f"Received message does not contain 'ADC:' {msg}")  # Log unexpected messages.
-        return None
+        msg = self.dispatcher.wait_for('ADC', after_seq=self.last_command_seq, timeout=self.DEFAULT_timeout)
+        raw_val = reading_value(msg)  # Decoded from a binary frame, or parsed from '<ADC:...>'.
+        if raw_val is None:
+            # Handle cases where the message format is unexpected or invalid.
+            logger.warning("Error parsing ADC from message: %s", msg.text)
+        return raw_val
 
     def get_weight(self):
         """
         Requests and retrieves the weight measurement from the Arduino, which is processed and returned in grams.
+        Waits for the first 'Weight' message received after the most recent command was sent.
 
         Returns:
             float: The weight in grams measured by the Arduino.
         """
-        msg = ""
-        # Loop until a message containing "Weight" is received.
-        while "Weight" not in msg:
-            while self.ser.in_waiting == 0:  # Wait for data in the Serial buffer.
-                pass
-            msg = self.recv_from_arduino()  # Read the message from Arduino.
-            if "Weight" in msg:
-                try:
-                    weight_data = msg.split(':')[1]  # Extract the data after the "Weight:" prefix.
-                    weight_val = float(weight_data.split(',')[0])  # Parse the first value as a float.
-                    return weight_val
-                except (IndexError, ValueError) as e:
-                    # Handle cases where the message format is unexpected or invalid.
-                    print(f"Error parsing weight from message: {msg}")
-                    print(f"Exception: {e}")
-                    return None
-            else:
-                print(f"Received message does not contain 'Weight:' {msg}")  # Log unexpected messages.
-        return None
+        msg = self.dispatcher.wait_for('Weight', after_seq=self.last_command_seq, timeout=self.DEFAULT_timeout)
+        weight_val = reading_value(msg)  # Decoded from a binary frame, or parsed from '<Weight:...>'.
+        if weight_val is None:
+            # Handle cases where the message format is unexpected or invalid.
+            logger.warning("Error parsing weight from message: %s", msg.text)
+        return weight_val
 
 ### CONTROL FUNCTIONS ##############################
     def set_mixTime(self, mixTime):
@@ -291,8 +931,7 @@ class PowderDispenseController:
             neededSteps = amount_or_steps
         else:
             # Calculate the number of steps based on the desired amount and calibration factor.
-            augCalFactor = self.powder_config['calibration']['augers'][augerType][powderType]
-            neededSteps = amount_or_steps / augCalFactor
+            neededSteps = self._steps_for(amount_or_steps, augerType, powderType)
 
         # Send the dispense command to the Arduino.
         self.run_command(f"<Dispense,{neededSteps},{direction}>")
@@ -310,9 +949,53 @@ class PowderDispenseController:
         Disables the stepper motor, stopping its operations to ensure safety and conserve power.
         """
         if self.isStepperOn:  # Only disable if it is currently on.
-            self.run_command(f"<DispenserOff>")
+            self.run_command(f"<DispenserOff>")  # Also ends a continuous feed.
             self.isStepperOn = False
 
+    def set_feed_rate(self, rate, direction=None, max_steps=None):
+        """
+        Turns the auger continuously at a step rate, or changes the rate of the running feed without stopping it.
+        The firmware takes the steps between other work, so the scale can be streamed and read while it feeds.
+        The stepper must be enabled, see enableStepper().
+
+        Parameters:
+            rate (float): Step rate in steps per second; 0 stops the feed.
+            direction (int, optional): The direction to dispense (default: the configured dispensing direction).
+            max_steps (int, optional): Steps after which the feed stops by itself, counted from its start; a new
+                                       rate replaces the limit. None for no limit.
+
+        Raises:
+            RuntimeError: If the firmware does not support continuous feeding.
+        """
+        command_str, timeout = self._feed_command(rate, direction, max_steps)
+        with self._lock:
+            if self.feedRate == 0:
+                self.lastFeed = None  # A new feed starts.
+            try:
+                self.run_command(command_str, timeout=timeout)
+            except TimeoutError:
+                if self.continuousFeed is not None:
+                    raise
+                self.continuousFeed = False
+                raise RuntimeError("The firmware does not support continuous feeding.") from None
+            self.continuousFeed = True
+            self.feedRate = max(rate, 0.0) if self.lastFeed is None else 0.0
+
+    def stop_feed(self):
+        """
+        Stops the continuous feed.
+
+        Returns:
+            FeedEnd: The steps of the latest feed and whether it had already stopped at its step limit, or None if
+                     no feed ran since the last one was reported.
+        """
+        if self.continuousFeed:
+            with self._lock:
+                # The firmware reports the feed in '<Fed:...>' before acknowledging, see _on_feed_end.
+                self.run_command("<FeedStop>", timeout=self.DEFAULT_timeout)
+                self.feedRate = 0.0
+        return self.lastFeed
+
 ## Scale controller functions
     def measRaw(self, avgReadingSamples=100, filterType=None):
         """
@@ -326,8 +1009,9 @@ class PowderDispenseController:
             float: The raw sensor data after optional filtering.
         """
         filterType = filterType or self.DEFAULT_filterType  # Use the default filter if none is provided.
-        self.run_command(f"<ADC,{avgReadingSamples},{filterType}>")  # Send ADC command to Arduino.
-        adc_val = self.get_raw()  # Retrieve the raw ADC value.
+        with self._lock:
+            self.run_command(f"<ADC,{avgReadingSamples},{filterType}>")  # Send ADC command to Arduino.
+            adc_val = self.get_raw()  # Retrieve the raw ADC value.
         return adc_val
 
     def measWeight(self, avgReadingSamples=100, filterType=None):
@@ -342,22 +1026,148 @@ class PowderDispenseController:
             float: The weight measured by the scale, processed through the defined filters.
         """
         filterType = filterType or self.DEFAULT_filterType  # Use the default filter if none is provided.
-        self.run_command(f"<Meas,{avgReadingSamples},{filterType}>")  # Send weight measurement command.
-        weight_val = self.get_weight()  # Retrieve the weight value from Arduino.
+        with self._lock:
+            self.run_command(f"<Meas,{avgReadingSamples},{filterType}>")  # Send weight measurement command.
+            weight_val = self.get_weight()  # Retrieve the weight value from Arduino.
         return weight_val
 
-    def scaleOn(self, settle_time=5):
+    def start_weight_stream(self, rate=20, avgReadingSamples=1, filterType=None, buffer_size=1024):
+        """
+        Switches the scale to streaming mode, in which the Arduino pushes weight readings continuously
+        instead of answering one 'Meas' command per reading.
+
+        Parameters:
+            rate (float, optional): Number of readings per second (default: 20). Limited by the scale's
+                                    sample rate divided by `avgReadingSamples`.
+            avgReadingSamples (int, optional): The number of readings the Arduino averages per streamed sample.
+            filterType (str, optional): The filter type to apply on the Arduino.
+            buffer_size (int, optional): Maximum number of samples kept for a slow consumer (default: 1024).
+
+        Returns:
+            WeightStream: Ring buffer receiving the samples; iterate over it to consume them.
+
+        Raises:
+            RuntimeError: If the firmware does not support streaming mode.
+        """
+        if self.weightStreaming is False:
+            raise RuntimeError("The firmware does not support weight streaming.")
+        filterType = filterType or self.DEFAULT_filterType  # Use the default filter if none is provided.
+        self.stop_weight_stream()  # Only one stream can be active at a time.
+        self.scaleOn()
+
+        stream = WeightStream(buffer_size)
+        self.dispatcher.subscribe('Stream', lambda msg: stream.push(parse_stream_sample(msg)))
+        self.weightStream = stream
+        command_str = f"<Stream,{rate},{avgReadingSamples},{filterType}>"
+        if self.weightStreaming is None:
+            # Firmware without the command may acknowledge it all the same, so only a reading proves support.
+            try:
+                self.run_command(command_str, timeout=NEGOTIATION_TIMEOUT)
+                self.weightStreaming = stream.wait_started(NEGOTIATION_TIMEOUT + 1.0 / rate)
+            except TimeoutError:
+                self.weightStreaming = False
+            if not self.weightStreaming:
+                logger.warning("Firmware does not support weight streaming; settling waits poll the scale with Meas instead.")
+                self.dispatcher.unsubscribe('Stream')
+                stream.close()
+                self.weightStream = None
+                raise RuntimeError("The firmware does not support weight streaming.")
+        else:
+            self.run_command(command_str)
+        return stream
+
+    def stop_weight_stream(self):
+        """
+        Stops streaming mode. Iterators over the stream end once the remaining samples are consumed.
+        """
+        if self.weightStream is not None:
+            self.run_command(f"<StreamStop>")
+            self.dispatcher.unsubscribe('Stream')
+            self.weightStream.close()
+            self.weightStream = None
+
+    def stream_weights(self, rate=20, avgReadingSamples=1, filterType=None, buffer_size=1024):
+        """
+        Generator yielding streamed weight samples. Streaming starts with the first sample requested and
+        stops when the generator is closed (e.g. when leaving a `for` loop with `break`).
+
+        Parameters:
+            rate (float, optional): Number of readings per second (default: 20).
+            avgReadingSamples (int, optional): The number of readings the Arduino averages per streamed sample.
+            filterType (str, optional): The filter type to apply on the Arduino.
+            buffer_size (int, optional): Maximum number of samples kept for a slow consumer (default: 1024).
+
+        Yields:
+            WeightSample: Timestamped weight readings in grams.
+        """
+        stream = self.start_weight_stream(rate, avgReadingSamples, filterType, buffer_size)
+        try:
+            yield from stream
+        finally:
+            if self.weightStream is stream:
+                self.stop_weight_stream()
+
+    def wait_for_settle(self, window=None, max_slope=None, max_std=None, timeout=None):
+        """
+        Waits until the scale readings are stable instead of sleeping for a fixed time.
+
+        The readings are taken from the active weight stream, or from a stream started for the duration of
+        the wait; on firmware without streaming mode, the scale is polled with 'Meas' instead. Arguments left
+        as None use the configured DEFAULT_SETTLE_* values.
+
+        Parameters:
+            window (float, optional): Time window in seconds over which the readings must be stable.
+            max_slope (float, optional): Maximum weight drift in grams per second within the window.
+            max_std (float, optional): Maximum standard deviation in grams within the window.
+            timeout (float, optional): Maximum time in seconds to wait.
+
+        Returns:
+            SettleResult: The mean weight of the final window, whether the scale settled and how long it took.
+        """
+        detector = self._settling_detector(window, max_slope, max_std, timeout)
+        stream = self.weightStream
+        if stream is not None:
+            stream.drain()  # Only readings taken from now on count.
+            result = detector.wait(stream)
+        else:
+            try:
+                stream = self.start_weight_stream()
+            except RuntimeError:
+                result = detector.poll(lambda: self.measWeight(avgReadingSamples=1))
+            else:
+                try:
+                    result = detector.wait(stream)
+                finally:
+                    self.stop_weight_stream()
+        if result.settled:
+            logger.debug("Scale settled after %.3f s at %s g", result.elapsed, result.weight)
+        else:
+            logger.warning("Scale did not settle within %.1f s (slope %.4f g/s, std %.4f g); continuing at %s g.",
+                           result.elapsed, result.slope, result.std, result.weight)
+        return result
+
+    def _settled_weight(self):
+        """
+        Waits for the scale to settle and returns the mean weight of the final window, or a 'Meas' reading if
+        no reading arrived while waiting.
+        """
+        result = self.wait_for_settle()
+        return result.weight if result.weight is not None else self.measWeight()
+
+    def scaleOn(self, settle_time=None):
         """
         Turns on the scale and waits for it to settle.
         Only turns on the scale if it is not already on, to prevent redundant operations.
 
         Parameters:
-            settle_time (int, optional): Time in seconds to wait after turning on the scale. Defaults to 5 seconds.
+            settle_time (float, optional): Maximum time in seconds to wait for the scale to settle after turning
+                                           it on. Defaults to the configured settling timeout; 0 skips the wait.
         """
         if not self.isScaleOn:  # Only power on the scale if it is currently off.
             self.run_command(f"<ScaleOn>")
             self.isScaleOn = True
-            time.sleep(settle_time)  # Allow time for the scale to stabilize.
+            if settle_time != 0:
+                self.wait_for_settle(timeout=settle_time)  # Wait until the readings are stable.
 
     def scaleOff(self):
         """
@@ -375,53 +1185,150 @@ class PowderDispenseController:
         self.run_command(f"<Tare>")  # Send the tare command to Arduino.
 
 ## Mixer controller functions
+    def _start_actuator(self, actuator, command_str, duration):
+        """
+        Sends a background actuator command such as '<Mix,5,1>' and returns a Future that is resolved by the
+        '<Done:...>' frame the firmware sends when the actuator stops. The command returns at once on the
+        Arduino, so the scale can be read and the auger turned while the actuator runs.
+
+        Firmware without background actuators ignores the flag and runs the command blocking, as `runMixer`
+        did before; the returned Future is then already resolved.
+
+        Parameters:
+            actuator (str): 'Mix', 'Drain' or 'Pump', as named in the firmware's frames.
+            command_str (str): The command string.
+            duration (float): Run time in seconds.
+
+        Returns:
+            concurrent.futures.Future: Resolves to an ActuatorDone.
+        """
+        future = Future()
+        with self._lock:
+            self._actuator_runs[actuator].append(future)  # Before sending: a short run may end before the reply is read.
+            try:
+                self.run_command(command_str, timeout=duration + self.DEFAULT_timeout)
+            except Exception:
+                self._end_actuator_run(actuator, future)
+                raise
+            try:
+                # The firmware announces a background run before acknowledging the command.
+                self.dispatcher.wait_for('Started', after_seq=self.last_command_seq, timeout=0)
+                self.backgroundActuators = True
+            except TimeoutError:
+                self.backgroundActuators = False
+                self._end_actuator_run(actuator, future, ActuatorDone(actuator, True, None))
+        return future
+
+    def start_pump(self, pump, volume=None, time=None):
+        """
+        Starts a pump for a set volume or time without waiting for it to finish, see runPump().
+
+        Parameters:
+            pump (str): Identifier for the pump (e.g., 'Flush').
+            volume (float, optional): Volume to dispense. If provided, time is calculated using calibration parameters.
+            time (float, optional): Time in seconds to run the pump. Used if volume is not provided.
+
+        Returns:
+            concurrent.futures.Future: Resolves to an ActuatorDone when the pump stops; already resolved if
+                                       there is nothing to pump.
+        """
+        pump_pin, pump_time = self._pump_time(pump, volume, time)  # Resolve the pin and run time from calibration.
+        if pump_time <= 0:
+            future = Future()
+            future.set_result(ActuatorDone('Pump', True, None))
+            return future
+        return self._start_actuator('Pump', f"<Pump,{pump_pin},{pump_time},1>", pump_time)
+
+    def start_mixer(self, duration=None):
+        """
+        Starts the mixer without waiting for it to finish.
+
+        Parameters:
+            duration (float, optional): Time in seconds to run the mixer. Defaults to the configured mixing time.
+
+        Returns:
+            concurrent.futures.Future: Resolves to an ActuatorDone when the mixer stops.
+        """
+        duration = duration or self.mixTime  # Use the default mixing time if no duration is provided.
+        return self._start_actuator('Mix', f"<Mix,{duration},1>", duration)
+
+    def start_drain(self, duration=None):
+        """
+        Starts draining without waiting for it to finish.
+
+        Parameters:
+            duration (float, optional): Time in seconds to drain. Defaults to the configured draining time.
+
+        Returns:
+            concurrent.futures.Future: Resolves to an ActuatorDone when the drain stops.
+        """
+        duration = duration or self.drainTime  # Use the default draining time if no duration is provided.
+        return self._start_actuator('Drain', f"<Drain,{duration},1>", duration)
+
+    def start_flush(self, volume=None, time=None):
+        """
+        Starts a flush without waiting for it to finish, see runFlush().
+
+        Returns:
+            concurrent.futures.Future: Resolves to an ActuatorDone when the flush pump stops.
+        """
+        return self.start_pump('Flush', volume, time)
+
+    def stop_actuators(self, actuator=None):
+        """
+        Stops background runs before their time is up. Their futures resolve with `completed` set to False.
+
+        Parameters:
+            actuator (str, optional): 'Mix', 'Drain' or 'Pump'; stops all of them if None.
+        """
+        if self.backgroundActuators is False:
+            return  # Firmware without background actuators has nothing running between commands.
+        self.run_command(f"<Stop,{actuator}>" if actuator else "<Stop>", timeout=self.DEFAULT_timeout)
+
     def runPump(self, pump, volume=None, time=None):
         """
         Operates a specified pump to dispense a set volume or run for a set time.
         Determines the operation duration based on calibration parameters or directly uses the specified time.
+        Other commands can be sent from other threads while the pump runs.
 
         Parameters:
             pump (str): Identifier for the pump (e.g., 'Flush' or 'Drain').
             volume (float, optional): Volume to dispense. If provided, time is calculated using calibration parameters. Defaults to None.
             time (float, optional): Time in seconds to run the pump. Used if volume is not provided. Defaults to None.
-        """
-        pump_pin = self.powder_config['calibration']['pumps'][pump]['pin']  # Get the pump's control pin.
-        if volume is not None and volume > 0:
-            # Calculate the pump runtime based on the calibration parameters.
-            a = self.powder_config['calibration']['pumps'][pump]['a']
-            b = self.powder_config['calibration']['pumps'][pump]['b']
-            pump_time = a * volume + b
-        elif time is not None and time > 0:
-            # Use the specified time if no volume is provided.
-            pump_time = time
-        else:
-            pump_time = 0
 
-        if pump_time > 0:
-            # Send the command to run the pump for the calculated or specified time.
-            self.run_command(f"<Pump,{pump_pin},{pump_time}>")
+        Returns:
+            ActuatorDone: How the run ended.
+        """
+        pump_time = self._pump_time(pump, volume, time)[1]
+        return self.start_pump(pump, volume, time).result(timeout=pump_time + self.DEFAULT_timeout)
 
     def runMixer(self, duration=None):
         """
         Runs the mixer for a specified duration.
-        Uses a default duration if none is provided.
+        Uses a default duration if none is provided. Other commands can be sent from other threads while it mixes.
 
         Parameters:
             duration (float, optional): Time in seconds to run the mixer. Defaults to the configured mixing time.
+
+        Returns:
+            ActuatorDone: How the run ended.
         """
         duration = duration or self.mixTime  # Use the default mixing time if no duration is provided.
-        self.run_command(f"<Mix,{duration}>")  # Send the mixer command to Arduino.
+        return self.start_mixer(duration).result(timeout=duration + self.DEFAULT_timeout)
 
     def runDrain(self, duration=None):
         """
         Runs the draining operation for a specified duration.
-        Uses a default duration if none is provided.
+        Uses a default duration if none is provided. Other commands can be sent from other threads while it drains.
 
         Parameters:
             duration (float, optional): Time in seconds to drain. Defaults to the configured draining time.
+
+        Returns:
+            ActuatorDone: How the run ended.
         """
         duration = duration or self.drainTime  # Use the default draining time if no duration is provided.
-        self.run_command(f"<Drain,{duration}>")  # Send the drain command to Arduino.
+        return self.start_drain(duration).result(timeout=duration + self.DEFAULT_timeout)
 
     def runFlush(self, volume=None, time=None):
         """
@@ -431,8 +1338,11 @@ class PowderDispenseController:
         Parameters:
             volume (float, optional): Volume to flush through the system. Defaults to None.
             time (float, optional): Time in seconds to run the flush. Defaults to None.
+
+        Returns:
+            ActuatorDone: How the run ended.
         """
-        self.runPump('Flush', volume, time)  # Use the pump to perform the flushing operation.
+        return self.runPump('Flush', volume, time)  # Use the pump to perform the flushing operation.
 
 ### Sequence Control Functions
     def purge_dispenser(self):
@@ -442,15 +1352,14 @@ class PowderDispenseController:
         to ensure the system is free of residual powder.
         """
         self.enableStepper()  # Ensure the stepper motor is enabled.
-        self.scaleOn()  # Power on the scale.
-        time.sleep(2)  # Wait for the scale to stabilize.
+        self.scaleOn()  # Power on the scale; returns once the scale has settled.
         self.tare()  # Zero the scale.
 
         weight = self.measWeight()  # Measure the current weight.
         while weight <= weight + 0.08:
             # Dispense small amounts until no significant powder remains.
             self.dispense(200, direction=self.dispenseDir, runSteps=True)
-            time.sleep(3)  # Allow time for the scale to settle.
+            self.wait_for_settle()  # Allow time for the scale to settle.
             weight = self.measWeight()  # Re-measure the weight.
 
         self.scaleOff()  # Power off the scale.
@@ -507,20 +1416,23 @@ class PowderDispenseController:
         for steps in range(minSteps, maxSteps + 1, stepInterval):
             # Dispense using the specified number of steps and direction.
             self.dispense(steps, direction=direction, runSteps=True, augerType=augerType, powderType=powderType)
-            measuredAmount = float(input(f"Enter the measured amount (in grams) from the scale for {steps} steps: "))
+            measuredAmount = float(_prompt(f"Enter the measured amount (in grams) from the scale for {steps} steps: "))
 
             # Log the steps and measured amount.
             steps_list.append(steps)
             measured_amounts.append(measuredAmount)
-            write_to_logfile(logfile, steps=steps, measured_amount=measuredAmount, augerType=augerType, powderType=powderType)
+            if logfile == self.log_file:
+                self.log_writer.write(steps=steps, measured_amount=measuredAmount, augerType=augerType, powderType=powderType)
+            else:
+                write_to_logfile(logfile, steps=steps, measured_amount=measuredAmount, augerType=augerType, powderType=powderType)
 
         self.disableStepper()  # Disable the stepper motor after calibration.
 
         # Perform linear regression to calculate the calibration factor.
+        import numpy as np  # Imported here, as loading numpy slows down importing the package.
         slope, intercept = np.polyfit(steps_list, measured_amounts, 1)
-        self.powder_config['calibration']['augers'][augerType][powderType] = slope  # Update the configuration with the new calibration factor.
-        save_config(config_file=self.config_file, powder_config=self.powder_config)  # Save the updated configuration.
-        print(f"Updated calibration factor for {augerType} with {powderType}: {slope}")
+        self.update_config(('calibration', 'augers', augerType, powderType), float(slope))  # Use and save the new calibration factor.
+        logger.info("Updated calibration factor for %s with %s: %s", augerType, powderType, slope)
 
     def calibrate_scale_seq(self, knownWeights=None, numMeas=None):
         """
@@ -548,49 +1460,45 @@ class PowderDispenseController:
             """
             totalADC = sum(self.measRaw() for _ in range(numMeas)) / numMeas  # Average ADC value over multiple readings.
             calibration_data.append((weight, totalADC))
-            print(f"Recorded {weight} g: {totalADC} (ADC Value)")  # Log the weight and ADC value.
+            logger.info("Recorded %s g: %s (ADC Value)", weight, totalADC)  # Log the weight and ADC value.
 
         if knownWeights is None:
             # If no weights are provided, prompt the user to manually record weights.
-            print("\nPlace the scale setup on an analytical scale and let it settle. Press a key when ready.")
-            input()
+            _prompt("\nPlace the scale setup on an analytical scale and let it settle. Press a key when ready.\n")
             while True:
-                print("Remove all weights from the scale. Press a key when ready to record the zero weight measurement.")
-                input()
+                _prompt("Remove all weights from the scale. Press a key when ready to record the zero weight measurement.\n")
                 record_weight(0.0)  # Record the zero-offset value.
-                weight = input("Enter the next known weight (g) or 'done' to finish: ")
+                weight = _prompt("Enter the next known weight (g) or 'done' to finish: ")
                 if weight.lower() == 'done':
                     break
                 try:
                     weight = float(weight)  # Convert input to a float.
-                    print(f"Place {weight} g on the scale. Press a key when ready.")
-                    input()
+                    _prompt(f"Place {weight} g on the scale. Press a key when ready.\n")
                     record_weight(weight)
                 except ValueError:
-                    print("Invalid input. Please enter a numeric value or 'done'.")
+                    logger.warning("Invalid input. Please enter a numeric value or 'done'.")
         else:
             # Use the provided list of known weights.
-            print("\nPlace the scale setup on an analytical scale and let it settle. Press a key when ready.")
-            input()
+            _prompt("\nPlace the scale setup on an analytical scale and let it settle. Press a key when ready.\n")
             for weight in knownWeights:
-                print("Remove all weights from the scale. Press a key when ready to record the zero weight measurement.")
-                input()
+                _prompt("Remove all weights from the scale. Press a key when ready to record the zero weight measurement.\n")
                 record_weight(0.0)  # Record the zero-offset value.
 
-                print(f"Place {weight} g on the scale. Press a key when ready.")
-                input()
+                _prompt(f"Place {weight} g on the scale. Press a key when ready.\n")
                 record_weight(weight)
 
         self.scaleOff()  # Power off the scale after calibration.
         self.disableStepper()  # Disable the stepper motor.
 
         # Perform linear regression to calculate the calibration slope and intercept.
+        import pandas as pd  # Imported here, as loading pandas and scipy slows down importing the package.
+        from scipy import stats
         df = pd.DataFrame(calibration_data, columns=["Known Weight (g)", "Measured ADC Value"])
         slope, intercept, r_value, p_value, std_err = stats.linregress(df["Known Weight (g)"], df["Measured ADC Value"])
         df["Slope"], df["Intercept"] = slope, intercept
         df["Regression Equation"] = f"y = {slope:.4f}x + {intercept:.4f}"
         df.to_excel("calibration_data_with_regression.xlsx", index=False)  # Save calibration data to an Excel file.
-        print(f"\nCalibration Results:\nSlope: {slope:.4f}\nIntercept: {intercept:.4f}\nRegression Equation: y = {slope:.4f}x + {intercept:.4f}")
+        logger.info("\nCalibration Results:\nSlope: %.4f\nIntercept: %.4f\nRegression Equation: y = %.4fx + %.4f", slope, intercept, slope, intercept)
 
         # Update and save the configuration with the new calibration parameters.
         self.update_config_with_calibration(slope, intercept)
@@ -603,41 +1511,154 @@ class PowderDispenseController:
         Parameters:
             desired_amount (float): The target amount of powder to dispense in grams.
 
+        Returns:
+            DispenseReport: Dispense time, final amount, overshoot and number of round trips.
+
         Behavior:
         - Uses real-time feedback from the scale to iteratively dispense powder until the desired amount is reached.
         """
-        self.scaleOn()  # Power on the scale.
-        time.sleep(1)  # Allow the scale to stabilize.
+        start, start_commands, bursts, total_steps = time.perf_counter(), self.command_count, 1, 0
+        self.scaleOn()  # Power on the scale; returns once the scale has settled.
         self.tare()  # Zero the scale.
-        time.sleep(1)
-        current_amount = self.measWeight()  # Measure the current weight.
+        try:
+            self.start_weight_stream()  # One stream serves every settling wait of the sequence.
+        except RuntimeError:
+            pass  # wait_for_settle polls the scale instead.
+        try:
+            current_amount = self._settled_weight()  # Measure the current weight.
+
+            self.enableStepper()  # Enable the stepper motor.
+            initial_dispense_percentage = 0.50  # Start with 50% of the desired amount.
+            initial_dispense_amount = desired_amount * initial_dispense_percentage
+            self.dispense(initial_dispense_amount, direction=self.dispenseDir, runSteps=False)  # Perform the initial dispense.
+            total_steps += self._steps_for(initial_dispense_amount, self.DEFAULT_augerType, self.DEFAULT_powderType)
+
+            # Iteratively dispense smaller amounts based on remaining weight.
+            while current_amount < desired_amount * 0.80:
+                self.dispense(400, direction=self.dispenseDir, runSteps=True)  # Dispense steps in chunks.
+                bursts, total_steps = bursts + 1, total_steps + 400
+                current_amount = self._settled_weight()  # Update the current weight.
+
+            while current_amount < desired_amount * 0.97:
+                self.dispense(20, direction=self.dispenseDir, runSteps=True)  # Fine-tune with smaller steps.
+                bursts, total_steps = bursts + 1, total_steps + 20
+                current_amount = self._settled_weight()
+
+            while current_amount < desired_amount * 0.99:
+                self.dispense(5, direction=self.dispenseDir, runSteps=True)  # Final small adjustments.
+                bursts, total_steps = bursts + 1, total_steps + 5
+                current_amount = self._settled_weight()
+        finally:
+            self.stop_weight_stream()
 
-        self.enableStepper()  # Enable the stepper motor.
-        time.sleep(1)
-        initial_dispense_percentage = 0.50  # Start with 50% of the desired amount.
-        initial_dispense_amount = desired_amount * initial_dispense_percentage
-        self.dispense(initial_dispense_amount, direction=self.dispenseDir, runSteps=False)  # Perform the initial dispense.
-        time.sleep(1)
+        self.disableStepper()  # Disable the stepper motor.
+        self.scaleOff()  # Power off the scale.
+        logger.info("Dispensing complete.")
+        return DispenseReport(desired_amount, current_amount, max(current_amount - desired_amount, 0.0),
+                              time.perf_counter() - start, self.command_count - start_commands, bursts, total_steps)
 
-        # Iteratively dispense smaller amounts based on remaining weight.
-        while current_amount < desired_amount * 0.80:
-            self.dispense(400, direction=self.dispenseDir, runSteps=True)  # Dispense steps in chunks.
-            time.sleep(1)
-            current_amount = self.measWeight()  # Update the current weight.
+    def dispense_closed_loop(self, desired_amount, augerType=None, powderType=None, **options):
+        """
+        Dispenses a specified amount of powder with the closed-loop engine, which predicts the remaining steps
+        from the auger calibration and live streamed weight instead of fixed-size bursts and fixed waits.
 
-        while current_amount < desired_amount * 0.97:
-            self.dispense(20, direction=self.dispenseDir, runSteps=True)  # Fine-tune with smaller steps.
-            time.sleep(1)
-            current_amount = self.measWeight()
+        Parameters:
+            desired_amount (float): The target amount of powder to dispense in grams.
+            augerType (str, optional): The type of auger to use for the operation.
+            powderType (str, optional): The type of powder to be dispensed.
+            **options: Tuning options passed to ClosedLoopDispenser (e.g. tolerance, aim, stream_rate, or
+                       model=False and trace_file to log bursts for fitting an InFlightModel).
 
-        while current_amount < desired_amount * 0.99:
-            self.dispense(5, direction=self.dispenseDir, runSteps=True)  # Final small adjustments.
-            time.sleep(1)
-            current_amount = self.measWeight()
+        Returns:
+            DispenseReport: Dispense time, final amount, overshoot and number of round trips.
+        """
+        engine = ClosedLoopDispenser(self, augerType=augerType, powderType=powderType, **options)
+        return engine.run(desired_amount)
 
-        self.disableStepper()  # Disable the stepper motor.
-        self.scaleOff()  # Power off the scale.
-        print("Dispensing complete.")
+    def dispense_until(self, target, threshold=None, max_chunk=10000, min_chunk=5, settle_time=0.5, augerType=None, powderType=None, on_progress=None):
+        """
+        Dispenses powder until the scale reaches a target weight, with the firmware checking the scale between
+        bursts ('<DispenseUntil,...>'): a whole dose is one command instead of a dispense, settle and measure
+        round trip per burst. The firmware reports every weight check, see `on_progress`.
+
+        Falls back to running the same loop on the PC (one dispense and one measurement per burst) on firmware
+        without the DispenseUntil command.
+
+        Parameters:
+            target (float): The target weight in grams.
+            threshold (float, optional): Weight in grams at which dispensing stops (default: 99% of the target).
+            max_chunk (int): Largest burst in steps; at most 32767, the range of an int on the AVR (default: 10000).
+            min_chunk (int): Smallest burst in steps (default: 5).
+            settle_time (float): Time in seconds to wait after each burst before checking the scale (default: 0.5).
+            augerType (str, optional): The type of auger, for the steps per gram.
+            powderType (str, optional): The type of powder, for the steps per gram.
+            on_progress (callable, optional): Called with a DoseProgress after every weight check.
+
+        Returns:
+            DispenseReport: Dispense time, final amount, overshoot and number of round trips.
+        """
+        start, start_commands = time.perf_counter(), self.command_count
+        command_str, stop_at, steps_per_gram = self._dose_command(target, threshold, max_chunk, min_chunk, settle_time, augerType, powderType)
+        self.scaleOn()  # Power on the scale; returns once the scale has settled.
+        self.tare()  # Zero the scale.
+        self.enableStepper()
+        try:
+            outcome = self._dose_on_device(command_str, settle_time, on_progress) if self.deviceDosing is not False else None
+            if outcome is None:
+                outcome = self._dose_on_host(target, stop_at, steps_per_gram, max_chunk, min_chunk, settle_time, on_progress)
+        finally:
+            self.disableStepper()
+            self.scaleOff()
+        return self._dose_report(target, *outcome, start, start_commands)
+
+    def _dose_on_device(self, command_str, settle_time, on_progress):
+        """
+        Sends a '<DispenseUntil,...>' command and follows its progress frames until the dose ends.
+
+        Returns:
+            tuple: (DoseResult, number of bursts), or None if the firmware does not know the command.
+
+        Raises:
+            TimeoutError: If the firmware stops reporting during the dose.
+        """
+        with self._lock:
+            return drive(self._dose_device_steps(self.dispatcher, self.reader.buffer, command_str, settle_time, on_progress))
+
+    def _dose_on_host(self, target, stop_at, steps_per_gram, max_chunk, min_chunk, settle_time, on_progress):
+        """
+        Runs the loop of DispenserControls::dispenseUntil on the PC, for firmware without DispenseUntil.
+
+        Returns:
+            tuple: (DoseResult, number of bursts).
+        """
+        return drive(self._dose_host_steps(target, stop_at, steps_per_gram, max_chunk, min_chunk, settle_time, on_progress))
+
+    def dispense_feed(self, desired_amount, augerType=None, powderType=None, **options):
+        """
+        Dispenses a target amount of powder with one continuous auger feed, lowering the step rate as the streamed
+        weight approaches the target instead of stopping for a measurement after every burst.
+
+        Falls back to `dispense_until` on firmware without continuous feeding.
+
+        Parameters:
+            desired_amount (float): The target amount of powder to dispense in grams.
+            augerType (str, optional): The type of auger, for the calibration lookup.
+            powderType (str, optional): The type of powder, for the calibration lookup.
+            **options: Tuning parameters passed to FeedController (e.g. max_rate, min_rate, ramp_time, lag).
+
+        Returns:
+            DispenseReport: Dispense time, final amount, overshoot and number of round trips.
+        """
+        if self.continuousFeed is None:
+            try:
+                self.set_feed_rate(0)  # Tells whether the firmware knows the Feed command.
+            except RuntimeError:
+                pass
+        if self.continuousFeed is False:
+            logger.info("Firmware does not support continuous feeding; dosing in bursts.")
+            return self.dispense_until(desired_amount, augerType=augerType, powderType=powderType)
+        engine = FeedController(self, augerType=augerType, powderType=powderType, **options)
+        return engine.run(desired_amount)
 
     def sensitivity_test(self, reps=None, samples=None, use_dispenser=False, amount_or_steps=None):
         """
@@ -653,10 +1674,10 @@ class PowderDispenseController:
         samples = samples or self.DEFAULT_samples
         self.enableStepper()
         self.scaleOn()
-        print("Starting sensitivity test...\n")
+        logger.info("Starting sensitivity test...\n")
 
         for r in range(1, reps + 1):
-            print(f"Repetition {r}: Resetting system for the next set of samples.")
+            logger.info("Repetition %d: Resetting system for the next set of samples.", r)
             self.tare()  # Reset the scale to zero.
 
             for s in range(1, samples + 1):
@@ -666,14 +1687,14 @@ class PowderDispenseController:
                     measured_weight = self.measWeight()
                 else:
                     # Manually add weight and measure.
-                    print(f"Place sample {s} on the scale.")
-                    input("Press Enter when ready.")
+                    _prompt(f"Place sample {s} on the scale.\nPress Enter when ready.")
                     measured_weight = self.measWeight()
 
-                # Log the measurement for this sample.
-                print(f"Measured Weight: {measured_weight:.3f} g")
-                write_to_logfile(self.log_file, repetition=r, sample=s, measured_amount=measured_weight)
+                # Log the measurement for this sample; the session log has no repetition or sample columns.
+                logger.info("Repetition %d, sample %d: Measured Weight: %.3f g", r, s, measured_weight)
+                self.log_writer.write(desired_amount=amount_or_steps if use_dispenser else None, measured_amount=measured_weight,
+                                      augerType=self.DEFAULT_augerType, powderType=self.DEFAULT_powderType)
 
         self.scaleOff()
         self.disableStepper()
-        print("Sensitivity test complete.")
\ No newline at end of file
+        logger.info("Sensitivity test complete.")
\ No newline at end of file
@@ -0,0 +1,404 @@
+"""
+Closed-loop dispensing using streaming weight feedback.
+
+The ClosedLoopDispenser predicts the number of auger steps still needed from the auger calibration factor in
+`config['calibration']['augers']` and the live weight, refining its grams-per-step estimate after every burst.
+Bursts shrink as the weight approaches the target, and the engine only waits for the scale to settle as long as
+the weight is still visibly changing. With an InFlightModel learned for the auger/powder pair (see `inflight`),
+it does not wait at all between bursts but predicts the settled weight from the first samples after each burst,
+and only lets the scale settle once the prediction says the target is reached.
+
+Dosing by weight on the device (`dispense_until`) follows a simpler rule that the firmware can run between
+bursts without the PC: every burst aims for half of the remaining mass, bounded by a smallest and largest burst,
+followed by a fixed settling time. `dose_chunk` is that rule; the controller uses it when the firmware lacks
+the DispenseUntil command and the PC has to run the loop itself.
+
+The FeedController does without bursts: it keeps the auger turning in the firmware's velocity mode
+(`set_feed_rate`) and lowers the step rate as the streamed weight, plus the powder still in flight, approaches
+the target, so the dose goes from coarse to fine without stopping and waiting in between.
+
+Classes:
+    DispenseReport - Summary of a dispense run, used to compare dispensing strategies.
+    ClosedLoopDispenser - Dispense engine driving a PowderDispenseController with streaming weight feedback.
+    FeedController - Dispense engine ramping down a continuous auger feed with streaming weight feedback.
+
+Functions:
+    dose_chunk(target, weight, steps_per_gram, min_chunk, max_chunk) - Returns the size of the next burst of a dose by weight.
+"""
+import logging
+import time
+from collections import deque, namedtuple
+
+from .settling import SettlingDetector
+from .stream import sample_time
+
+logger = logging.getLogger(__name__)
+
+DOSE_AIM = 0.5             # Share of the remaining mass each burst of a dose by weight aims for.
+DOSE_SAMPLES = 32          # Readings averaged per weight check (DispenserControls::DOSE_SAMPLES).
+DOSE_STOP_FRACTION = 0.99  # Default stop weight as a share of the target, as in dispense_powder_seq.
+
+DispenseReport = namedtuple('DispenseReport', ['target', 'dispensed', 'overshoot', 'duration', 'round_trips', 'bursts', 'steps'])
+DispenseReport.__doc__ = """
+Summary of a dispense run.
+
+Attributes:
+    target (float): The desired amount in grams.
+    dispensed (float): The final measured amount in grams.
+    overshoot (float): Amount dispensed above the target in grams (0 if the target was not exceeded).
+    duration (float): Wall-clock time of the run in seconds.
+    round_trips (int): Number of commands sent to the Arduino during the run.
+    bursts (int): Number of dispense commands.
+    steps (float): Total number of auger steps.
+"""
+
+
+def dose_chunk(target, weight, steps_per_gram, min_chunk, max_chunk):
+    """
+    Returns the size of the next burst of a dose by weight, as computed by DispenserControls::dispenseUntil.
+
+    Parameters:
+        target (float): Target weight in grams.
+        weight (float): Current weight in grams.
+        steps_per_gram (float): Auger calibration in steps per gram.
+        min_chunk (int): Smallest burst in steps.
+        max_chunk (int): Largest burst in steps.
+
+    Returns:
+        int: Number of auger steps.
+    """
+    return min(max(int((target - weight) * steps_per_gram * DOSE_AIM), min_chunk), max_chunk)
+
+
+class ClosedLoopDispenser:
+    """
+    Dispenses a target mass with as few bursts and as little waiting as possible.
+
+    Each burst aims for `aim` of the remaining mass (so the auger approaches the target from below), using a
+    grams-per-step estimate that starts at the configured calibration factor and is updated from the weight
+    gained by every burst. Between bursts, streamed weight samples are watched until the weight slope over
+    `settle_window` seconds falls below the settling threshold: a loose threshold while far from the target
+    and a tight one close to it.
+
+    With an InFlightModel, the engine reads the samples of the first `model.horizon` seconds after a burst and
+    continues with the predicted settled weight instead. Once the prediction is within the tolerance, the scale
+    is left to settle and the dose is topped up if the settled weight still falls short.
+
+    Parameters:
+        controller (PowderDispenseController): The connected controller.
+        augerType (str, optional): The auger type used for the calibration lookup (default: controller default).
+        powderType (str, optional): The powder type used for the calibration lookup (default: controller default).
+        tolerance (float): Accepted shortfall as a fraction of the target (default: 0.01).
+        aim (float): Fraction of the remaining mass targeted per burst (default: 0.8).
+        min_steps (int): Smallest burst in steps (default: 5).
+        stream_rate (float): Weight stream rate in samples per second (default: 20).
+        settle_window (float): Time window in seconds over which the weight slope is evaluated (default: 0.5).
+        coarse_slope (float): Settling threshold in g/s while far from the target (default: 0.02).
+        fine_slope (float): Settling threshold in g/s close to the target (default: 0.002).
+        fine_fraction (float): Remaining fraction of the target below which the fine threshold applies (default: 0.2).
+        settle_timeout (float): Maximum time in seconds to wait for settling after a burst (default: 5).
+        max_bursts (int): Safety limit on the number of bursts (default: 200).
+        model (InFlightModel or bool, optional): Settled-weight predictor; None uses the one stored for the
+                                                 auger/powder pair in `config['calibration']['inflight']`, if
+                                                 any, and False always waits for the scale (default: None).
+        trace_file (str, optional): JSON lines file the bursts are logged to as BurstTraces, for fitting and
+                                    evaluating an InFlightModel. Only bursts the engine waits for are logged.
+        stream_samples (int, optional): Readings the firmware averages per streamed sample (default: 1, or 4
+                                        with a model or trace file).
+        filterType (str, optional): Firmware filter of the streamed readings (default: the controller's, or
+                                    'NONE' with a model or trace file: the prediction needs the response of
+                                    the load cell itself, which the EWMA filter would hide behind its lag).
+    """
+    def __init__(self, controller, augerType=None, powderType=None, tolerance=0.01, aim=0.8, min_steps=5,
+                 stream_rate=20, settle_window=0.5, coarse_slope=0.02, fine_slope=0.002, fine_fraction=0.2,
+                 settle_timeout=5, max_bursts=200, model=None, trace_file=None, stream_samples=None, filterType=None) -> None:
+        self.controller = controller
+        self.augerType = augerType or controller.DEFAULT_augerType
+        self.powderType = powderType or controller.DEFAULT_powderType
+        self.tolerance = tolerance
+        self.aim = aim
+        self.min_steps = min_steps
+        self.stream_rate = stream_rate
+        self.settle_window = settle_window
+        self.coarse_slope = coarse_slope
+        self.fine_slope = fine_slope
+        self.fine_fraction = fine_fraction
+        self.settle_timeout = settle_timeout
+        self.max_bursts = max_bursts
+
+        # Grams per auger step, starting from the configured calibration factor.
+        self.grams_per_step = controller.settings.auger(self.augerType, self.powderType).grams_per_step
+
+        # Imported here so `python -m PowderDispenserController.inflight` does not find it imported already.
+        from .inflight import InFlightModel, TraceRecorder
+        if model is None:
+            calibration = controller.settings.inflight.get((self.augerType, self.powderType))
+            model = InFlightModel.from_calibration(calibration) if calibration is not None else None
+        self.model = model or None
+        self.recorder = TraceRecorder(trace_file) if trace_file else None
+        predicting = self.model is not None or self.recorder is not None
+        self.stream_samples = stream_samples or (4 if predicting else 1)
+        self.filterType = filterType or ('NONE' if predicting else None)
+
+    def _settled_weight(self, stream, slope_limit, on_sample=None):
+        # Waits until the slope over the settle window is below `slope_limit` (or the timeout expires) and
+        # returns the mean weight of the final window. Only the slope matters here, not the noise level.
+        detector = SettlingDetector(window=self.settle_window, max_slope=slope_limit, max_std=float('inf'),
+                                    timeout=self.settle_timeout, min_samples=2)
+        result = detector.wait(stream, on_sample)
+        if result.weight is None:
+            raise TimeoutError("No weight sample received while waiting for the scale to settle.")
+        return result.weight
+
+    def _predicted_weight(self, stream, start_weight, steps):
+        # Reads the samples of the first `model.horizon` seconds after a burst and returns the predicted
+        # settled weight.
+        samples = []
+        while not samples or samples[-1][0] < self.model.horizon:
+            sample = stream.get(timeout=self.settle_timeout)
+            if not samples:
+                first = sample_time(sample)
+            samples.append((sample_time(sample) - first, sample.weight))
+        return self.model.predict(samples, start_weight, steps)
+
+    def _traced_weight(self, stream, slope_limit, start_weight, steps):
+        # Waits for the scale like `_settled_weight` and logs the trajectory of the burst as a BurstTrace.
+        from .inflight import BurstTrace
+        samples = []
+        new = self._settled_weight(stream, slope_limit, lambda sample: samples.append((sample_time(sample), sample.weight)))
+        if samples:
+            first = samples[0][0]
+            samples = tuple((t - first, weight) for t, weight in samples)
+            self.recorder.write(BurstTrace(self.augerType, self.powderType, steps, start_weight, samples, new, samples[-1][0]))
+        return new
+
+    def run(self, desired_amount):
+        """
+        Dispenses `desired_amount` grams of powder.
+
+        Parameters:
+            desired_amount (float): The target amount of powder to dispense in grams.
+
+        Returns:
+            DispenseReport: Dispense time, final amount, overshoot and number of round trips.
+        """
+        ctrl = self.controller
+        start = time.perf_counter()
+        start_commands = ctrl.command_count
+        bursts = 0
+        total_steps = 0
+
+        ctrl.scaleOn()
+        ctrl.tare()
+        ctrl.enableStepper()
+        stream = ctrl.start_weight_stream(rate=self.stream_rate, avgReadingSamples=self.stream_samples, filterType=self.filterType)
+        try:
+            current = self._settled_weight(stream, self.fine_slope)
+            settled = True  # Whether `current` was read from the scale rather than predicted.
+            while bursts < self.max_bursts:
+                remaining = desired_amount - current
+                if remaining <= desired_amount * self.tolerance:
+                    if settled:
+                        break
+                    current, settled = self._settled_weight(stream, self.fine_slope), True  # Check the prediction.
+                    continue
+
+                steps = max(self.min_steps, round(self.aim * remaining / self.grams_per_step))
+                ctrl.dispense(steps, direction=ctrl.dispenseDir, runSteps=True, augerType=self.augerType, powderType=self.powderType)
+                stream.drain()  # Samples taken before the burst ended say nothing about its result.
+                bursts += 1
+                total_steps += steps
+
+                near_target = remaining - steps * self.grams_per_step < desired_amount * self.fine_fraction
+                slope_limit = self.fine_slope if near_target else self.coarse_slope
+                if self.model is not None:
+                    new = self._predicted_weight(stream, current, steps)
+                elif self.recorder is not None:
+                    new = self._traced_weight(stream, slope_limit, current, steps)
+                else:
+                    new = self._settled_weight(stream, slope_limit)
+                settled = self.model is None
+
+                # Refine the grams-per-step estimate from the weight gained by this burst.
+                gained = new - current
+                if gained > 0:
+                    self.grams_per_step = 0.5 * self.grams_per_step + 0.5 * gained / steps
+                current = new
+            if not settled:
+                current = self._settled_weight(stream, self.fine_slope)
+        finally:
+            ctrl.stop_weight_stream()
+            ctrl.disableStepper()
+            ctrl.scaleOff()
+
+        report = DispenseReport(
+            target=desired_amount,
+            dispensed=current,
+            overshoot=max(current - desired_amount, 0.0),
+            duration=time.perf_counter() - start,
+            round_trips=ctrl.command_count - start_commands,
+            bursts=bursts,
+            steps=total_steps,
+        )
+        logger.info("Dispensing complete: %.4f g of %.4f g in %.1f s, %d bursts, %d round trips.",
+                    report.dispensed, report.target, report.duration, report.bursts, report.round_trips)
+        return report
+
+
+class FeedController:
+    """
+    Dispenses a target mass with a continuous auger feed whose rate is lowered as the weight approaches the target.
+
+    With every streamed weight sample, the mass still to come is predicted as the target minus the weight minus
+    the powder in flight: what the auger delivered during the last `lag` seconds has left the auger but does not
+    show on the scale yet (fall time, load cell response). The feed rate is set to deliver the rest within
+    `ramp_time` seconds, bounded by `min_rate` and `max_rate`, so the auger slows down exponentially towards the
+    target. A new rate is only sent when it differs from the current one by more than `rate_step`. The feed stops
+    when the prediction reaches the target; if the settled weight then falls short by more than the tolerance,
+    a further feed tops it up.
+
+    Parameters:
+        controller (PowderDispenseController): The connected controller.
+        augerType (str, optional): The auger type used for the calibration lookup (default: controller default).
+        powderType (str, optional): The powder type used for the calibration lookup (default: controller default).
+        tolerance (float): Accepted shortfall as a fraction of the target (default: 0.01).
+        max_rate (float): Coarse feed rate in steps per second (default: 2000).
+        min_rate (float): Fine feed rate in steps per second (default: 50).
+        ramp_time (float): Time in seconds in which the feed rate would deliver the predicted remaining mass (default: 1.0).
+        lag (float): Time in seconds between powder leaving the auger and showing on the scale (default: 0.4).
+        rate_step (float): Smallest relative rate change sent to the firmware (default: 0.2).
+        stream_rate (float): Weight stream rate in samples per second (default: 40).
+        stream_samples (int): Readings the firmware averages per streamed sample (default: 4).
+        filterType (str): Firmware filter of the streamed readings; the EWMA filter would add lag (default: 'NONE').
+        settle_window (float): Time window in seconds over which the final weight must be stable (default: 0.5).
+        settle_slope (float): Settling threshold in g/s for the final weight (default: 0.002).
+        settle_timeout (float): Maximum time in seconds to wait for settling after a feed (default: 5).
+        max_feeds (int): Safety limit on the number of feeds, including top-ups (default: 5).
+    """
+    def __init__(self, controller, augerType=None, powderType=None, tolerance=0.01, max_rate=2000, min_rate=50,
+                 ramp_time=1.0, lag=0.4, rate_step=0.2, stream_rate=40, stream_samples=4, filterType='NONE',
+                 settle_window=0.5, settle_slope=0.002, settle_timeout=5, max_feeds=5) -> None:
+        self.controller = controller
+        self.augerType = augerType or controller.DEFAULT_augerType
+        self.powderType = powderType or controller.DEFAULT_powderType
+        self.tolerance = tolerance
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.ramp_time = ramp_time
+        self.lag = lag
+        self.rate_step = rate_step
+        self.stream_rate = stream_rate
+        self.stream_samples = stream_samples
+        self.filterType = filterType
+        self.max_feeds = max_feeds
+
+        self.grams_per_step = controller.settings.auger(self.augerType, self.powderType).grams_per_step
+        self._rates = deque()  # (sample time, steps per second) of the rate changes within the last `lag` seconds.
+        self._detector = SettlingDetector(window=settle_window, max_slope=settle_slope, max_std=float('inf'),
+                                          timeout=settle_timeout, min_samples=2)
+
+    def _set_rate(self, rate, now, max_steps=0):
+        # Sends a new feed rate and notes it for the in-flight estimate; `now` is None at the start of a feed.
+        self.controller.set_feed_rate(rate, max_steps=max_steps)
+        self._rates.append((now, rate))
+
+    def _in_flight(self, now):
+        # Grams delivered by the auger during the last `lag` seconds, from the history of feed rates.
+        if self._rates[0][0] is None:
+            self._rates[0] = (now, self._rates[0][1])  # The feed started just before the first sample.
+        start = now - self.lag
+        while len(self._rates) > 1 and self._rates[1][0] <= start:
+            self._rates.popleft()
+        steps = 0.0
+        for i, (since, rate) in enumerate(self._rates):
+            until = self._rates[i + 1][0] if i + 1 < len(self._rates) else now
+            steps += rate * max(until - max(since, start), 0.0)
+        return steps * self.grams_per_step
+
+    def _rate_for(self, remaining):
+        # Feed rate delivering `remaining` grams within the ramp time, bounded by the coarse and fine rates.
+        return min(max(remaining / (self.grams_per_step * self.ramp_time), self.min_rate), self.max_rate)
+
+    def _settled_weight(self, stream):
+        # Waits until the weight slope over the settle window is below the threshold (or the timeout expires)
+        # and returns the mean weight of the final window.
+        result = self._detector.wait(stream)
+        if result.weight is None:
+            raise TimeoutError("No weight sample received while waiting for the scale to settle.")
+        return result.weight
+
+    def _feed(self, stream, target, current):
+        # Feeds from `current` grams until the predicted weight reaches the target; returns the steps fed.
+        ctrl = self.controller
+        remaining = target - current
+        max_steps = int(2 * remaining / self.grams_per_step) + int(self.max_rate)  # Guards against an empty hopper.
+        rate = self._rate_for(remaining)
+        stream.drain()
+        self._rates.clear()
+        self._set_rate(rate, None, max_steps)
+        try:
+            while ctrl.feedRate > 0:  # Cleared when the firmware ends the feed at its step limit.
+                sample = stream.get(timeout=ctrl.DEFAULT_timeout)
+                remaining = target - sample.weight - self._in_flight(sample_time(sample))
+                if remaining <= 0:
+                    break
+                new_rate = self._rate_for(remaining)
+                if abs(new_rate - rate) > self.rate_step * rate:
+                    rate = new_rate
+                    self._set_rate(rate, sample_time(sample))
+        finally:
+            end = ctrl.stop_feed()
+        if end is None:
+            return 0
+        if end.completed:
+            logger.warning("Feed stopped at its step limit after %d steps; is the hopper empty?", end.steps)
+        return end.steps
+
+    def run(self, desired_amount):
+        """
+        Dispenses `desired_amount` grams of powder.
+
+        Parameters:
+            desired_amount (float): The target amount of powder to dispense in grams.
+
+        Returns:
+            DispenseReport: Dispense time, final amount, overshoot and number of round trips. `bursts` counts the feeds.
+        """
+        ctrl = self.controller
+        start = time.perf_counter()
+        start_commands = ctrl.command_count
+        feeds = 0
+        total_steps = 0
+
+        ctrl.scaleOn()
+        ctrl.tare()
+        ctrl.enableStepper()
+        stream = ctrl.start_weight_stream(rate=self.stream_rate, avgReadingSamples=self.stream_samples, filterType=self.filterType)
+        try:
+            current = self._settled_weight(stream)
+            while feeds < self.max_feeds and desired_amount - current > desired_amount * self.tolerance:
+                steps = self._feed(stream, desired_amount, current)
+                feeds += 1
+                total_steps += steps
+                stream.drain()
+                current = self._settled_weight(stream)
+                logger.debug("Feed %d: %d steps, settled at %.4f g.", feeds, steps, current)
+                if steps == 0 or (ctrl.lastFeed is not None and ctrl.lastFeed.completed):
+                    break
+        finally:
+            ctrl.stop_weight_stream()
+            ctrl.disableStepper()
+            ctrl.scaleOff()
+
+        report = DispenseReport(
+            target=desired_amount,
+            dispensed=current,
+            overshoot=max(current - desired_amount, 0.0),
+            duration=time.perf_counter() - start,
+            round_trips=ctrl.command_count - start_commands,
+            bursts=feeds,
+            steps=total_steps,
+        )
+        logger.info("Dispensing complete: %.4f g of %.4f g in %.1f s, %d feeds, %d round trips.",
+                    report.dispensed, report.target, report.duration, report.bursts, report.round_trips)
+        return report
@@ -0,0 +1,182 @@
+"""
+This module defines the DispenserFleet class which addresses several powder dispensers connected to one PC as a group.
+
+Every rig is driven by its own PowderDispenseController. Opening the controllers and running sequences is done on a
+thread pool, so the boot wait of each Arduino and the long-running commands of each rig overlap instead of adding up.
+
+Classes:
+    RigResult - Outcome of an operation on a single rig.
+    DispenserFleet - Discovers, opens and runs operations on a group of dispensers concurrently.
+"""
+import datetime
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .controller import PowderDispenseController
+from .utils import get_serial_ports
+
+logger = logging.getLogger(__name__)
+
+
+class RigResult(namedtuple('RigResult', ['port', 'result', 'error', 'elapsed'])):
+    """
+    Outcome of an operation on a single rig.
+
+    Attributes:
+        port (str): Serial port of the rig.
+        result: Return value of the operation, or None if it failed.
+        error (Exception): The exception raised by the operation, or None if it succeeded.
+        elapsed (float): Wall-clock time of the operation in seconds.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """bool: True if the operation completed without raising."""
+        return self.error is None
+
+
+class DispenserFleet:
+    """
+    Manages a group of powder dispensers, one PowderDispenseController per serial port.
+
+    Parameters:
+        ports (list of str, optional): Serial ports of the rigs. All USB serial ports are used if None.
+        max_workers (int, optional): Maximum number of rigs operated at the same time (default: one per rig).
+        overlay_dir (str, optional): Directory for per-rig configuration overlays ('config_<port>.json'), so the
+                                     rigs share the configuration file but save their calibrations separately.
+        **controller_kwargs: Further arguments passed to every PowderDispenseController (e.g. config_file).
+    """
+    def __init__(self, ports=None, max_workers=None, overlay_dir=None, **controller_kwargs) -> None:
+        self.ports = list(ports) if ports is not None else get_serial_ports()
+        self.overlay_dir = overlay_dir
+        self.controller_kwargs = controller_kwargs
+        self.rigs = {}      # Port -> connected PowderDispenseController.
+        self.failed = {}    # Port -> exception raised while opening the rig.
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(len(self.ports), 1), thread_name_prefix='DispenserFleet')
+
+    def _log_file_for(self, port, stamp):
+        # Rigs opened in the same second would otherwise share the default log file name.
+        name = os.path.basename(port).replace(':', '')
+        return f"logs/log_{stamp}_{name}.csv"
+
+    def _overlay_for(self, port):
+        # Per-rig configuration overlay; the port name identifies the rig as long as it stays on the same port.
+        name = os.path.basename(port).replace(':', '')
+        return os.path.join(self.overlay_dir, f"config_{name}.json")
+
+    def open(self):
+        """
+        Opens all rigs in parallel, so the total start-up time approaches that of a single rig.
+        Rigs that fail to open are recorded in `failed` and left out of `rigs`.
+
+        Returns:
+            dict: Maps each port to the RigResult of opening it.
+        """
+        stamp = datetime.datetime.now().strftime('%d%m%Y_%H%M%S')
+
+        def open_rig(port):
+            kwargs = dict(self.controller_kwargs)
+            kwargs.setdefault('log_file', self._log_file_for(port, stamp))
+            if self.overlay_dir is not None:
+                os.makedirs(self.overlay_dir, exist_ok=True)
+                kwargs.setdefault('config_overlay', self._overlay_for(port))
+            return PowderDispenseController(port, **kwargs)
+
+        results = self._map(open_rig, self.ports)
+        for port, outcome in results.items():
+            if outcome.ok:
+                self.rigs[port] = outcome.result
+                self.failed.pop(port, None)
+            else:
+                self.failed[port] = outcome.error
+                logger.warning("Failed to open rig on %s: %s", port, outcome.error)
+        return results
+
+    def _map(self, func, ports):
+        # Runs func(port) for every port concurrently and collects a RigResult per port.
+        def call(port):
+            start = time.perf_counter()
+            try:
+                return RigResult(port, func(port), None, time.perf_counter() - start)
+            except Exception as e:
+                return RigResult(port, None, e, time.perf_counter() - start)
+
+        futures = {port: self._executor.submit(call, port) for port in ports}
+        return {port: future.result() for port, future in futures.items()}
+
+    def run(self, method, *args, ports=None, **kwargs):
+        """
+        Calls a controller method on every rig concurrently, e.g. `fleet.run('dispense_powder_seq', 0.5)`.
+
+        Parameters:
+            method (str): Name of the PowderDispenseController method to call.
+            *args: Positional arguments for the method.
+            ports (list of str, optional): Only run on these rigs (default: all open rigs).
+            **kwargs: Keyword arguments for the method.
+
+        Returns:
+            dict: Maps each port to its RigResult.
+        """
+        return self.run_each(lambda rig: getattr(rig, method)(*args, **kwargs), ports=ports)
+
+    def run_each(self, sequence, ports=None):
+        """
+        Runs a custom sequence on every rig concurrently.
+
+        Parameters:
+            sequence (callable): Function called with the rig's controller, e.g. `lambda rig: rig.runMixer(5)`.
+            ports (list of str, optional): Only run on these rigs (default: all open rigs).
+
+        Returns:
+            dict: Maps each port to its RigResult. A failure on one rig does not affect the others.
+        """
+        ports = list(self.rigs) if ports is None else ports
+        return self._map(lambda port: sequence(self.rigs[port]), ports)
+
+    def run_recipe(self, recipe, max_workers=None):
+        """
+        Runs a recipe whose steps name the rigs they run on by port, overlapping independent steps within and
+        across rigs, see `scheduler.RecipeScheduler`.
+
+        Parameters:
+            recipe (Recipe): The steps to run.
+            max_workers (int, optional): Maximum number of steps running at the same time.
+
+        Returns:
+            ScheduleReport: Timing of every step, the critical path and the idle time of every rig resource.
+        """
+        from .scheduler import RecipeScheduler
+        return RecipeScheduler(self.rigs, max_workers=max_workers).run(recipe)
+
+    def close(self):
+        """
+        Closes every rig and shuts down the thread pool. A rig that fails to close is logged and does not keep
+        the other rigs open.
+        """
+        try:
+            for port, rig in self.rigs.items():
+                try:
+                    rig.close()
+                except Exception as error:
+                    logger.warning("Failed to close rig on %s: %s", port, error)
+            self.rigs.clear()
+        finally:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        if not self.rigs:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.rigs)
+
+    def __getitem__(self, port):
+        return self.rigs[port]
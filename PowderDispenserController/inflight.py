@@ -0,0 +1,323 @@
+"""
+Prediction of the settled weight of a dispense burst from the first moments after it.
+
+When the auger stops, powder is still falling and the load cell is still following the load, so the weight
+read right after a burst is too low. The dispense engines therefore wait for the scale after every burst: a
+fixed second in `dispense_powder_seq`, the settling detector in `ClosedLoopDispenser`. The InFlightModel
+predicts the settled weight from the streamed samples of the first `horizon` seconds after the burst instead,
+so the engine can move on without waiting. The settled weight gain of a burst is modelled as
+
+    gain = a * seen + b * slope + c * steps
+
+where `seen` is the gain visible at the horizon, `slope` the weight slope there (the load cell is still
+rising) and `steps` the burst size (powder still in flight). The coefficients are fitted by least squares per
+auger/powder pair from logged bursts and stored in `config['calibration']['inflight']`.
+
+Bursts are logged as BurstTraces, one JSON object per line, by `ClosedLoopDispenser(..., trace_file=...)`.
+Traces are recorded, and predictions made, from the unfiltered weight stream, so the samples follow the load
+cell rather than the lag of the firmware's EWMA filter.
+Times are taken from the Arduino's `millis()` when the samples carry it, so traces recorded on the virtual rig
+at any `speed` are in the time of the rig.
+
+Classes:
+    BurstTrace - Weight trajectory of one dispense burst until the scale settled.
+    TraceRecorder - Appends BurstTraces to a JSON lines file.
+    InFlightModel - Predicts the settled weight of a burst from its early weight trajectory.
+    EvaluationReport - Cross-validated prediction error and time saved for one auger/powder pair.
+
+Functions:
+    read_traces(paths) - Reads BurstTraces from JSON lines files.
+    evaluate(traces, horizon, window, folds) - Replays traces and reports the prediction error and time saved.
+
+Usage:
+    python -m PowderDispenserController.inflight logs/traces.jsonl [--horizon 0.3] [--save config.json]
+"""
+import argparse
+import json
+import os
+from collections import namedtuple
+
+from .settling import weight_slope
+from .stream import WeightSample
+
+DEFAULT_HORIZON = 0.3  # Seconds after a burst at which the settled weight is predicted.
+DEFAULT_WINDOW = 0.15  # Seconds of samples before the horizon used for the visible gain and the slope.
+MIN_TRACES = 4         # Fewest usable traces a model is fitted from.
+
+BurstTrace = namedtuple('BurstTrace', ['auger_type', 'powder_type', 'steps', 'start_weight', 'samples', 'settled_weight', 'settle_time'])
+BurstTrace.__doc__ = """
+Weight trajectory of one dispense burst until the scale settled.
+
+Attributes:
+    auger_type (str): The auger used.
+    powder_type (str): The powder dispensed.
+    steps (int): Auger steps of the burst.
+    start_weight (float): Settled weight in grams before the burst.
+    samples (tuple of tuple): (seconds since the first sample after the burst, grams) of every streamed sample
+                              until the scale settled.
+    settled_weight (float): Settled weight in grams after the burst.
+    settle_time (float): Seconds from the first sample after the burst until the scale counted as settled.
+"""
+
+EvaluationReport = namedtuple('EvaluationReport', ['bursts', 'mae', 'rmse', 'max_error', 'naive_mae', 'settle_time', 'horizon', 'time_saved'])
+EvaluationReport.__doc__ = """
+Cross-validated prediction error and time saved for one auger/powder pair.
+
+Attributes:
+    bursts (int): Number of traces evaluated.
+    mae (float): Mean absolute error of the predicted settled weight in grams.
+    rmse (float): Root mean square error in grams.
+    max_error (float): Largest absolute error in grams.
+    naive_mae (float): Mean absolute error in grams of taking the weight seen at the horizon as settled.
+    settle_time (float): Mean time in seconds the scale took to settle after a burst.
+    horizon (float): Time in seconds after a burst at which the prediction is made.
+    time_saved (float): Waiting time in seconds saved over all bursts by predicting instead of settling.
+"""
+
+
+class TraceRecorder:
+    """
+    Appends BurstTraces to a JSON lines file, one trace per line, creating the file and its directory on the
+    first trace.
+
+    Parameters:
+        path (str): Path of the trace file.
+    """
+    def __init__(self, path) -> None:
+        self.path = path
+        self.traces_written = 0
+
+    def write(self, trace):
+        """
+        Appends a trace to the file.
+
+        Parameters:
+            trace (BurstTrace): The trace to append.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(trace._asdict()) + '\n')
+        self.traces_written += 1
+
+
+def read_traces(paths):
+    """
+    Reads BurstTraces from JSON lines files.
+
+    Parameters:
+        paths (str or list of str): Trace files written by a TraceRecorder.
+
+    Returns:
+        list of BurstTrace: The traces, in file order.
+
+    Raises:
+        ValueError: If a line is not a valid trace.
+    """
+    traces = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        with open(path, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    fields = json.loads(line)
+                    fields['samples'] = tuple(tuple(sample) for sample in fields['samples'])
+                    traces.append(BurstTrace(**fields))
+                except (ValueError, TypeError, KeyError) as e:
+                    raise ValueError(f"{path}:{number} is not a valid burst trace: {e}") from None
+    return traces
+
+
+class InFlightModel:
+    """
+    Predicts the settled weight of a burst from the streamed samples of the first `horizon` seconds after it.
+
+    Parameters:
+        horizon (float): Time in seconds after the burst at which the prediction is made (default: 0.3).
+        gain (float): Coefficient of the weight gain visible at the horizon (default: 1.0).
+        slope (float): Coefficient of the weight slope at the horizon, in seconds (default: 0.0).
+        steps (float): Coefficient of the burst size, in grams per step (default: 0.0).
+        window (float): Time in seconds before the horizon whose samples are averaged for the visible gain and
+                        the slope (default: 0.15).
+    """
+    def __init__(self, horizon=DEFAULT_HORIZON, gain=1.0, slope=0.0, steps=0.0, window=DEFAULT_WINDOW) -> None:
+        self.horizon = horizon
+        self.gain = gain
+        self.slope = slope
+        self.steps = steps
+        self.window = window
+
+    def __repr__(self):
+        return f"InFlightModel(horizon={self.horizon}, gain={self.gain:.4g}, slope={self.slope:.4g}, steps={self.steps:.4g})"
+
+    @classmethod
+    def from_calibration(cls, calibration):
+        """
+        Creates the model stored in the configuration.
+
+        Parameters:
+            calibration (InFlightCalibration): The stored coefficients, see `Settings.inflight`.
+        """
+        return cls(calibration.horizon, calibration.gain, calibration.slope, calibration.steps, calibration.window)
+
+    def to_calibration(self):
+        """
+        Returns the coefficients as stored in `config['calibration']['inflight'][augerType][powderType]`.
+        """
+        return {'horizon': self.horizon, 'window': self.window, 'gain': self.gain, 'slope': self.slope, 'steps': self.steps}
+
+    def features(self, samples, start_weight, steps):
+        """
+        Returns the predictors of a burst: (visible gain in grams, slope in g/s, burst size in steps).
+
+        Parameters:
+            samples (sequence of tuple): (seconds since the first sample after the burst, grams); samples after
+                                         the horizon are ignored.
+            start_weight (float): Settled weight in grams before the burst.
+            steps (int): Auger steps of the burst.
+
+        Raises:
+            ValueError: If no sample lies within the horizon.
+        """
+        early = [sample for sample in samples if sample[0] <= self.horizon]
+        if not early:
+            raise ValueError("No weight sample within the prediction horizon.")
+        recent = [WeightSample(t, weight, None) for t, weight in early if t >= early[-1][0] - self.window]
+        seen = sum(sample.weight for sample in recent) / len(recent) - start_weight
+        return seen, weight_slope(recent), steps
+
+    def predict(self, samples, start_weight, steps):
+        """
+        Predicts the settled weight after a burst.
+
+        Parameters:
+            samples (sequence of tuple): (seconds since the first sample after the burst, grams).
+            start_weight (float): Settled weight in grams before the burst.
+            steps (int): Auger steps of the burst.
+
+        Returns:
+            float: The predicted settled weight in grams.
+        """
+        seen, slope, steps = self.features(samples, start_weight, steps)
+        return start_weight + self.gain * seen + self.slope * slope + self.steps * steps
+
+    @classmethod
+    def fit(cls, traces, horizon=DEFAULT_HORIZON, window=DEFAULT_WINDOW):
+        """
+        Fits the coefficients to logged bursts by least squares.
+
+        Parameters:
+            traces (sequence of BurstTrace): Bursts of one auger/powder pair.
+            horizon (float): Time in seconds after a burst at which the prediction is made (default: 0.3).
+            window (float): Time in seconds of samples used for the visible gain and the slope (default: 0.15).
+
+        Returns:
+            InFlightModel: The fitted model.
+
+        Raises:
+            ValueError: If fewer than MIN_TRACES traces have samples within the horizon.
+        """
+        model = cls(horizon, window=window)
+        rows, targets = [], []
+        for trace in traces:
+            try:
+                rows.append(model.features(trace.samples, trace.start_weight, trace.steps))
+            except ValueError:
+                continue
+            targets.append(trace.settled_weight - trace.start_weight)
+        if len(rows) < MIN_TRACES:
+            raise ValueError(f"At least {MIN_TRACES} bursts with samples within {horizon} s are needed, not {len(rows)}.")
+        import numpy as np  # Imported here, as loading NumPy slows down importing the package.
+        # Columns scaled to unit size, so the steps (thousands) and grams (thousandths) are weighed alike when
+        # lstsq drops directions the traces do not determine (e.g. bursts that all have the same size).
+        features = np.array(rows, dtype=float)
+        scales = np.abs(features).max(axis=0)
+        scales[scales < 1e-12] = 1.0  # Columns of rounding noise, e.g. the slopes of bursts that had all settled, stay tiny and are dropped.
+        coefficients = np.linalg.lstsq(features / scales, np.array(targets, dtype=float), rcond=None)[0] / scales
+        model.gain, model.slope, model.steps = (float(value) for value in coefficients)
+        return model
+
+
+def evaluate(traces, horizon=DEFAULT_HORIZON, window=DEFAULT_WINDOW, folds=5):
+    """
+    Replays logged bursts: for every auger/powder pair, predicts the settled weight of each burst with a model
+    fitted to the other folds of its bursts (cross-validation), and compares the prediction with the weight the
+    scale settled at and the waiting time it took.
+
+    Parameters:
+        traces (sequence of BurstTrace): The logged bursts.
+        horizon (float): Time in seconds after a burst at which the prediction is made (default: 0.3).
+        window (float): Time in seconds of samples used for the visible gain and the slope (default: 0.15).
+        folds (int): Number of cross-validation folds (default: 5).
+
+    Returns:
+        dict: (augerType, powderType) -> EvaluationReport, for the pairs with enough bursts.
+    """
+    groups = {}
+    for trace in traces:
+        if any(t <= horizon for t, _ in trace.samples):
+            groups.setdefault((trace.auger_type, trace.powder_type), []).append(trace)
+    reports = {}
+    for pair, group in groups.items():
+        k = min(folds, len(group))
+        errors, naive_errors = [], []
+        for fold in range(k):
+            train = [trace for i, trace in enumerate(group) if i % k != fold]
+            try:
+                model = InFlightModel.fit(train, horizon, window)
+            except ValueError:
+                break
+            for trace in group[fold::k]:
+                errors.append(model.predict(trace.samples, trace.start_weight, trace.steps) - trace.settled_weight)
+                seen = model.features(trace.samples, trace.start_weight, trace.steps)[0]
+                naive_errors.append(trace.start_weight + seen - trace.settled_weight)
+        if len(errors) < len(group):
+            continue  # Too few bursts to fit every fold.
+        settle_times = [trace.settle_time for trace in group]
+        reports[pair] = EvaluationReport(
+            bursts=len(group),
+            mae=sum(abs(e) for e in errors) / len(errors),
+            rmse=(sum(e * e for e in errors) / len(errors)) ** 0.5,
+            max_error=max(abs(e) for e in errors),
+            naive_mae=sum(abs(e) for e in naive_errors) / len(naive_errors),
+            settle_time=sum(settle_times) / len(settle_times),
+            horizon=horizon,
+            time_saved=sum(max(t - horizon, 0.0) for t in settle_times),
+        )
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate settled-weight predictors on logged dispense bursts.")
+    parser.add_argument('traces', nargs='+', help="Trace files written by ClosedLoopDispenser(trace_file=...).")
+    parser.add_argument('--horizon', type=float, default=DEFAULT_HORIZON, help=f"Prediction time in seconds after a burst (default: {DEFAULT_HORIZON}).")
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW, help=f"Samples used for the gain and slope, in seconds (default: {DEFAULT_WINDOW}).")
+    parser.add_argument('--folds', type=int, default=5, help="Cross-validation folds (default: 5).")
+    parser.add_argument('--save', metavar='CONFIG', help="Fit on all traces and store the models in this configuration file.")
+    args = parser.parse_args()
+
+    traces = read_traces(args.traces)
+    reports = evaluate(traces, args.horizon, args.window, args.folds)
+    if not reports:
+        raise SystemExit(f"Too few bursts to evaluate; at least {MIN_TRACES + 1} per auger/powder pair are needed.")
+    for (augerType, powderType), report in sorted(reports.items()):
+        print(f"{augerType}/{powderType}: {report.bursts} bursts, prediction at {report.horizon:g} s")
+        print(f"    error      MAE {report.mae * 1000:.2f} mg  RMSE {report.rmse * 1000:.2f} mg  max {report.max_error * 1000:.2f} mg"
+              f"  (weight at horizon: MAE {report.naive_mae * 1000:.2f} mg)")
+        print(f"    settling   {report.settle_time:.2f} s per burst, {report.time_saved:.1f} s saved over all bursts")
+
+    if args.save:
+        from .config import ConfigStore
+        store = ConfigStore(args.save)
+        for augerType, powderType in reports:
+            group = [trace for trace in traces if (trace.auger_type, trace.powder_type) == (augerType, powderType)]
+            model = InFlightModel.fit(group, args.horizon, args.window)
+            store.set(('calibration', 'inflight', augerType, powderType), model.to_calibration())
+            print(f"Saved {model} for {augerType}/{powderType} to {args.save}")
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""
+Per-command instrumentation for the controllers.
+
+Every command sent through `run_command` is recorded with its send time, the latency until the first byte
+arrives after it (first-byte latency), the latency until its '<Msg ...>' acknowledgement has been received
+(reply latency), the bytes sent and received, and its outcome ('ok', 'timeout' or 'error'). Latencies are
+aggregated per command name (e.g. 'Mix', 'Meas') into log-linear histograms in the style of HdrHistogram:
+values are counted in buckets whose width grows with the value, so recording is a constant-time dictionary
+update, memory stays bounded regardless of the number of commands and every percentile is reported within
+`1 / 2**(significant_bits - 1)` of the true value (under 1 % with the default). This keeps the bookkeeping cheap
+enough to leave enabled on production rigs.
+
+Note that the first byte after a command is not necessarily part of its reply: an unsolicited frame, e.g. a
+streamed weight sample, that arrives first is counted as well.
+
+Classes:
+    LatencyHistogram - Log-linear latency histogram with constant-time recording.
+    CommandRecord - Timings and outcome of a single command.
+    CommandStats - Per-command-type histograms, counters and recent records.
+
+Functions:
+    command_name(command_str) - Returns the name of a framed command, e.g. 'Mix' for '<Mix,10>'.
+"""
+import collections
+import json
+import threading
+
+OUTCOMES = ('ok', 'timeout', 'error')
+
+CommandRecord = collections.namedtuple(
+    'CommandRecord', ['command', 'sent_at', 'first_byte', 'reply', 'bytes_out', 'bytes_in', 'outcome'])
+CommandRecord.__doc__ = """
+Timings and outcome of a single command. `sent_at` is a time.monotonic() timestamp, `first_byte` and `reply`
+are latencies in seconds after it (None if nothing was received).
+"""
+
+
+def command_name(command_str):
+    """
+    Returns the name of a framed command, e.g. 'Mix' for '<Mix,10>'.
+    """
+    return command_str.strip('<>').split(',')[0]
+
+
+class LatencyHistogram:
+    """
+    Counts latencies in log-linear buckets of microseconds: values below 2**significant_bits microseconds get
+    one bucket each, above that every power of two is split into 2**(significant_bits - 1) equal buckets.
+
+    Parameters:
+        significant_bits (int): Resolution of the buckets; the relative error of a reported value is at
+                                most 1 / 2**(significant_bits - 1) (default: 8, i.e. under 1 %).
+    """
+    def __init__(self, significant_bits=8) -> None:
+        self.significant_bits = significant_bits
+        self.counts = {}      # Bucket index -> number of values.
+        self.count = 0
+        self.total = 0.0      # Sum of the recorded values in seconds.
+        self.min = None
+        self.max = None
+
+    def _index(self, micros):
+        shift = max(micros.bit_length() - self.significant_bits, 0)
+        return (shift << self.significant_bits) + (micros >> shift)
+
+    def _bounds(self, index):
+        # Returns the range [low, high) of values in microseconds that fall into a bucket.
+        shift, mantissa = divmod(index, 1 << self.significant_bits)
+        return mantissa << shift, (mantissa + 1) << shift
+
+    def record(self, seconds):
+        """
+        Adds one latency in seconds to the histogram.
+        """
+        index = self._index(max(int(seconds * 1e6), 0))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """
+        Returns the q-th percentile (0-100) in seconds, or None if the histogram is empty. The value is the
+        midpoint of the bucket holding it, clamped to the recorded minimum and maximum.
+        """
+        if not self.count:
+            return None
+        rank = max(q / 100 * self.count, 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                low, high = self._bounds(index)
+                return min(max((low + high) / 2e6, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        """
+        float: Mean of the recorded values in seconds, or None if the histogram is empty.
+        """
+        return self.total / self.count if self.count else None
+
+    def merge(self, other):
+        """
+        Adds the counts of another histogram with the same resolution to this one.
+        """
+        if other.significant_bits != self.significant_bits:
+            raise ValueError("Histograms with different resolutions cannot be merged.")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self):
+        """
+        Returns the count and the main statistics in milliseconds.
+
+        Returns:
+            dict: 'count', 'min_ms', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms' and 'max_ms' (None if empty).
+        """
+        def ms(value):
+            return None if value is None else value * 1000
+
+        return {
+            'count': self.count,
+            'min_ms': ms(self.min),
+            'mean_ms': ms(self.mean),
+            'p50_ms': ms(self.percentile(50)),
+            'p90_ms': ms(self.percentile(90)),
+            'p99_ms': ms(self.percentile(99)),
+            'max_ms': ms(self.max),
+        }
+
+    def buckets(self):
+        """
+        Returns the non-empty buckets as [low_us, high_us, count] lists in increasing order.
+        """
+        return [[*self._bounds(index), self.counts[index]] for index in sorted(self.counts)]
+
+
+class CommandStats:
+    """
+    Collects the command records of a controller. Thread-safe; recording costs a few microseconds.
+
+    Parameters:
+        history (int): Number of most recent CommandRecords kept for inspection (default: 1024).
+        significant_bits (int): Resolution of the latency histograms, see LatencyHistogram (default: 8).
+    """
+    def __init__(self, history=1024, significant_bits=8) -> None:
+        self.significant_bits = significant_bits
+        self.recent = collections.deque(maxlen=history)  # Most recent CommandRecords, oldest first.
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, name):
+        entry = self._commands.get(name)
+        if entry is None:
+            entry = self._commands[name] = {
+                'calls': 0,
+                'outcomes': dict.fromkeys(OUTCOMES, 0),
+                'bytes_out': 0,
+                'bytes_in': 0,
+                'first_byte': LatencyHistogram(self.significant_bits),
+                'reply': LatencyHistogram(self.significant_bits),
+            }
+        return entry
+
+    def record(self, command, sent_at, first_byte=None, reply=None, bytes_out=0, bytes_in=0, outcome='ok'):
+        """
+        Records one command.
+
+        Parameters:
+            command (str): The command string as sent, e.g. '<Mix,10>'.
+            sent_at (float): time.monotonic() timestamp taken just before the command was written.
+            first_byte (float, optional): Seconds until the first byte arrived after the command was sent.
+            reply (float, optional): Seconds until the acknowledgement was received.
+            bytes_out (int): Number of bytes written.
+            bytes_in (int): Number of bytes of the reply frame.
+            outcome (str): 'ok', 'timeout' or 'error' (default: 'ok').
+
+        Returns:
+            CommandRecord: The stored record.
+        """
+        record = CommandRecord(command, sent_at, first_byte, reply, bytes_out, bytes_in, outcome)
+        with self._lock:
+            entry = self._entry(command_name(command))
+            entry['calls'] += 1
+            entry['outcomes'][outcome] = entry['outcomes'].get(outcome, 0) + 1
+            entry['bytes_out'] += bytes_out
+            entry['bytes_in'] += bytes_in
+            if first_byte is not None:
+                entry['first_byte'].record(first_byte)
+            if reply is not None:
+                entry['reply'].record(reply)
+            self.recent.append(record)
+        return record
+
+    def snapshot(self, buckets=False):
+        """
+        Returns the current statistics per command name.
+
+        Parameters:
+            buckets (bool): Also include the raw histogram buckets, e.g. for merging runs later (default: False).
+
+        Returns:
+            dict: Maps each command name to its number of calls, counts per outcome, bytes sent and received,
+                  and summaries of the first-byte and reply latencies (see LatencyHistogram.summary).
+        """
+        with self._lock:
+            result = {}
+            for name, entry in self._commands.items():
+                result[name] = {
+                    'calls': entry['calls'],
+                    'outcomes': dict(entry['outcomes']),
+                    'bytes_out': entry['bytes_out'],
+                    'bytes_in': entry['bytes_in'],
+                    'first_byte': entry['first_byte'].summary(),
+                    'reply': entry['reply'].summary(),
+                }
+                if buckets:
+                    result[name]['first_byte']['buckets'] = entry['first_byte'].buckets()
+                    result[name]['reply']['buckets'] = entry['reply'].buckets()
+            return result
+
+    def histogram(self, name, kind='reply'):
+        """
+        Returns a copy of the 'reply' or 'first_byte' latency histogram of a command name.
+        """
+        copy = LatencyHistogram(self.significant_bits)
+        with self._lock:
+            entry = self._commands.get(name)
+            if entry is not None:
+                copy.merge(entry[kind])
+        return copy
+
+    def export(self, path):
+        """
+        Writes the statistics, including the histogram buckets, to a JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(buckets=True), f, indent=4)
+
+    def reset(self):
+        """
+        Discards all recorded commands.
+        """
+        with self._lock:
+            self._commands.clear()
+            self.recent.clear()
@@ -0,0 +1,163 @@
+"""
+Logging pipeline of the powder dispensing package.
+
+All messages of the package go to the 'PowderDispenserController' logger (and its children, one per module).
+The package does not set a level, so the application's logging level applies. That logger has a single
+handler that only puts records on an in-memory queue; a background thread (a `logging.handlers.QueueListener`,
+started with the first record) hands them to the root logger's handlers, as propagation would, or writes them
+to stdout if the root logger has none (a plain script or notebook). The serial hot path therefore never blocks
+on a slow console, Jupyter front end or journald pipe, and does not even format the message. Records are
+written as plain messages, so the output looks like it did with print. `configure_logging()` replaces the root
+handlers as destination and sets the level of the package logs.
+
+The per-command chatter ('Sent from PC -- COMMAND -- ...' and 'Reply Received: ...') is logged on the
+'PowderDispenserController.commands' logger at INFO level, so it can be silenced on its own, e.g. at high
+sample rates, with `set_command_logging(False)`.
+
+Interactive prompts (e.g. during scale calibration) are not log records and still go straight to stdout;
+call `flush_logging()` before prompting to keep the output in order.
+
+Functions:
+    configure_logging(level, handlers, fmt, commands) - Sets the level, destinations and format of the package logs.
+    set_command_logging(enabled) - Switches the per-command messages on or off.
+    flush_logging(timeout) - Waits until all queued records have been written.
+    shutdown_logging() - Writes the queued records and stops the background thread.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+PACKAGE_LOGGER = 'PowderDispenserController'
+COMMAND_LOGGER = PACKAGE_LOGGER + '.commands'  # Per-command send/reply messages.
+DEFAULT_FORMAT = '%(message)s'
+
+
+class _StdoutHandler(logging.StreamHandler):
+    # Looks up sys.stdout for every record, so redirections (Jupyter cells, contextlib.redirect_stdout) apply.
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _RootHandler(logging.Handler):
+    # Hands records to the root logger's handlers on the listener thread, like propagation does on the logging
+    # thread; writes them to stdout while the root logger has no handlers.
+    def __init__(self):
+        super().__init__()
+        self._fallback = _StdoutHandler()
+
+    def handle(self, record):
+        handlers = logging.root.handlers or [self._fallback]
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return record
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Enqueues records unformatted; formatting happens on the listener thread. Starts the listener on first use.
+    def prepare(self, record):
+        return record
+
+    def emit(self, record):
+        if _listener is None:
+            _start_listener()
+        super().emit(record)
+
+
+class _Listener(logging.handlers.QueueListener):
+    # Completes flush_logging() markers instead of writing them.
+    def handle(self, record):
+        event = getattr(record, 'flush_event', None)
+        if event is not None:
+            event.set()
+        else:
+            super().handle(record)
+
+
+_queue = queue.SimpleQueue()
+_handlers = [_RootHandler()]
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _start_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            listener = _Listener(_queue, *_handlers, respect_handler_level=True)
+            listener.start()
+            _listener = listener
+            atexit.register(shutdown_logging)
+
+
+def configure_logging(level=logging.INFO, handlers=None, fmt=DEFAULT_FORMAT, commands=True):
+    """
+    Configures the package logs. From then on they are written to `handlers` instead of the root logger's handlers.
+
+    Parameters:
+        level (int or str): Minimum level of the records written (default: logging.INFO).
+        handlers (list of logging.Handler, optional): Destinations of the records, e.g. a FileHandler;
+                                                      they are called on the background thread (default: stdout).
+        fmt (str): Format of the records for handlers without their own formatter (default: the bare message).
+        commands (bool): Whether per-command send/reply messages are written (default: True).
+    """
+    global _handlers
+    shutdown_logging()
+    _handlers = list(handlers) if handlers is not None else [_StdoutHandler()]
+    for handler in _handlers:
+        if handler.formatter is None:
+            handler.setFormatter(logging.Formatter(fmt))
+    logging.getLogger(PACKAGE_LOGGER).setLevel(level)
+    set_command_logging(commands)
+
+
+def set_command_logging(enabled):
+    """
+    Switches the per-command messages ('Sent from PC -- COMMAND -- ...', 'Reply Received: ...') on or off.
+    When off, logging a command costs a single level check.
+
+    Parameters:
+        enabled (bool): True to write the messages, False to drop them.
+    """
+    logging.getLogger(COMMAND_LOGGER).setLevel(logging.NOTSET if enabled else logging.WARNING)
+
+
+def flush_logging(timeout=1.0):
+    """
+    Waits until the background thread has written all queued records.
+
+    Parameters:
+        timeout (float): Maximum time in seconds to wait (default: 1.0).
+    """
+    if _listener is None:
+        return
+    done = threading.Event()
+    # The queue is FIFO, so once this marker record has been handled, every earlier record has been written.
+    _queue.put_nowait(logging.makeLogRecord({'flush_event': done}))
+    done.wait(timeout)
+
+
+def shutdown_logging():
+    """
+    Writes all queued records and stops the background thread. Logging restarts with the next record.
+    """
+    global _listener
+    with _listener_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        atexit.unregister(shutdown_logging)
+
+
+_package_logger = logging.getLogger(PACKAGE_LOGGER)
+if not _package_logger.handlers:
+    _package_logger.addHandler(_DeferredQueueHandler(_queue))
+    _package_logger.propagate = False  # The listener hands the records to the root handlers, see _RootHandler.
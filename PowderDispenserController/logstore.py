@@ -0,0 +1,269 @@
+"""
+Columnar (Parquet) storage for the dispensing logs.
+
+A log store is a directory of Parquet files sharing one typed schema: timestamps, float64 amounts, int64 steps and
+dictionary-encoded (categorical) auger, powder and filter types. The ParquetLogWriter buffers rows and writes each
+batch as a new part file (written under a temporary name and renamed, so readers and crashes never see a partial
+file), with `row_group_size` rows per row group. When the writer is closed, the part files of its session are
+merged into one file named after the session; it supersedes the parts, which are then deleted, so a slow session
+whose timer flushes a few rows at a time does not leave a trail of small files behind. After a crash the parts
+stay and are read as they are. Reading only touches the requested columns, and filters on the auger or powder
+type are pushed down to the row groups, so the history does not have to be parsed as a whole.
+
+Requires `pyarrow`, which is listed in requirements.txt; it is only imported when a log store is used, so the CSV
+logs work without it.
+
+Classes:
+    ParquetLogWriter - Buffered writer appending dispensing rows to a log store.
+
+Functions:
+    read_log_store(path, columns=None, augerType=None, powderType=None) - Loads selected columns and rows into a DataFrame.
+    export_csv(path, csv_file, **filters) - Writes (part of) a log store as a CSV log readable by `read_logfile`.
+    import_csv(csv_file, path) - Converts a CSV log into a log store.
+"""
+import atexit
+import datetime
+import os
+import re
+import threading
+import uuid
+
+from .logwriter import LOG_COLUMNS
+from .utils import read_logfile
+
+# Parquet column name -> CSV column name.
+CSV_COLUMNS = dict(zip(['desired_amount', 'measured_amount', 'steps', 'auger_type', 'powder_type', 'filter_type'], LOG_COLUMNS))
+PART_FILE = re.compile(r'(?P<session>part-.+)-\d{5}\.parquet$')  # Part file; '<session>.parquet' supersedes it.
+
+
+def _require_pyarrow():
+    # Imports pyarrow on first use, so the package can be used without it.
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("The Parquet log store requires pyarrow. Install it with 'pip install pyarrow'.") from e
+    return pyarrow, pyarrow.parquet
+
+
+def log_schema():
+    """
+    Returns the Arrow schema of the log store.
+
+    Returns:
+        pyarrow.Schema: The typed columns of a dispensing log.
+    """
+    pa, _ = _require_pyarrow()
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('timestamp', pa.timestamp('ms')),
+        ('desired_amount', pa.float64()),
+        ('measured_amount', pa.float64()),
+        ('steps', pa.int64()),
+        ('auger_type', category),
+        ('powder_type', category),
+        ('filter_type', category),
+    ])
+
+
+class ParquetLogWriter:
+    """
+    Appends dispensing rows to a Parquet log store, with the same `write()` interface as SessionLogWriter.
+
+    Parameters:
+        path (str): Directory of the log store; created if it does not exist.
+        flush_rows (int): Number of buffered rows written out as one part file (default: 4096); the parts are
+                          merged into one file on close().
+        flush_interval (float): Maximum time in seconds a row stays buffered (default: 60).
+        row_group_size (int): Maximum number of rows per row group (default: 4096).
+    """
+    def __init__(self, path, flush_rows=4096, flush_interval=60.0, row_group_size=4096) -> None:
+        self.pa, self.pq = _require_pyarrow()
+        self.logfile = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.row_group_size = row_group_size
+        self.schema = log_schema()
+        self.rows_written = 0
+        self.closed = False
+        self._columns = {name: [] for name in self.schema.names}
+        self._parts = []       # Part files written by this session.
+        self._prefix = f"part-{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._timer = None
+        os.makedirs(path, exist_ok=True)
+        atexit.register(self.close)
+
+    def write(self, desired_amount=None, measured_amount=None, steps=None, augerType=None, powderType=None, filterType=None):
+        """
+        Appends a row with dispensing operation details, timestamped with the current time.
+
+        Parameters:
+            desired_amount (float, optional): The target amount to be dispensed.
+            measured_amount (float, optional): The actual amount dispensed as measured by the scale.
+            steps (int, optional): The number of steps executed by the stepper motor (rounded to an integer).
+            augerType (str, optional): The type of auger used for dispensing.
+            powderType (str, optional): The type of powder dispensed.
+            filterType (str, optional): The type of filter applied to the weight measurement.
+
+        Raises:
+            ValueError: If the writer has been closed.
+        """
+        self._append(datetime.datetime.now(), desired_amount, measured_amount, steps, augerType, powderType, filterType)
+
+    def _append(self, timestamp, desired_amount, measured_amount, steps, augerType, powderType, filterType):
+        row = (timestamp,
+               None if desired_amount is None else float(desired_amount),
+               None if measured_amount is None else float(measured_amount),
+               None if steps is None else int(round(float(steps))),
+               augerType, powderType, filterType)
+        with self._lock:
+            if self.closed:
+                raise ValueError(f"Log store '{self.logfile}' has been closed.")
+            for values, value in zip(self._columns.values(), row):
+                values.append(value)
+            if len(self._columns['timestamp']) >= self.flush_rows:
+                self._flush_locked()
+            elif self._timer is None and self.flush_interval is not None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        num_rows = len(self._columns['timestamp'])
+        if num_rows == 0:
+            return
+        table = self.pa.Table.from_pydict(self._columns, schema=self.schema)
+        name = f"{self._prefix}-{len(self._parts):05d}.parquet"
+        self._write_file(table, name)
+        self._parts.append(name)
+        self.rows_written += num_rows
+        for values in self._columns.values():
+            values.clear()
+
+    def _write_file(self, table, name):
+        final = os.path.join(self.logfile, name)
+        temp = final + '.tmp'
+        self.pq.write_table(table, temp, row_group_size=self.row_group_size)
+        os.replace(temp, final)  # Readers only ever see complete files.
+
+    def _compact_locked(self):
+        # Merges the part files of this session into '<session>.parquet', then deletes them.
+        if len(self._parts) < 2:
+            return
+        parts = [os.path.join(self.logfile, name) for name in self._parts]
+        table = self.pa.concat_tables([self.pq.read_table(part, schema=self.schema) for part in parts])
+        self._write_file(table, f"{self._prefix}.parquet")
+        for part in parts:
+            os.remove(part)  # Superseded by the merged file, see read_log_store.
+        self._parts = [f"{self._prefix}.parquet"]
+
+    def flush(self):
+        """
+        Writes all buffered rows to a new part file.
+        """
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """
+        Flushes the buffered rows and merges the part files of the session into one. Further calls have no effect.
+        """
+        with self._lock:
+            if self.closed:
+                return
+            self._flush_locked()
+            self.closed = True
+            self._compact_locked()
+        atexit.unregister(self.close)
+
+    def __len__(self):
+        return self.rows_written + len(self._columns['timestamp'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _filters(augerType=None, powderType=None):
+    # Builds pyarrow filters; each argument may be a single type or a list of types.
+    filters = []
+    for column, value in (('auger_type', augerType), ('powder_type', powderType)):
+        if value is not None:
+            filters.append((column, 'in', [value] if isinstance(value, str) else list(value)))
+    return filters or None
+
+
+def _superseded(name, names):
+    # Whether a part file has been merged into its session's file (left over if deleting it was interrupted).
+    match = PART_FILE.match(name)
+    return match is not None and match.group('session') + '.parquet' in names
+
+
+def read_log_store(path, columns=None, augerType=None, powderType=None):
+    """
+    Loads a Parquet log store into a pandas DataFrame.
+
+    Parameters:
+        path (str): Directory of the log store (or a single Parquet file).
+        columns (list of str, optional): Only load these columns (default: all).
+        augerType (str or list of str, optional): Only load rows for these auger types.
+        powderType (str or list of str, optional): Only load rows for these powder types.
+
+    Returns:
+        pandas.DataFrame: Typed log data; auger, powder and filter types are categorical, rows in write order.
+    """
+    _, pq = _require_pyarrow()
+    schema = log_schema()
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.endswith('.parquet'))
+        files = [os.path.join(path, name) for name in names if not _superseded(name, names)]
+        if not files:
+            return schema.empty_table().select(columns or schema.names).to_pandas()
+        path = files
+    table = pq.read_table(path, columns=columns, filters=_filters(augerType, powderType), schema=schema)
+    return table.to_pandas()
+
+
+def export_csv(path, csv_file, augerType=None, powderType=None):
+    """
+    Writes a log store, or the rows of selected auger/powder types, as a CSV log readable by `read_logfile`.
+
+    Parameters:
+        path (str): Directory of the log store.
+        csv_file (str): Path of the CSV file to write.
+        augerType (str or list of str, optional): Only export rows for these auger types.
+        powderType (str or list of str, optional): Only export rows for these powder types.
+    """
+    df = read_log_store(path, columns=list(CSV_COLUMNS), augerType=augerType, powderType=powderType)
+    df['steps'] = df['steps'].astype('Int64')  # Keep integer steps integral in the presence of empty cells.
+    df.rename(columns=CSV_COLUMNS).to_csv(csv_file, index=False)
+
+
+def import_csv(csv_file, path):
+    """
+    Converts a CSV log into a log store. Cells holding lists of values are expanded to one row per value;
+    the imported rows have no timestamp.
+
+    Parameters:
+        csv_file (str): Path of the CSV log.
+        path (str): Directory of the log store to append to.
+
+    Returns:
+        int: The number of imported rows.
+    """
+    df = read_logfile(csv_file).reindex(columns=LOG_COLUMNS)
+    list_columns = [column for column in df.columns if df[column].map(lambda v: isinstance(v, list)).any()]
+    if list_columns:
+        df = df.explode(list_columns, ignore_index=True)
+    df = df.astype(object).where(df.notna(), None)
+
+    with ParquetLogWriter(path) as writer:
+        for row in df.itertuples(index=False):
+            writer._append(None, *row)
+    return len(df)
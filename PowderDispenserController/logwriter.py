@@ -0,0 +1,136 @@
+"""
+Append-only writer for the CSV dispensing logs.
+
+The SessionLogWriter keeps the log file open for the whole session and appends each row without re-reading the
+file, so logging a dispense costs the same at the ten-thousandth row as at the first. Rows are buffered and written
+out once `flush_rows` rows have accumulated or `flush_interval` seconds have passed since the first unwritten row,
+whichever comes first. Every flush writes whole lines and is followed by `os.fsync`, so a crash loses at most the
+rows of the current flush window and never leaves a half-written file behind.
+
+The file format is unchanged: one header line with LOG_COLUMNS, values written as pandas would write them, so
+`read_logfile` reads old and new logs alike.
+
+Classes:
+    SessionLogWriter - Buffered, append-only CSV log writer.
+
+Attributes:
+    LOG_COLUMNS - Column names of the dispensing log.
+"""
+import atexit
+import csv
+import io
+import os
+import threading
+
+LOG_COLUMNS = ['desired_amount', 'measured_amount', '# of steps', 'auger_type', 'powder_type', 'filter_type']
+
+
+class SessionLogWriter:
+    """
+    Appends rows to a CSV dispensing log in constant time.
+
+    Parameters:
+        logfile (str): Path to the log file. It is created with a header line if it does not exist or is empty.
+        flush_rows (int): Number of buffered rows that triggers a flush (default: 64).
+        flush_interval (float): Maximum time in seconds a row stays buffered (default: 1.0).
+        fsync (bool): Force flushed rows onto the disk, not only into the OS cache (default: True).
+    """
+    def __init__(self, logfile, flush_rows=64, flush_interval=1.0, fsync=True) -> None:
+        self.logfile = logfile
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rows_written = 0
+        self._rows = []                     # Formatted lines not yet written to the file.
+        self._lock = threading.Lock()
+        self._timer = None
+
+        directory = os.path.dirname(logfile)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(logfile, 'a', newline='', encoding='utf-8')
+        if self._file.tell() == 0:
+            self._file.write(self._format(LOG_COLUMNS))
+            self._sync()
+        atexit.register(self.close)
+
+    @staticmethod
+    def _format(values):
+        # Formats one CSV line; lists and tuples are stored as their Python representation, None as an empty field.
+        line = io.StringIO()
+        csv.writer(line, lineterminator='\n').writerow(
+            '' if value is None else str(list(value)) if isinstance(value, (list, tuple)) else value
+            for value in values
+        )
+        return line.getvalue()
+
+    def write(self, desired_amount=None, measured_amount=None, steps=None, augerType=None, powderType=None, filterType=None):
+        """
+        Appends a row with dispensing operation details.
+
+        Parameters:
+            desired_amount (float, optional): The target amount to be dispensed.
+            measured_amount (float, optional): The actual amount dispensed as measured by the scale.
+            steps (int, optional): The number of steps executed by the stepper motor.
+            augerType (str, optional): The type of auger used for dispensing.
+            powderType (str, optional): The type of powder dispensed.
+            filterType (str, optional): The type of filter applied to the weight measurement.
+
+        Raises:
+            ValueError: If the writer has been closed.
+        """
+        line = self._format((desired_amount, measured_amount, steps, augerType, powderType, filterType))
+        with self._lock:
+            if self._file is None:
+                raise ValueError(f"Log file '{self.logfile}' has been closed.")
+            self._rows.append(line)
+            if len(self._rows) >= self.flush_rows:
+                self._flush_locked()
+            elif self._timer is None and self.flush_interval is not None:
+                # Bound the time the first buffered row can be lost in a crash.
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._rows and self._file is not None:
+            self._file.write(''.join(self._rows))
+            self._sync()
+            self.rows_written += len(self._rows)
+            self._rows.clear()
+
+    def flush(self):
+        """
+        Writes all buffered rows to the file.
+        """
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """
+        Flushes the buffered rows and closes the file. Further calls have no effect.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_locked()
+            self._file.close()
+            self._file = None
+        atexit.unregister(self.close)
+
+    def __len__(self):
+        return self.rows_written + len(self._rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,233 @@
+"""
+Pipelined command batches.
+
+A recipe such as flush -> enable stepper -> dispense -> disable stepper -> scale on -> tare normally pays one
+serial round trip per step: each command is sent only after the previous one has been acknowledged. A
+`CommandBatch` queues the commands of such a recipe and the controller's `run_batch` sends them back-to-back.
+The firmware executes them in order, so the acknowledgements arrive in order too; each '<Msg ...>' reply is
+matched to its command by the echoed command text.
+
+The Arduino receives commands into the 64-byte serial buffer of its core while it executes the current one
+(e.g. a long 'Dispense'), and bytes arriving when that buffer is full are lost. `run_batch` therefore keeps at
+most `RX_WINDOW` bytes of unacknowledged commands in flight and sends the next command as soon as enough of
+the earlier ones have been acknowledged.
+
+Classes:
+    BatchCommand - A queued command with its timeout, expected reading and acknowledgement callback.
+    BatchResult - Reply and reading of one command of a batch.
+    CommandBatch - Builder queueing controller operations for one pipelined exchange.
+
+Functions:
+    echo_matches(command_str, reply_text) - Checks whether a '<Msg ...>' reply acknowledges a command.
+"""
+import inspect
+from collections import namedtuple
+
+RX_BUFFER_SIZE = 64             # Serial receive buffer of the Arduino AVR core (SERIAL_RX_BUFFER_SIZE).
+RX_WINDOW = RX_BUFFER_SIZE - 1  # Maximum number of unacknowledged command bytes in flight.
+
+BatchCommand = namedtuple('BatchCommand', ['command', 'timeout', 'value_kind', 'on_ack'], defaults=(None, None, None))
+BatchCommand.__doc__ = """
+A queued command. `timeout` is the maximum time in seconds to wait for its acknowledgement once the commands
+before it have been acknowledged (None: the batch default), `value_kind` the type of the reading it returns
+('Weight' or 'ADC', None for commands without a reading) and `on_ack` a function called once it has been
+acknowledged, e.g. to update the controller's stepper state.
+"""
+
+BatchResult = namedtuple('BatchResult', ['command', 'reply', 'value'])
+BatchResult.__doc__ = """
+Result of one command of a batch: the command string, the text of its '<Msg ...>' acknowledgement and the
+value of its reading (None for commands without a reading, or if the reading could not be parsed).
+"""
+
+
+def echo_matches(command_str, reply_text):
+    """
+    Checks whether a reply such as 'Msg Dispense,2000,1 Time 42' acknowledges the command '<Dispense,2000,1>'.
+    The firmware echoes at most its input buffer size, so a truncated echo matches as well.
+    """
+    if not reply_text.startswith('Msg '):
+        return False
+    end = reply_text.rfind(' Time ')
+    echo = reply_text[4:end] if end >= 4 else reply_text[4:]
+    return bool(echo) and command_str.strip('<>').startswith(echo)
+
+
+class CommandBatch:
+    """
+    Queues controller operations and runs them as one pipelined exchange. Create it with `controller.batch()`:
+
+        with dispenseBot.batch() as batch:
+            batch.runFlush(time=1)
+            batch.enableStepper()
+            batch.dispense(2000, runSteps=True)
+            batch.disableStepper()
+            batch.scaleOn()
+            batch.tare()
+        print(batch.results)
+
+    The batch runs when the `with` block ends without an exception (use `async with` for the asyncio
+    controller), or when `run()` is called. The methods mirror those of the controller, with two differences:
+    nothing waits on the host between commands (e.g. `scaleOn` does not wait for the scale to settle), and
+    measurements only return their value with the results of the batch.
+
+    Parameters:
+        controller (PowderDispenseController or AsyncPowderDispenseController): The controller running the batch.
+        timeout (float, optional): Maximum time in seconds to wait for each acknowledgement of commands without
+                                   their own timeout. Waits indefinitely if None, like run_command (default: None).
+    """
+    def __init__(self, controller, timeout=None) -> None:
+        self.controller = controller
+        self.timeout = timeout
+        self.commands = []     # Queued BatchCommands.
+        self.results = None    # List of BatchResult once the batch has run.
+        # States planned by the queued commands, so redundant switching is skipped as in the controller.
+        self._stepper_on = controller.isStepperOn
+        self._scale_on = controller.isScaleOn
+
+    def __len__(self):
+        return len(self.commands)
+
+    def add(self, command_str, timeout=None, value_kind=None, on_ack=None):
+        """
+        Queues a raw command string, e.g. '<Mix,5>'.
+
+        Returns:
+            int: Position of the command's result in `results`.
+        """
+        self.commands.append(BatchCommand(command_str, timeout, value_kind, on_ack))
+        return len(self.commands) - 1
+
+    def run(self):
+        """
+        Sends the queued commands and waits for all acknowledgements; with the asyncio controller, returns a
+        coroutine to await.
+
+        Returns:
+            list of BatchResult: One result per queued command, in order.
+        """
+        if inspect.iscoroutinefunction(self.controller.run_batch):
+            return self._run_async()
+        self.results = self.controller.run_batch(self.commands, timeout=self.timeout)
+        return self.results
+
+    async def _run_async(self):
+        self.results = await self.controller.run_batch(self.commands, timeout=self.timeout)
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.run()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self._run_async()
+
+    def _set_controller(self, name, value):
+        # Returns an acknowledgement callback updating a state attribute of the controller.
+        return lambda: setattr(self.controller, name, value)
+
+    ### Controller operations
+    def enableStepper(self):
+        """
+        Queues enabling the stepper motor, unless it is already on.
+        """
+        if not self._stepper_on:
+            self.add("<DispenserOn>", on_ack=self._set_controller('isStepperOn', True))
+            self._stepper_on = True
+
+    def disableStepper(self):
+        """
+        Queues disabling the stepper motor, unless it is already off.
+        """
+        if self._stepper_on:
+            self.add("<DispenserOff>", on_ack=self._set_controller('isStepperOn', False))
+            self._stepper_on = False
+
+    def scaleOn(self):
+        """
+        Queues powering on the scale, unless it is already on. Does not wait for the scale to settle.
+        """
+        if not self._scale_on:
+            self.add("<ScaleOn>", on_ack=self._set_controller('isScaleOn', True))
+            self._scale_on = True
+
+    def scaleOff(self):
+        """
+        Queues powering off the scale, unless it is already off.
+        """
+        if self._scale_on:
+            self.add("<ScaleOff>", on_ack=self._set_controller('isScaleOn', False))
+            self._scale_on = False
+
+    def tare(self):
+        """
+        Queues taring the scale.
+        """
+        self.add("<Tare>")
+
+    def dispense(self, amount_or_steps, direction=None, runSteps=False, augerType=None, powderType=None):
+        """
+        Queues dispensing an amount in grams or a number of steps, see PowderDispenseController.dispense.
+        """
+        controller = self.controller
+        direction = direction or controller.dispenseDir
+        if runSteps:
+            neededSteps = amount_or_steps
+        else:
+            neededSteps = controller._steps_for(amount_or_steps, augerType or controller.DEFAULT_augerType, powderType or controller.DEFAULT_powderType)
+        self.add(f"<Dispense,{neededSteps},{direction}>")
+
+    def runPump(self, pump, volume=None, time=None):
+        """
+        Queues running a pump for a volume or a time, see PowderDispenseController.runPump.
+        """
+        pump_pin, pump_time = self.controller._pump_time(pump, volume, time)
+        if pump_time > 0:
+            self.add(f"<Pump,{pump_pin},{pump_time}>", timeout=pump_time + self.controller.DEFAULT_timeout)
+
+    def runFlush(self, volume=None, time=None):
+        """
+        Queues a flush, see PowderDispenseController.runFlush.
+        """
+        self.runPump('Flush', volume, time)
+
+    def runMixer(self, duration=None):
+        """
+        Queues running the mixer, by default for the configured mixing time.
+        """
+        duration = duration or self.controller.mixTime
+        self.add(f"<Mix,{duration}>", timeout=duration + self.controller.DEFAULT_timeout)
+
+    def runDrain(self, duration=None):
+        """
+        Queues draining, by default for the configured draining time.
+        """
+        duration = duration or self.controller.drainTime
+        self.add(f"<Drain,{duration}>", timeout=duration + self.controller.DEFAULT_timeout)
+
+    def measWeight(self, avgReadingSamples=100, filterType=None):
+        """
+        Queues a weight measurement; its value is returned in the batch results.
+
+        Returns:
+            int: Position of the measurement in `results`.
+        """
+        filterType = filterType or self.controller.DEFAULT_filterType
+        return self.add(f"<Meas,{avgReadingSamples},{filterType}>", value_kind='Weight')
+
+    def measRaw(self, avgReadingSamples=100, filterType=None):
+        """
+        Queues a raw ADC measurement; its value is returned in the batch results.
+
+        Returns:
+            int: Position of the measurement in `results`.
+        """
+        filterType = filterType or self.controller.DEFAULT_filterType
+        return self.add(f"<ADC,{avgReadingSamples},{filterType}>", value_kind='ADC')
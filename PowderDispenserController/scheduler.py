@@ -0,0 +1,416 @@
+"""
+Resource-aware execution of recipes on one or several rigs.
+
+A Recipe is a directed acyclic graph of controller operations (`runFlush`, `dispense_powder_seq`, `runMixer`,
+`runDrain`, `tare`, ...) and host-side waits, each step naming the steps it depends on and the rig resources it
+occupies (auger, scale, mixer relay, drain relay, flush pump). The RecipeScheduler starts every step as soon as
+its dependencies have finished and its resources are free, so independent steps overlap instead of running one
+after the other, and reports the critical path and the idle time of every resource.
+
+Every command occupies the firmware of its rig as well: the Arduino executes one command at a time, so two
+operations on the same rig only overlap if at most one of them talks to the firmware, e.g. a soak time ('wait')
+next to a dispense. Firmware with background actuators only needs a moment to start the mixer, drain or pump, so
+`runMixer`, `runDrain`, `runFlush` and `runPump` leave the firmware free for other steps unless the controller
+found that the firmware runs them blocking (`backgroundActuators` is False). Operations on different rigs always
+overlap.
+Among the steps that are ready, the one with the longest estimated remaining path to the end of the recipe is
+started first.
+
+Classes:
+    Step - A recipe step: an operation with its rig, dependencies, resources and duration estimate.
+    Recipe - Builder for a DAG of steps.
+    StepRecord - Timing and outcome of an executed step.
+    ScheduleReport - Makespan, per-step records, critical path and resource idle times of a run.
+    RecipeScheduler - Executes recipes on a set of controllers.
+
+Functions:
+    default_resources(operation, args, kwargs, background_actuators) - Returns the resources an operation occupies on its rig.
+"""
+import logging
+import queue
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+FIRMWARE = 'firmware'       # Resource held by every operation that sends commands to the Arduino.
+WAIT = 'wait'               # Host-side delay: `recipe.add('soak', 'wait', 30)`.
+DEFAULT_ESTIMATE = 1.0      # Duration estimate in seconds for operations without a known duration.
+PUMP_TIMER = 'pump_timer'   # The firmware times one pump at a time in the background.
+BACKGROUND_OPERATIONS = ('runMixer', 'runDrain', 'runFlush', 'runPump')  # Need the firmware only to start.
+
+# Rig resources each controller operation occupies, besides the firmware.
+OPERATION_RESOURCES = {
+    'runFlush': ('flush_pump',),
+    'runMixer': ('mixer',),
+    'runDrain': ('drain',),
+    'reset': ('drain', 'flush_pump'),
+    'dispense': ('auger',),
+    'enableStepper': ('auger',),
+    'disableStepper': ('auger',),
+    'dispense_powder_seq': ('auger', 'scale'),
+    'dispense_closed_loop': ('auger', 'scale'),
+    'dispense_until': ('auger', 'scale'),
+    'dispense_feed': ('auger', 'scale'),
+    'set_feed_rate': ('auger',),
+    'stop_feed': ('auger',),
+    'purge_dispenser': ('auger', 'scale'),
+    'scaleOn': ('scale',),
+    'scaleOff': ('scale',),
+    'tare': ('scale',),
+    'measWeight': ('scale',),
+    'measRaw': ('scale',),
+    'wait_for_settle': ('scale',),
+}
+
+
+def default_resources(operation, args=(), kwargs=None, background_actuators=False):
+    """
+    Returns the resources an operation occupies on its rig.
+
+    Parameters:
+        operation (str or callable): Controller method name, 'wait', or a function called with the controller.
+        args (tuple): Positional arguments of the operation.
+        kwargs (dict, optional): Keyword arguments of the operation.
+        background_actuators (bool): Whether the firmware runs the mixer, drain and pumps in the background, so
+                                     these operations do not occupy it (default: False).
+
+    Returns:
+        tuple of str: The resources; 'wait' occupies none, any other operation at least the firmware (or, for
+                      background pumps, the pump timer).
+    """
+    if operation == WAIT:
+        return ()
+    if operation == 'runPump':
+        pump = args[0] if args else (kwargs or {}).get('pump')
+        resources = ('flush_pump' if pump == 'Flush' else f'pump:{pump}',)
+    else:
+        resources = OPERATION_RESOURCES.get(operation, ())
+    if background_actuators and operation in BACKGROUND_OPERATIONS:
+        return resources + ((PUMP_TIMER,) if operation in ('runFlush', 'runPump') else ())
+    return (FIRMWARE,) + resources
+
+
+Step = namedtuple('Step', ['name', 'operation', 'args', 'kwargs', 'rig', 'after', 'resources', 'estimate'])
+Step.__doc__ = """
+A recipe step.
+
+Attributes:
+    name (str): Unique name of the step within the recipe.
+    operation (str or callable): Controller method name (e.g. 'runMixer'), 'wait' for a host-side delay of
+                                 `args[0]` seconds, or a function called with the controller.
+    args (tuple): Positional arguments of the operation.
+    kwargs (dict): Keyword arguments of the operation.
+    rig: Key of the rig the step runs on (e.g. its port), or None if the scheduler has a single rig.
+    after (tuple of str): Names of the steps that must finish before this step starts.
+    resources (tuple of str): Rig resources the step occupies exclusively while it runs, or None for those of
+                              `default_resources`, resolved when the recipe runs.
+    estimate (float): Expected duration in seconds, or None to derive it from the operation.
+"""
+
+
+class Recipe:
+    """
+    Builder for a recipe: a directed acyclic graph of steps.
+
+        recipe = Recipe()
+        recipe.add('flush', 'runFlush', time=1)
+        recipe.add('dose', 'dispense_powder_seq', 0.5, after=['flush'])
+        recipe.add('soak', 'wait', 30, after=['dose'])
+        recipe.add('mix', 'runMixer', 5, after=['soak'])
+        recipe.add('drain', 'runDrain', 10, after=['mix'])
+    """
+    def __init__(self) -> None:
+        self.steps = {}  # Name -> Step, in the order they were added.
+
+    def add(self, name, operation, *args, rig=None, after=(), resources=None, estimate=None, **kwargs):
+        """
+        Adds a step.
+
+        Parameters:
+            name (str): Unique name of the step.
+            operation (str or callable): Controller method name, 'wait', or a function called with the controller.
+            *args: Positional arguments of the operation.
+            rig (optional): Key of the rig to run on; may be omitted when the scheduler has a single rig.
+            after (iterable of str): Names of earlier steps that must finish first.
+            resources (iterable of str, optional): Resources the step occupies (default: see default_resources).
+            estimate (float, optional): Expected duration in seconds, used to prioritise the steps.
+            **kwargs: Keyword arguments of the operation.
+
+        Returns:
+            str: The name of the step, for use in `after`.
+
+        Raises:
+            ValueError: If the name is already used or a dependency is unknown.
+        """
+        if name in self.steps:
+            raise ValueError(f"Duplicate recipe step '{name}'.")
+        after = tuple(after)
+        missing = [dep for dep in after if dep not in self.steps]
+        if missing:
+            raise ValueError(f"Step '{name}' depends on unknown steps: {', '.join(missing)}.")
+        resources = tuple(resources) if resources is not None else None
+        self.steps[name] = Step(name, operation, args, kwargs, rig, after, resources, estimate)
+        return name
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __iter__(self):
+        return iter(self.steps.values())
+
+    def critical_path(self, durations):
+        """
+        Returns the longest chain of dependent steps for given step durations. Since dependencies can only
+        refer to earlier steps, the steps are already in topological order.
+
+        Parameters:
+            durations (dict): Maps each step name to its (estimated) duration in seconds.
+
+        Returns:
+            tuple: (list of step names from first to last, total duration in seconds).
+        """
+        finish, previous = {}, {}
+        for step in self.steps.values():
+            start = max((finish[dep] for dep in step.after), default=0.0)
+            previous[step.name] = max(step.after, key=finish.get, default=None)
+            finish[step.name] = start + durations[step.name]
+        if not finish:
+            return [], 0.0
+        name = max(finish, key=finish.get)
+        length = finish[name]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        return path[::-1], length
+
+    def remaining_paths(self, durations):
+        """
+        Returns, for every step, the estimated time from its start to the end of the recipe along its longest
+        chain of dependents (the step's priority in the scheduler).
+        """
+        dependents = {name: [] for name in self.steps}
+        for step in self.steps.values():
+            for dep in step.after:
+                dependents[dep].append(step.name)
+        remaining = {}
+        for name in reversed(list(self.steps)):
+            remaining[name] = durations[name] + max((remaining[d] for d in dependents[name]), default=0.0)
+        return remaining
+
+
+StepRecord = namedtuple('StepRecord', ['name', 'rig', 'start', 'end', 'result', 'error'])
+StepRecord.__doc__ = """
+Timing and outcome of an executed step. `start` and `end` are seconds since the recipe started; `result` is the
+return value of the operation and `error` the exception it raised, or None.
+"""
+
+
+class ScheduleReport(namedtuple('ScheduleReport', ['makespan', 'records', 'critical_path', 'busy', 'skipped'])):
+    """
+    Outcome of a recipe run.
+
+    Attributes:
+        makespan (float): Wall-clock time from the start of the first step to the end of the last one, in seconds.
+        records (dict): Maps each executed step name to its StepRecord.
+        critical_path (list of str): The chain of steps that determined the makespan: each step in it was started
+                                     when the previous one finished, by dependency or by freeing a resource.
+        busy (dict): Maps each (rig, resource) to the time in seconds it was occupied.
+        skipped (list of str): Steps not run because a step they depend on, or an earlier step on their rig, failed.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """bool: True if every step ran and none raised."""
+        return not self.skipped and all(record.error is None for record in self.records.values())
+
+    @property
+    def idle(self):
+        """dict: Maps each (rig, resource) to the time in seconds it was not occupied during the makespan."""
+        return {key: self.makespan - busy for key, busy in self.busy.items()}
+
+    @property
+    def serial_time(self):
+        """float: Sum of the step durations, i.e. the makespan had the steps run one after the other."""
+        return sum(record.end - record.start for record in self.records.values())
+
+    def summary(self):
+        """
+        Returns a printable summary: makespan, critical path and idle time per resource.
+        """
+        lines = [f"makespan {self.makespan:.2f} s (steps one after the other: {self.serial_time:.2f} s)",
+                 f"critical path: {' -> '.join(self.critical_path)}"]
+        for (rig, resource), idle in sorted(self.idle.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+            share = idle / self.makespan if self.makespan else 0.0
+            lines.append(f"  {rig if rig is not None else '':<14} {resource:<12} idle {idle:>8.2f} s ({share:.0%})")
+        for name, record in self.records.items():
+            if record.error is not None:
+                lines.append(f"failed: {name}: {record.error!r}")
+        if self.skipped:
+            lines.append(f"skipped: {', '.join(self.skipped)}")
+        return '\n'.join(lines)
+
+
+class RecipeScheduler:
+    """
+    Executes recipes on one or several rigs, overlapping steps whose dependencies are met and whose resources
+    are free. Every step runs on a worker thread; steps that share a resource on the same rig never overlap.
+
+    When a step fails, the steps that depend on it and the steps not yet started on its rig are skipped, as the
+    state of that rig is unknown; steps on other rigs carry on.
+
+    Parameters:
+        rigs (PowderDispenseController, dict or DispenserFleet): A single controller, a mapping of rig keys
+                                                                   (e.g. ports) to controllers, or a fleet.
+        max_workers (int, optional): Maximum number of steps running at the same time (default: no limit
+                                     beyond the resources).
+    """
+    def __init__(self, rigs, max_workers=None) -> None:
+        if hasattr(rigs, 'rigs') and isinstance(rigs.rigs, dict):
+            rigs = rigs.rigs  # DispenserFleet.
+        self.rigs = dict(rigs) if isinstance(rigs, dict) else {None: rigs}
+        self.max_workers = max_workers
+
+    def _rig_key(self, step):
+        if step.rig in self.rigs:
+            return step.rig
+        if step.rig is None and len(self.rigs) == 1:
+            return next(iter(self.rigs))
+        raise ValueError(f"Step '{step.name}' runs on unknown rig {step.rig!r}.")
+
+    def resources(self, step):
+        """
+        Returns the resources a step occupies: its own, or the defaults for its operation on its rig's firmware.
+        """
+        if step.resources is not None:
+            return step.resources
+        controller = self.rigs[self._rig_key(step)]
+        background = getattr(controller, 'backgroundActuators', None) is not False  # Unknown: the controller's lock still serializes commands.
+        return default_resources(step.operation, step.args, step.kwargs, background)
+
+    def estimate(self, step):
+        """
+        Returns the expected duration of a step in seconds: its own estimate, the duration of a wait, mix, drain
+        or pump operation, or DEFAULT_ESTIMATE.
+        """
+        if step.estimate is not None:
+            return step.estimate
+        args, kwargs = step.args, step.kwargs
+        if step.operation == WAIT:
+            return float(args[0] if args else kwargs.get('seconds', 0.0))
+        controller = self.rigs[self._rig_key(step)]
+        if step.operation in ('runMixer', 'runDrain'):
+            duration = args[0] if args else kwargs.get('duration')
+            return duration or (controller.mixTime if step.operation == 'runMixer' else controller.drainTime)
+        if step.operation in ('runFlush', 'runPump'):
+            pump, args = ('Flush', args) if step.operation == 'runFlush' else (args[0] if args else kwargs.get('pump'), args[1:])
+            volume = args[0] if args else kwargs.get('volume')
+            duration = args[1] if len(args) > 1 else kwargs.get('time')
+            return controller._pump_time(pump, volume, duration)[1]
+        return DEFAULT_ESTIMATE
+
+    def plan(self, recipe):
+        """
+        Returns the critical path of a recipe from the duration estimates, before running it.
+
+        Returns:
+            tuple: (list of step names, estimated length in seconds), a lower bound of the makespan.
+        """
+        return recipe.critical_path({step.name: self.estimate(step) for step in recipe})
+
+    def _execute(self, step):
+        if step.operation == WAIT:
+            time.sleep(step.args[0] if step.args else step.kwargs.get('seconds', 0.0))
+            return None
+        controller = self.rigs[self._rig_key(step)]
+        if callable(step.operation):
+            return step.operation(controller, *step.args, **step.kwargs)
+        return getattr(controller, step.operation)(*step.args, **step.kwargs)
+
+    def run(self, recipe):
+        """
+        Runs a recipe and waits until every step has finished or been skipped.
+
+        Parameters:
+            recipe (Recipe): The steps to run.
+
+        Returns:
+            ScheduleReport: Timing of every step, the critical path and the busy time of every resource.
+
+        Raises:
+            ValueError: If a step runs on a rig the scheduler does not know.
+        """
+        steps = list(recipe)
+        rig_of = {step.name: self._rig_key(step) for step in steps}  # Raises before anything runs.
+        priority = recipe.remaining_paths({step.name: self.estimate(step) for step in steps})
+        pending = sorted(steps, key=lambda step: -priority[step.name])  # Highest priority first.
+        done, failed_rigs, skipped = set(), set(), []
+        holders = {}       # (rig, resource) -> name of the running step holding it.
+        records, trigger = {}, {}  # trigger: step -> the step whose completion let it start.
+        resources = {step.name: self.resources(step) for step in steps}
+        busy = {(rig_of[step.name], resource): 0.0 for step in steps for resource in resources[step.name]}
+        finished = queue.Queue()
+        running = 0
+        start_time = time.monotonic()
+
+        def work(step, started):
+            try:
+                result, error = self._execute(step), None
+            except Exception as e:
+                result, error = None, e
+            finished.put(StepRecord(step.name, rig_of[step.name], started - start_time, time.monotonic() - start_time, result, error))
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers or max(len(steps), 1), thread_name_prefix='RecipeScheduler')
+        try:
+            last = None  # Step whose completion started the current launch pass.
+            while pending or running:
+                for step in list(pending):
+                    rig = rig_of[step.name]
+                    if rig in failed_rigs or any(dep in skipped or (dep in records and records[dep].error) for dep in step.after):
+                        pending.remove(step)
+                        skipped.append(step.name)
+                        continue
+                    keys = [(rig, resource) for resource in resources[step.name]]
+                    if all(dep in done for dep in step.after) and not any(key in holders for key in keys):
+                        if self.max_workers and running >= self.max_workers:
+                            break
+                        pending.remove(step)
+                        for key in keys:
+                            holders[key] = step.name
+                        trigger[step.name] = last
+                        running += 1
+                        executor.submit(work, step, time.monotonic())
+                if not running:
+                    break  # Everything left was skipped.
+                record = finished.get()
+                running -= 1
+                records[record.name] = record
+                done.add(record.name)
+                last = record.name
+                rig = record.rig
+                for key in [key for key, holder in holders.items() if holder == record.name]:
+                    del holders[key]
+                    busy[key] += record.end - record.start
+                if record.error is not None:
+                    failed_rigs.add(rig)
+                    logger.warning("Recipe step %s failed on %s: %s", record.name, rig, record.error)
+        finally:
+            executor.shutdown()
+
+        makespan = max((record.end for record in records.values()), default=0.0)
+        return ScheduleReport(makespan, records, self._critical_path(records, trigger), busy, skipped)
+
+    @staticmethod
+    def _critical_path(records, trigger):
+        # Follows the chain of triggering steps back from the step that finished last.
+        if not records:
+            return []
+        name = max(records, key=lambda n: records[n].end)
+        path = []
+        while name is not None:
+            path.append(name)
+            name = trigger.get(name)
+        return path[::-1]
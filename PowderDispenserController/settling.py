@@ -0,0 +1,194 @@
+"""
+Scale settling detection for the powder dispensing system.
+
+Instead of sleeping a fixed time after switching the scale on, taring or dispensing, the SettlingDetector watches
+streamed weight samples and reports the scale as settled as soon as the readings over a sliding time window are
+both flat (small least-squares slope) and quiet (small standard deviation), with a maximum timeout as a fallback.
+On firmware without streaming mode, the same criteria are applied to readings polled one command at a time.
+
+Classes:
+    SettleResult - Outcome of waiting for the scale to settle.
+    SettlingDetector - Sliding-window stability detector for streamed weight samples.
+
+Functions:
+    weight_slope(samples) - Least-squares slope of a series of weight samples in grams per second.
+"""
+import time
+from collections import deque, namedtuple
+
+from .stream import WeightSample
+
+SettleResult = namedtuple('SettleResult', ['weight', 'settled', 'elapsed', 'slope', 'std'])
+SettleResult.__doc__ = """
+Outcome of waiting for the scale to settle.
+
+Attributes:
+    weight (float): Mean weight in grams over the final window, or None if no sample was received.
+    settled (bool): True if the stability criteria were met, False if the timeout expired first.
+    elapsed (float): Time in seconds spent waiting.
+    slope (float): Least-squares slope of the final window in grams per second.
+    std (float): Standard deviation of the final window in grams.
+"""
+
+
+def weight_slope(samples):
+    """
+    Returns the least-squares slope of a series of weight samples.
+
+    Parameters:
+        samples (sequence of WeightSample): Samples with `timestamp` (s) and `weight` (g) attributes.
+
+    Returns:
+        float: The slope in grams per second, or 0.0 if fewer than two samples span a non-zero time.
+    """
+    n = len(samples)
+    if n < 2:
+        return 0.0
+    t0 = samples[0].timestamp
+    mean_t = sum(s.timestamp - t0 for s in samples) / n
+    mean_w = sum(s.weight for s in samples) / n
+    var_t = sum((s.timestamp - t0 - mean_t) ** 2 for s in samples)
+    if var_t == 0:
+        return 0.0
+    cov = sum((s.timestamp - t0 - mean_t) * (s.weight - mean_w) for s in samples)
+    return cov / var_t
+
+
+class SettlingDetector:
+    """
+    Decides when the scale has settled from a stream of weight samples.
+
+    The scale counts as settled once the samples of the last `window` seconds (at least `min_samples` of them)
+    have an absolute slope below `max_slope` and a standard deviation below `max_std`.
+
+    Parameters:
+        window (float): Length of the sliding window in seconds (default: 0.5).
+        max_slope (float): Maximum absolute slope in grams per second (default: 0.005).
+        max_std (float): Maximum standard deviation in grams (default: 0.002).
+        timeout (float): Maximum time in seconds to wait before giving up (default: 5).
+        min_samples (int): Minimum number of samples in the window (default: 5).
+    """
+    def __init__(self, window=0.5, max_slope=0.005, max_std=0.002, timeout=5, min_samples=5) -> None:
+        self.window = window
+        self.max_slope = max_slope
+        self.max_std = max_std
+        self.timeout = timeout
+        self.min_samples = min_samples
+        self.samples = deque()
+
+    def reset(self):
+        """
+        Forgets all samples.
+        """
+        self.samples.clear()
+
+    def _stats(self):
+        n = len(self.samples)
+        mean = sum(s.weight for s in self.samples) / n
+        std = (sum((s.weight - mean) ** 2 for s in self.samples) / n) ** 0.5
+        return mean, weight_slope(self.samples), std
+
+    def update(self, sample):
+        """
+        Adds a sample and returns whether the scale is now settled.
+
+        Parameters:
+            sample (WeightSample): The newest sample.
+
+        Returns:
+            bool: True if the window meets the stability criteria.
+        """
+        samples = self.samples
+        samples.append(sample)
+        while sample.timestamp - samples[0].timestamp > self.window:
+            samples.popleft()
+        if len(samples) < self.min_samples or sample.timestamp - samples[0].timestamp < self.window * 0.8:
+            return False
+        _, slope, std = self._stats()
+        return abs(slope) < self.max_slope and std < self.max_std
+
+    def _result(self, settled, start):
+        if not self.samples:
+            return SettleResult(None, settled, time.monotonic() - start, 0.0, 0.0)
+        mean, slope, std = self._stats()
+        return SettleResult(mean, settled, time.monotonic() - start, slope, std)
+
+    def wait(self, stream, on_sample=None):
+        """
+        Consumes samples from a WeightStream until the scale has settled or the timeout expires.
+
+        Parameters:
+            stream (WeightStream): The active weight stream.
+            on_sample (callable, optional): Called with every sample consumed, e.g. to record the trajectory.
+
+        Returns:
+            SettleResult: The settled weight and how long it took.
+        """
+        self.reset()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return self._result(False, start)
+            try:
+                sample = stream.get(timeout=remaining)
+            except TimeoutError:
+                return self._result(False, start)
+            if on_sample is not None:
+                on_sample(sample)
+            if self.update(sample):
+                return self._result(True, start)
+
+    def poll(self, read_weight, interval=0.05):
+        """
+        Reads the weight every `interval` seconds until the scale has settled or the timeout expires, for
+        firmware that cannot stream readings.
+
+        Parameters:
+            read_weight (callable): Returns one weight reading in grams, e.g. a 'Meas' round trip.
+            interval (float): Time in seconds between the starts of two readings (default: 0.05, as a 20 Hz stream).
+
+        Returns:
+            SettleResult: The settled weight and how long it took.
+        """
+        self.reset()
+        start = time.monotonic()
+        while time.monotonic() - start < self.timeout:
+            due = time.monotonic() + interval
+            if self.update(WeightSample(time.monotonic(), read_weight(), None)):
+                return self._result(True, start)
+            time.sleep(max(due - time.monotonic(), 0.0))
+        return self._result(False, start)
+
+    async def poll_async(self, read_weight, interval=0.05):
+        """
+        Async version of `poll()`; `read_weight` is a coroutine function.
+        """
+        import asyncio
+        self.reset()
+        start = time.monotonic()
+        while time.monotonic() - start < self.timeout:
+            due = time.monotonic() + interval
+            if self.update(WeightSample(time.monotonic(), await read_weight(), None)):
+                return self._result(True, start)
+            await asyncio.sleep(max(due - time.monotonic(), 0.0))
+        return self._result(False, start)
+
+    async def wait_async(self, stream):
+        """
+        Async version of `wait()`; waits without blocking the event loop.
+        """
+        self.reset()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return self._result(False, start)
+            try:
+                sample = await stream.aget(timeout=remaining)
+            except TimeoutError:
+                return self._result(False, start)
+            if self.update(sample):
+                return self._result(True, start)
@@ -0,0 +1,702 @@
+"""
+Software stand-in for the powder dispenser Arduino ("virtual rig").
+
+The VirtualRig opens a pseudo-terminal (pty) pair and answers on it exactly like the firmware in
+`PowderDispenserCPP` does, so `PowderDispenseController(rig.port)` connects to it unchanged. Like the Arduino,
+it resets when the port is opened, prints the readiness banner after its boot time, and processes one command
+at a time in a single loop: blocking commands (Mix, Drain, Pump, Dispense, Meas, ...) hold up everything else,
+including the weight stream, for as long as they take on the real hardware.
+
+Physical model:
+    - Every auger step delivers `grams_per_step` of powder on average, with a burst-to-burst spread of `flow_cv`
+      (coefficient of variation of a 1000-step burst). Powder leaves the auger while the motor turns and lands
+      `fall_time` seconds later.
+    - The load cell follows the landed mass with a first-order response (`settle_tau`) and adds Gaussian noise
+      (`noise_std` grams per conversion). After ScaleOn it drifts from a `power_on_offset` back to zero with
+      time constant `power_on_tau`.
+    - Readings are converted at `sample_rate` Hz and pass through the firmware's EWMA, SMA and LPF filters, so the
+      filter lag of a Meas with N samples is reproduced as well as its duration.
+
+All durations are divided by `speed`, so e.g. `speed=10` runs a 10 s mix in 1 s while the physics and the
+reported `millis()` advance ten times faster than the wall clock. `latency` delays everything the rig sends by
+a fixed wall-clock time, standing in for the USB-serial bridge of the RedBoard, whose latency timer holds back
+small packets for up to 16 ms; a pty on its own answers within microseconds.
+
+A pty has no DTR line, so the reset on opening is modelled on the terminal's HUPCL flag, which decides whether
+the operating system drops DTR when a serial port is closed: the rig resets when it is opened after being
+closed with HUPCL set (the default), and keeps running, with its scale and dispenser state, when the previous
+client cleared HUPCL, as `PowderDispenseController(..., fast_attach=True)` does.
+
+After '<Binary,1>' the rig sends Weight, ADC and Stream readings as binary frames (see `binary`), like the
+firmware; with `binary_frames=False` it behaves like firmware without them and ignores the command.
+
+'<Mix,duration,1>', '<Drain,duration,1>' and '<Pump,pin,duration,1>' run the actuator in the background: the
+rig answers '<Started:...>' and the acknowledgement at once and sends '<Done:...>' when the time is up, while it
+keeps processing commands; '<Stop>' ends the runs early. With `background_actuators=False` it runs them blocking
+like firmware that times the relays with delay().
+
+'<DispenseUntil,target,stopAt,stepsPerGram,maxChunk,minChunk,settleMs,dir>' doses by weight on the rig, with
+'<Progress:...>' frames after every weight check and a final '<Dosed:...>'; with `dose_by_weight=False` the rig
+ignores the command like firmware without it.
+
+'<Feed,stepsPerSecond,dir,maxSteps>' turns the auger continuously between other work until '<FeedStop>', a rate
+of 0 or the step limit, and reports the feed as '<Fed:...>'; with `continuous_feed=False` the rig ignores
+Feed and FeedStop.
+
+With `weight_stream=False` the rig acknowledges '<Stream,...>' and '<StreamStop>' but never streams, like
+firmware whose loop acknowledges commands it does not know.
+
+Classes:
+    VirtualRig - Simulated RedBoard, scale, auger and relays behind a pty.
+
+Usage:
+    python -m PowderDispenserController.simulator [--speed X] [--latency S]
+"""
+import argparse
+import math
+import os
+import random
+import select
+import struct
+import termios
+import threading
+import time
+from collections import deque
+
+from .binary import encode_frame
+from .dispense import DOSE_SAMPLES, dose_chunk
+
+READY_BANNER = b"<Ready to push powder, baby!>\r\n"
+MANUAL_SLOPE = 3.06828559218341e-05     # ScaleControls::MANUAL_SLOPE, grams per ADC count.
+MANUAL_INTERCEPT = -12.9400964147       # ScaleControls::MANUAL_INTERCEPT, grams.
+BUFF_SIZE = 128                         # Comms::buffSize.
+DECIMAL = 4                             # Utils::DECIMAL.
+EWMA_ALPHA = 0.05                       # ScaleControls::ewmaFilter.
+SMA_READINGS = 10                       # ScaleControls::numReadings.
+LPF_ALPHA = 0.5                         # ScaleControls::lpfAlpha.
+FEED_MAX_BURST = 32                     # DispenserControls::FEED_MAX_BURST.
+FEED_PERIOD = 0.005                     # Simulated time in seconds between the steps of a continuous feed.
+IN_OPEN = 0x20                          # inotify event mask for a file being opened.
+INOTIFY_EVENT = struct.Struct('iIII')   # struct inotify_event without the name.
+
+
+def _atoi(text):
+    # C atoi(): leading integer of the string, 0 if there is none (or if strtok returned NULL).
+    digits = ''
+    for ch in (text or '').strip():
+        if ch.isdigit() or (not digits and ch in '+-'):
+            digits += ch
+        else:
+            break
+    try:
+        return int(digits)
+    except ValueError:
+        return 0
+
+
+def _atof(text):
+    # C atof(): leading floating-point number of the string, 0.0 if there is none.
+    text = (text or '').strip()
+    for end in range(len(text), 0, -1):
+        try:
+            return float(text[:end])
+        except ValueError:
+            continue
+    return 0.0
+
+
+class VirtualRig:
+    """
+    Simulated powder dispenser speaking the firmware's serial protocol over a pty.
+
+    Parameters:
+        grams_per_step (float): Mean powder mass per auger step in grams (default: the '8mm_base'/'dishwasher_salt'
+                                calibration factor).
+        flow_cv (float): Coefficient of variation of the mass of a 1000-step burst (default: 0.05).
+        step_rate (float): Auger speed in steps per second (default: 2000).
+        fall_time (float): Time in seconds between powder leaving the auger and landing on the scale (default: 0.15).
+        settle_tau (float): Time constant in seconds of the load cell response (default: 0.2).
+        noise_std (float): Standard deviation of a single conversion in grams (default: 0.001).
+        power_on_offset (float): Reading offset in grams right after ScaleOn (default: 0.02).
+        power_on_tau (float): Time constant in seconds of the power-on drift (default: 0.5).
+        sample_rate (float): Scale conversions per second (default: 320).
+        boot_time (float): Time in seconds from opening the port to the readiness banner (default: 1.6).
+        latency (float): Wall-clock delay in seconds of everything the rig sends, not divided by `speed` (default: 0).
+        binary_frames (bool): Whether the simulated firmware supports binary frames for readings (default: True).
+        background_actuators (bool): Whether the simulated firmware can run Mix, Drain and Pump in the background
+                                     (default: True).
+        dose_by_weight (bool): Whether the simulated firmware supports DispenseUntil (default: True).
+        continuous_feed (bool): Whether the simulated firmware supports Feed and FeedStop (default: True).
+        weight_stream (bool): Whether the simulated firmware streams readings after '<Stream,...>' (default: True).
+        speed (float): Simulation speed-up; all durations are divided by it (default: 1.0).
+        seed (int, optional): Seed of the random number generator for reproducible runs.
+    """
+    def __init__(self, grams_per_step=2.1130909090909088e-05, flow_cv=0.05, step_rate=2000, fall_time=0.15,
+                 settle_tau=0.2, noise_std=0.001, power_on_offset=0.02, power_on_tau=0.5, sample_rate=320,
+                 boot_time=1.6, latency=0.0, binary_frames=True, background_actuators=True, dose_by_weight=True, continuous_feed=True, weight_stream=True, speed=1.0, seed=None) -> None:
+        self.grams_per_step = grams_per_step
+        self.flow_cv = flow_cv
+        self.step_rate = step_rate
+        self.fall_time = fall_time
+        self.settle_tau = settle_tau
+        self.noise_std = noise_std
+        self.power_on_offset = power_on_offset
+        self.power_on_tau = power_on_tau
+        self.sample_rate = sample_rate
+        self.boot_time = boot_time
+        self.latency = latency
+        self.binary_frames = binary_frames
+        self.background_actuators = background_actuators
+        self.dose_by_weight = dose_by_weight
+        self.continuous_feed = continuous_feed
+        self.weight_stream = weight_stream
+        self.speed = speed
+        self.rng = random.Random(seed)
+
+        self.commands = []          # Every command received, in order, as sent between the markers.
+        self.boots = 0              # Number of resets (port openings after DTR was dropped).
+        self.dispensed = 0.0        # Total powder delivered by the auger in grams.
+        self._base_mass = 0.0       # Mass that has fully settled on the scale.
+        self._landing = []          # (landing time, grams) of powder still falling or settling.
+        self._epoch = time.monotonic()
+        self._master = None
+        self._thread = None
+        self._delivery = None
+        self._stop = threading.Event()
+        self._outbox = deque()      # (delivery time, bytes) held back by the simulated latency.
+        self._outbox_ready = threading.Condition()
+        self._power_on()
+
+    ## Simulated time
+    def now(self):
+        """
+        Returns the simulated time in seconds since the rig was created.
+        """
+        return (time.monotonic() - self._epoch) * self.speed
+
+    def _delay(self, seconds):
+        # Blocks like the Arduino's delay(); the loop does nothing else meanwhile.
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def _millis(self):
+        return int((self.now() - self._boot_at) * 1000)
+
+    ## Physical model
+    @property
+    def mass(self):
+        """float: The mass of powder that has landed on the scale, in grams."""
+        now = self.now()
+        return self._base_mass + sum(grams for t, grams in list(self._landing) if t <= now)
+
+    def _load(self, t):
+        # Load cell signal in grams at simulated time t, before noise.
+        settled = []
+        load = self._base_mass
+        for landed, grams in self._landing:
+            age = t - landed
+            if age > 10 * self.settle_tau:
+                self._base_mass += grams
+                load += grams
+                settled.append((landed, grams))
+            elif age > 0:
+                load += grams * (1 - math.exp(-age / self.settle_tau))
+        for item in settled:
+            self._landing.remove(item)
+        if self.scale_on:
+            load += self.power_on_offset * math.exp(-(t - self._scale_on_at) / self.power_on_tau)
+        return load
+
+    def _conversion(self, t):
+        # One ADC conversion in counts, as returned by Scale.getReading().
+        if self.scale_on:
+            grams = self._load(t) + self.rng.gauss(0, self.noise_std)
+            self._last_raw = (grams - MANUAL_INTERCEPT) / MANUAL_SLOPE
+        return self._last_raw  # A powered-down scale keeps returning its last conversion.
+
+    def _filter(self, reading, filterType):
+        # ScaleControls::applyFilter.
+        if filterType == 'EWMA':
+            self._ewma = reading if self._ewma is None else EWMA_ALPHA * reading + (1 - EWMA_ALPHA) * self._ewma
+            return self._ewma
+        if filterType == 'SMA':
+            self._sma_sum -= self._sma_values[self._sma_index]
+            self._sma_values[self._sma_index] = reading
+            self._sma_sum += reading
+            self._sma_index = (self._sma_index + 1) % SMA_READINGS
+            self._sma_count = min(self._sma_count + 1, SMA_READINGS)
+            return self._sma_sum / self._sma_count
+        if filterType == 'LPF':
+            self._lpf = LPF_ALPHA * reading + (1 - LPF_ALPHA) * self._lpf
+            return self._lpf
+        return reading
+
+    def _get_reading(self, samples, filterType, timeout_ms=1000):
+        # ScaleControls::getReading: averages `samples` filtered conversions, one per conversion period.
+        start = self.now()
+        total = 0.0
+        for i in range(samples):
+            if i * 1000.0 / self.sample_rate > timeout_ms:
+                self._write(b"Timeout while averaging scale readings.\r\n")
+                break
+            total += self._filter(self._conversion(start + i / self.sample_rate), filterType)
+        self._delay(samples / self.sample_rate)
+        return total / samples if samples else float('nan')
+
+    def _to_weight(self, raw):
+        return raw * MANUAL_SLOPE + MANUAL_INTERCEPT - self._tare
+
+    def _dispense(self, steps, direction):
+        # The auger only moves with the driver enabled and only delivers powder when turning forward.
+        duration = abs(steps) / self.step_rate
+        start = self.now()
+        if self.dispenser_enabled and direction == 1 and steps > 0:
+            mean = steps * self.grams_per_step
+            std = self.grams_per_step * self.flow_cv * math.sqrt(1000 * steps)
+            grams = max(self.rng.gauss(mean, std), 0.0)
+            self.dispensed += grams
+            chunks = max(1, min(20, steps // 50))
+            for i in range(chunks):
+                self._landing.append((start + duration * (i + 1) / chunks + self.fall_time, grams / chunks))
+        self._delay(duration)
+
+    def _input_pending(self):
+        # Serial.available() > 0: the PC has sent more bytes.
+        try:
+            return bool(select.select([self._master], [], [], 0)[0])
+        except (OSError, ValueError):
+            return False
+
+    def _dispense_until(self, target, stop_at, steps_per_gram, max_chunk, min_chunk, settle_ms, direction):
+        # DispenserControls::dispenseUntil.
+        limit = int(2 * target * steps_per_gram) + max_chunk
+        steps = 0
+        weight = self._to_weight(self._get_reading(DOSE_SAMPLES, 'NONE'))
+        while True:
+            self._write(f"<Progress:{weight:.{DECIMAL}f},{steps},{self._millis()}>\r\n".encode())
+            if weight >= stop_at:
+                reason = 0
+                break
+            if steps >= limit:
+                reason = 1
+                break
+            if self._input_pending():
+                reason = 2
+                break
+            chunk = dose_chunk(target, weight, steps_per_gram, min_chunk, max_chunk)
+            self._dispense(chunk, direction)
+            steps += chunk
+            self._delay(settle_ms / 1000.0)
+            weight = self._to_weight(self._get_reading(DOSE_SAMPLES, 'NONE'))
+        self._write(f"<Dosed:{weight:.{DECIMAL}f},{steps},{reason}>\r\n".encode())
+
+    def _set_feed_rate(self, rate, direction, max_steps):
+        # DispenserControls::setFeedRate.
+        if rate <= 0:
+            if self._feed_rate > 0:
+                self._stop_feed(False)
+            return
+        if self._feed_rate <= 0:
+            self._feed_steps = 0
+            self._feed_last = self.now()
+        self._feed_rate, self._feed_dir, self._feed_limit = rate, direction, max_steps
+
+    def _stop_feed(self, completed):
+        # DispenserControls::stopFeed.
+        self._feed_rate = 0.0
+        self._write(f"<Fed:{self._feed_steps},{int(completed)},{self._millis()}>\r\n".encode())
+
+    def _update_feed(self):
+        # DispenserControls::updateFeed; returns the wall-clock time until the next steps are due. The rig steps
+        # every FEED_PERIOD at least, instead of every loop() pass like the firmware.
+        if self._feed_rate <= 0:
+            return 0.1
+        step_time = 1.0 / self._feed_rate
+        now = self.now()
+        due = int((now - self._feed_last) / step_time)
+        batch = max(1, min(FEED_MAX_BURST, int(FEED_PERIOD / step_time)))
+        if due < batch:
+            return (self._feed_last + batch * step_time - now) / self.speed
+        if due > FEED_MAX_BURST:
+            due = FEED_MAX_BURST
+            self._feed_last = now  # The loop was held up; the missed steps are dropped.
+        else:
+            self._feed_last += due * step_time
+        if self._feed_limit > 0:
+            due = min(due, self._feed_limit - self._feed_steps)
+        self._dispense(due, self._feed_dir)
+        self._feed_steps += due
+        if 0 < self._feed_limit <= self._feed_steps:
+            self._stop_feed(True)
+        return 0.0
+
+    def _power_on(self):
+        # State after setup(): scale powered down (setupScale ends with powerDown), dispenser disabled, filters reset.
+        self.scale_on = False
+        self.dispenser_enabled = False
+        self._scale_on_at = self.now()
+        self._boot_at = self.now()
+        self._last_raw = -MANUAL_INTERCEPT / MANUAL_SLOPE
+        self._ewma = None
+        self._sma_values = [0.0] * SMA_READINGS
+        self._sma_sum, self._sma_index, self._sma_count = 0.0, 0, 0
+        self._lpf = 0.5
+        self._tare = 0.0
+        self._streaming = False
+        self._binary = False
+        self.actuators = {}         # Actuator running in the background ('Mix', 'Drain', 'Pump') -> simulated end time.
+        self._feed_rate, self._feed_dir, self._feed_limit, self._feed_steps, self._feed_last = 0.0, 1, 0, 0, 0.0
+        self._inbuf, self._in_progress = b'', False
+
+    ## Serial protocol
+    def _write(self, data):
+        if self.latency > 0:
+            with self._outbox_ready:
+                self._outbox.append((time.monotonic() + self.latency, data))
+                self._outbox_ready.notify()
+            return
+        try:
+            os.write(self._master, data)
+        except OSError:
+            pass  # Nobody has the port open.
+
+    def _deliver(self):
+        # Writes the held-back output once its latency has passed, in order.
+        while not self._stop.is_set():
+            with self._outbox_ready:
+                while not self._outbox and not self._stop.is_set():
+                    self._outbox_ready.wait(0.1)
+                if not self._outbox:
+                    continue
+                due, data = self._outbox[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._outbox_ready.wait(wait)
+                    continue
+                self._outbox.popleft()
+            try:
+                os.write(self._master, data)
+            except OSError:
+                pass
+
+    def _send_reading(self, kind, value, text):
+        # Sends a reading as a binary frame or, in ASCII mode, as '<text>'.
+        if self._binary:
+            self._write(encode_frame(kind, value, self._millis()))
+        else:
+            self._write(f"<{text}>\r\n".encode())
+
+    def _start_actuator(self, name, duration):
+        # MixerControls::start: a new run of an actuator ends its current one as stopped.
+        if name in self.actuators:
+            self._finish_actuator(name, False)
+        self.actuators[name] = self.now() + duration
+        self._write(f"<Started:{name},{int(duration * 1000)}>\r\n".encode())
+
+    def _finish_actuator(self, name, completed):
+        # MixerControls::finish.
+        del self.actuators[name]
+        self._write(f"<Done:{name},{int(completed)},{self._millis()}>\r\n".encode())
+
+    def _update_actuators(self):
+        # MixerControls::update; returns the wall-clock time until the next actuator is due to stop.
+        now = self.now()
+        wait = 0.1
+        for name, end in list(self.actuators.items()):
+            if now >= end:
+                self._finish_actuator(name, True)
+            else:
+                wait = min(wait, (end - now) / self.speed)
+        return wait
+
+    def _runs_in_background(self, message, fields):
+        # runsInBackground() in Comms.cpp: the background form has `fields` fields and ends with a non-zero flag.
+        tokens = message.split(',')
+        return self.background_actuators and len(tokens) == fields and _atoi(tokens[-1]) != 0
+
+    def _reply(self, message):
+        # Comms::replyToPC.
+        self._write(f"<Msg {message} Time {self._millis() >> 9}>\r\n".encode())
+
+    def _handle(self, message):
+        # Comms::parseData.
+        self.commands.append(message)
+        tokens = message.split(',')
+        command, args = tokens[0], tokens[1:] + [None] * 3
+
+        if command == 'Ping':
+            flags = [self.scale_on, self.dispenser_enabled, self._streaming] + ([self._binary] if self.binary_frames else [])
+            self._write(f"<Status:{','.join(str(int(flag)) for flag in flags)}>\r\n".encode())
+            self._reply(message)
+        elif command == 'Binary' and self.binary_frames:
+            self._binary = _atoi(args[0]) != 0
+            self._reply(message)
+        elif command == 'Stream':
+            rate, samples, filterType = _atof(args[0]), _atoi(args[1]) % 256, args[2]
+            self._reply(message)
+            if rate <= 0 or not self.weight_stream:
+                self._streaming = False
+            else:
+                self._stream_interval = int(1000.0 / rate)
+                self._stream_samples = samples or 1
+                self._stream_filter = filterType
+                self._last_stream = self._millis() - self._stream_interval
+                self._streaming = True
+        elif command == 'StreamStop':
+            self._streaming = False
+            self._reply(message)
+        elif command in ('Mix', 'Drain', 'Pump') and self._runs_in_background(message, 4 if command == 'Pump' else 3):
+            self._start_actuator(command, _atof(args[1] if command == 'Pump' else args[0]))
+            self._reply(message)
+        elif command == 'Stop' and self.background_actuators:
+            for name in list(self.actuators):
+                if args[0] in (None, name):
+                    self._finish_actuator(name, False)
+            self._reply(message)
+        elif command in ('Mix', 'Drain'):
+            self._delay(_atof(args[0]))
+            self._reply(message)
+        elif command == 'Pump':
+            self._delay(_atof(args[1]))
+            self._reply(message)
+        elif command == 'DispenseUntil' and self.dose_by_weight:
+            self._dispense_until(_atof(args[0]), _atof(args[1]), _atof(args[2]), _atoi(args[3]), _atoi(args[4]),
+                                 _atoi(args[5]), _atoi(args[6]))
+            self._reply(message)
+        elif command == 'Feed' and self.continuous_feed:
+            self._set_feed_rate(_atof(args[0]), _atoi(args[1]), _atoi(args[2]))
+            self._reply(message)
+        elif command == 'FeedStop' and self.continuous_feed:
+            if self._feed_rate > 0:
+                self._stop_feed(False)
+            self._reply(message)
+        elif command == 'Dispense':
+            self._dispense(_atoi(args[0]), _atoi(args[1]))
+            self._reply(message)
+        elif command == 'DispenserOn':
+            self.dispenser_enabled = True
+            self._reply(message)
+        elif command == 'DispenserOff':
+            if self._feed_rate > 0:
+                self._stop_feed(False)
+            self.dispenser_enabled = False
+            self._reply(message)
+        elif command == 'ScaleOn':
+            if not self.scale_on:
+                self.scale_on = True
+                self._scale_on_at = self.now()
+            self._reply(message)
+        elif command == 'ScaleOff':
+            self.scale_on = False
+            self._reply(message)
+        elif command == 'Tare':
+            self._tare = 0.0
+            self._tare = self._to_weight(self._get_reading(100, 'NONE'))
+            self._reply(message)
+        elif command == 'Meas':
+            raw = self._get_reading(_atoi(args[0]) % 256, args[1])
+            weight = self._to_weight(raw)
+            self._send_reading('Weight', weight, f"Weight:{weight:.{DECIMAL}f}")
+            self._reply(message)
+        elif command == 'ADC':
+            raw = self._get_reading(_atoi(args[0]) % 256, args[1])
+            self._send_reading('ADC', raw, f"ADC:{raw:.2f}")
+            self._reply(message)
+        # Unknown commands are ignored without a reply, as in the firmware.
+
+    def _receive(self, data):
+        # Comms::getDataFromPC, one character at a time.
+        for x in data:
+            x = bytes((x,))
+            if len(self._inbuf) < BUFF_SIZE - 1:
+                if x == b'>' and self._in_progress:
+                    self._in_progress = False
+                    self._handle(self._inbuf.decode('utf-8', 'replace'))
+                    self._inbuf = b''
+                elif self._in_progress:
+                    self._inbuf += x
+                elif x == b'<':
+                    self._inbuf, self._in_progress = b'', True
+            elif x == b'>':
+                # The firmware stops parsing after an overflow; the simulator truncates the command instead.
+                self._in_progress = False
+                self._handle(self._inbuf.decode('utf-8', 'replace'))
+                self._inbuf = b''
+
+    def _update_stream(self):
+        # ScaleControls::updateStream; returns the wall-clock time until the next sample is due.
+        if not self._streaming:
+            return 0.1
+        now_ms = self._millis()
+        wait_ms = self._last_stream + self._stream_interval - now_ms
+        if wait_ms > 0:
+            return wait_ms / 1000.0 / self.speed
+        self._last_stream = now_ms
+        weight = self._to_weight(self._get_reading(self._stream_samples, self._stream_filter, self._stream_interval))
+        if self._binary:
+            self._write(encode_frame('Stream', weight, now_ms))
+        else:
+            self._write(f"<Stream:{weight:.{DECIMAL}f},{now_ms}>\r\n".encode())
+        return 0.0
+
+    def _watch_opens(self):
+        # Watches the slave device for openings with inotify (Linux), since a port that is closed and reopened
+        # right away does not necessarily show up as a hang-up on the master side. Returns None if unavailable.
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK)
+            if fd < 0:
+                return None
+            if libc.inotify_add_watch(fd, self.port.encode(), IN_OPEN) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _port_opened(self, watch):
+        # Consumes pending inotify events; returns True if the port has been opened since the last call.
+        opened = False
+        try:
+            while True:
+                data = os.read(watch, 4096)
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+                    opened = opened or bool(mask & IN_OPEN)
+                    offset += INOTIFY_EVENT.size + name_len
+        except BlockingIOError:
+            pass
+        return opened
+
+    def _hangs_up(self):
+        # Whether closing the port drops DTR (HUPCL), i.e. whether the next opening resets the rig.
+        try:
+            return bool(termios.tcgetattr(self._master)[2] & termios.HUPCL)
+        except termios.error:
+            return True
+
+    def _boot(self, poller, watch):
+        # Opening the port resets the Arduino: input sent during the boot time is lost.
+        self.boots += 1
+        self._power_on()
+        deadline = time.monotonic() + self.boot_time / self.speed
+        while time.monotonic() < deadline and not self._stop.is_set():
+            for fd, event in poller.poll(max(deadline - time.monotonic(), 0) * 1000):
+                if fd == watch:
+                    if self._port_opened(watch):
+                        deadline = time.monotonic() + self.boot_time / self.speed  # Reset again.
+                elif event & select.POLLHUP:
+                    return False
+                else:
+                    try:
+                        os.read(self._master, 4096)
+                    except OSError:
+                        return False
+        self._boot_at = self.now()
+        self._write(READY_BANNER)
+        return True
+
+    def _run(self, watch):
+        poller = select.poll()
+        poller.register(self._master, select.POLLIN | select.POLLHUP)
+        if watch is not None:
+            poller.register(watch, select.POLLIN)
+        connected = False
+        hangs_up = True  # HUPCL as last seen before the current poll, i.e. as left by the previous client.
+        try:
+            while not self._stop.is_set():
+                timeout = min(self._update_stream(), self._update_actuators(), self._update_feed()) * 1000 if connected else 20
+                events = dict(poller.poll(timeout))
+                if watch is not None and watch in events and self._port_opened(watch):
+                    if hangs_up or self.boots == 0:
+                        connected = self._boot(poller, watch)
+                    else:
+                        connected = True  # DTR stayed asserted: no reset, the firmware keeps its state.
+                    hangs_up = self._hangs_up()
+                    continue
+                hangs_up = self._hangs_up()
+                master_events = events.get(self._master, 0)
+                if master_events & select.POLLHUP:
+                    connected = False  # The port was closed; the next opening resets the rig if DTR was dropped.
+                    time.sleep(0.02)
+                elif not connected:
+                    if watch is None:  # Without inotify, the end of the hang-up marks an opening.
+                        connected = self._boot(poller, watch) if hangs_up or self.boots == 0 else True
+                elif master_events:
+                    try:
+                        self._receive(os.read(self._master, 4096))
+                    except OSError:
+                        connected = False
+        finally:
+            if watch is not None:
+                os.close(watch)
+
+    ## Lifecycle
+    def start(self):
+        """
+        Creates the pty and starts the simulated firmware. Connect to `port` afterwards.
+
+        Returns:
+            str: The serial port to pass to PowderDispenseController.
+        """
+        import tty
+        self._master, slave = os.openpty()
+        tty.setraw(slave)
+        attrs = termios.tcgetattr(slave)
+        attrs[2] |= termios.HUPCL  # Closing drops DTR, as on a real serial port.
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        self.port = os.ttyname(slave)
+        os.close(slave)  # Only the client holds the slave side, so closing the port is noticed.
+        self._stop.clear()
+        watch = self._watch_opens()  # Set up before returning the port, so no opening is missed.
+        self._thread = threading.Thread(target=self._run, args=(watch,), name='VirtualRig', daemon=True)
+        self._thread.start()
+        if self.latency > 0:
+            self._delivery = threading.Thread(target=self._deliver, name='VirtualRigOutput', daemon=True)
+            self._delivery.start()
+        return self.port
+
+    def stop(self):
+        """
+        Stops the simulated firmware and closes the pty.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._delivery is not None:
+            self._delivery.join()
+            self._delivery = None
+        if self._master is not None:
+            os.close(self._master)
+            self._master = None
+
+    def __enter__(self):
+        if self._thread is None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a virtual powder dispenser on a pseudo-terminal.")
+    parser.add_argument('--speed', type=float, default=1.0, help="Simulation speed-up factor.")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible runs.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Delay in seconds of everything the rig sends.")
+    args = parser.parse_args()
+
+    with VirtualRig(speed=args.speed, seed=args.seed, latency=args.latency) as rig:
+        print(f"Virtual rig listening on {rig.port} (Ctrl-C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Continuous scale telemetry for the powder dispensing system.
+
+In streaming mode the firmware pushes `<Stream:weight,millis>` frames at a fixed rate instead of answering one
+`<Meas,...>` command per reading. The frames are collected into a bounded ring buffer that can be consumed as a
+plain iterator or as an async iterator; when the consumer falls behind, the oldest samples are dropped so memory
+use stays constant.
+
+Classes:
+    WeightSample - A single streamed weight reading.
+    WeightStream - Bounded ring buffer of streamed weight readings with blocking and async iteration.
+
+Functions:
+    parse_stream_sample(msg) - Converts a received 'Stream' message into a WeightSample.
+    sample_time(sample) - Returns the time of a streamed sample in seconds, on the Arduino's clock if reported.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+WeightSample = namedtuple('WeightSample', ['timestamp', 'weight', 'device_ms'])
+WeightSample.__doc__ = """
+A streamed weight reading.
+
+Attributes:
+    timestamp (float): Host `time.monotonic()` at which the frame was received.
+    weight (float): The weight in grams.
+    device_ms (int): The Arduino's `millis()` when the reading was taken, or None if not reported.
+"""
+
+
+def parse_stream_sample(msg):
+    """
+    Converts a received 'Stream' message into a WeightSample.
+
+    Parameters:
+        msg (Message or BinaryMessage): A message whose text has the form 'Stream:<weight>,<millis>', or a
+                                        decoded binary Stream frame.
+
+    Returns:
+        WeightSample: The parsed sample, or None if the message is malformed.
+    """
+    device_ms = getattr(msg, 'device_ms', None)
+    if device_ms is not None:  # Binary frame: already decoded.
+        return WeightSample(msg.timestamp, msg.value, device_ms)
+    try:
+        fields = msg.text.split(':', 1)[1].split(',')
+        device_ms = int(fields[1]) if len(fields) > 1 else None
+        return WeightSample(msg.timestamp, float(fields[0]), device_ms)
+    except (IndexError, ValueError):
+        return None
+
+
+def sample_time(sample):
+    """
+    Returns the time of a streamed sample in seconds: the Arduino's `millis()` if the sample carries it, which
+    keeps durations in the time of the rig (the virtual rig's clock runs `speed` times faster), else the host's
+    `time.monotonic()`.
+
+    Parameters:
+        sample (WeightSample): A streamed sample.
+
+    Returns:
+        float: The time in seconds.
+    """
+    return sample.device_ms / 1000.0 if sample.device_ms is not None else sample.timestamp
+
+
+class StreamClosed(Exception):
+    """
+    Raised when reading from a WeightStream that has been closed and fully consumed.
+    """
+
+
+class WeightStream:
+    """
+    Bounded ring buffer of streamed weight readings.
+
+    Samples are pushed from the serial reader (thread or event loop) and consumed with `get()`, by iterating
+    (`for sample in stream`) or by async iteration (`async for sample in stream`). Iteration ends once the
+    stream is closed and the remaining samples have been consumed.
+
+    Parameters:
+        maxlen (int): Maximum number of buffered samples; older samples are dropped first (default: 1024).
+    """
+    def __init__(self, maxlen=1024) -> None:
+        self.maxlen = maxlen
+        self.dropped = 0        # Number of samples discarded because the consumer fell behind.
+        self.closed = False
+        self.latest = None      # Most recent sample, also when it has already been consumed.
+        self._samples = deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self._async_waiters = []
+
+    def push(self, sample):
+        """
+        Adds a sample, dropping the oldest one if the buffer is full.
+
+        Parameters:
+            sample (WeightSample): The sample to add. None is ignored.
+        """
+        if sample is None:
+            return
+        with self._cond:
+            if len(self._samples) == self.maxlen:
+                self.dropped += 1
+            self._samples.append(sample)
+            self.latest = sample
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        self._wake(waiters)
+
+    def close(self):
+        """
+        Marks the stream as finished; consumers stop once the buffered samples are used up.
+        """
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        self._wake(waiters)
+
+    @staticmethod
+    def _wake(waiters):
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+
+    def get(self, timeout=None):
+        """
+        Returns the oldest buffered sample, waiting for one if the buffer is empty.
+
+        Parameters:
+            timeout (float, optional): Maximum time in seconds to wait. Waits indefinitely if None.
+
+        Returns:
+            WeightSample: The oldest buffered sample.
+
+        Raises:
+            TimeoutError: If no sample arrives within the timeout.
+            StreamClosed: If the stream has been closed and no samples remain.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._samples:
+                if self.closed:
+                    raise StreamClosed("Weight stream has been stopped.")
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No weight sample received within timeout.")
+                self._cond.wait(remaining)
+            return self._samples.popleft()
+
+    async def aget(self, timeout=None):
+        """
+        Async version of `get()`; waits without blocking the event loop.
+        """
+        import asyncio  # Already loaded when an event loop runs; not imported with the module to keep imports fast.
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if self._samples:
+                    return self._samples.popleft()
+                if self.closed:
+                    raise StreamClosed("Weight stream has been stopped.")
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError("No weight sample received within timeout.")
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def wait_started(self, timeout=None):
+        """
+        Waits until the first sample has arrived, without consuming it.
+
+        Parameters:
+            timeout (float, optional): Maximum time in seconds to wait. Waits indefinitely if None.
+
+        Returns:
+            bool: True if a sample has arrived, False if the timeout expired or the stream was closed first.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.latest is not None or self.closed, timeout)
+            return self.latest is not None
+
+    async def await_started(self, timeout=None):
+        """
+        Async version of `wait_started()`; waits without blocking the event loop.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if self.latest is not None or self.closed:
+                    return self.latest is not None
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def drain(self):
+        """
+        Returns and removes all buffered samples without waiting.
+
+        Returns:
+            list of WeightSample: The buffered samples, oldest first.
+        """
+        with self._cond:
+            samples = list(self._samples)
+            self._samples.clear()
+        return samples
+
+    def __len__(self):
+        return len(self._samples)
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.get()
+            except StreamClosed:
+                return
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.aget()
+        except StreamClosed:
+            raise StopAsyncIteration
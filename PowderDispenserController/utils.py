@@ -9,23 +9,31 @@ This module provides functionality to:
 Functions:
     list_serial_ports() - Lists all available serial ports and their details.
     get_serial_port() - Automatically retrieves a serial port associated with a USB serial device.
-    get_config(config_file) - Loads the configuration settings from a JSON file.
-    save_config(config_file, powder_config) - Saves configuration settings to a JSON file.
+    get_serial_ports() - Retrieves all serial ports associated with USB serial devices.
+    set_hangup_on_close(ser, enabled) - Controls whether closing a serial port drops DTR (and resets the Arduino).
+    pulse_dtr(ser) - Resets the Arduino by pulsing DTR.
+    get_config(config_file) - Loads the configuration settings from a (commented) JSON file.
+    save_config(config_file, powder_config) - Saves configuration settings to a JSON file atomically.
     read_logfile(logfile) - Reads dispensing operation logs into a pandas DataFrame.
-    write_to_logfile(logfile, **kwargs) - Appends dispensing operation details into a logfile.
+    write_to_logfile(logfile, **kwargs) - Appends a row of dispensing operation details to a logfile.
 """
 
-import json
+import logging
 import serial
 import serial.tools.list_ports
-import pandas as pd
 import ast
+import time
+
+from .logwriter import SessionLogWriter
+from .config import read_config, file_lock, write_json_atomic
+
+logger = logging.getLogger(__name__)
 
 def list_serial_ports():
     """
     Lists all available serial ports on the system along with their details.
 
-    This function prints the following information for each detected serial port:
+    This function logs the following information for each detected serial port:
     - Port (e.g., COM3 or /dev/ttyUSB0)
     - Description (e.g., Arduino device name)
     - Hardware ID (e.g., USB vendor and product IDs)
@@ -34,7 +42,7 @@ def list_serial_ports():
     """
     ports = serial.tools.list_ports.comports()  # Get all available serial ports.
     for port in ports:
-        print(f"Port: {port.device}, Description: {port.description}, Hardware ID: {port.hwid}")  # Print port details.
+        logger.info("Port: %s, Description: %s, Hardware ID: %s", port.device, port.description, port.hwid)  # Log port details.
 
 def get_serial_port():
     """
@@ -46,17 +54,72 @@ def get_serial_port():
     Raises:
         Exception: If no USB serial port is detected.
     """
-    ports = serial.tools.list_ports.comports()  # Get all available serial ports.
-    for port in ports:
-        if 'serial' in port.description.lower():  # Look for ports with 'serial' in their description.
-            return port.device  # Return the port name (e.g., COM3 or /dev/ttyUSB0).
+    ports = get_serial_ports()
+    if ports:
+        return ports[0]  # Return the port name (e.g., COM3 or /dev/ttyUSB0).
     raise Exception(
         "ERROR: No USB Serial Port Found. Please try again or define the port manually using list_serial_ports()."
     )
 
+def get_serial_ports():
+    """
+    Retrieves every serial port associated with a USB serial device, e.g. one per connected dispenser.
+
+    Returns:
+        list of str: The names of all detected ports with a description containing 'serial', sorted by name.
+    """
+    ports = serial.tools.list_ports.comports()  # Get all available serial ports.
+    # Look for ports with 'serial' in their description.
+    return sorted(port.device for port in ports if 'serial' in port.description.lower())
+
+def set_hangup_on_close(ser, enabled):
+    """
+    Sets the HUPCL flag of an open serial port, which decides whether the operating system drops DTR when the
+    port is closed. Arduino boards reset when DTR is asserted again, so with the flag cleared, closing the port
+    (also when the program crashes) and reopening it does not reset the board.
+
+    Parameters:
+        ser (serial.Serial): The open serial port.
+        enabled (bool): True to drop DTR on close (the default of the operating system), False to keep it asserted.
+
+    Returns:
+        bool: The previous setting, or None if the platform or port does not support it (e.g. on Windows).
+    """
+    try:
+        import termios
+    except ImportError:
+        return None  # Not a POSIX system.
+    try:
+        attrs = termios.tcgetattr(ser.fileno())
+        previous = bool(attrs[2] & termios.HUPCL)
+        attrs[2] = attrs[2] | termios.HUPCL if enabled else attrs[2] & ~termios.HUPCL
+        termios.tcsetattr(ser.fileno(), termios.TCSANOW, attrs)
+    except (termios.error, AttributeError, OSError, ValueError, serial.SerialException):
+        return None
+    return previous
+
+def pulse_dtr(ser, duration=0.1):
+    """
+    Resets the Arduino by deasserting and reasserting DTR.
+
+    Parameters:
+        ser (serial.Serial): The open serial port.
+        duration (float): Time in seconds DTR is held deasserted (default: 0.1).
+
+    Returns:
+        bool: True if the pulse was sent, False if the port has no modem control lines (e.g. a pseudo-terminal).
+    """
+    try:
+        ser.dtr = False
+        time.sleep(duration)
+        ser.dtr = True
+    except (OSError, serial.SerialException):
+        return False
+    return True
+
 def get_config(config_file):
     """
-    Loads configuration settings from a JSON file.
+    Loads configuration settings from a JSON file, which may contain '//' and '/* */' comments.
 
     Parameters:
         config_file (str): The path to the configuration file.
@@ -66,15 +129,9 @@ def get_config(config_file):
 
     Raises:
         FileNotFoundError: If the configuration file does not exist.
+        ConfigError: If the file is not valid JSON.
     """
-    try:
-        with open(config_file, "r") as file:  # Open the configuration file in read mode.
-            powder_config = json.load(file)  # Parse the JSON content into a dictionary.
-    except FileNotFoundError:
-        raise FileNotFoundError(
-            f"Error: '{config_file}' file not found. Please make sure the file exists in the current directory."
-        )
-    return powder_config  # Return the loaded configuration dictionary.
+    return read_config(config_file)  # Parse the commented JSON content into a dictionary.
 
 def save_config(config_file, powder_config):
     """
@@ -84,11 +141,13 @@ def save_config(config_file, powder_config):
         config_file (str): The path to the configuration file.
         powder_config (dict): The configuration settings to be saved.
 
-    This function overwrites the file with the new configuration settings.
+    This function replaces the file with the new configuration settings atomically: other processes holding
+    the file's lock wait, and a crash leaves either the old or the new file, never a partial one. Comments in
+    the file are not preserved; use a ConfigStore with an overlay file to keep the original file untouched.
     """
-    with open(config_file, 'w') as f:  # Open the configuration file in write mode.
-        json.dump(powder_config, f, indent=4)  # Save the configuration as a formatted JSON file.
-    print(f"Configuration saved to {config_file}")  # Confirm that the configuration has been saved.
+    with file_lock(config_file):
+        write_json_atomic(config_file, powder_config)  # Write to a temporary file and rename it over the original.
+    logger.info("Configuration saved to %s", config_file)  # Confirm that the configuration has been saved.
 
 def read_logfile(logfile):
     """
@@ -104,15 +163,16 @@ def read_logfile(logfile):
         - Parses string representations of lists in specific columns (e.g., 'desired_amount', 'measured_amount').
         - If the log file does not exist, raises a FileNotFoundError.
     """
+    import pandas as pd  # Imported here, as loading pandas slows down importing the package.
     df = pd.read_csv(logfile)  # Load the CSV file into a DataFrame.
     
     # Columns that may contain string representations of lists (to be converted to actual lists).
     list_columns = ['desired_amount', 'measured_amount', '# of steps']
 
     for column in df.columns:
-        if column in list_columns and df[column].dtype == object:
-            # Convert string representations of lists into actual Python lists.
-            df[column] = df[column].apply(ast.literal_eval)
+        if column in list_columns and not pd.api.types.is_numeric_dtype(df[column]):
+            # Convert string representations of lists into actual Python lists, leaving empty cells as they are.
+            df[column] = df[column].apply(lambda value: ast.literal_eval(value) if isinstance(value, str) else value)
     return df  # Return the parsed DataFrame.
 
 def write_to_logfile(logfile, desired_amount=None, measured_amount=None, steps=None, augerType=None, powderType=None, filterType=None):
@@ -129,32 +189,8 @@ def write_to_logfile(logfile, desired_amount=None, measured_amount=None, steps=N
         filterType (str, optional): The type of filter applied to the weight measurement.
 
     Behavior:
-        - Reads the existing log file into a DataFrame.
-        - Appends the new row of data to the DataFrame.
-        - Saves the updated DataFrame back to the log file.
-    """
-    # Create a new row with the provided data.
-    new_row = {
-        'desired_amount': [desired_amount] if desired_amount is not None else None,
-        'measured_amount': [measured_amount] if measured_amount is not None else None,
-        '# of steps': [steps] if steps is not None else None,
-        'auger_type': [augerType] if augerType is not None else None,
-        'powder_type': [powderType] if powderType is not None else None,
-        'filter_type': [filterType] if filterType is not None else None
-    }
-
-    try:
-        log_df = read_logfile(logfile)  # Load the existing log file into a DataFrame.
-    except FileNotFoundError:
-        # If the log file does not exist, create an empty DataFrame with appropriate columns.
-        log_df = pd.DataFrame(columns=new_row.keys())
-
-    # Append the new row to the DataFrame.
-    append_df = pd.DataFrame(new_row)
-    if log_df.empty:
-        log_df = append_df
-    else:
-        log_df = pd.concat([log_df, append_df], ignore_index=True).reset_index(drop=True)
-
-    # Save the updated DataFrame back to the log file.
-    log_df.to_csv(logfile, index=False)
+        - Appends a single row to the end of the log file without re-reading it, creating the file with a
+          header line if it does not exist. Use a SessionLogWriter to log many rows efficiently.
+    """
+    with SessionLogWriter(logfile, flush_rows=1, flush_interval=None) as writer:
+        writer.write(desired_amount, measured_amount, steps, augerType, powderType, filterType)
@@ -0,0 +1,46 @@
+"""
+Host-side benchmarks for the powder dispensing package.
+
+The benchmarks run against a pseudo-terminal (pty) stand-in for the Arduino, so they can be run
+without a RedBoard attached. Each module can be executed directly, e.g.:
+
+    python -m benchmarks.bench_framing
+
+`benchmarks.suite` runs the end-to-end benchmarks against the virtual rig and compares them with
+`baseline.json`:
+
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+
+`benchmarks.bench_import` fails if importing the package exceeds its time budget or loads heavy
+dependencies such as numpy or pandas:
+
+    python -m benchmarks.bench_import --budget 0.25
+
+`benchmarks.bench_attach` compares cold connects with fast attaches (`fast_attach=True`):
+
+    python -m benchmarks.bench_attach --speed 1
+
+`benchmarks.bench_pipeline` times a flush-dispense-tare recipe sent one command at a time and as a
+pipelined batch, against a virtual rig that delays its replies like a USB serial link:
+
+    python -m benchmarks.bench_pipeline --latency 0.004
+
+`benchmarks.bench_binary` compares the ASCII and binary framing of streamed weight readings:
+
+    python -m benchmarks.bench_binary
+
+`benchmarks.bench_scheduler` runs the notebook recipe on several virtual rigs step by step and through the
+recipe scheduler:
+
+    python -m benchmarks.bench_scheduler --rigs 2
+
+`benchmarks.bench_dispense_until` doses a target by weight from the PC, with the firmware's DispenseUntil and
+with a continuous feed:
+
+    python -m benchmarks.bench_dispense_until --target 0.1
+
+`benchmarks.bench_inflight` logs closed-loop doses, replays them to evaluate the settled-weight predictor and
+doses again with and without it:
+
+    python -m benchmarks.bench_inflight --doses 5
+"""
@@ -0,0 +1,80 @@
+"""
+Cold vs. warm attach times against the virtual rig.
+
+Connects a PowderDispenseController to a `VirtualRig` in three ways and prints how long each takes:
+    - cold: the default constructor; opening the port resets the Arduino, so it waits for the boot banner,
+    - first warm: `fast_attach=True` after a cold session, which dropped DTR on close, so the board still
+      resets once and the ping waits through its boot,
+    - warm: `fast_attach=True` after a fast session; nothing resets and a single 'Ping' restores the
+      scale and stepper state.
+
+Run at `--speed 1` to see the real boot time of the RedBoard.
+
+Usage:
+    python -m benchmarks.bench_attach [--speed 1] [--repeat 5]
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+from PowderDispenserController import PowderDispenseController
+from PowderDispenserController.logconfig import flush_logging
+from PowderDispenserController.simulator import VirtualRig
+
+from .suite import DEFAULT_CONFIG
+
+
+def timed_attach(port, config, fast_attach):
+    """
+    Opens a controller on `port`, closes it again and returns the time the constructor took in seconds.
+    """
+    start = time.perf_counter()
+    controller = PowderDispenseController(port, config_file=config, fast_attach=fast_attach)
+    elapsed = time.perf_counter() - start
+    controller.scaleOn(settle_time=0)  # State a warm attach has to restore.
+    controller.close()
+    return elapsed
+
+
+def measure_attach(speed=1.0, repeat=5, config_file=DEFAULT_CONFIG):
+    """
+    Measures cold, first warm and warm attach times on a fresh virtual rig. Every round starts with an
+    unmeasured cold session, so the measured cold attach follows a session that dropped DTR on close.
+
+    Returns:
+        dict: 'cold', 'first_warm' and 'warm' -> list of attach times in seconds, and 'boots', the number of
+              times the rig was reset.
+    """
+    times = {'cold': [], 'first_warm': [], 'warm': []}
+    with VirtualRig(speed=speed, seed=1) as rig:
+        with contextlib.redirect_stdout(io.StringIO()):  # Silence the session messages.
+            for _ in range(repeat):
+                # A pty has no DTR line to pulse, so only a cold session after a cold session resets the rig.
+                timed_attach(rig.port, config_file, fast_attach=False)
+                times['cold'].append(timed_attach(rig.port, config_file, fast_attach=False))
+                times['first_warm'].append(timed_attach(rig.port, config_file, fast_attach=True))
+                times['warm'].append(timed_attach(rig.port, config_file, fast_attach=True))
+            flush_logging()
+        boots = rig.boots
+    return {**times, 'boots': boots}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--speed', type=float, default=1.0, help="Virtual rig speed-up factor (default: 1).")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of cold/warm rounds (default: 5).")
+    args = parser.parse_args()
+
+    results = measure_attach(args.speed, args.repeat)
+    cold = statistics.median(results['cold'])
+    for name in ('cold', 'first_warm', 'warm'):
+        median = statistics.median(results[name])
+        print(f"{name:<12} median {median * 1000:>9.1f} ms  max {max(results[name]) * 1000:>9.1f} ms  "
+              f"({cold / median:,.1f}x cold)")
+    print(f"rig resets: {results['boots']} in {args.repeat} rounds")
+
+
+if __name__ == '__main__':
+    main()
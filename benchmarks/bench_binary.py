@@ -0,0 +1,73 @@
+"""
+ASCII vs. binary framing of streamed weight readings.
+
+Decodes the same stream of readings once as ASCII '<Stream:weight,millis>' frames and once as binary frames
+(see `PowderDispenserController.binary`) and prints, for each format:
+    - the bytes per reading and the highest reading rate the serial line can carry at `--baud`
+      (10 bits per byte), against the NAU7802's 320 SPS,
+    - the host time to turn received bytes into WeightSamples, with the bytes fed in small chunks as they
+      arrive from a live stream, and in one large chunk as after the reader fell behind.
+
+Usage:
+    python -m benchmarks.bench_binary [--readings 20000] [--baud 115200]
+"""
+import argparse
+import time
+
+from PowderDispenserController.binary import encode_frame
+from PowderDispenserController.comms import FrameBuffer, make_message
+from PowderDispenserController.stream import parse_stream_sample
+
+SAMPLE_RATE = 320  # NAU7802 conversions per second.
+
+
+def make_stream(readings, binary):
+    """
+    Returns the bytes of `readings` streamed weight readings as the firmware sends them.
+    """
+    weights = [0.5 + (i % 1000) * 0.0001 for i in range(readings)]
+    if binary:
+        return b''.join(encode_frame('Stream', weight, i * 3) for i, weight in enumerate(weights))
+    return b''.join(b'<Stream:%.4f,%d>\r\n' % (weight, i * 3) for i, weight in enumerate(weights))
+
+
+def decode_time(data, chunk_size):
+    """
+    Feeds `data` to a FrameBuffer in chunks of `chunk_size` bytes and converts every frame into a WeightSample.
+
+    Returns:
+        tuple: (elapsed seconds, number of samples).
+    """
+    buffer = FrameBuffer()
+    samples = 0
+    start = time.perf_counter()
+    for offset in range(0, len(data), chunk_size):
+        buffer.feed(data[offset:offset + chunk_size])
+        while len(buffer):
+            samples += 1
+            if parse_stream_sample(make_message(samples, buffer.pop(), 0.0)) is None:
+                samples -= 1
+    return time.perf_counter() - start, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--readings', type=int, default=20000, help="Number of readings to decode (default: 20000).")
+    parser.add_argument('--baud', type=int, default=115200, help="Serial baud rate (default: 115200).")
+    args = parser.parse_args()
+
+    for name, binary in (('ascii', False), ('binary', True)):
+        data = make_stream(args.readings, binary)
+        frame_bytes = len(data) / args.readings
+        line_rate = args.baud / 10 / frame_bytes
+        print(f"{name:<7} {frame_bytes:>5.1f} B/reading  line limit {line_rate:>6.0f} readings/s "
+              f"({line_rate / SAMPLE_RATE:.1f}x {SAMPLE_RATE} SPS)")
+        for label, chunk_size in (('live', 64), ('backlog', 4096)):
+            # Best of three runs; the first one also pays for importing NumPy.
+            elapsed, samples = min(decode_time(data, chunk_size) for _ in range(3))
+            assert samples == args.readings, f"{name}: decoded {samples} of {args.readings} readings"
+            print(f"        {label:<8} {elapsed / samples * 1e6:>6.2f} us/reading  ({samples / elapsed:,.0f} readings/s)")
+
+
+if __name__ == '__main__':
+    main()
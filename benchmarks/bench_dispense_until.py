@@ -0,0 +1,71 @@
+"""
+Host-side vs. device-side dosing by weight, and continuous feeding, against the virtual rig.
+
+Doses the same target with
+    - `dispense_powder_seq`: a dispense, settle and measure round trip per burst from the PC,
+    - `dispense_until` on firmware without DispenseUntil: the dosing loop run from the PC,
+    - `dispense_until` on firmware with DispenseUntil: the whole dose as one command,
+    - `dispense_feed`: one continuous auger feed slowed down as the streamed weight approaches the target,
+and prints the wall time, the number of commands and the dosing error of each. The PC-side waits (settling,
+`settle_time`) are real time while the rig runs `--speed` times faster, so the times are for comparison only.
+
+Usage:
+    python -m benchmarks.bench_dispense_until [--target 0.1] [--speed 20]
+"""
+import argparse
+import contextlib
+import io
+
+from PowderDispenserController import PowderDispenseController, set_command_logging
+from PowderDispenserController.logconfig import flush_logging
+from PowderDispenserController.simulator import VirtualRig
+
+from .suite import DEFAULT_CONFIG
+
+VARIANTS = (
+    ('dispense_powder_seq', True, lambda controller, target: controller.dispense_powder_seq(target)),
+    ('until, on PC', False, lambda controller, target: controller.dispense_until(target)),
+    ('until, on device', True, lambda controller, target: controller.dispense_until(target)),
+    ('continuous feed', True, lambda controller, target: controller.dispense_feed(target)),
+)
+
+
+def measure(target, speed, seed=1, config_file=DEFAULT_CONFIG):
+    """
+    Runs every variant on a fresh virtual rig.
+
+    Returns:
+        list of tuple: (variant name, DispenseReport, grams delivered according to the rig).
+    """
+    results = []
+    set_command_logging(False)
+    try:
+        for name, dose_by_weight, run in VARIANTS:
+            with VirtualRig(speed=speed, seed=seed, dose_by_weight=dose_by_weight) as rig:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    controller = PowderDispenseController(rig.port, config_file=config_file)
+                try:
+                    before = rig.mass
+                    report = run(controller, target)
+                    results.append((name, report, rig.mass - before))
+                finally:
+                    controller.close()
+    finally:
+        flush_logging()
+        set_command_logging(True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--target', type=float, default=0.1, help="Target mass in grams (default: 0.1).")
+    parser.add_argument('--speed', type=float, default=20.0, help="Virtual rig speed-up factor (default: 20).")
+    args = parser.parse_args()
+
+    for name, report, delivered in measure(args.target, args.speed):
+        print(f"{name:<20} {report.duration:>7.2f} s  {report.round_trips:>5} commands  {report.bursts:>4} bursts  "
+              f"error {(delivered - args.target) * 1000:>+7.2f} mg")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Throughput benchmark for the serial frame reader.
+
+A writer thread pushes `<Weight:...>` frames into the master side of a pty pair while the reader
+consumes them from the slave side through pyserial, exactly as the controller does with the Arduino.
+The byte-at-a-time reader used by the controller before `FrameReader` is measured alongside it.
+
+Usage:
+    python -m benchmarks.bench_framing [--frames N]
+"""
+import argparse
+import os
+import threading
+import time
+
+import serial
+
+from PowderDispenserController.comms import FrameReader
+
+
+def open_loopback():
+    """
+    Opens a pty pair to stand in for the Arduino.
+
+    Returns:
+        tuple: (master_fd, serial.Serial) where writes to `master_fd` arrive on the serial port.
+    """
+    master_fd, slave_fd = os.openpty()
+    ser = serial.Serial(os.ttyname(slave_fd), 115200, timeout=1)
+    os.close(slave_fd)  # pyserial holds its own descriptor on the slave side.
+    return master_fd, ser
+
+
+def feed_frames(master_fd, num_frames):
+    """
+    Writes `num_frames` weight frames to the master side of the pty, as `Serial.println` would.
+    """
+    payload = b''.join(b'<Weight:%.4f,%d>\r\n' % (i * 0.0001, i) for i in range(num_frames))
+    view = memoryview(payload)
+    while view:
+        written = os.write(master_fd, view[:4096])
+        view = view[written:]
+
+
+def legacy_recv(ser, timeout=10):
+    """
+    Byte-at-a-time reader equivalent to the previous `recv_from_arduino` loop.
+    """
+    start_time = time.time()
+    ck = ""
+    while time.time() - start_time < timeout:
+        while ord(ser.read()) != 60:  # Wait for '<'.
+            pass
+        char = ser.read()
+        while ord(char) != 62:  # Read until '>'.
+            ck += char.decode("utf-8")
+            char = ser.read()
+        return ck
+    raise TimeoutError("Arduino did not respond within timeout. Try resetting the device.")
+
+
+def run(name, recv, num_frames):
+    """
+    Measures how many frames per second `recv` can consume from the loopback.
+
+    Returns:
+        float: Frames per second.
+    """
+    master_fd, ser = open_loopback()
+    writer = threading.Thread(target=feed_frames, args=(master_fd, num_frames), daemon=True)
+    try:
+        start = time.perf_counter()
+        writer.start()
+        for _ in range(num_frames):
+            recv(ser)
+        elapsed = time.perf_counter() - start
+    finally:
+        writer.join()
+        ser.close()
+        os.close(master_fd)
+    rate = num_frames / elapsed
+    print(f"{name:<12} {num_frames} frames in {elapsed:.3f} s -> {rate:,.0f} frames/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=20000, help="Number of frames to read per reader.")
+    args = parser.parse_args()
+
+    before = run("byte-wise", legacy_recv, args.frames)
+
+    readers = {}
+    def framed_recv(ser):
+        reader = readers.get(ser) or readers.setdefault(ser, FrameReader(ser))
+        return reader.read_frame(10)
+    after = run("FrameReader", framed_recv, args.frames)
+
+    print(f"Speed-up: {after / before:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
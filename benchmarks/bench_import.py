@@ -0,0 +1,100 @@
+"""
+Import-time budget check for the package.
+
+Imports `PowderDispenserController` in fresh interpreters and fails (exit code 1) if the median import time
+exceeds `--budget` seconds, or if the import pulls in any of the heavy optional dependencies (numpy, pandas,
+scipy, matplotlib, pyarrow), which must only be loaded by the functions that use them. Use `--profile` to
+print the slowest modules as reported by `python -X importtime`.
+
+Usage:
+    python -m benchmarks.bench_import [--budget 0.25] [--runs 5] [--profile]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PACKAGE = 'PowderDispenserController'
+HEAVY_MODULES = ('numpy', 'pandas', 'scipy', 'matplotlib', 'pyarrow')
+
+_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import {PACKAGE}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def import_once():
+    """
+    Imports the package in a fresh interpreter.
+
+    Returns:
+        tuple: (import time in seconds, list of heavy modules loaded by the import).
+    """
+    output = subprocess.run([sys.executable, '-c', _PROBE], capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['elapsed'], result['heavy']
+
+
+def measure_import(runs=5):
+    """
+    Imports the package `runs` times, each in a fresh interpreter.
+
+    Returns:
+        tuple: (list of import times in seconds, sorted list of heavy modules loaded by any import).
+    """
+    times, heavy = [], set()
+    for _ in range(runs):
+        elapsed, loaded = import_once()
+        times.append(elapsed)
+        heavy.update(loaded)
+    return times, sorted(heavy)
+
+
+def profile(top=10):
+    """
+    Prints the `top` slowest modules (cumulative time) of one import, as reported by `python -X importtime`.
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {PACKAGE}'],
+                            capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>10.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--budget', type=float, default=0.25, help="Maximum median import time in seconds (default: 0.25).")
+    parser.add_argument('--runs', type=int, default=5, help="Number of fresh interpreters to import in (default: 5).")
+    parser.add_argument('--profile', action='store_true', help="Print the slowest modules of one import.")
+    args = parser.parse_args()
+
+    times, heavy = measure_import(args.runs)
+    median = statistics.median(times)
+    print(f"import {PACKAGE}: median {median * 1000:.1f} ms, min {min(times) * 1000:.1f} ms, "
+          f"max {max(times) * 1000:.1f} ms over {args.runs} runs (budget {args.budget * 1000:.0f} ms)")
+    if args.profile:
+        profile()
+
+    failed = False
+    if median > args.budget:
+        print(f"FAIL  import time {median * 1000:.1f} ms exceeds the budget of {args.budget * 1000:.0f} ms")
+        failed = True
+    if heavy:
+        print(f"FAIL  importing {PACKAGE} loads {', '.join(heavy)}; import them where they are used")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("PASS")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Settling waits vs. predicted settled weights in closed-loop dispensing, against the virtual rig.
+
+Doses `--doses` targets with `dispense_closed_loop` waiting for the scale after every burst and logs the bursts,
+replays the log to report the cross-validated error of the settled-weight predictor (see
+`PowderDispenserController.inflight`), fits it to all bursts and doses the same targets again with it. Prints the
+wall time, bursts and dosing error of both runs. The PC-side settling waits are real time while the rig runs
+`--speed` times faster, so the times are for comparison only.
+
+Usage:
+    python -m benchmarks.bench_inflight [--doses 5] [--speed 20]
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+from PowderDispenserController import PowderDispenseController, set_command_logging
+from PowderDispenserController.inflight import InFlightModel, evaluate, read_traces
+from PowderDispenserController.logconfig import flush_logging
+from PowderDispenserController.simulator import VirtualRig
+
+from .suite import DEFAULT_CONFIG
+
+TARGETS = (0.05, 0.1, 0.2, 0.08, 0.15, 0.12, 0.06, 0.18)
+
+
+def dose(controller, rig, targets, **options):
+    """
+    Doses every target with `dispense_closed_loop`.
+
+    Returns:
+        list of tuple: (DispenseReport, grams delivered according to the rig).
+    """
+    results = []
+    for target in targets:
+        before = rig.mass
+        report = controller.dispense_closed_loop(target, **options)
+        results.append((report, rig.mass - before))
+    return results
+
+
+def summary(name, results):
+    """
+    Returns one line with the total time, the bursts and the mean absolute dosing error of a run.
+    """
+    duration = sum(report.duration for report, _ in results)
+    bursts = sum(report.bursts for report, _ in results)
+    error = sum(abs(delivered - report.target) for report, delivered in results) / len(results)
+    return f"{name:<10} {duration:>7.2f} s  {bursts:>4} bursts  mean error {error * 1000:>6.2f} mg"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doses', type=int, default=5, help=f"Number of doses per run, at most {len(TARGETS)} (default: 5).")
+    parser.add_argument('--speed', type=float, default=20.0, help="Virtual rig speed-up factor (default: 20).")
+    args = parser.parse_args()
+    targets = TARGETS[:args.doses]
+
+    set_command_logging(False)
+    try:
+        with tempfile.TemporaryDirectory() as directory, VirtualRig(speed=args.speed, seed=1) as rig:
+            trace_file = os.path.join(directory, 'traces.jsonl')
+            with contextlib.redirect_stdout(io.StringIO()):
+                controller = PowderDispenseController(rig.port, config_file=DEFAULT_CONFIG)
+            try:
+                waiting = dose(controller, rig, targets, model=False, trace_file=trace_file)
+                traces = read_traces(trace_file)
+                reports = evaluate(traces)
+                model = InFlightModel.fit(traces)
+                predicted = dose(controller, rig, targets, model=model)
+            finally:
+                controller.close()
+    finally:
+        flush_logging()
+        set_command_logging(True)
+
+    for (augerType, powderType), report in reports.items():
+        print(f"{augerType}/{powderType}: {report.bursts} bursts, prediction MAE {report.mae * 1000:.2f} mg "
+              f"(weight at {report.horizon:g} s: {report.naive_mae * 1000:.2f} mg), settling {report.settle_time:.2f} rig s per burst")
+    print(f"{model}")
+    print(summary('waiting', waiting))
+    print(summary('predicted', predicted))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Throughput benchmark for the dispensing log.
+
+Writes rows of dispensing details to a temporary CSV log, once through the read-modify-write path used by
+`write_to_logfile` before `SessionLogWriter` (read the whole file, append a row, rewrite the file) and once
+through the append-only SessionLogWriter. The old path is quadratic in the number of rows, so by default it
+only writes `--legacy-rows` rows and its time for the full `--rows` is extrapolated.
+
+Usage:
+    python -m benchmarks.bench_logwriter [--rows N] [--legacy-rows N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from PowderDispenserController.logwriter import SessionLogWriter
+from PowderDispenserController.utils import read_logfile
+
+
+def legacy_write(logfile, desired_amount=None, measured_amount=None, steps=None, augerType=None, powderType=None, filterType=None):
+    """
+    Read-modify-write logger equivalent to the previous `write_to_logfile`.
+    """
+    new_row = {
+        'desired_amount': [desired_amount] if desired_amount is not None else None,
+        'measured_amount': [measured_amount] if measured_amount is not None else None,
+        '# of steps': [steps] if steps is not None else None,
+        'auger_type': [augerType] if augerType is not None else None,
+        'powder_type': [powderType] if powderType is not None else None,
+        'filter_type': [filterType] if filterType is not None else None
+    }
+    try:
+        log_df = read_logfile(logfile)
+    except FileNotFoundError:
+        log_df = pd.DataFrame(columns=new_row.keys())
+    append_df = pd.DataFrame(new_row)
+    if log_df.empty:
+        log_df = append_df
+    else:
+        log_df = pd.concat([log_df, append_df], ignore_index=True).reset_index(drop=True)
+    log_df.to_csv(logfile, index=False)
+
+
+def sample_row(i):
+    """
+    Returns the keyword arguments of the i-th benchmark row.
+    """
+    return dict(desired_amount=0.5, measured_amount=0.5 + (i % 17) * 1e-4, steps=2500 + i % 13,
+                augerType='8mm_base', powderType='dishwasher_salt', filterType='EWMA')
+
+
+def legacy_session(logfile, num_rows):
+    """
+    Logs `num_rows` rows through the old path, one read-modify-write per row.
+    """
+    for i in range(num_rows):
+        legacy_write(logfile, **sample_row(i))
+
+
+def writer_session(logfile, num_rows):
+    """
+    Logs `num_rows` rows through one SessionLogWriter, as a controller does over a session.
+    """
+    with SessionLogWriter(logfile) as writer:
+        for i in range(num_rows):
+            writer.write(**sample_row(i))
+
+
+def run(name, session, num_rows, directory):
+    """
+    Times `session(logfile, num_rows)` on a fresh log file and checks that every row arrived.
+
+    Returns:
+        float: Elapsed time in seconds.
+    """
+    logfile = os.path.join(directory, f"{name}.csv")
+    start = time.perf_counter()
+    session(logfile, num_rows)
+    elapsed = time.perf_counter() - start
+    rows = len(read_logfile(logfile))
+    assert rows == num_rows, f"{name}: expected {num_rows} rows, found {rows}"
+    print(f"{name:<18} {num_rows} rows in {elapsed:.3f} s -> {num_rows / elapsed:,.0f} rows/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100000, help="Number of rows written with SessionLogWriter.")
+    parser.add_argument('--legacy-rows', type=int, default=2000, help="Number of rows written with the old path.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        before = run("read-modify-write", legacy_session, args.legacy_rows, directory)
+        # Every old write re-reads all previous rows, so the total time grows with the square of the row count.
+        before_full = before * (args.rows / args.legacy_rows) ** 2
+        print(f"{'':<18} extrapolated to {args.rows} rows: {before_full:,.0f} s")
+        after = run("SessionLogWriter", writer_session, args.rows, directory)
+
+    print(f"Speed-up for {args.rows} rows: {before_full / after:,.0f}x")
+
+
+if __name__ == '__main__':
+    main()
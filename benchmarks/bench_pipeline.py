@@ -0,0 +1,110 @@
+"""
+Sequential vs. pipelined execution of a notebook recipe against the virtual rig.
+
+Runs the recipe of `Use_Example.ipynb` (flush -> enable stepper -> dispense 2000 steps -> disable stepper ->
+scale on -> tare) once with one `run_command` round trip per step and once as a `CommandBatch`, and reports
+the wall time of both and the overhead on top of the time the rig spends executing the commands. The rig
+delays its replies by `--latency` seconds to stand in for the USB-serial bridge; with a pty alone, a round
+trip takes microseconds and there is little to save.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--speed 20] [--latency 0.004] [--repeat 5]
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+from PowderDispenserController import PowderDispenseController, set_command_logging
+from PowderDispenserController.logconfig import flush_logging
+from PowderDispenserController.simulator import VirtualRig
+
+from .suite import DEFAULT_CONFIG
+
+STEPS = 2000
+FLUSH_TIME = 1.0
+
+
+def recipe_sequential(controller):
+    """
+    Runs the recipe with one round trip per step, as in the notebook.
+    """
+    controller.runFlush(time=FLUSH_TIME)
+    controller.enableStepper()
+    controller.dispense(STEPS, runSteps=True)
+    controller.disableStepper()
+    controller.scaleOn(settle_time=0)  # The batch does not wait for the scale to settle either.
+    controller.tare()
+
+
+def recipe_batched(controller):
+    """
+    Runs the recipe as one pipelined batch.
+    """
+    with controller.batch() as batch:
+        batch.runFlush(time=FLUSH_TIME)
+        batch.enableStepper()
+        batch.dispense(STEPS, runSteps=True)
+        batch.disableStepper()
+        batch.scaleOn()
+        batch.tare()
+    return batch.results
+
+
+def _reset(controller):
+    # Returns the rig to the recipe's starting state: stepper disabled and scale off.
+    controller.disableStepper()
+    controller.scaleOff()
+
+
+def measure_pipeline(speed=20.0, latency=0.004, repeat=5, config_file=DEFAULT_CONFIG):
+    """
+    Times both variants of the recipe `repeat` times each on a fresh virtual rig.
+
+    Returns:
+        dict: 'sequential' and 'batched' -> list of wall times in seconds, 'round_trips' -> commands per recipe,
+              'busy' -> wall time the rig spends executing the recipe (flush, auger steps and tare readings).
+    """
+    times = {'sequential': [], 'batched': []}
+    set_command_logging(False)
+    try:
+        with VirtualRig(speed=speed, seed=1, latency=latency) as rig, contextlib.redirect_stdout(io.StringIO()):
+            busy = (FLUSH_TIME + STEPS / rig.step_rate + 100 / rig.sample_rate) / speed  # Tare averages 100 readings.
+            controller = PowderDispenseController(rig.port, config_file=config_file)
+            try:
+                for _ in range(repeat):
+                    for name, recipe in (('sequential', recipe_sequential), ('batched', recipe_batched)):
+                        _reset(controller)
+                        start_commands = len(rig.commands)
+                        start = time.perf_counter()
+                        recipe(controller)
+                        times[name].append(time.perf_counter() - start)
+                        round_trips = len(rig.commands) - start_commands
+            finally:
+                controller.close()
+                flush_logging()
+    finally:
+        set_command_logging(True)
+    return {**times, 'round_trips': round_trips, 'busy': busy}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--speed', type=float, default=20.0, help="Virtual rig speed-up factor (default: 20).")
+    parser.add_argument('--latency', type=float, default=0.004, help="Reply delay of the rig in seconds (default: 0.004).")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of runs of each variant (default: 5).")
+    args = parser.parse_args()
+
+    results = measure_pipeline(args.speed, args.latency, args.repeat)
+    busy = results['busy']
+    sequential = statistics.median(results['sequential'])
+    for name in ('sequential', 'batched'):
+        median = statistics.median(results[name])
+        print(f"{name:<11} median {median * 1000:>9.1f} ms  overhead {(median - busy) * 1000:>8.1f} ms  "
+              f"({sequential / median:.2f}x sequential)")
+    print(f"{results['round_trips']} commands per recipe, rig latency {args.latency * 1000:.1f} ms, speed {args.speed:g}")
+
+
+if __name__ == '__main__':
+    main()
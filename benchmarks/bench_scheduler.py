@@ -0,0 +1,109 @@
+"""
+Serial vs. scheduled execution of a notebook recipe on several virtual rigs.
+
+Runs the recipe of `Use_Example.ipynb` (flush, scale on and settle, tare, dispense, weigh, soak, mix, drain) on
+`--rigs` virtual rigs, once step after step and rig after rig as the notebook does, and once through the
+RecipeScheduler, which overlaps the rigs and, within a rig, the host-side waits (scale settling, soaking) with
+the firmware commands that do not need the same resources. Prints the makespan of both, the critical path and
+the idle time of every resource.
+
+Usage:
+    python -m benchmarks.bench_scheduler [--rigs 2] [--speed 20]
+"""
+import argparse
+import contextlib
+import io
+import time
+
+from PowderDispenserController import PowderDispenseController, set_command_logging
+from PowderDispenserController.logconfig import flush_logging
+from PowderDispenserController.scheduler import Recipe, RecipeScheduler
+from PowderDispenserController.simulator import VirtualRig
+
+from .suite import DEFAULT_CONFIG
+
+STEPS = 2000
+FLUSH_TIME = 2.0
+SETTLE_TIME = 1.0   # Scale warm-up after powering on, in rig seconds.
+SOAK_TIME = 3.0     # Wetting of the powder before mixing, in rig seconds.
+MIX_TIME = 3.0
+DRAIN_TIME = 3.0
+
+
+def build_recipe(ports, speed):
+    """
+    Returns the notebook recipe for every rig as one Recipe. Host-side waits are divided by `speed` like the
+    durations on the virtual rig.
+    """
+    recipe = Recipe()
+    for port in ports:
+        step = lambda name: f"{port}:{name}"
+        recipe.add(step('flush'), 'runFlush', time=FLUSH_TIME, rig=port)
+        recipe.add(step('scale_on'), 'scaleOn', settle_time=0, rig=port)
+        recipe.add(step('settle'), 'wait', SETTLE_TIME / speed, rig=port, after=[step('scale_on')], resources=['scale'])
+        recipe.add(step('tare'), 'tare', rig=port, after=[step('settle'), step('flush')])
+        recipe.add(step('stepper_on'), 'enableStepper', rig=port)
+        recipe.add(step('dispense'), 'dispense', STEPS, runSteps=True, rig=port, after=[step('tare'), step('stepper_on')])
+        recipe.add(step('weigh'), 'measWeight', rig=port, after=[step('dispense')])
+        recipe.add(step('stepper_off'), 'disableStepper', rig=port, after=[step('dispense')])
+        recipe.add(step('soak'), 'wait', SOAK_TIME / speed, rig=port, after=[step('dispense')])
+        recipe.add(step('mix'), 'runMixer', MIX_TIME, rig=port, after=[step('soak'), step('weigh')])
+        recipe.add(step('drain'), 'runDrain', DRAIN_TIME, rig=port, after=[step('mix')])
+    return recipe
+
+
+def run_serial(scheduler, recipe):
+    """
+    Runs the steps of the recipe one after the other, in the order they were added.
+
+    Returns:
+        float: Wall time in seconds.
+    """
+    start = time.perf_counter()
+    for step in recipe:
+        scheduler._execute(step)
+    return time.perf_counter() - start
+
+
+def _reset(controllers):
+    # Returns every rig to the recipe's starting state: stepper disabled and scale off.
+    for controller in controllers.values():
+        controller.disableStepper()
+        controller.scaleOff()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rigs', type=int, default=2, help="Number of virtual rigs (default: 2).")
+    parser.add_argument('--speed', type=float, default=20.0, help="Virtual rig speed-up factor (default: 20).")
+    args = parser.parse_args()
+
+    set_command_logging(False)
+    try:
+        with contextlib.ExitStack() as stack:
+            rigs = [stack.enter_context(VirtualRig(speed=args.speed, seed=i)) for i in range(args.rigs)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                controllers = {rig.port: PowderDispenseController(rig.port, config_file=DEFAULT_CONFIG) for rig in rigs}
+            for controller in controllers.values():
+                stack.callback(controller.close)
+            scheduler = RecipeScheduler(controllers)
+            recipe = build_recipe(list(controllers), args.speed)
+
+            _reset(controllers)
+            serial = run_serial(scheduler, recipe)
+            _reset(controllers)
+            report = scheduler.run(recipe)
+    finally:
+        flush_logging()
+        set_command_logging(True)
+
+    print(f"{len(recipe)} steps on {args.rigs} rigs, speed {args.speed:g}")
+    print(f"serial     {serial:>7.2f} s")
+    print(f"scheduled  {report.makespan:>7.2f} s  ({serial / report.makespan:.2f}x serial)")
+    print(report.summary())
+    if not report.ok:
+        raise SystemExit("The recipe failed.")
+
+
+if __name__ == '__main__':
+    main()
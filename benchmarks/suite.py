@@ -0,0 +1,230 @@
+"""
+End-to-end latency and throughput benchmarks against the virtual rig.
+
+Runs a PowderDispenseController against `VirtualRig` and measures:
+    - the time to import the package in a fresh interpreter,
+    - run_command round-trip latency percentiles,
+    - measWeight / measRaw sample rates,
+    - dispense_powder_seq wall time per target mass and the resulting grams per minute,
+    - log write throughput.
+
+Results are written as JSON. With `--baseline`, every metric is compared against a stored result and the run
+fails (exit code 1) if any metric is worse than the baseline by more than `--threshold` and by more than the
+metric's noise floor (e.g. 0.5 ms for latencies). Results depend on the machine and on `--speed`, so compare
+only runs made with the same settings on the same machine.
+
+Usage:
+    python -m benchmarks.suite [--speed X] [--output results.json] [--baseline benchmarks/baseline.json]
+                               [--threshold 0.2] [--save-baseline PATH]
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from PowderDispenserController import PowderDispenseController, set_command_logging
+from PowderDispenserController.logconfig import flush_logging
+from PowderDispenserController.simulator import VirtualRig
+
+from .bench_import import measure_import
+from .bench_logwriter import writer_session
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+
+
+def metric(value, unit, better, floor=0.0):
+    """
+    Returns a metric entry; `better` is 'lower', 'higher' or None for informational values. Differences
+    smaller than `floor` (in the metric's unit) are treated as measurement noise when comparing.
+    """
+    return {'value': value, 'unit': unit, 'better': better, 'floor': floor}
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (0-100) of `values` with linear interpolation.
+    """
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def bench_import(runs):
+    """
+    Measures the median time of importing the package in `runs` fresh interpreters.
+    """
+    times, _ = measure_import(runs)
+    return {'import_time': metric(statistics.median(times) * 1000, 'ms', 'lower', floor=20.0)}
+
+
+def bench_latency(controller, commands):
+    """
+    Measures the round-trip time of `commands` DispenserOn/DispenserOff commands.
+    """
+    samples = []
+    for i in range(commands):
+        start = time.perf_counter()
+        controller.run_command("<DispenserOn>" if i % 2 == 0 else "<DispenserOff>")
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'command_latency_p50': metric(percentile(samples, 50), 'ms', 'lower', floor=0.5),
+        'command_latency_p90': metric(percentile(samples, 90), 'ms', 'lower', floor=0.5),
+        'command_latency_p99': metric(percentile(samples, 99), 'ms', 'lower', floor=0.5),
+        'command_latency_max': metric(max(samples), 'ms', None),
+    }
+
+
+def bench_sampling(controller, readings, avgReadingSamples):
+    """
+    Measures how many measWeight and measRaw readings per second the controller obtains.
+    """
+    results = {}
+    for name, measure in (('meas_weight_rate', controller.measWeight), ('meas_raw_rate', controller.measRaw)):
+        start = time.perf_counter()
+        for _ in range(readings):
+            measure(avgReadingSamples)
+        results[name] = metric(readings / (time.perf_counter() - start), 'Hz', 'higher')
+    return results
+
+
+def bench_dispense(controller, rig, targets):
+    """
+    Runs dispense_powder_seq for every target mass and records its wall time and accuracy.
+    """
+    results = {}
+    total_grams = total_time = 0.0
+    for target in targets:
+        before = rig.mass
+        report = controller.dispense_powder_seq(target)
+        dispensed = rig.mass - before
+        total_grams += dispensed
+        total_time += report.duration
+        results[f'dispense_{target:g}g_time'] = metric(report.duration, 's', 'lower')
+        results[f'dispense_{target:g}g_round_trips'] = metric(report.round_trips, 'commands', 'lower')
+        results[f'dispense_{target:g}g_error'] = metric((dispensed - target) * 1000, 'mg', None)
+    results['dispense_rate'] = metric(total_grams / total_time * 60, 'g/min', 'higher')
+    return results
+
+
+def bench_logging(directory, rows):
+    """
+    Measures SessionLogWriter throughput.
+    """
+    start = time.perf_counter()
+    writer_session(os.path.join(directory, 'bench_log.csv'), rows)
+    return {'log_write_rate': metric(rows / (time.perf_counter() - start), 'rows/s', 'higher')}
+
+
+def run_suite(config_file=DEFAULT_CONFIG, speed=20.0, seed=1, commands=1000, readings=50, avgReadingSamples=10,
+              targets=(0.05, 0.1), log_rows=100000, import_runs=5):
+    """
+    Runs all benchmarks against a fresh virtual rig.
+
+    Returns:
+        dict: {'meta': run settings and environment, 'metrics': name -> {'value', 'unit', 'better'}}.
+    """
+    metrics = bench_import(import_runs)
+    config_file = os.path.abspath(config_file)  # The benchmarks run in a temporary working directory.
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory, VirtualRig(speed=speed, seed=seed) as rig:
+        os.chdir(directory)  # The controller creates its 'logs' directory in the working directory.
+        try:
+            set_command_logging(False)  # No per-command messages, as on a rig polling at high rates.
+            with contextlib.redirect_stdout(io.StringIO()):  # Silence the remaining session messages.
+                start = time.perf_counter()
+                controller = PowderDispenseController(rig.port, config_file=config_file)
+                metrics['connect_time'] = metric(time.perf_counter() - start, 's', 'lower', floor=0.05)
+                try:
+                    controller.scaleOn()
+                    metrics.update(bench_latency(controller, commands))
+                    metrics.update(bench_sampling(controller, readings, avgReadingSamples))
+                    metrics.update(bench_dispense(controller, rig, targets))
+                finally:
+                    controller.close()
+                    flush_logging()  # Write queued messages while stdout is still redirected.
+            metrics.update(bench_logging(directory, log_rows))
+        finally:
+            set_command_logging(True)
+            os.chdir(cwd)
+
+    meta = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'speed': speed,
+        'seed': seed,
+        'avgReadingSamples': avgReadingSamples,
+        'targets': list(targets),
+    }
+    return {'meta': meta, 'metrics': metrics}
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares results with a baseline.
+
+    Parameters:
+        results (dict): Output of `run_suite`.
+        baseline (dict): A stored output of `run_suite`.
+        threshold (float): Accepted relative regression, e.g. 0.2 for 20 %.
+
+    Returns:
+        list of tuple: (name, value, baseline value, relative change, passed) for every comparable metric.
+    """
+    rows = []
+    for name, entry in results['metrics'].items():
+        reference = baseline['metrics'].get(name)
+        if entry['better'] is None or reference is None or not reference['value']:
+            continue
+        difference = entry['value'] - reference['value']
+        change = difference / abs(reference['value'])
+        regression = change if entry['better'] == 'lower' else -change
+        passed = regression <= threshold or abs(difference) <= entry.get('floor', 0.0)
+        rows.append((name, entry['value'], reference['value'], change, passed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help="Configuration file for the controller.")
+    parser.add_argument('--speed', type=float, default=20.0, help="Virtual rig speed-up factor.")
+    parser.add_argument('--seed', type=int, default=1, help="Virtual rig random seed.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--baseline', help="Compare the results with this JSON file.")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Accepted relative regression (default: 0.2).")
+    parser.add_argument('--save-baseline', help="Store the results as a new baseline at this path.")
+    args = parser.parse_args()
+
+    results = run_suite(args.config, speed=args.speed, seed=args.seed)
+    for name, entry in results['metrics'].items():
+        print(f"{name:<28} {entry['value']:>14,.3f} {entry['unit']}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('speed') != results['meta']['speed']:
+            print(f"Warning: baseline was recorded at speed {baseline['meta'].get('speed')}, this run at {args.speed}.")
+        rows = compare(results, baseline, args.threshold)
+        print(f"\nComparison with {args.baseline} (threshold {args.threshold:.0%}):")
+        for name, value, reference, change, passed in rows:
+            print(f"{'PASS' if passed else 'FAIL'}  {name:<28} {value:>14,.3f} vs {reference:>14,.3f} ({change:+.1%})")
+        if not all(passed for *_, passed in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Tests for persisting configuration changes (`config.ConfigStore`, `config.write_json_atomic`).
+"""
+import json
+import os
+
+import pytest
+
+from PowderDispenserController import config
+from PowderDispenserController.config import ConfigStore, load_settings, read_config, write_json_atomic
+
+SHIPPED_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+AUGER_KEYS = ('calibration', 'augers', '8mm_base', 'dishwasher_salt')
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    # A copy of the shipped, commented configuration file.
+    path = tmp_path / 'config.json'
+    with open(SHIPPED_CONFIG, encoding='utf-8') as file:
+        path.write_text(file.read(), encoding='utf-8')
+    return str(path)
+
+
+def test_burst_of_changes_is_one_write(config_file):
+    store = ConfigStore(config_file, delay=60)
+    for i in range(1, 11):
+        store.set(AUGER_KEYS, i * 1e-05)
+        store.set(('calibration', 'augers', '8mm_base', 'sugar'), i * 2e-05)
+    assert store.writes == 0 and store.pending
+    store.close()
+    assert store.writes == 1 and not store.pending
+    saved = read_config(config_file)['calibration']['augers']['8mm_base']
+    assert saved == {'dishwasher_salt': 1e-04, 'sugar': 2e-04}
+
+
+def test_background_write_after_delay(config_file):
+    store = ConfigStore(config_file, delay=0.05)
+    store.set(AUGER_KEYS, 3e-05)
+    store.set(AUGER_KEYS, 4e-05)
+    store._timer.join(5)
+    assert store.writes == 1
+    assert read_config(config_file)['calibration']['augers']['8mm_base']['dishwasher_salt'] == 4e-05
+
+
+def test_write_json_atomic_failed_dump_leaves_no_temp_file(tmp_path):
+    path = tmp_path / 'data.json'
+    write_json_atomic(str(path), {'a': 1})
+    with pytest.raises(TypeError):
+        write_json_atomic(str(path), {'a': object()})  # Not JSON serializable.
+    assert os.listdir(tmp_path) == ['data.json']
+    assert json.loads(path.read_text()) == {'a': 1}
+
+
+def test_flush_keeps_changes_when_the_write_fails(config_file, monkeypatch):
+    store = ConfigStore(config_file, delay=60)
+    store.set(AUGER_KEYS, 5e-05)
+
+    def fail(path, data):
+        raise OSError("disk full")
+    monkeypatch.setattr(config, 'write_json_atomic', fail)
+    with pytest.raises(OSError):
+        store.flush()
+    assert store.pending and store.writes == 0
+
+    store.set(('calibration', 'augers', '8mm_base', 'sugar'), 6e-05)  # Scheduled while the write failed.
+    monkeypatch.undo()
+    assert store.flush()
+    saved = read_config(config_file)['calibration']['augers']['8mm_base']
+    assert saved == {'dishwasher_salt': 5e-05, 'sugar': 6e-05}
+
+
+def test_overlay_leaves_the_config_file_untouched(config_file, tmp_path):
+    overlay_file = str(tmp_path / 'rig1.json')
+    with open(config_file, 'rb') as file:
+        original = file.read()
+    store = ConfigStore(config_file, overlay_file, delay=60)
+    assert store.target == overlay_file
+    store.set(AUGER_KEYS, 7e-05)
+    store.close()
+
+    with open(config_file, 'rb') as file:
+        assert file.read() == original  # Comments included.
+    assert read_config(overlay_file) == {'calibration': {'augers': {'8mm_base': {'dishwasher_salt': 7e-05}}}}
+    assert load_settings(config_file, overlay_file).auger('8mm_base', 'dishwasher_salt').grams_per_step == 7e-05
@@ -0,0 +1,18 @@
+"""
+Regression test for the import time of the package, see `benchmarks.bench_import`.
+"""
+import os
+import statistics
+
+from benchmarks.bench_import import PACKAGE, measure_import
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET = 0.25  # Seconds, the default budget of bench_import.
+
+
+def test_cold_import_within_budget(monkeypatch):
+    monkeypatch.chdir(ROOT)  # The fresh interpreters import the package from the repository.
+    times, heavy = measure_import(runs=5)
+    assert heavy == [], f"importing {PACKAGE} loads {', '.join(heavy)}; import them where they are used"
+    assert statistics.median(times) <= BUDGET, f"median import time {statistics.median(times) * 1000:.1f} ms"
+
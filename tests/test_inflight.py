@@ -0,0 +1,37 @@
+"""
+Tests for fitting the settled-weight predictor (`inflight.InFlightModel`).
+"""
+import pytest
+
+from PowderDispenserController.inflight import MIN_TRACES, BurstTrace, InFlightModel
+
+
+def trace(steps, start_weight, seen, rate, gain=1.1, slope=0.2, grams_per_step=2e-06):
+    # A burst whose weight has risen by `seen` at the first sample and grows at `rate` g/s until the horizon.
+    samples = tuple((t / 100, start_weight + seen + rate * t / 100) for t in range(31))
+    visible = sum(weight for t, weight in samples[-16:]) / 16 - start_weight  # The 0.15 s window before 0.3 s.
+    settled = start_weight + gain * visible + slope * rate + grams_per_step * steps
+    return BurstTrace('8mm_base', 'dishwasher_salt', steps, start_weight, samples, settled, 1.0)
+
+
+def test_fit_recovers_coefficients():
+    traces = [trace(400 * (i % 3 + 1), 0.01 * i, 0.002 * (i % 4 + 1), 0.01 * (i % 5)) for i in range(12)]
+    model = InFlightModel.fit(traces)
+    assert (model.gain, model.slope, model.steps) == pytest.approx((1.1, 0.2, 2e-06), rel=1e-6)
+    for burst in traces:
+        assert model.predict(burst.samples, burst.start_weight, burst.steps) == pytest.approx(burst.settled_weight)
+
+
+def test_fit_rank_deficient_traces():
+    # Every burst settled before the horizon (slope 0) and had the same size: only the gain is determined.
+    traces = [trace(400, 0.01 * i, 0.002 * (i + 1), 0.0, grams_per_step=0.0) for i in range(6)]
+    model = InFlightModel.fit(traces)
+    for burst in traces:
+        assert model.predict(burst.samples, burst.start_weight, burst.steps) == pytest.approx(burst.settled_weight)
+    assert model.slope == 0.0
+
+
+def test_fit_needs_enough_traces():
+    traces = [trace(400, 0.0, 0.002, 0.0)] * (MIN_TRACES - 1)
+    with pytest.raises(ValueError):
+        InFlightModel.fit(traces)
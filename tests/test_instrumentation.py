@@ -0,0 +1,102 @@
+"""
+Tests for the command latency statistics (`instrumentation.LatencyHistogram`, `instrumentation.CommandStats`).
+"""
+import json
+import math
+import random
+
+import pytest
+
+from PowderDispenserController.instrumentation import CommandStats, LatencyHistogram, command_name
+
+PERCENTILES = (1, 10, 25, 50, 75, 90, 99, 99.9, 100)
+
+
+def distributions(count=20000, seed=3):
+    rng = random.Random(seed)
+    return {
+        'uniform': [rng.uniform(1e-4, 1.0) for _ in range(count)],
+        'lognormal': [rng.lognormvariate(math.log(0.005), 1.0) for _ in range(count)],
+        'exponential': [1e-3 + rng.expovariate(1 / 0.02) for _ in range(count)],
+        'bimodal': [rng.gauss(0.002, 1e-4) if rng.random() < 0.9 else rng.gauss(0.5, 0.01) for _ in range(count)],
+    }
+
+
+def exact_percentile(values, q):
+    # The value at the rank LatencyHistogram.percentile reports, at its resolution of whole microseconds.
+    ordered = sorted(int(value * 1e6) for value in values)
+    rank = max(q / 100 * len(ordered), 1)
+    return ordered[math.ceil(rank) - 1] / 1e6
+
+
+@pytest.mark.parametrize('significant_bits', [4, 6, 8])
+@pytest.mark.parametrize('name', ['uniform', 'lognormal', 'exponential', 'bimodal'])
+def test_percentiles_within_error_bound(name, significant_bits):
+    values = distributions()[name]
+    histogram = LatencyHistogram(significant_bits)
+    for value in values:
+        histogram.record(value)
+    bound = 1 / 2 ** (significant_bits - 1)
+    for q in PERCENTILES:
+        exact = exact_percentile(values, q)
+        assert abs(histogram.percentile(q) - exact) <= bound * exact + 1e-6, q
+    assert histogram.count == len(values)
+    assert histogram.mean == pytest.approx(sum(values) / len(values))
+    assert (histogram.min, histogram.max) == (min(values), max(values))
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None and histogram.mean is None
+    assert histogram.summary()['p99_ms'] is None
+    assert histogram.buckets() == []
+
+
+def test_merge():
+    values = distributions(4000)['lognormal']
+    whole, first, second = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i, value in enumerate(values):
+        whole.record(value)
+        (first if i % 3 else second).record(value)
+    first.merge(second)
+    assert first.counts == whole.counts
+    assert (first.count, first.min, first.max) == (whole.count, whole.min, whole.max)
+    assert first.total == pytest.approx(whole.total)
+    assert first.summary() == pytest.approx(whole.summary())
+
+    empty = LatencyHistogram()
+    empty.merge(LatencyHistogram())
+    assert empty.count == 0 and empty.min is None
+    with pytest.raises(ValueError):
+        first.merge(LatencyHistogram(significant_bits=6))
+
+
+def test_buckets_round_trip_through_export(tmp_path):
+    stats = CommandStats()
+    values = distributions(2000)['exponential']
+    for value in values:
+        stats.record('<Meas,10,NONE>', 0.0, first_byte=value / 2, reply=value, bytes_out=14, bytes_in=30)
+    stats.record('<Meas,5,NONE>', 0.0, outcome='timeout')
+    path = tmp_path / 'stats.json'
+    stats.export(str(path))
+
+    exported = json.loads(path.read_text())['Meas']
+    assert exported['calls'] == len(values) + 1
+    assert exported['outcomes'] == {'ok': len(values), 'timeout': 1, 'error': 0}
+    assert exported['bytes_out'] == 14 * len(values)
+    for kind in ('first_byte', 'reply'):
+        original = stats.histogram('Meas', kind)
+        assert exported[kind]['buckets'] == original.buckets()
+        assert sum(count for _, _, count in exported[kind]['buckets']) == exported[kind]['count'] == len(values)
+        # Recording the midpoint of every exported bucket rebuilds the histogram.
+        rebuilt = LatencyHistogram(stats.significant_bits)
+        for low, high, count in exported[kind]['buckets']:
+            assert low < high
+            for _ in range(count):
+                rebuilt.record((low + high) / 2e6)
+        assert rebuilt.counts == original.counts
+
+
+def test_command_name():
+    assert command_name('<Mix,10>') == 'Mix'
+    assert command_name('<Tare>') == 'Tare'
@@ -0,0 +1,65 @@
+"""
+Tests for the Parquet log store (`logstore.ParquetLogWriter`, `logstore.read_log_store`).
+"""
+import os
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from PowderDispenserController.logstore import ParquetLogWriter, read_log_store
+
+
+def parquet_files(path):
+    return sorted(name for name in os.listdir(path) if name.endswith('.parquet'))
+
+
+def test_session_parts_are_merged_on_close(tmp_path):
+    path = str(tmp_path / 'history.parquet')
+    writer = ParquetLogWriter(path, flush_rows=3, flush_interval=None)
+    for i in range(10):
+        writer.write(0.1, 0.1 + i / 1000, 1000 + i, '8mm_base', 'salt' if i % 2 else 'sugar')
+    writer.flush()
+    assert len(parquet_files(path)) == 4  # One part per flush, readable during the session.
+    assert read_log_store(path)['steps'].tolist() == list(range(1000, 1010))
+
+    writer.close()
+    files = parquet_files(path)
+    assert len(files) == 1 and not files[0].endswith('-00000.parquet')
+    df = read_log_store(path)
+    assert df['steps'].tolist() == list(range(1000, 1010))
+    assert read_log_store(path, columns=['steps'], powderType='salt')['steps'].tolist() == [1001, 1003, 1005, 1007, 1009]
+
+
+def test_sessions_are_kept_apart(tmp_path):
+    path = str(tmp_path / 'history.parquet')
+    for session in range(2):
+        with ParquetLogWriter(path, flush_rows=2, flush_interval=None) as writer:
+            for i in range(5):
+                writer.write(steps=session * 10 + i)
+    assert len(parquet_files(path)) == 2
+    assert read_log_store(path)['steps'].tolist() == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14]
+
+
+def test_parts_left_by_an_interrupted_merge_are_skipped(tmp_path, monkeypatch):
+    path = str(tmp_path / 'history.parquet')
+    writer = ParquetLogWriter(path, flush_rows=2, flush_interval=None)
+    for i in range(4):
+        writer.write(steps=i)
+
+    def crash(part):
+        raise OSError("crashed while deleting the parts")
+    monkeypatch.setattr(os, 'remove', crash)
+    with pytest.raises(OSError):
+        writer.close()
+    monkeypatch.undo()
+    assert len(parquet_files(path)) == 3  # The merged file and both parts.
+    assert read_log_store(path)['steps'].tolist() == [0, 1, 2, 3]
+
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / 'history.parquet')
+    ParquetLogWriter(path).close()
+    assert parquet_files(path) == []
+    assert len(read_log_store(path)) == 0
+    assert list(read_log_store(path, columns=['steps']).columns) == ['steps']
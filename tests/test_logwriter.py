@@ -0,0 +1,66 @@
+"""
+Tests for the CSV dispensing logs (`logwriter.SessionLogWriter`, `utils.write_to_logfile`, `utils.read_logfile`).
+"""
+import time
+
+import pytest
+
+from PowderDispenserController.logwriter import LOG_COLUMNS, SessionLogWriter
+from PowderDispenserController.utils import read_logfile, write_to_logfile
+
+HEADER = ','.join(LOG_COLUMNS) + '\n'
+
+
+def read_text(path):
+    # What a crash would leave: the file contents on disk, while the writer is still open.
+    with open(path, encoding='utf-8') as file:
+        return file.read()
+
+
+def test_rows_are_written_after_flush_interval(tmp_path):
+    path = tmp_path / 'log.csv'
+    writer = SessionLogWriter(str(path), flush_rows=64, flush_interval=0.1)
+    try:
+        writer.write(0.1, 0.0998, 1200, '8mm_base', 'dishwasher_salt')
+        writer.write(0.2, 0.2003, 2400, '8mm_base', 'dishwasher_salt')
+        assert read_text(path) == HEADER  # Buffered, fewer than flush_rows.
+        assert len(writer) == 2 and writer.rows_written == 0
+
+        deadline = time.monotonic() + 5
+        while writer.rows_written < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert read_text(path) == HEADER + '0.1,0.0998,1200,8mm_base,dishwasher_salt,\n0.2,0.2003,2400,8mm_base,dishwasher_salt,\n'
+    finally:
+        writer.close()
+
+
+def test_rows_are_written_at_flush_rows(tmp_path):
+    path = tmp_path / 'log.csv'
+    with SessionLogWriter(str(path), flush_rows=3, flush_interval=None) as writer:
+        for i in range(4):
+            writer.write(measured_amount=i)
+        # The first three rows survive a crash now, the fourth is still buffered.
+        assert read_text(path) == HEADER + ',0,,,,\n,1,,,,\n,2,,,,\n'
+    assert read_text(path).endswith(',3,,,,\n')
+
+
+def test_write_after_close_raises(tmp_path):
+    writer = SessionLogWriter(str(tmp_path / 'log.csv'))
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write(0.1)
+
+
+def test_write_to_logfile_is_readable(tmp_path):
+    path = str(tmp_path / 'logs' / 'log.csv')
+    write_to_logfile(path, desired_amount=0.1, measured_amount=0.0995, steps=1200, augerType='8mm_base', powderType='dishwasher_salt', filterType='EWMA')
+    write_to_logfile(path, desired_amount=[0.1, 0.2], measured_amount=[0.099, 0.201], steps=[1200, 2400], augerType='8mm_base', powderType='dishwasher_salt')
+    with SessionLogWriter(path) as writer:  # Appends to the file without a second header.
+        writer.write(steps=600, measured_amount=0.05)
+
+    df = read_logfile(path)
+    assert list(df.columns) == LOG_COLUMNS
+    assert len(df) == 3
+    assert df['desired_amount'][0] == 0.1 and df['filter_type'][0] == 'EWMA'
+    assert df['desired_amount'][1] == [0.1, 0.2] and df['# of steps'][1] == [1200, 2400]
+    assert df['measured_amount'][2] == 0.05 and df['# of steps'][2] == 600
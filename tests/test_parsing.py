@@ -0,0 +1,151 @@
+"""
+Tests for the parsing of received frames (`comms.FrameBuffer`, `binary.decode_frames`) and of configuration
+files (`config.strip_comments`, `config.Settings`, overlays).
+
+Run from the repository root with `python -m pytest -q`.
+"""
+import json
+import os
+
+import pytest
+
+from PowderDispenserController.binary import FRAME_SIZE, NUMPY_MIN_FRAMES, BinaryReading, decode_frames, encode_frame
+from PowderDispenserController.comms import FrameBuffer
+from PowderDispenserController.config import ConfigError, Settings, load_settings, merge_config, parse_config, read_config, strip_comments
+
+SHIPPED_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+
+
+def corrupt(frame):
+    # Flips a bit of the CRC, leaving the header valid.
+    return frame[:-1] + bytes((frame[-1] ^ 0x01,))
+
+
+def drain(buffer):
+    frames = []
+    while len(buffer):
+        frames.append(buffer.pop())
+    return frames
+
+
+def test_decode_frames_roundtrip():
+    data = encode_frame('Weight', 1.25, 100) + encode_frame('ADC', -4096, 101) + encode_frame('Stream', 0.5, 2**32 + 7)
+    readings, end, errors = decode_frames(data)
+    assert readings == [BinaryReading('Weight', 1.25, 100), BinaryReading('ADC', -4096, 101), BinaryReading('Stream', 0.5, 7)]
+    assert (end, errors) == (len(data), 0)
+
+
+def test_decode_frames_partial_frame():
+    frame = encode_frame('Weight', 1.25, 100)
+    assert decode_frames(frame[:-1]) == ([], 0, 0)
+    readings, end, errors = decode_frames(frame + frame[:5])
+    assert (len(readings), end, errors) == (1, FRAME_SIZE, 0)
+
+
+def test_decode_frames_corrupted_crc():
+    data = encode_frame('Weight', 1.0, 1) + corrupt(encode_frame('Weight', 2.0, 2)) + encode_frame('Weight', 3.0, 3)
+    readings, end, errors = decode_frames(data)
+    assert [reading.value for reading in readings] == [1.0, 3.0]
+    assert (end, errors) == (len(data), 1)
+
+
+def test_decode_frames_corrupted_crc_numpy_run():
+    frames = [encode_frame('Stream', i / 4, i) for i in range(NUMPY_MIN_FRAMES + 6)]
+    frames[10] = corrupt(frames[10])
+    readings, end, errors = decode_frames(b''.join(frames))
+    assert [reading.device_ms for reading in readings] == [i for i in range(len(frames)) if i != 10]
+    assert (end, errors) == (len(frames) * FRAME_SIZE, 1)
+
+
+def test_frame_buffer_garbage_between_frames():
+    buffer = FrameBuffer()
+    buffer.feed(b'noise\r\n<Msg:Ready>\r\n\x00\xffjunk' + encode_frame('Weight', 1.5, 9) + b'\xa5\x00garbage<Weight:2.5>')
+    assert drain(buffer) == ['Msg:Ready', BinaryReading('Weight', 1.5, 9), 'Weight:2.5']
+    assert buffer.crc_errors == 0
+
+
+def test_frame_buffer_split_chunks():
+    data = b'<Msg:Tare done>\r\n' + encode_frame('Stream', 0.25, 40) + b'<Weight:0.75>\r\n' + encode_frame('ADC', 1234, 41)
+    buffer = FrameBuffer()
+    for i in range(len(data)):
+        buffer.feed(data[i:i + 1])  # One byte per chunk, splitting every frame.
+    assert drain(buffer) == ['Msg:Tare done', BinaryReading('Stream', 0.25, 40), 'Weight:0.75', BinaryReading('ADC', 1234, 41)]
+    assert buffer.bytes_received == len(data)
+
+
+def test_frame_buffer_corrupted_crc():
+    buffer = FrameBuffer()
+    buffer.feed(corrupt(encode_frame('Weight', 1.0, 1)) + b'<Msg:ok>' + encode_frame('Weight', 2.0, 2))
+    assert drain(buffer) == ['Msg:ok', BinaryReading('Weight', 2.0, 2)]
+    assert buffer.crc_errors == 1
+
+
+def test_frame_buffer_mixed_ascii_and_binary():
+    stream = [encode_frame('Stream', i / 8, i) for i in range(NUMPY_MIN_FRAMES)]
+    data = b'<Status:1,0>\r\n' + b''.join(stream[:32]) + b'<Msg:Mixing>\r\n' + b''.join(stream[32:]) + b'<Msg:Done>\r\n'
+    buffer = FrameBuffer()
+    buffer.feed(data[:100])
+    buffer.feed(data[100:])
+    frames = drain(buffer)
+    assert frames[0] == 'Status:1,0'
+    assert frames[33] == 'Msg:Mixing'
+    assert frames[-1] == 'Msg:Done'
+    readings = frames[1:33] + frames[34:-1]
+    assert readings == [BinaryReading('Stream', i / 8, i) for i in range(NUMPY_MIN_FRAMES)]
+
+
+def test_frame_buffer_truncated_ascii_frame():
+    buffer = FrameBuffer()
+    buffer.feed(b'<Weight:1.2<Msg:Ready>')
+    assert drain(buffer) == ['Msg:Ready']
+
+
+def test_shipped_config_parses():
+    with open(SHIPPED_CONFIG, encoding='utf-8') as file:
+        assert '//' in file.read()  # The shipped file is commented.
+    settings = Settings(read_config(SHIPPED_CONFIG))
+    assert settings.auger('8mm_base', 'dishwasher_salt').grams_per_step == pytest.approx(2.1130909090909088e-05)
+    assert settings.load_cells['100g'].slope == pytest.approx(7.91113773979552e-05)
+    assert 'decimal' in settings.constants
+
+
+def test_strip_comments_keeps_strings():
+    text = """{
+        // A line comment.
+        "url": "http://example.com/a//b", /* A block
+        comment. */ "quote": "say \\"//not a comment\\"", "block": "/* kept */"
+    }"""
+    stripped = strip_comments(text)
+    assert stripped.count('\n') == text.count('\n')  # Line numbers of parse errors still match.
+    assert json.loads(stripped) == {'url': 'http://example.com/a//b', 'quote': 'say "//not a comment"', 'block': '/* kept */'}
+
+
+def test_parse_config_errors():
+    with pytest.raises(ConfigError):
+        parse_config('{"a": 1,, // broken\n}')
+    with pytest.raises(ConfigError):
+        parse_config('[1, 2]  // not an object')
+
+
+def test_merge_config_overlay():
+    base = {'calibration': {'augers': {'8mm': {'salt': 1e-5, 'sugar': 2e-5}}, 'weights': [{'value': 1}]}, 'constants': {'decimal': 4}}
+    overlay = {'calibration': {'augers': {'8mm': {'salt': 3e-5}}, 'weights': [{'value': 5}]}, 'extra': True}
+    merged = merge_config(base, overlay)
+    assert merged == {
+        'calibration': {'augers': {'8mm': {'salt': 3e-5, 'sugar': 2e-5}}, 'weights': [{'value': 5}]},
+        'constants': {'decimal': 4},
+        'extra': True,
+    }
+    assert base['calibration']['augers']['8mm']['salt'] == 1e-5  # The base is not modified.
+
+
+def test_load_settings_with_overlay(tmp_path):
+    overlay_file = tmp_path / 'rig.json'
+    settings = load_settings(SHIPPED_CONFIG, str(overlay_file))  # A missing overlay counts as empty.
+    assert settings.auger('8mm_base', 'dishwasher_salt').grams_per_step == pytest.approx(2.1130909090909088e-05)
+
+    overlay_file.write_text('{\n  // Recalibrated on this rig.\n  "calibration": {"augers": {"8mm_base": {"dishwasher_salt": 4e-05}}}\n}\n')
+    settings = load_settings(SHIPPED_CONFIG, str(overlay_file))
+    assert settings.auger('8mm_base', 'dishwasher_salt') == (4e-05, 1 / 4e-05)
+    assert settings.auger('8mm_base1', 'dishwasher_salt').grams_per_step == pytest.approx(1.9812121212121218e-05)
+    assert load_settings(SHIPPED_CONFIG).auger('8mm_base', 'dishwasher_salt').grams_per_step == pytest.approx(2.1130909090909088e-05)
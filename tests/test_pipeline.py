@@ -0,0 +1,84 @@
+"""
+Tests for pipelined command batches (`pipeline.echo_matches`, `PowderDispenseController.run_batch`).
+
+The batch tests run against the virtual rig, which needs a POSIX pseudo-terminal.
+"""
+import contextlib
+import io
+import os
+
+import pytest
+
+from PowderDispenserController import PowderDispenseController, set_command_logging
+from PowderDispenserController.pipeline import RX_WINDOW, BatchCommand, BatchResult, echo_matches
+
+SHIPPED_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+
+
+@pytest.mark.parametrize('command_str, reply_text', [
+    ('<Dispense,2000,1>', 'Msg Dispense,2000,1 Time 42'),
+    ('<Tare>', 'Msg Tare'),                                  # No ' Time ' suffix.
+    ('<Dispense,2000,1>', 'Msg Dispense,20 Time 42'),        # Echo truncated by the firmware's input buffer.
+    ('<Note,at Time 3>', 'Msg Note,at Time 3 Time 9'),       # Only the last ' Time ' is the suffix.
+    ('Mix,5', 'Msg Mix,5 Time 1'),                           # Command without its markers.
+])
+def test_echo_matches(command_str, reply_text):
+    assert echo_matches(command_str, reply_text)
+
+
+@pytest.mark.parametrize('command_str, reply_text', [
+    ('<Dispense,2000,1>', 'Msg Mix,5 Time 42'),              # Another command.
+    ('<Tare>', 'Msg Tare,1 Time 3'),                         # Echo longer than the command.
+    ('<Tare>', 'Weight:1.2345'),                             # Not an acknowledgement.
+    ('<Tare>', 'Msg  Time 3'),                               # Empty echo.
+    ('<Tare>', 'Msg '),
+])
+def test_echo_does_not_match(command_str, reply_text):
+    assert not echo_matches(command_str, reply_text)
+
+
+@pytest.fixture(scope='module')
+def controller():
+    if os.name != 'posix':
+        pytest.skip("The virtual rig needs a POSIX pseudo-terminal.")
+    from PowderDispenserController.simulator import VirtualRig
+    set_command_logging(False)
+    try:
+        with VirtualRig(speed=20, seed=1) as rig:
+            with contextlib.redirect_stdout(io.StringIO()):
+                controller = PowderDispenseController(rig.port, config_file=SHIPPED_CONFIG)
+            try:
+                yield controller
+            finally:
+                controller.close()
+    finally:
+        set_command_logging(True)
+
+
+@pytest.mark.parametrize('window', [RX_WINDOW, 20])
+def test_batch_longer_than_rx_window(controller, window, monkeypatch):
+    acked = []  # Commands acknowledged so far, in order.
+    in_flight = []  # Unacknowledged command bytes whenever a command is sent.
+    command_strs = ['<Tare>'] + [f'<Meas,{n},NONE>' for n in range(1, 9)] + ['<ScaleOn>', '<Tare>']
+    commands = [BatchCommand(command, value_kind='Weight' if command.startswith('<Meas') else None,
+                             on_ack=lambda command=command: acked.append(command)) for command in command_strs]
+    assert sum(map(len, command_strs)) > RX_WINDOW
+
+    send = controller.send_to_arduino
+    sent = []
+
+    def record(command_str):
+        sent.append(command_str)
+        in_flight.append(sum(map(len, sent)) - sum(map(len, acked)))
+        send(command_str)
+    monkeypatch.setattr(controller, 'send_to_arduino', record)
+
+    results = controller.run_batch(commands, timeout=5, window=window)
+    assert [result.command for result in results] == command_strs
+    assert acked == command_strs
+    for result in results:
+        assert isinstance(result, BatchResult)
+        assert echo_matches(result.command, result.reply)
+    assert all(isinstance(result.value, float) for result in results[1:9])
+    assert results[0].value is None and results[-1].value is None
+    assert max(in_flight) <= window
@@ -0,0 +1,145 @@
+"""
+Tests for recipe scheduling (`scheduler.Recipe`, `scheduler.RecipeScheduler`), with callable steps on fake
+controllers instead of rigs.
+"""
+import threading
+import time
+
+import pytest
+
+from PowderDispenserController.scheduler import FIRMWARE, PUMP_TIMER, Recipe, RecipeScheduler, default_resources
+
+
+class FakeController:
+    # The attributes the scheduler reads from a controller; steps record what ran on it.
+    mixTime = 10.0
+    drainTime = 5.0
+    backgroundActuators = True
+
+    def __init__(self) -> None:
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _pump_time(self, pump, volume=None, time=None):
+        return 7, time or 2.0
+
+
+def run(controller, name, seconds=0.0, fail=False):
+    # A callable step: records its name on the controller, takes `seconds` and optionally fails.
+    with controller._lock:
+        controller.calls.append(name)
+    time.sleep(seconds)
+    if fail:
+        raise RuntimeError(f"{name} failed")
+    return name
+
+
+def overlap(first, second):
+    return first.start < second.end and second.start < first.end
+
+
+def test_default_resources():
+    assert default_resources('wait') == ()
+    assert default_resources('runMixer', (5,)) == (FIRMWARE, 'mixer')
+    assert default_resources('runMixer', (5,), background_actuators=True) == ('mixer',)
+    assert default_resources('runPump', ('Flush', 10), background_actuators=True) == ('flush_pump', PUMP_TIMER)
+    assert default_resources('runPump', (), {'pump': 'Acid'}) == (FIRMWARE, 'pump:Acid')
+    assert default_resources('dispense_powder_seq', (0.5,)) == (FIRMWARE, 'auger', 'scale')
+
+
+def test_resource_exclusion():
+    recipe = Recipe()
+    recipe.add('weigh1', run, 'weigh1', 0.1, resources=['scale'])
+    recipe.add('weigh2', run, 'weigh2', 0.1, resources=['scale'])
+    recipe.add('mix', run, 'mix', 0.1, resources=['mixer'])
+    report = RecipeScheduler(FakeController()).run(recipe)
+    assert report.ok
+    records = report.records
+    assert not overlap(records['weigh1'], records['weigh2'])
+    assert overlap(records['mix'], records['weigh1']) or overlap(records['mix'], records['weigh2'])
+    assert report.busy[None, 'scale'] == pytest.approx(0.2, abs=0.1)
+
+
+def test_same_resource_on_different_rigs_overlaps():
+    recipe = Recipe()
+    recipe.add('a', run, 'a', 0.1, rig='rig1', resources=[FIRMWARE])
+    recipe.add('b', run, 'b', 0.1, rig='rig2', resources=[FIRMWARE])
+    report = RecipeScheduler({'rig1': FakeController(), 'rig2': FakeController()}).run(recipe)
+    assert overlap(report.records['a'], report.records['b'])
+
+
+def test_priority_follows_longest_remaining_path():
+    controller = FakeController()
+    recipe = Recipe()
+    recipe.add('short', run, 'short', estimate=1, resources=[FIRMWARE])
+    recipe.add('head', run, 'head', estimate=1, resources=[FIRMWARE])
+    recipe.add('tail', run, 'tail', estimate=5, after=['head'], resources=[FIRMWARE])
+    assert recipe.remaining_paths({'short': 1, 'head': 1, 'tail': 5}) == {'short': 1, 'head': 6, 'tail': 5}
+    report = RecipeScheduler(controller).run(recipe)
+    assert report.ok
+    assert controller.calls == ['head', 'tail', 'short']
+
+
+def test_failure_skips_dependents_and_rig():
+    rig1, rig2 = FakeController(), FakeController()
+    recipe = Recipe()
+    recipe.add('fail', run, 'fail', 0.05, fail=True, rig='rig1', resources=['auger'])
+    recipe.add('dependent', run, 'dependent', rig='rig1', after=['fail'], resources=['mixer'])
+    recipe.add('chained', run, 'chained', rig='rig1', after=['dependent'], resources=['mixer'])
+    recipe.add('soak', 'wait', 0.15, rig='rig1')
+    recipe.add('same_rig', run, 'same_rig', rig='rig1', after=['soak'], resources=['drain'])  # Ready after the failure.
+    recipe.add('other_rig', run, 'other_rig', 0.2, rig='rig2', resources=['auger'])
+    recipe.add('other_next', run, 'other_next', rig='rig2', after=['other_rig'], resources=['auger'])
+    report = RecipeScheduler({'rig1': rig1, 'rig2': rig2}).run(recipe)
+
+    assert not report.ok
+    assert isinstance(report.records['fail'].error, RuntimeError)
+    assert sorted(report.skipped) == ['chained', 'dependent', 'same_rig']
+    assert rig1.calls == ['fail']
+    assert rig2.calls == ['other_rig', 'other_next']
+    assert report.records['other_next'].error is None
+
+
+def test_critical_path():
+    recipe = Recipe()
+    recipe.add('a', run, 'a', estimate=2)
+    recipe.add('b', run, 'b', estimate=3, after=['a'])
+    recipe.add('c', run, 'c', estimate=4)
+    recipe.add('d', run, 'd', estimate=1, after=['b', 'c'])
+    assert RecipeScheduler(FakeController()).plan(recipe) == (['a', 'b', 'd'], 6)
+    assert Recipe().critical_path({}) == ([], 0.0)
+
+
+def test_critical_path_through_freed_resource():
+    # 'late' depends on nothing but waits for the scale that 'first' holds, so 'first' triggers it.
+    recipe = Recipe()
+    recipe.add('first', run, 'first', 0.1, resources=['scale'], estimate=2)
+    recipe.add('after_first', run, 'after_first', 0.02, after=['first'], resources=[], estimate=1)
+    recipe.add('late', run, 'late', 0.15, resources=['scale'], estimate=1)
+    report = RecipeScheduler(FakeController()).run(recipe)
+    assert report.ok
+    assert report.critical_path == ['first', 'late']
+    assert report.makespan == pytest.approx(0.25, abs=0.1)
+    assert report.serial_time > report.makespan
+
+
+def test_estimates_and_unknown_rig():
+    scheduler = RecipeScheduler(FakeController())
+    recipe = Recipe()
+    recipe.add('mix', 'runMixer')
+    recipe.add('flush', 'runFlush', time=3)
+    recipe.add('soak', 'wait', 30)
+    assert [scheduler.estimate(step) for step in recipe] == [10.0, 3, 30.0]
+
+    recipe.add('elsewhere', run, 'elsewhere', rig='rig9')
+    with pytest.raises(ValueError):
+        scheduler.run(recipe)
+
+
+def test_recipe_validation():
+    recipe = Recipe()
+    recipe.add('a', 'wait', 0)
+    with pytest.raises(ValueError):
+        recipe.add('a', 'wait', 0)
+    with pytest.raises(ValueError):
+        recipe.add('b', 'wait', 0, after=['missing'])